@@ -1,79 +1,118 @@
-import json
 import os
-import datetime
+import time
 import argparse
-from collections import defaultdict
+from cost_log import log_files
+from cost_store import CostStore
 
-def analyze_openrouter_costs(days=30):
-    """Analyze OpenRouter costs from the log file"""
-    log_file = os.environ.get("OPENROUTER_COST_LOG", "openrouter_costs.json")
+def analyze_openrouter_costs(days=30, db_path=None, rollups=None):
+    """Analyze OpenRouter costs from the log file
     
-    if not os.path.exists(log_file):
+    Entries are imported into a SQLite store (in memory unless ``db_path`` is
+    given, in which case only the new tail of the log is imported) and all
+    aggregations run in SQL. ``rollups`` adds per-'day', per-'label' or
+    per-'run' tables to the report.
+    """
+    if not log_files() and not db_path:
         print("No cost log file found.")
         return
     
-    with open(log_file, 'r') as f:
-        logs = json.load(f)
-    
-    # Filter by date range if needed
-    if days:
-        cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
-        logs = [entry for entry in logs if entry.get('timestamp', '') >= cutoff]
-    
-    if not logs:
-        print(f"No entries found in the past {days} days.")
-        return
-    
-    # Analysis by provider and model
-    total_cost = sum(entry.get('cost', 0) for entry in logs)
-    total_tokens = sum(entry.get('total_tokens', 0) for entry in logs)
-    total_runs = len(logs)
-    
-    by_provider = defaultdict(lambda: defaultdict(int))
-    by_model = defaultdict(lambda: defaultdict(int))
-    
-    for entry in logs:
-        provider = entry.get('provider', 'unknown')
-        model = entry.get('model', 'unknown')
-        cost = entry.get('cost', 0)
-        tokens = entry.get('total_tokens', 0)
+    store = CostStore(db_path or ":memory:")
+    try:
+        imported = store.ingest()
+        if db_path:
+            print(f"Imported {imported} new cost log entries into {db_path}")
+        since = time.time() - days * 86400 if days else None
+        totals = store.totals(since)
         
-        by_provider[provider]['cost'] += cost
-        by_provider[provider]['tokens'] += tokens
-        by_provider[provider]['runs'] += 1
+        if not totals['runs']:
+            print(f"No entries found in the past {days} days.")
+            return
         
-        by_model[model]['cost'] += cost
-        by_model[model]['tokens'] += tokens
-        by_model[model]['runs'] += 1
-    
-    # Print report
-    print(f"{'=' * 50}")
-    print(f"OPENROUTER COST ANALYSIS - PAST {days} DAYS")
-    print(f"{'=' * 50}")
-    print(f"Total runs: {total_runs}")
-    print(f"Total tokens: {total_tokens:,}")
-    print(f"Total cost: ${total_cost:.4f}")
-    print(f"Average cost per run: ${total_cost/total_runs if total_runs else 0:.4f}")
+        total_cost = totals['cost']
+        total_tokens = totals['tokens']
+        total_runs = totals['runs']
+        
+        # Print report
+        print(f"{'=' * 50}")
+        print(f"OPENROUTER COST ANALYSIS - PAST {days} DAYS")
+        print(f"{'=' * 50}")
+        print(f"Total runs: {total_runs}")
+        print(f"Total tokens: {total_tokens:,}")
+        print(f"Total cost: ${total_cost:.4f}")
+        print(f"Average cost per run: ${total_cost/total_runs if total_runs else 0:.4f}")
+        
+        print("\nCOST BY PROVIDER:")
+        for stats in store.breakdown('provider', since):
+            pct_cost = (stats['cost'] / total_cost * 100) if total_cost else 0
+            print(f"  {stats['key']}: ${stats['cost']:.4f} ({pct_cost:.1f}% of total)")
+            print(f"    - Runs: {stats['runs']} ({stats['runs']/total_runs*100:.1f}% of total)")
+            print(f"    - Tokens: {stats['tokens']:,} ({stats['tokens']/total_tokens*100 if total_tokens else 0:.1f}% of total)")
+            print(f"    - Avg cost per token: ${stats['cost']/stats['tokens']*1000:.5f} per 1K tokens" if stats['tokens'] else "")
+        
+        print("\nCOST BY MODEL:")
+        for stats in store.breakdown('model', since):
+            pct_cost = (stats['cost'] / total_cost * 100) if total_cost else 0
+            print(f"  {stats['key']}: ${stats['cost']:.4f} ({pct_cost:.1f}% of total)")
+            print(f"    - Runs: {stats['runs']}")
+            print(f"    - Tokens: {stats['tokens']:,}")
+            print(f"    - Avg cost per token: ${stats['cost']/stats['tokens']*1000:.5f} per 1K tokens" if stats['tokens'] else "")
+        
+        for dimension in rollups or []:
+            print_rollup(store.breakdown(dimension, since), dimension)
+        
+        print_latency(store.latency_percentiles(since))
+        print_routing_accuracy(store.routing_accuracy(since))
+    finally:
+        store.close()
+
+def print_rollup(rows, dimension):
+    """Print calls, tokens and cost per day, label or run"""
+    print(f"\nCOST BY {dimension.upper()}:")
+    for stats in rows:
+        line = f"  {stats['key']}: ${stats['cost']:.4f} - {stats['runs']} calls, {stats['tokens']:,} tokens"
+        if dimension == 'run':
+            line += f" ({stats['first'][:16].replace('T', ' ')})"
+        print(line)
+
+def format_percentiles(values, unit):
+    """Format ``{percentile: value}`` as 'p50 1.2s, p95 3.4s, p99 5.6s'"""
+    return ", ".join(f"p{pct:g} {value:.1f}{unit}" for pct, value in values.items())
+
+def print_latency(rows):
+    """Print latency and throughput percentiles per model"""
+    if not rows:
+        return
     
-    print("\nCOST BY PROVIDER:")
-    for provider, stats in by_provider.items():
-        pct_cost = (stats['cost'] / total_cost * 100) if total_cost else 0
-        print(f"  {provider}: ${stats['cost']:.4f} ({pct_cost:.1f}% of total)")
-        print(f"    - Runs: {stats['runs']} ({stats['runs']/total_runs*100:.1f}% of total)")
-        print(f"    - Tokens: {stats['tokens']:,} ({stats['tokens']/total_tokens*100:.1f}% of total)")
-        print(f"    - Avg cost per token: ${stats['cost']/stats['tokens']*1000:.5f} per 1K tokens" if stats['tokens'] else "")
+    print("\nLATENCY AND THROUGHPUT BY MODEL:")
+    for stats in rows:
+        print(f"  {stats['model']}: {stats['calls']} timed calls")
+        print(f"    - Latency: {format_percentiles(stats['latency'], 's')}")
+        if stats['first_token_latency']:
+            print(f"    - Time to first token: {format_percentiles(stats['first_token_latency'], 's')}")
+        if stats['tokens_per_second']:
+            print(f"    - Throughput: {format_percentiles(stats['tokens_per_second'], ' tok/s')}")
+
+def print_routing_accuracy(rows):
+    """Compare estimated and actual cost/tokens for auto-routed calls"""
+    if not rows:
+        return
     
-    print("\nCOST BY MODEL:")
-    for model, stats in by_model.items():
-        pct_cost = (stats['cost'] / total_cost * 100) if total_cost else 0
-        print(f"  {model}: ${stats['cost']:.4f} ({pct_cost:.1f}% of total)")
-        print(f"    - Runs: {stats['runs']}")
-        print(f"    - Tokens: {stats['tokens']:,}")
-        print(f"    - Avg cost per token: ${stats['cost']/stats['tokens']*1000:.5f} per 1K tokens" if stats['tokens'] else "")
+    print("\nAUTO-ROUTING ESTIMATES VS ACTUAL:")
+    for stats in rows:
+        print(f"  {stats['model']}: {int(stats['runs'])} routed runs")
+        print(f"    - Cost: estimated ${stats['estimated_cost']:.4f}, actual ${stats['actual_cost']:.4f}"
+              + (f" (actual/estimated {stats['actual_cost']/stats['estimated_cost']:.2f}x)" if stats['estimated_cost'] else ""))
+        print(f"    - Input tokens: estimated {int(stats['estimated_tokens']):,}, actual {int(stats['actual_tokens']):,}"
+              + (f" (actual/estimated {stats['actual_tokens']/stats['estimated_tokens']:.2f}x)" if stats['estimated_tokens'] else ""))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze OpenRouter costs")
     parser.add_argument("--days", type=int, default=30, help="Number of days to analyze")
+    parser.add_argument("--db", type=str, default=os.environ.get("OPENROUTER_COST_DB"),
+                        help="SQLite database to keep between runs; only new log entries are imported "
+                             "(default: OPENROUTER_COST_DB, otherwise an in-memory database)")
+    parser.add_argument("--by", action="append", choices=["day", "label", "run"], default=[],
+                        help="Add a rollup per day, Gmail label or run (repeatable)")
     args = parser.parse_args()
     
-    analyze_openrouter_costs(args.days) 
\ No newline at end of file
+    analyze_openrouter_costs(args.days, db_path=args.db, rollups=args.by)
@@ -1,12 +1,17 @@
 import os
 import json
+import threading
+import httplib2
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+_local = threading.local()
+
 def authenticate_gmail():
     """Authenticate with Gmail API using OAuth."""
     creds = None
@@ -32,4 +37,38 @@ def authenticate_gmail():
             creds = flow.run_local_server(port=0)
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
-    return build('gmail', 'v1', credentials=creds) 
\ No newline at end of file
+    return build('gmail', 'v1', credentials=creds)
+
+def cached_gmail_service():
+    """
+    Return this thread's Gmail service, authenticating on first use.
+
+    Long-running processes (see ``daemon.py``) use this to skip the token
+    refresh and discovery build on every run; the service's authorized HTTP
+    client refreshes the access token itself when it expires. Services are
+    kept per thread because their ``httplib2`` connections are not thread-safe.
+    """
+    service = getattr(_local, 'service', None)
+    if service is None:
+        service = _local.service = authenticate_gmail()
+    return service
+
+def thread_service_factory(service):
+    """
+    Return a function that builds Gmail services sharing ``service``'s credentials.
+
+    Each built service has its own ``httplib2`` connection (which is not
+    thread-safe) but reuses the authenticated credentials and the loaded
+    discovery document, so worker threads neither authenticate, refresh
+    ``token.json`` nor fetch the discovery document again.
+    """
+    credentials = service._http.credentials
+    document = service._rootDesc
+
+    def factory():
+        return build_from_document(document, http=AuthorizedHttp(credentials, http=httplib2.Http()))
+    return factory
+
+def reset_gmail_service():
+    """Drop this thread's cached Gmail service so the next call authenticates again."""
+    _local.service = None
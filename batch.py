@@ -0,0 +1,390 @@
+"""
+Offline batch-API submission for runs that are not latency-sensitive.
+
+``python main.py --batch`` builds the analysis prompt as usual, writes it in
+the provider's batch JSONL format and submits it at batch pricing. The run
+state (batch id, request file, newsletters and report options) is saved under
+``NEWSLETTER_BATCH_DIR`` (default ``batch_runs``). A later
+``python main.py --collect`` polls the pending runs and finishes the report
+for every batch whose results are ready. A fetched result is kept in the run
+state, and the run is marked completed only once its report is written, so
+a failed report can be collected again without losing the paid output.
+
+Providers are reached through ``BatchAdapter`` implementations. The
+``LocalFileAdapter`` (selected with ``BATCH_ADAPTER=local``) keeps batches on
+disk so the whole flow can be exercised without network access.
+"""
+
+import abc
+import datetime
+import json
+import os
+import uuid
+from typing import Callable, Dict, List, Optional
+
+BATCH_SYSTEM_MESSAGE = "You are an AI consultant helping summarize AI newsletter content for regular people."
+BATCH_MAX_TOKENS = 8000
+# OpenAI and Anthropic both bill batch requests at half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+
+PENDING = "pending"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def batch_dir() -> str:
+    """Return the directory holding batch run state."""
+    return os.environ.get("NEWSLETTER_BATCH_DIR", "batch_runs")
+
+
+class BatchAdapter(abc.ABC):
+    """Interface for submitting and collecting provider batch jobs."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def build_request(self, custom_id: str, prompt: str, model: str) -> Dict:
+        """Return one request line in the provider's batch JSONL format."""
+
+    @abc.abstractmethod
+    def submit(self, requests_path: str) -> str:
+        """Submit the JSONL request file and return the provider's batch id."""
+
+    @abc.abstractmethod
+    def status(self, batch_id: str) -> str:
+        """Return PENDING, COMPLETED or FAILED for a submitted batch."""
+
+    @abc.abstractmethod
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        """Return ``{custom_id: {"content": str, "usage": dict}}`` for a completed batch."""
+
+
+def openai_request(custom_id: str, prompt: str, model: str) -> Dict:
+    """Build a request line in OpenAI's ``/v1/chat/completions`` batch format."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "max_tokens": BATCH_MAX_TOKENS,
+            "messages": [
+                {"role": "system", "content": BATCH_SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+        },
+    }
+
+
+def parse_openai_results(text: str) -> Dict[str, Dict]:
+    """Parse an OpenAI batch output file into per-request results."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        body = (entry.get("response") or {}).get("body") or {}
+        if entry.get("error") or not body.get("choices"):
+            continue
+        results[entry["custom_id"]] = {
+            "content": body["choices"][0]["message"]["content"],
+            "usage": body.get("usage", {}),
+        }
+    return results
+
+
+class OpenAIBatchAdapter(BatchAdapter):
+    """OpenAI Batch API (file upload plus ``/v1/batches``)."""
+
+    name = "openai"
+
+    def __init__(self, client=None):
+        if client is None:
+            from clients import openai_client
+            client = openai_client()
+        self.client = client
+
+    def build_request(self, custom_id, prompt, model):
+        return openai_request(custom_id, prompt, model)
+
+    def submit(self, requests_path):
+        with open(requests_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status == "completed":
+            return COMPLETED
+        if batch.status in ("failed", "expired", "cancelled"):
+            return FAILED
+        return PENDING
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return {}
+        return parse_openai_results(self.client.files.content(batch.output_file_id).text)
+
+
+class AnthropicBatchAdapter(BatchAdapter):
+    """Anthropic Message Batches API."""
+
+    name = "claude"
+
+    def __init__(self, client=None):
+        if client is None:
+            from clients import anthropic_client
+            client = anthropic_client()
+        self.client = client
+
+    def build_request(self, custom_id, prompt, model):
+        return {
+            "custom_id": custom_id,
+            "params": {
+                "model": model,
+                "max_tokens": BATCH_MAX_TOKENS,
+                "system": BATCH_SYSTEM_MESSAGE,
+                "messages": [{"role": "user", "content": prompt}],
+            },
+        }
+
+    def submit(self, requests_path):
+        with open(requests_path, 'r') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        batch = self.client.messages.batches.create(requests=requests)
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return PENDING
+        return COMPLETED if batch.request_counts.succeeded else FAILED
+
+    def results(self, batch_id):
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                continue
+            message = entry.result.message
+            results[entry.custom_id] = {
+                "content": message.content[0].text,
+                "usage": {
+                    "prompt_tokens": message.usage.input_tokens,
+                    "completion_tokens": message.usage.output_tokens,
+                    "total_tokens": message.usage.input_tokens + message.usage.output_tokens,
+                },
+            }
+        return results
+
+
+class LocalFileAdapter(BatchAdapter):
+    """
+    File-based stand-in for a provider batch API.
+
+    Submitted request files are copied to ``<directory>/<batch_id>/input.jsonl``.
+    A batch is complete once ``output.jsonl`` (OpenAI output format) exists
+    next to it, which ``fulfil`` writes from a response function.
+    """
+
+    name = "local"
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(batch_dir(), "local")
+
+    def build_request(self, custom_id, prompt, model):
+        return openai_request(custom_id, prompt, model)
+
+    def submit(self, requests_path):
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        path = os.path.join(self.directory, batch_id)
+        os.makedirs(path, exist_ok=True)
+        with open(requests_path, 'r') as src, open(os.path.join(path, "input.jsonl"), 'w') as dst:
+            dst.write(src.read())
+        return batch_id
+
+    def status(self, batch_id):
+        path = os.path.join(self.directory, batch_id)
+        if os.path.exists(os.path.join(path, "output.jsonl")):
+            return COMPLETED
+        if os.path.exists(os.path.join(path, "failed")):
+            return FAILED
+        return PENDING
+
+    def results(self, batch_id):
+        with open(os.path.join(self.directory, batch_id, "output.jsonl"), 'r') as f:
+            return parse_openai_results(f.read())
+
+    def fulfil(self, batch_id: str, respond: Callable[[Dict], str]) -> None:
+        """Answer every request of a local batch with ``respond(request_body)``."""
+        path = os.path.join(self.directory, batch_id)
+        with open(os.path.join(path, "input.jsonl"), 'r') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        with open(os.path.join(path, "output.jsonl"), 'w') as f:
+            for request in requests:
+                content = respond(request["body"])
+                f.write(json.dumps({
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "body": {
+                        "choices": [{"message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    }},
+                    "error": None,
+                }) + "\n")
+
+
+def get_batch_adapter(provider: str) -> BatchAdapter:
+    """
+    Return the batch adapter for a direct-API provider.
+
+    ``BATCH_ADAPTER=local`` selects the file-based adapter regardless of provider.
+
+    Raises:
+        ValueError: If the provider has no batch API
+    """
+    if os.environ.get("BATCH_ADAPTER", "").lower() == "local":
+        return LocalFileAdapter()
+    if provider == 'openai':
+        return OpenAIBatchAdapter()
+    if provider == 'claude':
+        return AnthropicBatchAdapter()
+    raise ValueError(f"Batch mode supports the 'openai' and 'claude' providers, not '{provider}'")
+
+
+BATCH_ADAPTERS = {adapter.name: adapter for adapter in (OpenAIBatchAdapter, AnthropicBatchAdapter, LocalFileAdapter)}
+
+
+def adapter_for_state(state: Dict) -> BatchAdapter:
+    """
+    Return the adapter a run was submitted through, as recorded in its state.
+
+    Collection must poll the API that holds the batch, whatever
+    ``BATCH_ADAPTER`` is set to now.
+
+    Raises:
+        ValueError: If the state names an unknown adapter
+    """
+    name = state.get("adapter", state["provider"])
+    if name not in BATCH_ADAPTERS:
+        raise ValueError(f"Unknown batch adapter '{name}' for run {state['run_id']}")
+    return BATCH_ADAPTERS[name]()
+
+
+def run_state_path(run_id: str) -> str:
+    """Return the path of a batch run's state file."""
+    return os.path.join(batch_dir(), run_id, "state.json")
+
+
+def save_run_state(state: Dict) -> None:
+    """Write a batch run's state atomically."""
+    path = run_state_path(state["run_id"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_run_state(run_id: str) -> Dict:
+    """Load a batch run's state."""
+    with open(run_state_path(run_id), 'r') as f:
+        return json.load(f)
+
+
+def pending_runs() -> List[str]:
+    """Return the ids of saved batch runs that have not been collected, oldest first."""
+    root = batch_dir()
+    if not os.path.isdir(root):
+        return []
+    run_ids = []
+    for run_id in sorted(os.listdir(root)):
+        if os.path.exists(run_state_path(run_id)) and load_run_state(run_id)["status"] == PENDING:
+            run_ids.append(run_id)
+    return run_ids
+
+
+def submit_batch(prompt: str, provider: str, model: str, context: Dict,
+                 adapter: Optional[BatchAdapter] = None) -> Dict:
+    """
+    Write the analysis request as batch JSONL, submit it and save the run state.
+
+    Args:
+        prompt: The full analysis prompt
+        provider: 'openai' or 'claude'
+        model: Provider model id for the request
+        context: JSON-serialisable data needed to finish the report later
+            (newsletters, report options, model info)
+        adapter: Optional adapter (defaults to ``get_batch_adapter(provider)``)
+
+    Returns:
+        The saved run state dictionary
+    """
+    adapter = adapter or get_batch_adapter(provider)
+    run_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+    run_path = os.path.dirname(run_state_path(run_id))
+    os.makedirs(run_path, exist_ok=True)
+    requests_path = os.path.join(run_path, "requests.jsonl")
+    with open(requests_path, 'w') as f:
+        f.write(json.dumps(adapter.build_request("analysis", prompt, model)) + "\n")
+    state = {
+        "run_id": run_id,
+        "adapter": adapter.name,
+        "provider": provider,
+        "model": model,
+        "batch_id": adapter.submit(requests_path),
+        "requests_path": requests_path,
+        "status": PENDING,
+        "submitted_at": datetime.datetime.now().isoformat(),
+        "context": context,
+    }
+    save_run_state(state)
+    return state
+
+
+def collect_batch(state: Dict, adapter: Optional[BatchAdapter] = None) -> Optional[Dict]:
+    """
+    Poll a submitted batch and return its analysis result once it is ready.
+
+    A finished result is saved in the run state (``result``) and returned
+    from there on later calls without polling; the run stays pending until
+    ``complete_run`` records that its report was written. A failed batch
+    marks the run FAILED.
+
+    Args:
+        state: Run state from ``submit_batch`` or ``load_run_state``
+        adapter: Optional adapter (defaults to the one recorded in the state, see ``adapter_for_state``)
+
+    Returns:
+        ``{"content": str, "usage": dict}`` if the batch completed, otherwise None
+
+    Raises:
+        Exception: If the batch failed or returned no result for the analysis request
+    """
+    if state.get("result"):
+        return state["result"]
+    adapter = adapter or adapter_for_state(state)
+    status = adapter.status(state["batch_id"])
+    if status == PENDING:
+        return None
+    result = adapter.results(state["batch_id"]).get("analysis") if status == COMPLETED else None
+    state["collected_at"] = datetime.datetime.now().isoformat()
+    if result:
+        state["result"] = result
+    else:
+        state["status"] = FAILED
+    save_run_state(state)
+    if not result:
+        raise Exception(f"Batch {state['batch_id']} for run {state['run_id']} failed")
+    return result
+
+
+def complete_run(state: Dict) -> None:
+    """Mark a collected run COMPLETED once its report has been written."""
+    state["status"] = COMPLETED
+    state["completed_at"] = datetime.datetime.now().isoformat()
+    save_run_state(state)
@@ -0,0 +1,278 @@
+"""
+Performance benchmarks for the local pre-processing stages.
+
+Each benchmark builds a synthetic corpus, times the stage and prints a short
+summary. Run a single benchmark with e.g.:
+
+    python benchmarks.py dedup --blocks 10000
+"""
+
+import argparse
+import random
+import time
+
+
+def synthetic_words(rng, count, vocabulary_size=5000):
+    """Return ``count`` pseudo-words drawn from a fixed synthetic vocabulary."""
+    return [f"w{rng.randrange(vocabulary_size)}" for _ in range(count)]
+
+
+def perturb(rng, words, edit_rate=0.1):
+    """Return a copy of ``words`` with roughly ``edit_rate`` of them replaced."""
+    edited = list(words)
+    for _ in range(max(1, int(len(words) * edit_rate))):
+        edited[rng.randrange(len(edited))] = f"x{rng.randrange(1000)}"
+    return edited
+
+
+def benchmark_dedup(num_blocks=10000, duplicate_rate=0.2, words_per_block=80, seed=0):
+    """
+    Time MinHash signatures and LSH clustering over synthetic story blocks.
+
+    A share of the blocks (``duplicate_rate``) are lightly edited copies of an
+    earlier block, so the benchmark also reports how many of those planted
+    duplicates were recovered.
+    """
+    from dedup import shingle_hashes, minhash_signatures, cluster_signatures
+
+    rng = random.Random(seed)
+    blocks = []
+    planted = []
+    for i in range(num_blocks):
+        if blocks and rng.random() < duplicate_rate:
+            original = rng.randrange(len(blocks))
+            blocks.append(perturb(rng, blocks[original]))
+            planted.append((original, i))
+        else:
+            blocks.append(synthetic_words(rng, words_per_block))
+    texts = [" ".join(words) for words in blocks]
+
+    start = time.perf_counter()
+    shingles = [shingle_hashes(t) for t in texts]
+    shingled = time.perf_counter()
+    signatures = minhash_signatures(shingles)
+    signed = time.perf_counter()
+    clusters = cluster_signatures(signatures)
+    clustered = time.perf_counter()
+
+    cluster_of = {}
+    for cluster_id, members in enumerate(clusters):
+        for member in members:
+            cluster_of[member] = cluster_id
+    recovered = sum(1 for a, b in planted if cluster_of[a] == cluster_of[b])
+
+    print(f"Story blocks:        {num_blocks:,}")
+    print(f"Shingling:           {shingled - start:.3f}s")
+    print(f"MinHash signatures:  {signed - shingled:.3f}s")
+    print(f"LSH clustering:      {clustered - signed:.3f}s")
+    print(f"Total:               {clustered - start:.3f}s")
+    print(f"Clusters:            {len(clusters):,}")
+    print(f"Planted duplicates recovered: {recovered}/{len(planted)}")
+    return {
+        'blocks': num_blocks,
+        'seconds': clustered - start,
+        'clusters': len(clusters),
+        'planted': len(planted),
+        'recovered': recovered,
+    }
+
+
+def benchmark_prerank(num_newsletters=1000, blocks_per_newsletter=8, num_sources=60, shared_stories=200,
+                      budget_tokens=30000, seed=0):
+    """
+    Time TF-IDF pre-ranking over a synthetic newsletter corpus.
+
+    Newsletters mix unique filler blocks with lightly edited copies of a pool
+    of shared stories, so cross-source coverage scoring has real work to do.
+    """
+    from email.utils import format_datetime
+    import datetime
+    from ranking import rank_story_blocks, select_within_budget
+
+    rng = random.Random(seed)
+    stories = [synthetic_words(rng, 70) for _ in range(shared_stories)]
+    newest = datetime.datetime(2025, 1, 8, tzinfo=datetime.timezone.utc)
+    newsletters = []
+    for i in range(num_newsletters):
+        blocks = []
+        for _ in range(blocks_per_newsletter):
+            if rng.random() < 0.3:
+                blocks.append(" ".join(perturb(rng, rng.choice(stories))))
+            else:
+                blocks.append(" ".join(synthetic_words(rng, 70)))
+        sent = newest - datetime.timedelta(hours=rng.uniform(0, 24 * 7))
+        newsletters.append({
+            'content': "\n\n---\n\n".join(blocks),
+            'sender': f"Source {i % num_sources} <s{i % num_sources}@example.com>",
+            'date': format_datetime(sent),
+        })
+
+    start = time.perf_counter()
+    ranked = rank_story_blocks(newsletters)
+    ranked_at = time.perf_counter()
+    selected = select_within_budget(ranked, budget_tokens)
+    selected_at = time.perf_counter()
+
+    print(f"Newsletters:         {num_newsletters:,}")
+    print(f"Story blocks:        {len(ranked):,}")
+    print(f"TF-IDF + scoring:    {ranked_at - start:.3f}s")
+    print(f"Budget selection:    {selected_at - ranked_at:.3f}s")
+    print(f"Total:               {selected_at - start:.3f}s")
+    print(f"Blocks selected:     {len(selected):,} (budget {budget_tokens:,} tokens)")
+    return {
+        'newsletters': num_newsletters,
+        'blocks': len(ranked),
+        'seconds': selected_at - start,
+        'selected': len(selected),
+    }
+
+
+def benchmark_report(num_newsletters=10000, num_senders=500, steps=4, seed=0):
+    """
+    Time report generation at growing corpus sizes to check it scales linearly.
+
+    The report is built ``steps`` times, at ``num_newsletters / steps``,
+    ``2 * num_newsletters / steps`` ... newsletters, and the time per
+    newsletter is printed for each size; with linear scaling it stays flat.
+    Runs in a temporary directory so the website cache is not touched.
+    """
+    from email.utils import format_datetime
+    import datetime
+    import os
+    import tempfile
+    from report import generate_report
+
+    rng = random.Random(seed)
+    newest = datetime.datetime(2025, 1, 8, tzinfo=datetime.timezone.utc)
+    newsletters = []
+    for i in range(num_newsletters):
+        sender = rng.randrange(num_senders)
+        sent = newest - datetime.timedelta(hours=rng.uniform(0, 24 * 7))
+        newsletters.append({
+            'subject': f"Issue {i}: " + " ".join(synthetic_words(rng, 6)),
+            'sender': f"Source {sender} <news@source{sender}.example.com>",
+            'date': format_datetime(sent),
+            'body': f"Read online at https://source{sender}.example.com/ " + " ".join(synthetic_words(rng, 200)),
+        })
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            for step in range(1, steps + 1):
+                size = num_newsletters * step // steps
+                start = time.perf_counter()
+                generate_report(newsletters[:size], [], "Analysis", 7)
+                elapsed = time.perf_counter() - start
+                results.append({'newsletters': size, 'seconds': elapsed})
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'Newsletters':>12} {'Seconds':>9} {'us/newsletter':>14}")
+    for result in results:
+        per_item = result['seconds'] / result['newsletters'] * 1e6
+        print(f"{result['newsletters']:>12,} {result['seconds']:>9.3f} {per_item:>14.1f}")
+    first, last = results[0], results[-1]
+    growth = (last['seconds'] / first['seconds']) / (last['newsletters'] / first['newsletters'])
+    print(f"Time growth relative to input growth: {growth:.2f} (1.0 = linear)")
+    return {'sizes': results, 'growth': growth}
+
+
+def benchmark_breaking_news(num_newsletters=20000, num_senders=300, shared_stories=500, seed=0):
+    """
+    Time breaking-news detection on a synthetic corpus from one busy day.
+
+    Subjects mix unique headlines with lightly edited copies of a pool of
+    shared stories (relayed by several senders), and some carry breaking-news
+    indicators. The indicator scan is timed against the previous approach (a
+    substring test per indicator on the lowercased text) with the shipped
+    indicator list and with 240 more, then the whole detection (scan,
+    subject merging and ranking) is timed.
+    """
+    from email.utils import format_datetime
+    import datetime
+    from breaking_news import BREAKING_NEWS_INDICATORS, KeywordMatcher, detect_breaking_news, lead_paragraph
+
+    rng = random.Random(seed)
+    stories = [synthetic_words(rng, 8) for _ in range(shared_stories)]
+    newest = datetime.datetime(2025, 1, 8, tzinfo=datetime.timezone.utc)
+    newsletters = []
+    for i in range(num_newsletters):
+        words = perturb(rng, rng.choice(stories)) if rng.random() < 0.4 else synthetic_words(rng, 8)
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words)), rng.choice(BREAKING_NEWS_INDICATORS))
+        sender = rng.randrange(num_senders)
+        sent = newest - datetime.timedelta(hours=rng.uniform(0, 24))
+        newsletters.append({
+            'subject': f"Source {sender}: " + " ".join(words),
+            'sender': f"Source {sender} <news@source{sender}.example.com>",
+            'date': format_datetime(sent),
+            'body': "<p>" + " ".join(synthetic_words(rng, 60)) + "</p><p>" + " ".join(synthetic_words(rng, 200)) + "</p>",
+        })
+    texts = [f"{nl['subject']}\n{lead_paragraph(nl['body'])}" for nl in newsletters]
+
+    # The indicator scan at the shipped list size and with many more indicators
+    scans = []
+    for extra in (0, 240):
+        indicators = BREAKING_NEWS_INDICATORS + [" ".join(synthetic_words(rng, 2)) for _ in range(extra)]
+        matcher = KeywordMatcher(indicators)
+        start = time.perf_counter()
+        naive = [[k for k in indicators if k in text.lower()] for text in texts]
+        naive_at = time.perf_counter()
+        matched = [matcher.find(text) for text in texts]
+        matched_at = time.perf_counter()
+        scans.append((len(indicators), naive_at - start, matched_at - naive_at,
+                      sum(1 for found in matched if found)))
+    start = time.perf_counter()
+    items = detect_breaking_news(newsletters, max_items=None)
+    detected_at = time.perf_counter()
+
+    print(f"Newsletters:           {num_newsletters:,}")
+    print(f"{'Indicators':>10} {'Substring scan':>15} {'Aho-Corasick':>13} {'Matched':>8}")
+    for count, naive_seconds, matcher_seconds, hits in scans:
+        print(f"{count:>10} {naive_seconds:>14.3f}s {matcher_seconds:>12.3f}s {hits:>8,}")
+    print(f"Full detection:        {detected_at - start:.3f}s")
+    print(f"Items after merging:   {len(items):,} (top item from {len(items[0]['sources'])} sources)")
+    return {
+        'newsletters': num_newsletters,
+        'scans': scans,
+        'seconds': detected_at - start,
+        'items': len(items),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run performance benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    dedup_parser = subparsers.add_parser("dedup", help="MinHash/LSH story deduplication")
+    dedup_parser.add_argument("--blocks", type=int, default=10000, help="Number of story blocks")
+    dedup_parser.add_argument("--duplicate-rate", type=float, default=0.2,
+                              help="Share of blocks that are near-duplicates")
+
+    prerank_parser = subparsers.add_parser("prerank", help="TF-IDF story pre-ranking")
+    prerank_parser.add_argument("--newsletters", type=int, default=1000, help="Number of newsletters")
+    prerank_parser.add_argument("--budget", type=int, default=30000, help="Prompt budget in tokens")
+
+    report_parser = subparsers.add_parser("report", help="Report generation scaling")
+    report_parser.add_argument("--newsletters", type=int, default=10000, help="Largest number of newsletters")
+    report_parser.add_argument("--senders", type=int, default=500, help="Number of distinct senders")
+
+    breaking_parser = subparsers.add_parser("breaking-news", help="Breaking-news detection")
+    breaking_parser.add_argument("--newsletters", type=int, default=20000, help="Number of newsletters")
+    breaking_parser.add_argument("--senders", type=int, default=300, help="Number of distinct senders")
+
+    args = parser.parse_args()
+    if args.benchmark == "dedup":
+        benchmark_dedup(num_blocks=args.blocks, duplicate_rate=args.duplicate_rate)
+    elif args.benchmark == "prerank":
+        benchmark_prerank(num_newsletters=args.newsletters, budget_tokens=args.budget)
+    elif args.benchmark == "report":
+        benchmark_report(num_newsletters=args.newsletters, num_senders=args.senders)
+    elif args.benchmark == "breaking-news":
+        benchmark_breaking_news(num_newsletters=args.newsletters, num_senders=args.senders)
+
+
+if __name__ == "__main__":
+    main()
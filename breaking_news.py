@@ -0,0 +1,190 @@
+"""
+Breaking-news detection for the report's "just in" section.
+
+Newsletters sent within ``window_hours`` of the newest one are candidates.
+Each candidate's subject and lead paragraph are scanned for the breaking-news
+indicators ("announces", "just in", ...) in a single pass with an
+Aho-Corasick automaton over words, so the cost per newsletter depends on its
+length and not on the number of indicators, and indicators only match whole
+words ("launches" does not match "relaunches").
+
+Near-identical subjects (e.g. the same announcement relayed by several
+newsletters) are merged with the MinHash/LSH clustering from ``dedup.py``.
+Each merged item is ranked by how many distinct sources corroborate it, by
+whether an indicator matched and by how recent its newest copy is; only the
+top ``max_items`` are kept, so busy days do not flood the section.
+
+``python benchmarks.py breaking-news`` times detection on a synthetic corpus.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from dedup import cluster_signatures, minhash_signatures, sender_name, shingle_hashes
+from timeline import Timeline
+
+BREAKING_NEWS_INDICATORS = ['breaking', 'just in', 'just announced', 'new release',
+                            'launches', 'launched', 'announces', 'announced',
+                            'releases', 'released', 'introduces', 'introduced',
+                            'unveils', 'unveiled', 'debuts', 'just now']
+
+DEFAULT_WINDOW_HOURS = 24
+DEFAULT_MAX_ITEMS = 10
+# Minimum estimated Jaccard similarity of subject words to merge two items
+SUBJECT_SIMILARITY = 0.6
+LEAD_CHARS = 400
+# Score weights: per corroborating source, for an indicator match, and for
+# recency (1 for the newest newsletter, falling to 0 at the window's edge)
+SOURCE_WEIGHT = 1.0
+INDICATOR_WEIGHT = 1.0
+RECENCY_WEIGHT = 1.0
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_TAG_RE = re.compile(r'<(script|style)\b.*?</\1>|<[^>]+>', re.DOTALL | re.IGNORECASE)
+_PARAGRAPH_RE = re.compile(r'\n\s*\n|</p>|<br\s*/?>\s*<br\s*/?>', re.IGNORECASE)
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton matching many keyword phrases in one pass over a text's words."""
+
+    def __init__(self, keywords: Iterable[str]):
+        """
+        Args:
+            keywords: Keyword phrases; matching is case-insensitive and on whole words
+        """
+        # State 0 is the root; goto[state] maps a word to the next state
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+        for keyword in keywords:
+            words = _WORD_RE.findall(keyword.lower())
+            if not words:
+                continue
+            state = 0
+            for word in words:
+                if word not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][word] = len(self.goto) - 1
+                state = self.goto[state][word]
+            if keyword not in self.output[state]:
+                self.output[state].append(keyword)
+        # Breadth-first, so every state's failure target is final before its children need it
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text: str) -> List[str]:
+        """Return every keyword occurrence in a text, in order of where it ends."""
+        goto, fail, output = self.goto, self.fail, self.output
+        root = goto[0]
+        words = _WORD_RE.findall(text.lower())
+        if root.keys().isdisjoint(words):
+            # Most texts contain no word that starts a keyword
+            return []
+        found = []
+        state = 0
+        for word in words:
+            if state == 0:
+                # Fast path: most words do not start any keyword
+                state = root.get(word, 0)
+            else:
+                while state and word not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(word, 0)
+            if output[state]:
+                found.extend(output[state])
+        return found
+
+    def matches(self, text: str) -> Set[str]:
+        """Return the set of keywords occurring in a text."""
+        return set(self.find(text))
+
+
+DEFAULT_MATCHER = KeywordMatcher(BREAKING_NEWS_INDICATORS)
+
+
+def clean_subject(subject: str) -> str:
+    """Strip a leading ``[Tag]`` and a ``Newsletter Name:`` prefix from a subject."""
+    subject = re.sub(r'^\[.*?\]', '', subject).strip()
+    return re.sub(r'^.*?:', '', subject).strip()
+
+
+def lead_paragraph(body: str, max_chars: int = LEAD_CHARS) -> str:
+    """Return the first paragraph of text in a (HTML or plain text) body, cut to ``max_chars``."""
+    # Only the start of the body is looked at, so long newsletters cost the same
+    head = body[:max_chars * 8]
+    for paragraph in _PARAGRAPH_RE.split(head):
+        text = ' '.join(_TAG_RE.sub(' ', paragraph).split())
+        if text:
+            return text[:max_chars]
+    return ''
+
+
+def detect_breaking_news(newsletters: Sequence[Dict], timeline: Optional[Timeline] = None,
+                         window_hours: float = DEFAULT_WINDOW_HOURS, max_items: Optional[int] = DEFAULT_MAX_ITEMS,
+                         matcher: KeywordMatcher = DEFAULT_MATCHER,
+                         similarity: float = SUBJECT_SIMILARITY) -> List[Dict]:
+    """
+    Select, merge and rank the breaking-news items of a run.
+
+    Args:
+        newsletters: Newsletter dictionaries with ``subject``, ``sender``, ``body`` and a date
+        timeline: Timeline of the newsletters (built if None)
+        window_hours: Newsletters sent within this many hours of the newest one are candidates
+        max_items: Maximum number of items returned (None for all)
+        matcher: Indicator matcher
+        similarity: Minimum subject similarity to merge two newsletters into one item
+
+    Returns:
+        Items, highest score first, with keys ``subject`` (cleaned), ``sender``
+        (corroborating source names joined with commas), ``sources``,
+        ``highlight`` (an indicator matched), ``indicators``, ``timestamp``
+        (newest copy) and ``score``
+    """
+    if timeline is None:
+        timeline = Timeline(newsletters)
+    candidates = timeline.recent(hours=window_hours)
+    if not candidates:
+        return []
+    newest = max(timeline.timestamps[i] for i in candidates)
+    subjects = [clean_subject(newsletters[i].get('subject', '')) for i in candidates]
+    signatures = minhash_signatures([shingle_hashes(subject, k=1) for subject in subjects])
+    items = []
+    for members in cluster_signatures(signatures, threshold=similarity):
+        sources = []
+        indicators = []
+        for m in members:
+            nl = newsletters[candidates[m]]
+            name = sender_name(nl.get('sender', ''))
+            if name not in sources:
+                sources.append(name)
+            for keyword in matcher.find(f"{nl.get('subject', '')}\n{lead_paragraph(nl.get('body', ''))}"):
+                if keyword not in indicators:
+                    indicators.append(keyword)
+        timestamps = [timeline.timestamps[candidates[m]] for m in members]
+        latest = max(range(len(members)), key=lambda k: (timestamps[k], -k))
+        recency = 1 - (newest - timestamps[latest]) / (window_hours * 3600) if window_hours else 1.0
+        score = (SOURCE_WEIGHT * len(sources) + INDICATOR_WEIGHT * bool(indicators)
+                 + RECENCY_WEIGHT * max(0.0, recency))
+        items.append({
+            "subject": subjects[members[latest]],
+            "sender": ", ".join(sources),
+            "sources": sources,
+            "highlight": bool(indicators),
+            "indicators": indicators,
+            "timestamp": timestamps[latest],
+            "score": round(score, 4),
+            "_order": members[0],
+        })
+    items.sort(key=lambda item: (-item["score"], item["_order"]))
+    for item in items:
+        del item["_order"]
+    return items if max_items is None else items[:max_items]
@@ -0,0 +1,229 @@
+"""
+Pre-call cost estimation and budget enforcement.
+
+Before the analysis runs, the prompt's tokens are estimated locally and
+priced with the model table (``model_catalog.py``). The estimate is checked
+against up to three limits:
+
+- ``--max-cost``: the most this run may spend
+- ``--daily-budget``: spend over the last 24 hours, from the cost log
+- ``--monthly-budget``: spend over the last 30 days, from the cost log
+
+If the estimate does not fit, the run either aborts or is downgraded: first
+to the best affordable model in the table (OpenRouter only, never below the
+requested quality tier), then by trimming the newsletter content to a token
+budget the current model can afford. Each LLM call of the run then reserves
+its estimated cost, so chunked and two-step runs stop before a call that
+would cross the limit.
+"""
+
+import datetime
+import threading
+from typing import Callable, Dict, Optional
+
+from cost_log import iter_entries
+from model_catalog import (
+    OUTPUT_TOKENS_PER_TOPIC,
+    estimate_tokens,
+    fits_context,
+    load_model_table,
+    model_price
+)
+
+ABORT = "abort"
+DOWNGRADE = "downgrade"
+
+# Prompt instructions and newsletter headers around the content, in tokens
+PROMPT_OVERHEAD_TOKENS = 1500
+# Below this content budget a trimmed report is not worth producing
+MIN_CONTENT_TOKENS = 2000
+
+
+class BudgetExceeded(Exception):
+    """Raised when a call would exceed the run, daily or monthly budget."""
+    pass
+
+
+def spent_since(cutoff: datetime.datetime, path: Optional[str] = None) -> float:
+    """Return the total cost logged since ``cutoff``, streaming the cost log."""
+    cutoff_iso = cutoff.isoformat()
+    return sum(entry.get('cost') or 0 for entry in iter_entries(path) if entry.get('timestamp', '') >= cutoff_iso)
+
+
+def estimate_call(prompt: str, model: str, num_topics: int = 10, table: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    Estimate the cost of sending a prompt to a model.
+
+    Args:
+        prompt: The full prompt
+        model: Model id (OpenRouter or direct)
+        num_topics: Number of topics requested, used to reserve output tokens
+        table: Optional model table (defaults to ``load_model_table()``)
+
+    Returns:
+        Dictionary with ``model``, ``input_tokens``, ``output_tokens``,
+        ``cost`` and ``priced`` (False if the model had no known price)
+    """
+    price = model_price(model, table)
+    input_tokens = estimate_tokens(prompt)
+    output_tokens = max(1, num_topics) * OUTPUT_TOKENS_PER_TOPIC
+    cost = (input_tokens * price["input_price"] + output_tokens * price["output_price"]) / 1_000_000
+    return {
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost": round(cost, 6),
+        "priced": price["known"],
+    }
+
+
+class Budget:
+    """Spending limits for one run, with thread-safe per-call reservations."""
+
+    def __init__(self, max_cost: Optional[float] = None, daily_limit: Optional[float] = None,
+                 monthly_limit: Optional[float] = None, action: str = DOWNGRADE,
+                 spent_day: Optional[float] = None, spent_month: Optional[float] = None):
+        """
+        Args:
+            max_cost: Maximum spend for this run in USD
+            daily_limit: Maximum spend over the last 24 hours in USD
+            monthly_limit: Maximum spend over the last 30 days in USD
+            action: ``DOWNGRADE`` or ``ABORT`` when the analysis would not fit
+            spent_day, spent_month: Prior spend; read from the cost log when
+                the matching limit is set and no value is given
+        """
+        now = datetime.datetime.now()
+        self.max_cost = max_cost
+        self.daily_limit = daily_limit
+        self.monthly_limit = monthly_limit
+        self.action = action
+        if spent_day is None and daily_limit is not None:
+            spent_day = spent_since(now - datetime.timedelta(days=1))
+        if spent_month is None and monthly_limit is not None:
+            spent_month = spent_since(now - datetime.timedelta(days=30))
+        self.spent_day = spent_day or 0.0
+        self.spent_month = spent_month or 0.0
+        self.committed = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """True if any limit is set."""
+        return any(limit is not None for limit in (self.max_cost, self.daily_limit, self.monthly_limit))
+
+    def remaining(self) -> Optional[float]:
+        """Return the amount still available under the tightest limit, or None without limits."""
+        available = []
+        if self.max_cost is not None:
+            available.append(self.max_cost - self.committed)
+        if self.daily_limit is not None:
+            available.append(self.daily_limit - self.spent_day - self.committed)
+        if self.monthly_limit is not None:
+            available.append(self.monthly_limit - self.spent_month - self.committed)
+        return min(available) if available else None
+
+    def describe(self) -> str:
+        """Return a short description of the configured limits and prior spend."""
+        parts = []
+        if self.max_cost is not None:
+            parts.append(f"run ${self.max_cost:.2f}")
+        if self.daily_limit is not None:
+            parts.append(f"daily ${self.spent_day:.2f}/${self.daily_limit:.2f}")
+        if self.monthly_limit is not None:
+            parts.append(f"monthly ${self.spent_month:.2f}/${self.monthly_limit:.2f}")
+        return ", ".join(parts)
+
+    def reserve(self, estimate: Dict, what: str = "LLM call") -> None:
+        """
+        Reserve the estimated cost of a call.
+
+        Raises:
+            BudgetExceeded: If the call does not fit in the remaining budget
+        """
+        with self._lock:
+            remaining = self.remaining()
+            if remaining is not None and estimate["cost"] > remaining:
+                raise BudgetExceeded(
+                    f"{what} on {estimate['model']} is estimated at ${estimate['cost']:.4f} but only "
+                    f"${max(0.0, remaining):.4f} of the budget is left ({self.describe()})"
+                )
+            self.committed += estimate["cost"]
+
+
+def plan_within_budget(budget: Budget, prompt: str, model: str, num_topics: int = 10,
+                       rebuild_prompt: Optional[Callable[[int], str]] = None, can_switch_model: bool = True,
+                       min_tier: int = 1, table: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    Check the analysis against the budget and downgrade it if needed.
+
+    Args:
+        budget: The run's budget
+        prompt: The analysis prompt
+        model: Model the prompt would be sent to
+        num_topics: Number of topics requested
+        rebuild_prompt: Optional function returning the prompt rebuilt with a
+            newsletter content token budget; enables content trimming
+        can_switch_model: Whether another model from the table may be used
+            (only OpenRouter calls can switch)
+        min_tier: Lowest model quality tier a downgrade may pick
+        table: Optional model table (defaults to ``load_model_table()``)
+
+    Returns:
+        Dictionary with ``prompt``, ``model``, ``action`` ('within_budget',
+        'downgraded_model' or 'trimmed_content'), ``estimate``,
+        ``original_model``, ``original_cost`` and ``remaining``
+
+    Raises:
+        BudgetExceeded: If the analysis cannot fit, or the action is ``ABORT``
+    """
+    table = table if table is not None else load_model_table()
+    estimate = estimate_call(prompt, model, num_topics, table)
+    remaining = budget.remaining()
+    plan = {
+        "prompt": prompt,
+        "model": model,
+        "action": "within_budget",
+        "estimate": estimate,
+        "original_model": model,
+        "original_cost": estimate["cost"],
+        "remaining": remaining,
+    }
+    if not estimate["priced"]:
+        print(f"No price known for {model}; estimating with the highest configured prices")
+    if remaining is None or estimate["cost"] <= remaining:
+        return plan
+
+    message = (f"Estimated cost ${estimate['cost']:.4f} on {model} exceeds the remaining budget "
+               f"${max(0.0, remaining):.4f} ({budget.describe()})")
+    if budget.action == ABORT:
+        raise BudgetExceeded(message)
+    print(message)
+
+    if can_switch_model:
+        affordable = []
+        for candidate, entry in table.items():
+            if entry["tier"] < min_tier or not fits_context(entry, estimate["input_tokens"], estimate["output_tokens"]):
+                continue
+            candidate_estimate = estimate_call(prompt, candidate, num_topics, table)
+            if candidate_estimate["cost"] <= remaining:
+                affordable.append((-entry["tier"], candidate_estimate["cost"], candidate, candidate_estimate))
+        if affordable:
+            _, _, candidate, candidate_estimate = min(affordable)
+            print(f"Downgrading to {candidate} (estimated ${candidate_estimate['cost']:.4f}) to stay within budget")
+            return dict(plan, model=candidate, action="downgraded_model", estimate=candidate_estimate)
+
+    if rebuild_prompt is not None:
+        price = model_price(model, table)
+        output_cost = estimate["output_tokens"] * price["output_price"] / 1_000_000
+        affordable_input = int((remaining - output_cost) * 1_000_000 / price["input_price"]) if price["input_price"] else 0
+        content_tokens = affordable_input - PROMPT_OVERHEAD_TOKENS
+        if content_tokens >= MIN_CONTENT_TOKENS:
+            trimmed = rebuild_prompt(content_tokens)
+            trimmed_estimate = estimate_call(trimmed, model, num_topics, table)
+            if trimmed_estimate["cost"] <= remaining:
+                print(f"Trimming newsletter content to ~{content_tokens:,} tokens "
+                      f"(estimated ${trimmed_estimate['cost']:.4f}) to stay within budget")
+                return dict(plan, prompt=trimmed, action="trimmed_content", estimate=trimmed_estimate,
+                            content_tokens=content_tokens)
+
+    raise BudgetExceeded(message + "; no cheaper model or smaller prompt fits")
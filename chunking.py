@@ -0,0 +1,135 @@
+"""
+Context-window guard and chunk planning for oversized prompts.
+
+Before the analysis call, the prompt size is estimated locally and compared
+with the chosen model's context window from ``model_catalog``. When the
+prompt does not fit, newsletters are split into balanced chunks (whole
+newsletters only, never cutting one in half), each chunk is analyzed on its
+own and a final merge pass combines the partial topic lists. This replaces
+OpenRouter's lossy "middle-out" transform, which silently drops the middle
+of an oversized prompt.
+"""
+
+import math
+from typing import Dict, List, Optional
+
+from model_catalog import (
+    CONTEXT_SAFETY_MARGIN,
+    OUTPUT_TOKENS_PER_TOPIC,
+    context_window,
+    estimate_tokens
+)
+
+MAX_CHUNK_WORKERS = 4
+
+MERGE_PROMPT = """
+Below are {num_partials} partial analyses. Each one covers a different subset of this period's AI newsletters,
+because the full set was too large to analyze in one request.
+
+Merge them into the {num_topics} most significant and distinct topics overall:
+- Combine topics that describe the same development and credit all of their sources
+- A development covered in several partial analyses is more important than one covered in only one
+- Sort topics by importance (most important first)
+- Keep the same fields for each topic: headline, what's new, why it matters, practical impact and sources
+- Keep every relevant link from the partial analyses
+
+{output_format}
+{partials}
+"""
+
+
+def check_context(prompt: str, model: str, num_topics: int = 10,
+                  table: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    Pre-flight check of a prompt against a model's context window.
+
+    Args:
+        prompt: The full prompt that would be sent
+        model: Model id (OpenRouter or direct)
+        num_topics: Number of topics requested, used to reserve output tokens
+        table: Optional model table (defaults to ``load_model_table()``)
+
+    Returns:
+        Dictionary with ``model``, ``context_window``, ``estimated_input_tokens``,
+        ``reserved_output_tokens``, ``max_input_tokens`` and ``fits``
+    """
+    window = context_window(model, table)
+    input_tokens = estimate_tokens(prompt)
+    output_tokens = num_topics * OUTPUT_TOKENS_PER_TOPIC
+    max_input = int(window * (1 - CONTEXT_SAFETY_MARGIN)) - output_tokens
+    return {
+        "model": model,
+        "context_window": window,
+        "estimated_input_tokens": input_tokens,
+        "reserved_output_tokens": output_tokens,
+        "max_input_tokens": max_input,
+        "fits": input_tokens <= max_input,
+    }
+
+
+def partition_balanced(sizes: List[int], num_chunks: int) -> List[List[int]]:
+    """
+    Split items into ``num_chunks`` groups with roughly equal total size.
+
+    Uses longest-processing-time-first assignment: items are taken largest
+    first and each goes to the currently lightest group. Indices within each
+    group are returned in their original order.
+
+    Args:
+        sizes: Size (e.g. estimated tokens) of each item
+        num_chunks: Number of groups to create
+
+    Returns:
+        List of index lists, one per non-empty group
+    """
+    num_chunks = max(1, min(num_chunks, len(sizes)))
+    groups = [[] for _ in range(num_chunks)]
+    loads = [0] * num_chunks
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        target = loads.index(min(loads))
+        groups[target].append(index)
+        loads[target] += sizes[index]
+    return [sorted(group) for group in groups if group]
+
+
+def plan_chunks(sizes: List[int], overhead_tokens: int, max_input_tokens: int) -> List[List[int]]:
+    """
+    Choose the smallest number of balanced chunks whose prompts fit the limit.
+
+    Args:
+        sizes: Estimated tokens of each newsletter's content block
+        overhead_tokens: Tokens of the prompt around the newsletter content
+        max_input_tokens: Input token limit per request
+
+    Returns:
+        List of index lists, one per chunk
+
+    Raises:
+        ValueError: If a single newsletter does not fit the limit on its own
+    """
+    budget = max_input_tokens - overhead_tokens
+    if not sizes:
+        return []
+    if max(sizes) > budget:
+        raise ValueError(
+            f"A single newsletter (~{max(sizes)} tokens) does not fit the {budget}-token content budget"
+        )
+    num_chunks = max(1, math.ceil(sum(sizes) / budget))
+    while True:
+        groups = partition_balanced(sizes, num_chunks)
+        if all(sum(sizes[i] for i in group) <= budget for group in groups):
+            return groups
+        num_chunks += 1
+
+
+def build_merge_prompt(partials: List[str], num_topics: int, output_format: str) -> str:
+    """Build the prompt that merges partial chunk analyses into the final topic list."""
+    sections = "\n".join(
+        f"PARTIAL ANALYSIS #{i}\n{partial.strip()}\n" for i, partial in enumerate(partials, 1)
+    )
+    return MERGE_PROMPT.format(
+        num_partials=len(partials),
+        num_topics=num_topics,
+        output_format=output_format,
+        partials=sections,
+    )
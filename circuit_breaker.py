@@ -0,0 +1,231 @@
+"""
+Per-provider circuit breakers with health state persisted between runs.
+
+Each provider/model pair (e.g. ``openrouter:openai/gpt-4.1-mini``) gets a
+breaker that tracks recent outcomes and latencies. After repeated failures
+the breaker opens and callers skip that provider immediately instead of
+waiting on its timeouts. The state is saved to a small JSON file
+(``LLM_HEALTH_STATE``, default ``llm_health.json``) so the next scheduled run
+starts with the same knowledge. A run creates one ``HealthStore`` and passes
+it to every call; saves hold the file's lock and merge this process's
+changed breakers into the state on disk, so concurrent runs keep each
+other's updates. An open breaker half-opens on a schedule
+(exponential backoff) to let a single probe request test for recovery.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from file_lock import locked, write_atomic
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+WINDOW_SIZE = 20
+FAILURE_THRESHOLD = 3            # consecutive failures that open the breaker
+ERROR_RATE_THRESHOLD = 0.5       # error rate over the window that opens the breaker
+MIN_CALLS_FOR_RATE = 10
+SLOW_CALL_SECONDS = 180.0        # successful calls slower than this are counted as slow, not failed
+BASE_COOLDOWN = 60.0             # seconds before the first half-open probe
+MAX_COOLDOWN = 3600.0
+PROBE_TIMEOUT = 600.0            # a probe older than this is assumed lost
+
+
+class CircuitBreaker:
+    """Health state of one provider/model pair."""
+
+    def __init__(self, key: str, state: Optional[Dict] = None):
+        state = state or {}
+        self.key = key
+        self.state = state.get("state", CLOSED)
+        self.outcomes = list(state.get("outcomes", []))[-WINDOW_SIZE:]
+        self.latencies = list(state.get("latencies", []))[-WINDOW_SIZE:]
+        self.consecutive_failures = state.get("consecutive_failures", 0)
+        self.open_count = state.get("open_count", 0)
+        self.opened_at = state.get("opened_at")
+        self.next_probe_at = state.get("next_probe_at")
+        self.probe_started_at = state.get("probe_started_at")
+        self.last_error = state.get("last_error")
+
+    def to_dict(self) -> Dict:
+        """Return the persisted representation of the breaker."""
+        return {
+            "state": self.state,
+            "outcomes": self.outcomes,
+            "latencies": self.latencies,
+            "consecutive_failures": self.consecutive_failures,
+            "open_count": self.open_count,
+            "opened_at": self.opened_at,
+            "next_probe_at": self.next_probe_at,
+            "probe_started_at": self.probe_started_at,
+            "last_error": self.last_error,
+        }
+
+    @property
+    def error_rate(self) -> float:
+        """Share of failed calls in the recent window."""
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(0) / len(self.outcomes)
+
+    @property
+    def slow_calls(self) -> int:
+        """Number of successful calls in the recent window slower than ``SLOW_CALL_SECONDS``."""
+        return sum(1 for latency in self.latencies if latency > SLOW_CALL_SECONDS)
+
+    def allow_request(self, now: Optional[float] = None) -> bool:
+        """
+        Return True if a call to this provider should be attempted.
+
+        A closed breaker always allows calls. An open breaker allows nothing
+        until its next probe time, then moves to half-open and allows exactly
+        one probe; further calls are refused until the probe reports back.
+        """
+        now = now if now is not None else time.time()
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if self.next_probe_at is not None and now >= self.next_probe_at:
+                self.state = HALF_OPEN
+                self.probe_started_at = now
+                return True
+            return False
+        # Half-open: only one probe at a time, unless the last one was lost
+        if self.probe_started_at is None or now - self.probe_started_at > PROBE_TIMEOUT:
+            self.probe_started_at = now
+            return True
+        return False
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        """
+        Record a successful call.
+
+        A slow success still counts as a success: long prompts legitimately
+        take minutes, so latency alone never opens the breaker. Slow calls
+        are tracked separately through ``slow_calls``.
+        """
+        if latency is not None:
+            self.latencies = (self.latencies + [round(latency, 3)])[-WINDOW_SIZE:]
+        self.outcomes = (self.outcomes + [1])[-WINDOW_SIZE:]
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self.open_count = 0
+            self.opened_at = None
+            self.next_probe_at = None
+            self.probe_started_at = None
+
+    def record_failure(self, error: Optional[str] = None, now: Optional[float] = None) -> None:
+        """Record a failed call and open the breaker if thresholds are crossed."""
+        now = now if now is not None else time.time()
+        self.outcomes = (self.outcomes + [0])[-WINDOW_SIZE:]
+        self.consecutive_failures += 1
+        self.last_error = (error or "")[:200] or None
+        should_open = (
+            self.state == HALF_OPEN
+            or self.consecutive_failures >= FAILURE_THRESHOLD
+            or (len(self.outcomes) >= MIN_CALLS_FOR_RATE and self.error_rate >= ERROR_RATE_THRESHOLD)
+        )
+        if should_open:
+            self.trip(now)
+
+    def trip(self, now: float) -> None:
+        """Open the breaker and schedule the next half-open probe."""
+        self.state = OPEN
+        self.opened_at = now
+        self.probe_started_at = None
+        cooldown = min(MAX_COOLDOWN, BASE_COOLDOWN * (2 ** self.open_count))
+        self.open_count += 1
+        self.next_probe_at = now + cooldown
+
+
+class HealthStore:
+    """Collection of circuit breakers backed by a JSON state file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("LLM_HEALTH_STATE", "llm_health.json")
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # Breakers changed since the last save; only these overwrite the state on disk
+        self._dirty = set()
+        for key, state in self._read().items():
+            self._breakers[key] = CircuitBreaker(key, state)
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        """Return the breaker for a provider key, creating it if needed."""
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(key)
+            return self._breakers[key]
+
+    def allow(self, key: str) -> bool:
+        """Return True if the provider may be called, persisting any state change."""
+        with self._lock:
+            breaker = self._breakers.setdefault(key, CircuitBreaker(key))
+            before = breaker.state, breaker.probe_started_at
+            allowed = breaker.allow_request()
+            changed = (breaker.state, breaker.probe_started_at) != before
+            if changed:
+                self._dirty.add(key)
+        if not allowed:
+            print(f"Circuit open for {key}, skipping (next probe in "
+                  f"{max(0, (breaker.next_probe_at or 0) - time.time()):.0f}s)")
+        if changed:
+            self.save()
+        return allowed
+
+    def record_success(self, key: str, latency: Optional[float] = None) -> None:
+        """Record a successful call and persist the state."""
+        with self._lock:
+            breaker = self._breakers.setdefault(key, CircuitBreaker(key))
+            breaker.record_success(latency)
+            self._dirty.add(key)
+        if latency is not None and latency > SLOW_CALL_SECONDS:
+            print(f"Slow call to {key} ({latency:.0f}s; {breaker.slow_calls} of the last "
+                  f"{len(breaker.latencies)} calls were slow)")
+        self.save()
+
+    def record_failure(self, key: str, error: Optional[str] = None) -> None:
+        """Record a failed call and persist the state."""
+        with self._lock:
+            breaker = self._breakers.setdefault(key, CircuitBreaker(key))
+            breaker.record_failure(error)
+            self._dirty.add(key)
+            if breaker.state == OPEN:
+                print(f"Circuit opened for {key} after {breaker.consecutive_failures} failure(s)")
+        self.save()
+
+    def save(self) -> None:
+        """
+        Merge the changed breakers into the state file and write it atomically.
+
+        Breakers this store has not changed take the state on disk, so updates
+        from other runs are kept and picked up.
+        """
+        try:
+            with locked(self.path):
+                data = self._read()
+                with self._lock:
+                    for key in self._dirty:
+                        data[key] = self._breakers[key].to_dict()
+                    for key, state in data.items():
+                        if key not in self._dirty:
+                            self._breakers[key] = CircuitBreaker(key, state)
+                    self._dirty.clear()
+                write_atomic(self.path, json.dumps(data, indent=2))
+        except OSError as e:
+            print(f"Warning: could not save provider health state: {str(e)}")
@@ -0,0 +1,133 @@
+"""
+Process-wide registry of API clients.
+
+Every ``openai.OpenAI`` or ``anthropic.Anthropic`` client owns an httpx
+connection pool, so building one per call pays a new TLS handshake each time
+and leaks the pool. The registry builds each client lazily on first use with
+tuned timeouts and pool limits, hands the same instance to every caller (the
+sync clients are thread-safe, so the threaded chunking and expansion modes
+share their pools), and closes them when the process exits.
+
+The plain HTTP calls to OpenRouter and the other OpenAI-compatible endpoints
+(``hedging.py``, ``llm.py``) share one pooled ``requests.Session`` from
+``http_session()`` for the same reason.
+"""
+
+import atexit
+import os
+import threading
+from typing import Dict
+
+import anthropic
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 300.0             # long analyses can take minutes to generate
+WRITE_TIMEOUT = 30.0
+POOL_TIMEOUT = 30.0
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 60.0
+MAX_RETRIES = 2
+
+_lock = threading.Lock()
+_clients: Dict[str, object] = {}
+_shutdown_registered = False
+
+
+def client_timeout() -> httpx.Timeout:
+    """Return the timeout used by all direct-API clients."""
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, write=WRITE_TIMEOUT, pool=POOL_TIMEOUT)
+
+
+def client_limits() -> httpx.Limits:
+    """Return the connection pool limits used by all direct-API clients."""
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _register_shutdown() -> None:
+    global _shutdown_registered
+    if not _shutdown_registered:
+        atexit.register(close_clients)
+        _shutdown_registered = True
+
+
+def _get_client(name: str, build):
+    with _lock:
+        if name not in _clients:
+            _clients[name] = build()
+            _register_shutdown()
+        return _clients[name]
+
+
+def openai_client():
+    """
+    Return the shared OpenAI client, creating it on first use.
+
+    Raises:
+        ImportError: If the openai package is not installed
+    """
+    if openai is None:
+        raise ImportError("The openai package is required for direct OpenAI calls")
+    return _get_client("openai", lambda: openai.OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        timeout=client_timeout(),
+        max_retries=MAX_RETRIES,
+        http_client=httpx.Client(timeout=client_timeout(), limits=client_limits()),
+    ))
+
+
+def anthropic_client():
+    """Return the shared Anthropic client, creating it on first use."""
+    return _get_client("anthropic", lambda: anthropic.Anthropic(
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        timeout=client_timeout(),
+        max_retries=MAX_RETRIES,
+        http_client=httpx.Client(timeout=client_timeout(), limits=client_limits()),
+    ))
+
+
+def http_session() -> requests.Session:
+    """
+    Return the shared ``requests`` session, creating it on first use.
+
+    Its connection pool keeps up to ``MAX_CONNECTIONS`` connections per host
+    alive, so repeated and concurrent OpenRouter calls reuse them instead of
+    opening a new TLS connection per request.
+    """
+    def build():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_KEEPALIVE_CONNECTIONS, pool_maxsize=MAX_CONNECTIONS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return _get_client("http", build)
+
+
+def close_clients() -> None:
+    """
+    Close all shared clients and forget them.
+
+    Registered with ``atexit``; safe to call more than once. The next
+    ``openai_client()``, ``anthropic_client()`` or ``http_session()`` call
+    builds a new client.
+    """
+    with _lock:
+        closing = list(_clients.values())
+        _clients.clear()
+    for client in closing:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"Warning: could not close API client: {str(e)}")
@@ -11,6 +11,8 @@ import re
 from typing import Dict, List, Tuple, Any
 from urllib.parse import urlparse
 
+from websites import WebsiteResolver
+
 
 class ConfigValidationError(Exception):
     """Exception raised when configuration validation fails."""
@@ -51,8 +53,7 @@ def validate_newsletter_websites_json(file_path: str = 'newsletter_websites.json
         return False, errors
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = WebsiteResolver(file_path, load=False).read()
     except json.JSONDecodeError as e:
         errors.append(f"Invalid JSON in {file_path}: {str(e)}")
         return False, errors
@@ -168,6 +169,10 @@ def validate_environment_variables() -> Tuple[bool, List[str]]:
         if cost_log_dir and not os.path.exists(cost_log_dir):
             errors.append(f"Directory for OPENROUTER_COST_LOG does not exist: {cost_log_dir}")
     
+    # Check cost log contents
+    valid, cost_log_errors = validate_cost_log(cost_log_path)
+    errors.extend(cost_log_errors)
+    
     # Check output directory if specified
     output_dir = os.environ.get("NEWSLETTER_SUMMARY_OUTPUT_DIR")
     if output_dir and not os.path.exists(output_dir):
@@ -176,6 +181,50 @@ def validate_environment_variables() -> Tuple[bool, List[str]]:
     return len(errors) == 0, errors
 
 
+def validate_cost_log(file_path: str = None) -> Tuple[bool, List[str]]:
+    """
+    Validate the JSON Lines cost log by streaming it line by line.
+    
+    A missing log is valid, and so is a JSON-array log from older versions
+    (it is migrated on the next write).
+    
+    Args:
+        file_path: Path to the cost log (defaults to OPENROUTER_COST_LOG)
+        
+    Returns:
+        Tuple of (is_valid, list_of_errors)
+    """
+    from cost_log import log_path
+    
+    errors = []
+    file_path = file_path or log_path()
+    if not os.path.exists(file_path):
+        return True, errors
+    
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            bad_lines = []
+            for line_number, line in enumerate(f, 1):
+                if line_number == 1 and line.lstrip().startswith('['):
+                    return True, errors
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    bad_lines.append(line_number)
+                    continue
+                if not isinstance(entry, dict):
+                    bad_lines.append(line_number)
+        if bad_lines:
+            shown = ", ".join(str(n) for n in bad_lines[:5]) + (" ..." if len(bad_lines) > 5 else "")
+            errors.append(f"Cost log {file_path} has {len(bad_lines)} malformed line(s): {shown}")
+    except (OSError, UnicodeDecodeError) as e:
+        errors.append(f"Error reading cost log {file_path}: {str(e)}")
+    
+    return len(errors) == 0, errors
+
+
 def validate_credentials_files() -> Tuple[bool, List[str]]:
     """
     Validate Gmail credentials files.
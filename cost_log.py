@@ -0,0 +1,211 @@
+"""
+Append-only JSON Lines cost log.
+
+Every LLM call appends one JSON object per line to ``OPENROUTER_COST_LOG``
+(default ``openrouter_costs.jsonl``). Appends hold the log's lock from
+``file_lock.locked`` (``fcntl.flock`` on a ``.lock`` file where available,
+plus a thread lock), so concurrent runs cannot lose or interleave entries,
+and each write costs O(1) instead of rewriting the whole file.
+
+When the log grows beyond ``MAX_LOG_BYTES`` it is rotated like
+``logging.handlers.RotatingFileHandler``: ``log.1`` is the most recent
+rotated file, up to ``BACKUP_COUNT`` files are kept. Readers stream the
+rotated files and the current log oldest first with ``iter_entries``.
+
+Each run tags its entries with ``run_id`` and Gmail ``label`` via
+``set_run_context`` so costs can be rolled up per run and per label.
+
+Logs written by older versions as a single JSON array (``openrouter_costs.json``)
+are converted to JSON Lines on first write.
+"""
+
+import datetime
+import json
+import os
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+from file_lock import locked
+
+DEFAULT_LOG = "openrouter_costs.jsonl"
+LEGACY_LOG = "openrouter_costs.json"
+MAX_LOG_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+_run_context: Dict = {}
+
+
+def log_path() -> str:
+    """Return the path of the cost log."""
+    return os.environ.get("OPENROUTER_COST_LOG", DEFAULT_LOG)
+
+
+def new_run_id() -> str:
+    """Return an id for the current run, e.g. ``20250101_120000_a1b2c3``."""
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+
+
+def set_run_context(**fields) -> None:
+    """
+    Set fields (e.g. ``run_id`` and ``label``) added to every entry logged by this process.
+
+    Fields passed as None are removed. Values in the logged entry itself take precedence.
+    """
+    for key, value in fields.items():
+        if value is None:
+            _run_context.pop(key, None)
+        else:
+            _run_context[key] = value
+
+
+def _is_legacy_array(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(64).lstrip()[:1] == b'['
+
+
+def _write_jsonl(path: str, entries: List[Dict]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp_path, path)
+
+
+def migrate_legacy_log(path: str, legacy_path: Optional[str] = None) -> int:
+    """
+    Convert a JSON-array cost log to JSON Lines. Call with the log lock held.
+
+    Two cases are handled: the log path itself still holds a JSON array (a
+    custom ``OPENROUTER_COST_LOG`` from an older version), or the log does not
+    exist yet and ``legacy_path`` does. A migrated legacy file is renamed to
+    ``<legacy_path>.migrated``. An array file that cannot be parsed is moved
+    aside to ``<path>.corrupt``.
+
+    Args:
+        path: Path of the JSON Lines cost log
+        legacy_path: Optional path of an old array log to import
+
+    Returns:
+        Number of migrated entries
+    """
+    if os.path.exists(path) and os.path.getsize(path) and _is_legacy_array(path):
+        source = path
+    elif legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+        source = legacy_path
+    else:
+        return 0
+    try:
+        with open(source, 'r') as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError("not a JSON array")
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"Warning: could not migrate cost log {source} ({str(e)}); moving it aside")
+        os.replace(source, f"{source}.corrupt")
+        return 0
+    _write_jsonl(path, [entry for entry in entries if isinstance(entry, dict)])
+    if source != path:
+        os.replace(source, f"{source}.migrated")
+    print(f"Migrated {len(entries)} cost log entries from {source} to JSON Lines")
+    return len(entries)
+
+
+def rotated_paths(path: str, backup_count: int = BACKUP_COUNT) -> List[str]:
+    """Return the rotated log files that exist, oldest first."""
+    candidates = [f"{path}.{i}" for i in range(backup_count, 0, -1)]
+    return [candidate for candidate in candidates if os.path.exists(candidate)]
+
+
+def rotate(path: str, backup_count: int = BACKUP_COUNT) -> None:
+    """Shift ``path`` to ``path.1`` (dropping the oldest backup). Call with the log lock held."""
+    for i in range(backup_count - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    if backup_count > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+
+def append_entry(entry: Dict, path: Optional[str] = None, max_bytes: int = MAX_LOG_BYTES,
+                 backup_count: int = BACKUP_COUNT) -> None:
+    """
+    Append one entry to the cost log.
+
+    Args:
+        entry: JSON-serialisable cost entry
+        path: Log path (defaults to ``log_path()``)
+        max_bytes: Rotate the log before it would grow beyond this size
+        backup_count: Number of rotated files to keep
+    """
+    path = path or log_path()
+    line = json.dumps({**_run_context, **entry}) + "\n"
+    with locked(path):
+        migrate_legacy_log(path, LEGACY_LOG if path == DEFAULT_LOG else None)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size and size + len(line) > max_bytes:
+            rotate(path, backup_count)
+            size = 0
+        if size:
+            # Never glue an entry onto a partial line left by a crashed writer
+            with open(path, 'rb') as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    line = "\n" + line
+        with open(path, 'ab') as f:
+            f.write(line.encode('utf-8'))
+
+
+def _iter_file(path: str) -> Iterator[Dict]:
+    if _is_legacy_array(path):
+        # Not yet migrated: read-only tools still understand the old format
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            return
+        yield from (entry for entry in entries if isinstance(entry, dict))
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict):
+                yield entry
+
+
+def log_files(path: Optional[str] = None, include_rotated: bool = True) -> List[str]:
+    """
+    Return the files that make up the cost log, oldest first.
+
+    A legacy array log at the default location is included until it has been migrated.
+    """
+    path = path or log_path()
+    files = rotated_paths(path) if include_rotated else []
+    if os.path.exists(path):
+        files.append(path)
+    elif path == DEFAULT_LOG and os.path.exists(LEGACY_LOG):
+        files.append(LEGACY_LOG)
+    return files
+
+
+def iter_entries(path: Optional[str] = None, include_rotated: bool = True) -> Iterator[Dict]:
+    """
+    Stream cost entries oldest first without loading the log into memory.
+
+    Malformed lines (e.g. a line cut short by a crash) are skipped.
+
+    Args:
+        path: Log path (defaults to ``log_path()``)
+        include_rotated: Also read the rotated backups
+
+    Yields:
+        Cost entry dictionaries
+    """
+    for file_path in log_files(path, include_rotated):
+        yield from _iter_file(file_path)
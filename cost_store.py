@@ -0,0 +1,285 @@
+"""
+Indexed SQLite store for cost and usage analytics.
+
+``analyze_costs.py`` imports the JSON Lines cost log (see ``cost_log.py``)
+into a SQLite database and runs its aggregations in SQL, using indexes on
+timestamp, model, provider and label. Imports are incremental: for every log
+file the store remembers its inode and the byte offset already ingested, so
+a later import only reads the new tail. Rotated files keep their inode, so
+rotation never causes entries to be read twice.
+
+Latency and throughput percentiles are estimated by streaming rows through
+P² estimators, so they stay memory-bounded on large logs.
+
+Without a database path the store lives in memory and is rebuilt on every run.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from cost_log import DEFAULT_LOG, LEGACY_LOG, log_files, log_path, migrate_legacy_log
+from file_lock import locked
+from quantiles import StreamingPercentiles
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cost_entries (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    day TEXT NOT NULL,
+    model TEXT,
+    provider TEXT,
+    label TEXT,
+    run_id TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    estimated_cost REAL,
+    estimated_input_tokens INTEGER,
+    latency REAL,
+    first_token_latency REAL,
+    tokens_per_second REAL,
+    retries INTEGER,
+    http_status INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_cost_entries_ts ON cost_entries (ts);
+CREATE INDEX IF NOT EXISTS idx_cost_entries_model ON cost_entries (model, ts);
+CREATE INDEX IF NOT EXISTS idx_cost_entries_provider ON cost_entries (provider, ts);
+CREATE INDEX IF NOT EXISTS idx_cost_entries_label ON cost_entries (label, ts);
+CREATE INDEX IF NOT EXISTS idx_cost_entries_run ON cost_entries (run_id);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    head TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (device, inode)
+);
+"""
+
+# Rollup dimensions accepted by ``breakdown``, mapped to their column
+DIMENSIONS = {
+    "provider": "provider",
+    "model": "model",
+    "day": "day",
+    "label": "label",
+    "run": "run_id",
+}
+
+HEAD_BYTES = 200
+
+# Columns added after the first schema version, created on open if missing
+ADDED_COLUMNS = {
+    "latency": "REAL",
+    "first_token_latency": "REAL",
+    "tokens_per_second": "REAL",
+    "retries": "INTEGER",
+    "http_status": "INTEGER",
+}
+
+INSERT_COLUMNS = (
+    "ts", "timestamp", "day", "model", "provider", "label", "run_id", "prompt_tokens", "completion_tokens",
+    "total_tokens", "cost", "estimated_cost", "estimated_input_tokens", "latency", "first_token_latency",
+    "tokens_per_second", "retries", "http_status",
+)
+
+
+def entry_row(entry: Dict) -> Optional[tuple]:
+    """
+    Convert a cost log entry to a ``cost_entries`` row.
+
+    Returns:
+        The row tuple, or None if the entry has no parseable timestamp
+    """
+    try:
+        when = datetime.datetime.fromisoformat(entry["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    routing = entry.get("routing") or {}
+    return (
+        when.timestamp(),
+        entry["timestamp"],
+        when.date().isoformat(),
+        entry.get("model"),
+        entry.get("provider"),
+        entry.get("label"),
+        entry.get("run_id"),
+        entry.get("prompt_tokens") or 0,
+        entry.get("completion_tokens") or 0,
+        entry.get("total_tokens") or 0,
+        entry.get("cost") or 0,
+        routing.get("estimated_cost"),
+        routing.get("estimated_input_tokens"),
+        entry.get("latency"),
+        entry.get("first_token_latency"),
+        entry.get("tokens_per_second"),
+        entry.get("retries"),
+        entry.get("http_status"),
+    )
+
+
+class CostStore:
+    """SQLite database of cost entries with incremental log import."""
+
+    def __init__(self, db_path: str = ":memory:"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(cost_entries)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE cost_entries ADD COLUMN {column} {column_type}")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
+
+    def ingest(self, path: Optional[str] = None) -> int:
+        """
+        Import new entries from the cost log and its rotated files.
+
+        An old JSON-array log is migrated to JSON Lines first, so the store
+        only ever tails JSON Lines files.
+
+        Args:
+            path: Cost log path (defaults to ``cost_log.log_path()``)
+
+        Returns:
+            Number of entries imported
+        """
+        path = path or log_path()
+        if os.path.exists(path) or (path == DEFAULT_LOG and os.path.exists(LEGACY_LOG)):
+            with locked(path):
+                migrate_legacy_log(path, LEGACY_LOG if path == DEFAULT_LOG else None)
+        return sum(self.ingest_file(file_path) for file_path in log_files(path))
+
+    def ingest_file(self, file_path: str) -> int:
+        """
+        Import the part of one JSON Lines file that has not been ingested yet.
+
+        Only complete lines are imported; a line still being written is
+        picked up by the next import. Entries and the new offset are
+        committed in one transaction.
+        """
+        stat = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            head = f.read(HEAD_BYTES).split(b"\n", 1)[0].decode('utf-8', 'replace')
+            known = self.conn.execute(
+                "SELECT head, offset FROM ingested_files WHERE device = ? AND inode = ?",
+                (stat.st_dev, stat.st_ino)
+            ).fetchone()
+            # A reused inode or a rewritten file starts over
+            offset = known["offset"] if known and known["head"] == head and known["offset"] <= stat.st_size else 0
+            f.seek(offset)
+            rows = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                row = entry_row(entry) if isinstance(entry, dict) else None
+                if row:
+                    rows.append(row)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO cost_entries ({', '.join(INSERT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in INSERT_COLUMNS)})",
+                rows
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ingested_files (device, inode, head, offset) VALUES (?, ?, ?, ?)",
+                (stat.st_dev, stat.st_ino, head, offset)
+            )
+        return len(rows)
+
+    def totals(self, since: Optional[float] = None) -> Dict:
+        """Return call count, tokens and cost since a Unix timestamp."""
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS runs, COALESCE(SUM(total_tokens), 0) AS tokens, COALESCE(SUM(cost), 0) AS cost "
+            "FROM cost_entries WHERE ts >= ?",
+            (since or 0,)
+        ).fetchone()
+        return dict(row)
+
+    def breakdown(self, dimension: str, since: Optional[float] = None) -> List[Dict]:
+        """
+        Aggregate calls, tokens and cost by a dimension.
+
+        Args:
+            dimension: One of ``DIMENSIONS`` ('provider', 'model', 'day', 'label', 'run')
+            since: Optional Unix timestamp lower bound
+
+        Returns:
+            List of dictionaries with ``key``, ``runs``, ``tokens``, ``cost``,
+            ``first`` and ``last`` (ISO timestamps); days and runs are in
+            chronological order, other dimensions by descending cost
+
+        Raises:
+            ValueError: If the dimension is unknown
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown cost dimension: {dimension}")
+        column = DIMENSIONS[dimension]
+        order = "first" if dimension in ("day", "run") else "cost DESC"
+        rows = self.conn.execute(
+            f"SELECT COALESCE({column}, '(none)') AS key, COUNT(*) AS runs, SUM(total_tokens) AS tokens, "
+            f"SUM(cost) AS cost, MIN(timestamp) AS first, MAX(timestamp) AS last "
+            f"FROM cost_entries WHERE ts >= ? GROUP BY key ORDER BY {order}",
+            (since or 0,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def routing_accuracy(self, since: Optional[float] = None) -> List[Dict]:
+        """Return estimated versus actual cost and input tokens of auto-routed calls, per model."""
+        rows = self.conn.execute(
+            "SELECT COALESCE(model, 'unknown') AS model, COUNT(*) AS runs, "
+            "SUM(estimated_cost) AS estimated_cost, SUM(cost) AS actual_cost, "
+            "COALESCE(SUM(estimated_input_tokens), 0) AS estimated_tokens, SUM(prompt_tokens) AS actual_tokens "
+            "FROM cost_entries WHERE ts >= ? AND estimated_cost IS NOT NULL GROUP BY model",
+            (since or 0,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def latency_percentiles(self, since: Optional[float] = None,
+                            percentiles: Tuple[float, ...] = (50, 95, 99)) -> List[Dict]:
+        """
+        Estimate latency, time-to-first-token and throughput percentiles per model.
+
+        Rows are streamed from the database into P² estimators (see
+        ``quantiles.py``), so memory does not grow with the number of calls.
+
+        Args:
+            since: Optional Unix timestamp lower bound
+            percentiles: Percentiles to estimate
+
+        Returns:
+            List of dictionaries (sorted by model) with ``model``, ``calls`` and
+            ``{percentile: value}`` maps under ``latency``, ``first_token_latency``
+            and ``tokens_per_second``; calls without telemetry are ignored
+        """
+        metrics = ("latency", "first_token_latency", "tokens_per_second")
+        stats = {}
+        cursor = self.conn.execute(
+            "SELECT COALESCE(model, 'unknown') AS model, latency, first_token_latency, tokens_per_second "
+            "FROM cost_entries WHERE ts >= ? AND latency IS NOT NULL",
+            (since or 0,)
+        )
+        for row in cursor:
+            model_stats = stats.get(row["model"])
+            if model_stats is None:
+                model_stats = stats[row["model"]] = {metric: StreamingPercentiles(percentiles) for metric in metrics}
+            for metric in metrics:
+                if row[metric] is not None:
+                    model_stats[metric].add(row[metric])
+        return [
+            dict({"model": model, "calls": model_stats["latency"].count},
+                 **{metric: model_stats[metric].values() if model_stats[metric].count else {} for metric in metrics})
+            for model, model_stats in sorted(stats.items())
+        ]
@@ -0,0 +1,329 @@
+"""
+Long-running scheduler for digest jobs, with warm clients and caches.
+
+Running ``main.py`` from cron pays for interpreter startup, the heavy SDK
+imports, the Gmail discovery build and an OAuth refresh on every run. The
+daemon pays them once: it keeps one process alive, reuses the authenticated
+Gmail service (``auth.cached_gmail_service``), the pooled LLM clients
+(``clients.py``) and the in-memory caches between runs, and runs the jobs of a
+config file on their schedules.
+
+The config file (``daemon.json`` or ``NEWSLETTER_DAEMON_CONFIG``) lists jobs::
+
+    {"jobs": [
+      {"name": "defi-daily", "every_minutes": 360, "jitter_seconds": 300,
+       "label": "DeFi Updates", "days": 1, "args": ["--publish"]},
+      {"name": "ai-weekly", "every_minutes": 10080, "label": null,
+       "to_email": "me@example.com", "days": 7,
+       "env": {"NEWSLETTER_SUMMARY_OUTPUT_DIR": "docs"}}
+    ]}
+
+``label`` (null for no label), ``from_email``, ``to_email`` and ``days``
+become the matching ``main.py`` options, ``args`` adds any others, and ``env``
+sets environment variables for the job's runs. Job options are checked with
+``main.py``'s parser when the config is loaded. Each run starts at a random
+offset of up to ``jitter_seconds`` after its slot, so jobs sharing an interval
+do not all hit Gmail and the LLM providers at once.
+
+Jobs run one at a time, so they never overlap: a job that is still running
+when another falls due delays it, and slots a job missed while the daemon was
+busy are skipped rather than run back to back. A lock file allows one daemon
+per state directory (``daemon`` or ``NEWSLETTER_DAEMON_DIR``). The daemon
+keeps its state in ``status.json`` there, which ``python daemon.py status``
+prints.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import signal
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+STATUS_FILE = "status.json"
+LOCK_FILE = "daemon.lock"
+DEFAULT_JITTER_SECONDS = 60
+# Job keys that map to main.py options
+JOB_OPTIONS = {'from_email': '--from-email', 'to_email': '--to-email', 'days': '--days'}
+
+
+def daemon_dir() -> str:
+    """Return the directory holding the daemon's lock and status files."""
+    return os.environ.get("NEWSLETTER_DAEMON_DIR", "daemon")
+
+
+def config_path() -> str:
+    """Return the path of the daemon's job config file."""
+    return os.environ.get("NEWSLETTER_DAEMON_CONFIG", "daemon.json")
+
+
+def job_argv(job: Dict) -> List[str]:
+    """Return the ``main.py`` arguments of a job."""
+    argv = []
+    if 'label' in job:
+        argv += ['--label', job['label']] if job['label'] else ['--no-label']
+    for key, option in JOB_OPTIONS.items():
+        if job.get(key) is not None:
+            argv += [option, str(job[key])]
+    return argv + [str(arg) for arg in job.get('args', [])]
+
+
+def load_config(path: str) -> List[Dict]:
+    """
+    Load and check the jobs of a daemon config file.
+
+    Args:
+        path: Path of the JSON config file
+
+    Returns:
+        List of job dictionaries with ``argv`` and ``jitter_seconds`` filled in
+
+    Raises:
+        ValueError: If the config has no jobs, or a job has no name, a
+            duplicate name, no positive ``every_minutes`` or options that
+            ``main.py`` rejects
+    """
+    from main import parse_args
+
+    with open(path, 'r') as f:
+        config = json.load(f)
+    jobs = config.get('jobs') or []
+    if not jobs:
+        raise ValueError(f"No jobs configured in {path}")
+    names = set()
+    for job in jobs:
+        name = job.get('name')
+        if not name:
+            raise ValueError(f"Every job in {path} needs a name")
+        if name in names:
+            raise ValueError(f"Duplicate job name '{name}' in {path}")
+        names.add(name)
+        if not isinstance(job.get('every_minutes'), (int, float)) or job['every_minutes'] <= 0:
+            raise ValueError(f"Job '{name}' needs a positive every_minutes")
+        job['jitter_seconds'] = job.get('jitter_seconds', DEFAULT_JITTER_SECONDS)
+        job['argv'] = job_argv(job)
+        try:
+            parse_args(job['argv'])
+        except SystemExit:
+            raise ValueError(f"Job '{name}' has invalid options: {' '.join(job['argv'])}")
+    return jobs
+
+
+def default_run_job(argv: List[str]):
+    """Run ``main.py`` in this process with the warm Gmail service."""
+    from auth import cached_gmail_service
+    from main import main
+
+    return main(argv, gmail_service=cached_gmail_service)
+
+
+class Scheduler:
+    """Runs jobs one at a time on their schedules and records their status."""
+
+    def __init__(self, jobs: List[Dict], state_dir: Optional[str] = None,
+                 run_job: Callable = default_run_job, clock: Callable[[], float] = time.time,
+                 rng: Optional[random.Random] = None):
+        self.jobs = {job['name']: job for job in jobs}
+        self.state_dir = state_dir or daemon_dir()
+        self.run_job = run_job
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.stopping = threading.Event()
+        now = clock()
+        self.status = {
+            "pid": os.getpid(),
+            "started_at": now,
+            "updated_at": now,
+            "running": None,
+            "jobs": {name: {"slot": now, "next_run": None, "runs": 0, "failures": 0,
+                            "last_started": None, "last_finished": None, "last_status": None,
+                            "last_run_id": None, "last_duration": None} for name in self.jobs},
+        }
+        for name in self.jobs:
+            self._schedule(name, now)
+
+    def _schedule(self, name: str, slot: float) -> None:
+        job = self.jobs[name]
+        state = self.status["jobs"][name]
+        state["slot"] = slot
+        state["next_run"] = slot + self.rng.uniform(0, job['jitter_seconds'])
+
+    def write_status(self) -> None:
+        """Write the status file atomically."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.status["updated_at"] = self.clock()
+        path = os.path.join(self.state_dir, STATUS_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.status, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def next_job(self) -> str:
+        """Return the name of the job due first."""
+        return min(self.jobs, key=lambda name: self.status["jobs"][name]["next_run"])
+
+    def run(self, name: str) -> None:
+        """Run one job now and schedule its next run after the slots it has missed."""
+        from auth import reset_gmail_service
+
+        job = self.jobs[name]
+        state = self.status["jobs"][name]
+        started = self.clock()
+        state["last_started"] = started
+        self.status["running"] = name
+        self.write_status()
+        print(f"[daemon] Running job '{name}': {' '.join(job['argv'])}")
+        saved_env = {key: os.environ.get(key) for key in job.get('env', {})}
+        os.environ.update({key: str(value) for key, value in job.get('env', {}).items()})
+        try:
+            run = self.run_job(job['argv'])
+            if run is not None and 'report' in run.completed():
+                status = "ok"
+            else:
+                status = "incomplete"
+            state["last_run_id"] = run.run_id if run is not None else None
+        except Exception as e:
+            status = f"error: {str(e)}"
+        except SystemExit as e:
+            # Option errors exit from main(); they fail this job, not the daemon
+            status = f"error: exited with status {e.code}"
+        finally:
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        finished = self.clock()
+        if status != "ok":
+            state["failures"] += 1
+            # Authenticate again next time in case the cached service went bad
+            reset_gmail_service()
+        state["runs"] += 1
+        state["last_finished"] = finished
+        state["last_duration"] = round(finished - started, 3)
+        state["last_status"] = status
+        interval = job['every_minutes'] * 60
+        slot = state["slot"] + interval
+        if slot <= finished:
+            slot += ((finished - slot) // interval + 1) * interval
+        self._schedule(name, slot)
+        self.status["running"] = None
+        self.write_status()
+        print(f"[daemon] Job '{name}' finished ({status}) in {state['last_duration']:.1f}s; next run at "
+              f"{datetime.datetime.fromtimestamp(state['next_run']).isoformat(timespec='seconds')}")
+
+    def serve(self) -> None:
+        """Run jobs as they fall due until ``stop`` is called."""
+        self.write_status()
+        while not self.stopping.is_set():
+            name = self.next_job()
+            delay = self.status["jobs"][name]["next_run"] - self.clock()
+            if delay > 0 and self.stopping.wait(delay):
+                break
+            self.run(name)
+
+    def stop(self, *_) -> None:
+        """Stop after the running job (also used as a signal handler)."""
+        self.stopping.set()
+
+
+def hold_lock(state_dir: str):
+    """
+    Take the daemon lock of a state directory for the life of the process.
+
+    Returns:
+        The open lock file (keep a reference to it)
+
+    Raises:
+        RuntimeError: If another daemon holds the lock
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    lock_file = open(os.path.join(state_dir, LOCK_FILE), 'a')
+    if fcntl:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"Another daemon is already running with state in {state_dir}")
+    return lock_file
+
+
+def process_alive(pid: int) -> bool:
+    """Check whether a process id belongs to a running process."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_time(timestamp: Optional[float]) -> str:
+    """Format a status timestamp for display."""
+    if timestamp is None:
+        return "-"
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='seconds')
+
+
+def format_status(status: Dict) -> str:
+    """Render the daemon status as text."""
+    alive = process_alive(status["pid"])
+    lines = [
+        f"Daemon pid {status['pid']} {'running' if alive else 'not running'} "
+        f"(started {format_time(status['started_at'])}, updated {format_time(status['updated_at'])})",
+    ]
+    if alive and status.get("running"):
+        lines.append(f"Running job: {status['running']}")
+    lines.append(f"{'Job':<20} {'Next run':<20} {'Last finished':<20} {'Runs':>5} {'Fails':>5}  Last status")
+    for name, job in status["jobs"].items():
+        lines.append(f"{name:<20} {format_time(job['next_run']):<20} {format_time(job['last_finished']):<20} "
+                     f"{job['runs']:>5} {job['failures']:>5}  {job['last_status'] or '-'}"
+                     + (f" (run {job['last_run_id']})" if job.get('last_run_id') else ""))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run digest jobs on a schedule in one long-running process")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Run the configured jobs until interrupted")
+    serve_parser.add_argument('--config', default=None,
+                              help='Job config file (default: NEWSLETTER_DAEMON_CONFIG or daemon.json)')
+    status_parser = subparsers.add_parser("status", help="Show the running daemon's job status")
+    status_parser.add_argument('--json', action='store_true', help='Print the raw status JSON')
+    args = parser.parse_args()
+
+    state_dir = daemon_dir()
+    if args.command == "status":
+        path = os.path.join(state_dir, STATUS_FILE)
+        if not os.path.exists(path):
+            print(f"No daemon status in {state_dir}")
+            return
+        with open(path, 'r') as f:
+            status = json.load(f)
+        print(json.dumps(status, indent=2) if args.json else format_status(status))
+        return
+
+    jobs = load_config(args.config or config_path())
+    lock_file = hold_lock(state_dir)
+    scheduler = Scheduler(jobs, state_dir)
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    print(f"[daemon] Serving {len(jobs)} jobs: {', '.join(job['name'] for job in jobs)}")
+    try:
+        scheduler.serve()
+    finally:
+        lock_file.close()
+    print("[daemon] Stopped")
+
+
+if __name__ == "__main__":
+    main()
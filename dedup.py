@@ -0,0 +1,325 @@
+"""
+Story-level near-duplicate detection for newsletter content.
+
+Newsletters frequently cover the same announcement in slightly different
+words. This module splits cleaned newsletter text into story blocks, computes
+MinHash signatures for every block with vectorized NumPy operations and groups
+near-duplicates with LSH banding, so each story only needs to be sent to the
+LLM once.
+"""
+
+import re
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Mersenne prime 2^31 - 1 keeps (a * x + b) well inside uint64 range
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_MAX_HASH = np.uint64((1 << 31) - 2)
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_THRESHOLD = 0.5
+
+# Upper bound on the number of shingles hashed per vectorized batch. With the
+# default 128 permutations this keeps the working matrix around 16MB.
+_SHINGLES_PER_BATCH = 1 << 14
+
+_HEADING_RE = re.compile(r'^\s{0,3}#{1,6}\s')
+_RULE_RE = re.compile(r'^\s*(?:[-*_]\s*){3,}$')
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def split_story_blocks(text: str, min_words: int = 25) -> List[str]:
+    """
+    Split cleaned newsletter markdown into story-sized blocks.
+
+    Headings and horizontal rules always start a new block. Consecutive
+    paragraphs are merged until a block holds at least ``min_words`` words,
+    and the block is closed at the next paragraph boundary, so newsletters
+    without headings still split into one block per story paragraph. A
+    heading stays with the paragraphs after it. Shorter blocks are never
+    dropped: they join the block before them (or the next one at the start
+    of the text), and a text shorter than ``min_words`` becomes a single
+    block.
+
+    Args:
+        text: Cleaned markdown produced by ``utils.clean_body``
+        min_words: Minimum number of words per block
+
+    Returns:
+        List of story block strings in document order
+    """
+    blocks = []
+    current = []
+    current_words = 0
+
+    def flush(final=False):
+        nonlocal current, current_words
+        if not current:
+            return
+        block = "\n\n".join(current).strip()
+        if current_words >= min_words or (final and not blocks):
+            blocks.append(block)
+        elif blocks:
+            blocks[-1] = f"{blocks[-1]}\n\n{block}"
+        else:
+            # A short leading block is carried into the next one
+            return
+        current = []
+        current_words = 0
+
+    for paragraph in re.split(r'\n\s*\n', text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if _RULE_RE.match(paragraph):
+            flush()
+            continue
+        heading = _HEADING_RE.match(paragraph)
+        if heading:
+            flush()
+        current.append(paragraph)
+        current_words += len(paragraph.split())
+        if not heading and current_words >= min_words:
+            flush()
+    flush(final=True)
+    return blocks
+
+
+def shingle_hashes(text: str, k: int = 3) -> np.ndarray:
+    """
+    Hash the word k-grams of a text into a deduplicated uint32 array.
+
+    Args:
+        text: Text to shingle
+        k: Number of words per shingle
+
+    Returns:
+        Sorted array of unique 32-bit shingle hashes
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint32)
+    if len(words) < k:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                         dtype=np.uint32, count=len(shingles))
+    return np.unique(hashes)
+
+
+def _permutations(num_perm: int, seed: int):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    return a.reshape(-1, 1), b.reshape(-1, 1)
+
+
+def minhash_signatures(shingle_sets: Sequence[np.ndarray], num_perm: int = DEFAULT_NUM_PERM,
+                       seed: int = 1) -> np.ndarray:
+    """
+    Compute MinHash signatures for many shingle sets at once.
+
+    All shingles are concatenated and permuted in large vectorized batches;
+    per-block minima are taken with ``np.minimum.reduceat`` so no Python loop
+    runs over individual shingles or permutations.
+
+    Args:
+        shingle_sets: One array of shingle hashes per block
+        num_perm: Number of hash permutations (signature length)
+        seed: Seed for the permutation coefficients
+
+    Returns:
+        Array of shape (len(shingle_sets), num_perm) with dtype uint64.
+        Blocks without shingles get a signature of all ``_MAX_HASH`` values.
+    """
+    n = len(shingle_sets)
+    signatures = np.full((n, num_perm), _MAX_HASH, dtype=np.uint64)
+    if n == 0:
+        return signatures
+    a, b = _permutations(num_perm, seed)
+    lengths = np.fromiter((len(s) for s in shingle_sets), dtype=np.int64, count=n)
+
+    start = 0
+    while start < n:
+        # Grow the batch until it holds enough shingles to amortize numpy overhead
+        end = start
+        total = 0
+        while end < n and (total == 0 or total + lengths[end] <= _SHINGLES_PER_BATCH):
+            total += lengths[end]
+            end += 1
+        batch_idx = np.arange(start, end)
+        batch_idx = batch_idx[lengths[start:end] > 0]
+        if len(batch_idx):
+            values = np.concatenate([shingle_sets[i] for i in batch_idx]).astype(np.uint64)
+            values %= _MERSENNE_PRIME
+            permuted = (a * values + b) % _MERSENNE_PRIME
+            offsets = np.concatenate(([0], np.cumsum(lengths[batch_idx])[:-1]))
+            signatures[batch_idx] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        start = end
+    return signatures
+
+
+def lsh_candidate_pairs(signatures: np.ndarray, bands: int = DEFAULT_BANDS) -> set:
+    """
+    Find candidate near-duplicate pairs with LSH banding.
+
+    Args:
+        signatures: MinHash signatures of shape (n, num_perm)
+        bands: Number of bands; ``num_perm`` must be divisible by it
+
+    Returns:
+        Set of (i, j) index pairs with i < j that share at least one band bucket
+    """
+    n, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+    rows = num_perm // bands
+    pairs = set()
+    empty = np.all(signatures == _MAX_HASH, axis=1)
+    for band in range(bands):
+        band_view = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        # Collapse each band row to a single key, then group equal keys by sorting
+        keys = band_view.view(np.dtype((np.void, band_view.dtype.itemsize * rows))).ravel()
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        for group in np.split(order, boundaries):
+            if len(group) < 2:
+                continue
+            members = sorted(int(i) for i in group if not empty[i])
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+def cluster_signatures(signatures: np.ndarray, bands: int = DEFAULT_BANDS,
+                       threshold: float = DEFAULT_THRESHOLD) -> List[List[int]]:
+    """
+    Group blocks into near-duplicate clusters.
+
+    Candidate pairs from LSH are confirmed by their estimated Jaccard
+    similarity (share of matching signature positions) and merged with a
+    union-find so that transitive duplicates end up in one cluster.
+
+    Args:
+        signatures: MinHash signatures of shape (n, num_perm)
+        bands: Number of LSH bands
+        threshold: Minimum estimated Jaccard similarity to merge two blocks
+
+    Returns:
+        List of clusters, each a sorted list of block indices, ordered by
+        their first member
+    """
+    n = signatures.shape[0]
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = lsh_candidate_pairs(signatures, bands)
+    if pairs:
+        pair_array = np.array(sorted(pairs), dtype=np.int64)
+        similarity = np.mean(signatures[pair_array[:, 0]] == signatures[pair_array[:, 1]], axis=1)
+        for (i, j), sim in zip(pair_array, similarity):
+            if sim >= threshold:
+                root_i, root_j = find(int(i)), find(int(j))
+                if root_i != root_j:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(n):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda members: members[0])
+
+
+def sender_name(sender: str) -> str:
+    """Return the display name portion of a From header."""
+    name = sender.split('<')[0].strip().strip('"')
+    return name or sender.strip()
+
+
+def cluster_story_blocks(cleaned_newsletters: Sequence[Dict], num_perm: int = DEFAULT_NUM_PERM,
+                         bands: int = DEFAULT_BANDS, threshold: float = DEFAULT_THRESHOLD,
+                         min_words: int = 25) -> List[Dict]:
+    """
+    Split cleaned newsletters into story blocks and cluster near-duplicates.
+
+    Args:
+        cleaned_newsletters: Newsletter dictionaries whose ``content`` key holds
+            cleaned markdown and whose ``sender`` key holds the From header
+        num_perm: MinHash signature length
+        bands: Number of LSH bands
+        threshold: Minimum estimated Jaccard similarity to merge two blocks
+        min_words: Minimum words per story block
+
+    Returns:
+        List of cluster dictionaries in document order with keys:
+        ``text`` (representative block), ``newsletter_index`` (newsletter the
+        representative is attributed to), ``members`` (list of
+        (newsletter_index, block_text) tuples) and ``sources`` (distinct
+        sender names in first-seen order)
+    """
+    block_texts = []
+    block_owner = []
+    for index, nl in enumerate(cleaned_newsletters):
+        for block in split_story_blocks(nl.get('content', ''), min_words=min_words):
+            block_texts.append(block)
+            block_owner.append(index)
+    if not block_texts:
+        return []
+
+    signatures = minhash_signatures([shingle_hashes(t) for t in block_texts], num_perm=num_perm)
+    clusters = []
+    for members in cluster_signatures(signatures, bands=bands, threshold=threshold):
+        sources = []
+        for i in members:
+            name = sender_name(cleaned_newsletters[block_owner[i]].get('sender', ''))
+            if name not in sources:
+                sources.append(name)
+        # The longest version usually carries the most detail
+        representative = max(members, key=lambda i: (len(block_texts[i]), -i))
+        clusters.append({
+            'text': block_texts[representative],
+            'newsletter_index': block_owner[members[0]],
+            'members': [(block_owner[i], block_texts[i]) for i in members],
+            'sources': sources,
+        })
+    return clusters
+
+
+def coverage_annotation(sources: Sequence[str]) -> Optional[str]:
+    """Return the '[Covered by N sources: ...]' marker for multi-source stories."""
+    if len(sources) < 2:
+        return None
+    return f"[Covered by {len(sources)} sources: {', '.join(sources)}]"
+
+
+def deduplicate_newsletter_content(cleaned_newsletters: Sequence[Dict], **kwargs) -> List[str]:
+    """
+    Rebuild each newsletter's content with near-duplicate stories sent once.
+
+    Each story cluster is emitted only in the first newsletter that carries
+    it, prefixed with a coverage annotation when more than one source
+    reported it. Later copies are dropped.
+
+    Args:
+        cleaned_newsletters: Newsletter dictionaries with ``content`` and ``sender``
+        **kwargs: Passed through to ``cluster_story_blocks``
+
+    Returns:
+        List of deduplicated content strings, one per input newsletter
+    """
+    per_newsletter = [[] for _ in cleaned_newsletters]
+    for cluster in cluster_story_blocks(cleaned_newsletters, **kwargs):
+        annotation = coverage_annotation(cluster['sources'])
+        text = f"{annotation}\n{cluster['text']}" if annotation else cluster['text']
+        per_newsletter[cluster['newsletter_index']].append(text)
+    return ["\n\n".join(parts) for parts in per_newsletter]
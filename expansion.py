@@ -0,0 +1,225 @@
+"""
+Two-step topic generation: a short ranked outline, then parallel expansion.
+
+A single completion for many topics can hit the model's output limit and
+cut the last topics off mid-sentence, and its latency grows with the number
+of topics. In two-step mode a first call returns only the ranked topic
+outline (JSON). Each topic's full section is then written by its own call,
+run concurrently under a cap, and the sections are assembled in rank order,
+so wall-clock time stays close to the outline plus one topic's generation.
+"""
+
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from budget import BudgetExceeded
+
+DEFAULT_EXPAND_CONCURRENCY = 5
+# Newsletter content tokens given to a topic whose sources match no newsletter
+FALLBACK_CONTENT_TOKENS = 6000
+
+OUTLINE_OUTPUT_FORMAT = """Respond with ONLY a JSON object (no markdown, no commentary) listing the topics ranked by
+importance, most important first. Do not write the full sections yet:
+
+{"topics": [
+  {"headline": "Clear, concise headline",
+   "summary": "One sentence on what happened",
+   "sources": ["Newsletter name", "Another newsletter"]}
+]}
+"""
+
+EXPANSION_PROMPT = """
+You are writing topic #{rank} of an AI newsletter summary for regular people.
+
+TOPIC: {headline}
+IN SHORT: {summary}
+COVERED BY: {sources}
+
+Using the newsletter content below, write this topic's section in exactly this markdown format
+(do not repeat the headline and do not write any other topics):
+
+- **What's New:** [Brief description of the development]
+
+- **Why It Matters:** [Explanation for regular users]
+
+- **Practical Impact:** [2-3 specific actions or opportunities]
+
+- **Source:** [Newsletter names that covered this topic]
+
+Include relevant links to the actual products or announcements where the newsletters provide them.
+Ignore sponsored or advertising content.
+
+NEWSLETTER CONTENT:
+{content}
+"""
+
+
+def parse_outline(reply: str, num_topics: int) -> List[Dict]:
+    """
+    Parse the ranked topic outline from the first call.
+
+    Args:
+        reply: Raw LLM reply, optionally wrapped in a markdown code fence
+        num_topics: Maximum number of topics to keep
+
+    Returns:
+        List of ``{"headline", "summary", "sources"}`` dictionaries in rank order
+
+    Raises:
+        ValueError: If the reply does not contain a usable topic list
+    """
+    from topics import strip_code_fence
+
+    try:
+        data = json.loads(strip_code_fence(reply))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Topic outline is not valid JSON: {str(e)}")
+    items = data.get("topics") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("Topic outline has no 'topics' list")
+    outline = []
+    for item in items:
+        if not isinstance(item, dict) or not str(item.get("headline", "")).strip():
+            continue
+        sources = item.get("sources") or []
+        outline.append({
+            "headline": str(item["headline"]).strip(),
+            "summary": str(item.get("summary", "")).strip(),
+            "sources": [str(source) for source in sources] if isinstance(sources, list) else [str(sources)],
+        })
+    if not outline:
+        raise ValueError("Topic outline contains no topics")
+    return outline[:num_topics]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def relevant_blocks(topic: Dict, newsletters: List[Dict],
+                    budget_tokens: int = FALLBACK_CONTENT_TOKENS) -> List[Dict]:
+    """
+    Cut newsletters down to the story blocks most similar to a topic.
+
+    Every newsletter's story blocks are ranked by TF-IDF cosine similarity to
+    the topic's headline and summary (see ``ranking.py``) and kept, best
+    first, until ``budget_tokens`` is used. Blocks sharing no term with the
+    topic are dropped unless no block does.
+
+    Returns:
+        Copies of the newsletters that kept a block, in their original order,
+        with only the kept blocks as ``content``
+    """
+    from dedup import split_story_blocks
+    from ranking import CHARS_PER_TOKEN, build_tfidf_matrix
+    from utils import clean_body
+
+    blocks = []
+    for index, newsletter in enumerate(newsletters):
+        content = newsletter['content'] if 'content' in newsletter else \
+            clean_body(newsletter.get('body', ''), newsletter.get('body_format'))
+        for position, text in enumerate(split_story_blocks(content, min_words=1)):
+            blocks.append((index, position, text))
+    if not blocks:
+        return []
+    tfidf, _, _ = build_tfidf_matrix([f"{topic['headline']} {topic['summary']}"] + [text for _, _, text in blocks])
+    similarity = (tfidf[1:] @ tfidf[0].T).toarray().ravel()
+    ranked = sorted(range(len(blocks)), key=lambda i: -similarity[i])
+    if similarity.max() > 0:
+        # Unrelated blocks would only dilute the section; without any overlap keep a bounded slice
+        ranked = [i for i in ranked if similarity[i] > 0]
+    kept = []
+    used = 0
+    for i in ranked:
+        cost = len(blocks[i][2]) // CHARS_PER_TOKEN + 1
+        if used + cost <= budget_tokens:
+            kept.append(blocks[i])
+            used += cost
+    per_newsletter = {}
+    for index, _, text in sorted(kept):
+        per_newsletter.setdefault(index, []).append(text)
+    return [dict(newsletters[index], content="\n\n".join(texts)) for index, texts in sorted(per_newsletter.items())]
+
+
+def newsletters_for_topic(topic: Dict, newsletters: List[Dict]) -> List[Dict]:
+    """
+    Return the newsletters credited as sources of a topic.
+
+    Source names are matched loosely against sender display names and
+    subjects. If nothing matches, the story blocks most similar to the topic
+    are used instead (``relevant_blocks``), so an expansion prompt never
+    carries the whole corpus.
+    """
+    from dedup import sender_name
+
+    sources = [_normalize(source) for source in topic["sources"] if _normalize(source)]
+    matched = []
+    for newsletter in newsletters:
+        name = _normalize(sender_name(newsletter.get("sender", "")))
+        haystack = name + _normalize(newsletter.get("subject", ""))
+        if any(source in haystack or (name and name in source) for source in sources):
+            matched.append(newsletter)
+    return matched or relevant_blocks(topic, newsletters)
+
+
+def build_expansion_prompt(topic: Dict, rank: int, content: str) -> str:
+    """Build the prompt that writes one topic's full section."""
+    return EXPANSION_PROMPT.format(
+        rank=rank,
+        headline=topic["headline"],
+        summary=topic["summary"] or "(see newsletters)",
+        sources=", ".join(topic["sources"]) or "(not specified)",
+        content=content,
+    )
+
+
+def fallback_section(topic: Dict) -> str:
+    """Section used when a topic's expansion call fails: the outline summary and sources."""
+    return (f"- **What's New:** {topic['summary']}\n\n"
+            f"- **Source:** {', '.join(topic['sources'])}")
+
+
+def expand_topics(outline: List[Dict], prompts: List[str], complete: Callable[[str], str],
+                  max_workers: int = DEFAULT_EXPAND_CONCURRENCY) -> List[str]:
+    """
+    Expand every outline topic concurrently and return the sections in rank order.
+
+    Args:
+        outline: Ranked topics from ``parse_outline``
+        prompts: Expansion prompt for each topic
+        complete: Function that sends a prompt and returns the reply text
+        max_workers: Maximum number of expansion calls in flight
+
+    Returns:
+        List of section texts aligned with ``outline``; a failed expansion
+        falls back to the outline summary
+
+    Raises:
+        BudgetExceeded: If an expansion call does not fit in the budget
+    """
+    def expand(index):
+        try:
+            return complete(prompts[index]).strip()
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"Expanding topic {index + 1} failed: {str(e)}")
+            return fallback_section(outline[index])
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(executor.map(expand, range(len(outline))))
+
+
+def strip_repeated_headline(section: str) -> str:
+    """Drop a leading markdown heading if the model repeated the topic headline."""
+    return re.sub(r'^\s*#{1,6}\s+.*\n+', '', section, count=1)
+
+
+def assemble_analysis(outline: List[Dict], sections: List[str]) -> str:
+    """Assemble the final markdown analysis from the outline and expanded sections."""
+    parts = []
+    for rank, (topic, section) in enumerate(zip(outline, sections), 1):
+        parts.append(f"### {rank}. {topic['headline']}\n{strip_repeated_headline(section)}\n")
+    return "\n".join(parts)
@@ -0,0 +1,248 @@
+"""
+Per-newsletter story extracts reused across incremental runs.
+
+Daily rolling reports cover mostly the same newsletters as the day before.
+Instead of sending every newsletter in the window to the LLM again, each
+newsletter is reduced once to a short list of candidate stories with
+importance scores. Extracts are stored keyed by Gmail message id and by the
+version of the extraction prompt (a hash of its template, so editing the
+prompt invalidates old extracts automatically). A run only extracts
+newsletters it has not seen before; the final ranking and synthesis call
+works on the compact stored extracts.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from budget import BudgetExceeded
+from file_lock import locked, write_atomic
+
+EXTRACTION_PROMPT = """Extract the candidate news stories from this AI newsletter.
+
+For each distinct story (at most {max_stories}), give:
+- "title": a short, specific headline
+- "summary": one or two sentences on what happened
+- "importance": an integer from 1 (minor) to 10 (major development for regular people)
+- "links": URLs from the newsletter that point to the product or announcement
+
+Ignore sponsored content, advertisements, job listings and newsletter housekeeping.
+Respond with ONLY a JSON object of the form {{"stories": [...]}}.
+
+SUBJECT: {subject}
+SENDER: {sender}
+DATE: {date}
+CONTENT:
+{content}
+"""
+
+PROMPT_VERSION = hashlib.sha256(EXTRACTION_PROMPT.encode('utf-8')).hexdigest()[:12]
+MAX_STORIES = 8
+MAX_EXTRACT_CHARS = 12000
+RETENTION_DAYS = 30
+MAX_WORKERS = 4
+
+
+def extracts_path() -> str:
+    """Return the path of the extract store file."""
+    return os.environ.get("NEWSLETTER_EXTRACTS", "newsletter_extracts.json")
+
+
+def message_key(newsletter: Dict) -> str:
+    """
+    Return the store key for a newsletter.
+
+    The Gmail message id is used when available; otherwise a hash of sender,
+    date and subject stands in for it.
+    """
+    if newsletter.get('id'):
+        return str(newsletter['id'])
+    raw = f"{newsletter.get('sender', '')}|{newsletter.get('date', '')}|{newsletter.get('subject', '')}"
+    return "h:" + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def build_extraction_prompt(newsletter: Dict, content: str) -> str:
+    """Fill the extraction prompt for one cleaned newsletter."""
+    return EXTRACTION_PROMPT.format(
+        max_stories=MAX_STORIES,
+        subject=newsletter.get('subject', ''),
+        sender=newsletter.get('sender', ''),
+        date=newsletter.get('date', ''),
+        content=content[:MAX_EXTRACT_CHARS],
+    )
+
+
+def parse_extract(reply: str) -> List[Dict]:
+    """
+    Parse and normalise the stories from an extraction reply.
+
+    Args:
+        reply: Raw LLM reply, optionally wrapped in a markdown code fence
+
+    Returns:
+        List of story dictionaries with ``title``, ``summary``, ``importance``
+        and ``links``
+
+    Raises:
+        ValueError: If the reply is not a JSON object with a ``stories`` list
+    """
+    from topics import strip_code_fence
+
+    try:
+        data = json.loads(strip_code_fence(reply))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Extraction reply is not valid JSON: {str(e)}")
+    if not isinstance(data, dict) or not isinstance(data.get('stories'), list):
+        raise ValueError("Extraction reply has no 'stories' list")
+    stories = []
+    for story in data['stories'][:MAX_STORIES]:
+        if not isinstance(story, dict) or not isinstance(story.get('title'), str):
+            continue
+        try:
+            importance = int(story.get('importance', 5))
+        except (TypeError, ValueError):
+            importance = 5
+        stories.append({
+            'title': story['title'].strip(),
+            'summary': str(story.get('summary', '')).strip(),
+            'importance': min(10, max(1, importance)),
+            'links': [link for link in story.get('links', []) if isinstance(link, str)],
+        })
+    return stories
+
+
+class ExtractStore:
+    """Stored extracts for the current prompt version, persisted as JSON."""
+
+    def __init__(self, path: Optional[str] = None, prompt_version: str = PROMPT_VERSION):
+        self.path = path or extracts_path()
+        self.prompt_version = prompt_version
+        self._lock = threading.Lock()
+        self._new: Dict[str, Dict] = {}
+        # Extracts made with another prompt version are not reused
+        self._extracts: Dict[str, Dict] = dict(self._read().get(prompt_version, {}))
+
+    def _read(self) -> Dict:
+        """Read the store file, or return an empty store if it is missing or corrupt."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._extracts
+
+    def __len__(self) -> int:
+        return len(self._extracts)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the stored extract for a message key, if any."""
+        return self._extracts.get(key)
+
+    def put(self, key: str, record: Dict) -> None:
+        """Store the extract for a message key."""
+        with self._lock:
+            self._extracts[key] = record
+            self._new[key] = record
+
+    def save(self, retention_days: int = RETENTION_DAYS) -> None:
+        """
+        Merge the new extracts into the store file and write it atomically.
+
+        Extracts saved meanwhile by other runs, and those of other prompt
+        versions, are kept; extracts older than the retention period are
+        dropped from every version.
+        """
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=retention_days)).isoformat()
+        with locked(self.path):
+            data = self._read()
+            with self._lock:
+                data.setdefault(self.prompt_version, {}).update(self._new)
+                data = {
+                    version: {
+                        key: record for key, record in extracts.items()
+                        if isinstance(record, dict) and record.get('extracted_at', '') >= cutoff
+                    }
+                    for version, extracts in data.items() if isinstance(extracts, dict)
+                }
+                self._new = {}
+                self._extracts = dict(data.get(self.prompt_version, {}))
+            write_atomic(self.path, json.dumps(data))
+
+
+def extract_newsletters(newsletters: List[Dict], contents: List[str], complete: Callable[[str], str],
+                        store: Optional[ExtractStore] = None,
+                        max_workers: int = MAX_WORKERS) -> Tuple[List[Optional[Dict]], Dict]:
+    """
+    Return extracts for all newsletters, calling the LLM only for unseen ones.
+
+    Args:
+        newsletters: Newsletter dictionaries in the current window
+        contents: Cleaned body text for each newsletter
+        complete: Function that sends a prompt and returns the reply text
+        store: Extract store (defaults to the shared store file)
+        max_workers: Number of concurrent extraction calls
+
+    Returns:
+        Tuple of (extract record or None per newsletter, stats dictionary with
+        ``reused``, ``extracted`` and ``failed`` counts); records are saved to
+        the store, failed extractions are retried on the next run
+
+    Raises:
+        BudgetExceeded: If an extraction call does not fit in the budget (after
+            saving the extracts that completed)
+    """
+    store = store if store is not None else ExtractStore()
+    keys = [message_key(nl) for nl in newsletters]
+    pending = [i for i, key in enumerate(keys) if key not in store and contents[i].strip()]
+    stats = {'reused': sum(1 for key in keys if key in store), 'extracted': 0, 'failed': 0}
+
+    def extract(i):
+        reply = complete(build_extraction_prompt(newsletters[i], contents[i]))
+        return {
+            'sender': newsletters[i].get('sender', ''),
+            'subject': newsletters[i].get('subject', ''),
+            'date': newsletters[i].get('date', ''),
+            'stories': parse_extract(reply),
+            'extracted_at': datetime.datetime.now().isoformat(),
+        }
+
+    if pending:
+        print(f"Extracting stories from {len(pending)} new newsletter(s); "
+              f"reusing {stats['reused']} stored extract(s)")
+        budget_error = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {i: executor.submit(extract, i) for i in pending}
+            for i, future in futures.items():
+                try:
+                    store.put(keys[i], future.result())
+                    stats['extracted'] += 1
+                except BudgetExceeded as e:
+                    budget_error = budget_error or e
+                except Exception as e:
+                    print(f"Extraction failed for '{newsletters[i].get('subject', '')}': {str(e)}")
+                    stats['failed'] += 1
+        store.save()
+        if budget_error is not None:
+            # The completed extracts are kept; the run stops instead of synthesising from a partial set
+            raise budget_error
+    return [store.get(key) for key in keys], stats
+
+
+def format_extract(record: Dict) -> str:
+    """Format one extract as the compact candidate-story list used in the synthesis prompt."""
+    lines = []
+    for story in sorted(record['stories'], key=lambda s: -s['importance']):
+        line = f"- [importance {story['importance']}] {story['title']}: {story['summary']}"
+        if story['links']:
+            line += f" (links: {', '.join(story['links'])})"
+        lines.append(line)
+    return "\n".join(lines) or "- (no stories)"
@@ -0,0 +1,64 @@
+"""
+Per-path file locks and atomic writes shared by the modules that update files in place.
+
+``locked(path)`` serialises writers of one file across threads (a
+``threading.Lock`` per path) and across processes (``fcntl.flock`` on a
+``.lock`` file next to it, where available). Locks on different paths are
+independent, so e.g. saving the website cache never waits for a cost log
+append. ``write_atomic`` replaces a file through a temporary file of its
+own, so concurrent writers never share (and clobber) one ``.tmp`` path.
+"""
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+_registry_lock = threading.Lock()
+_thread_locks: Dict[str, threading.Lock] = {}
+
+
+def thread_lock(path: str) -> threading.Lock:
+    """Return the in-process lock of a path (the same lock for every spelling of the path)."""
+    key = os.path.abspath(path)
+    with _registry_lock:
+        lock = _thread_locks.get(key)
+        if lock is None:
+            lock = _thread_locks[key] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def locked(path: str):
+    """Hold the in-process and inter-process lock of a file."""
+    with thread_lock(path):
+        with open(f"{path}.lock", 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Replace a file's contents atomically through a uniquely named temporary file in its directory."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
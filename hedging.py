@@ -0,0 +1,354 @@
+"""
+Hedged LLM requests with latency-based failover across providers.
+
+A request is first sent to the primary provider of a fallback chain. If the
+primary has not produced its first streamed token within the hedge delay
+(by default its recent p95 time-to-first-token), the same request is sent to
+the next provider in the chain. The first complete answer wins and the
+remaining requests are cancelled. Every provider that produces tokens adds a
+sample to a small latency history file so the hedge delay tracks reality. A
+run loads one ``LatencyHistory`` and shares it between its hedged calls;
+saves append the new samples to the file's under its lock, so overlapping
+runs do not drop each other's samples.
+
+All providers are called through the OpenAI-compatible streaming chat
+completions API, which OpenRouter, OpenAI and Anthropic's compatibility
+endpoint all speak.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from clients import http_session
+from file_lock import locked, write_atomic
+
+DEFAULT_HEDGE_AFTER = 20.0  # seconds, used until a provider has latency history
+HISTORY_SIZE = 100
+MIN_SAMPLES_FOR_PERCENTILE = 5
+REQUEST_TIMEOUT = 300
+
+DEFAULT_CHAIN = [
+    {"name": "openrouter", "base_url": "https://openrouter.ai/api/v1", "api_key_env": "OPENROUTER_API_KEY"},
+    {"name": "openai", "base_url": "https://api.openai.com/v1", "api_key_env": "OPENAI_API_KEY",
+     "model": "gpt-4.1-2025-04-14"},
+    {"name": "anthropic", "base_url": "https://api.anthropic.com/v1", "api_key_env": "ANTHROPIC_API_KEY",
+     "model": "claude-3-7-sonnet-20250219"},
+]
+
+
+class RequestCancelled(Exception):
+    """Raised inside a provider call that lost the race and was cancelled."""
+    pass
+
+
+class LatencyHistory:
+    """Per-provider time-to-first-token and total latency samples, persisted as JSON."""
+
+    def __init__(self, path: Optional[str] = None, size: int = HISTORY_SIZE):
+        self.path = path or os.environ.get("LLM_LATENCY_HISTORY", "llm_latency_history.json")
+        self.size = size
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Dict[str, deque]] = {}
+        # Samples recorded since the last save, appended to the file's on save
+        self._pending: Dict[str, Dict[str, List[float]]] = {}
+        self._load(self._read())
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _load(self, data: Dict) -> None:
+        self._samples = {
+            key: {name: deque(values[-self.size:], maxlen=self.size) for name, values in series.items()}
+            for key, series in data.items()
+        }
+
+    def record(self, key: str, first_token: Optional[float] = None, total: Optional[float] = None) -> None:
+        """Add a latency sample (in seconds) for a provider key."""
+        with self._lock:
+            series = self._samples.setdefault(key, {
+                "first_token": deque(maxlen=self.size), "total": deque(maxlen=self.size)
+            })
+            pending = self._pending.setdefault(key, {"first_token": [], "total": []})
+            if first_token is not None:
+                series["first_token"].append(round(first_token, 3))
+                pending["first_token"].append(round(first_token, 3))
+            if total is not None:
+                series["total"].append(round(total, 3))
+                pending["total"].append(round(total, 3))
+
+    def percentile(self, key: str, pct: float, metric: str = "first_token") -> Optional[float]:
+        """Return the given percentile of a metric, or None without enough samples."""
+        with self._lock:
+            values = sorted(self._samples.get(key, {}).get(metric, []))
+        if len(values) < MIN_SAMPLES_FOR_PERCENTILE:
+            return None
+        index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+        return values[index]
+
+    def save(self) -> None:
+        """Append the new samples to the history file and write it atomically."""
+        with locked(self.path):
+            data = self._read()
+            with self._lock:
+                for key, pending in self._pending.items():
+                    series = data.setdefault(key, {})
+                    for name, values in pending.items():
+                        series[name] = (list(series.get(name, [])) + values)[-self.size:]
+                self._pending = {}
+                self._load(data)
+            write_atomic(self.path, json.dumps(data))
+
+
+def target_key(target: Dict) -> str:
+    """Return the history key for a chain target (provider and model)."""
+    return f"{target['name']}:{target.get('model', '')}"
+
+
+def build_fallback_chain(model: str, chain_spec: Optional[List[Dict]] = None,
+                         use_openrouter: bool = True) -> List[Dict]:
+    """
+    Resolve the fallback chain into callable targets.
+
+    The chain comes from ``chain_spec``, the ``LLM_FALLBACK_CHAIN`` environment
+    variable (a JSON list) or ``DEFAULT_CHAIN``. Entries without a ``model``
+    use the given OpenRouter model; entries whose API key is not configured
+    are skipped, and so are OpenRouter entries when ``use_openrouter`` is off.
+
+    Args:
+        model: Model for chain entries that do not pin their own
+        chain_spec: Optional list of chain entry dictionaries
+        use_openrouter: Keep the entries that call OpenRouter
+
+    Returns:
+        List of target dictionaries with ``name``, ``base_url``, ``api_key`` and ``model``
+    """
+    if chain_spec is None:
+        env_chain = os.environ.get("LLM_FALLBACK_CHAIN")
+        chain_spec = json.loads(env_chain) if env_chain else DEFAULT_CHAIN
+    targets = []
+    for entry in chain_spec:
+        api_key = entry.get("api_key") or os.environ.get(entry.get("api_key_env", ""), "")
+        if not api_key or (not use_openrouter and "openrouter.ai" in entry["base_url"]):
+            continue
+        targets.append({
+            "name": entry["name"],
+            "base_url": entry["base_url"].rstrip('/'),
+            "api_key": api_key,
+            "model": entry.get("model") or model,
+        })
+    return targets
+
+
+def usage_options(target: Dict) -> Dict:
+    """Return the request fields that ask a streaming endpoint to report token usage."""
+    if "openrouter.ai" in target["base_url"]:
+        return {"usage": {"include": True}}
+    return {"stream_options": {"include_usage": True}}
+
+
+def stream_chat_completion(target: Dict, messages: List[Dict], on_first_token: Callable[[], None],
+                           cancel_event: threading.Event, response_holder: Optional[list] = None,
+                           timeout: float = REQUEST_TIMEOUT, on_delta: Optional[Callable[[str], None]] = None,
+                           extra_body: Optional[Dict] = None) -> Dict:
+    """
+    Stream one chat completion from an OpenAI-compatible endpoint.
+
+    Args:
+        target: Chain target with ``base_url``, ``api_key`` and ``model``
+        messages: Chat messages to send
+        on_first_token: Called once when the first content token arrives
+        cancel_event: When set, the stream is closed and RequestCancelled raised
+        response_holder: Optional list the live response is appended to, so
+            another thread can close it to interrupt a blocking read
+        timeout: Connect/read timeout in seconds
+        on_delta: Optional callback receiving each content delta as it arrives
+        extra_body: Optional extra request fields (e.g. ``response_format``)
+
+    Returns:
+        Dictionary with ``content`` (full text), ``usage`` (may be empty) and
+        ``http_status``
+    """
+    response = http_session().post(
+        f"{target['base_url']}/chat/completions",
+        headers={
+            "Authorization": f"Bearer {target['api_key']}",
+            "Content-Type": "application/json",
+        },
+        data=json.dumps(dict({
+            "model": target["model"],
+            "messages": messages,
+            "stream": True,
+        }, **usage_options(target), **(extra_body or {}))),
+        stream=True,
+        timeout=timeout,
+    )
+    if response_holder is not None:
+        response_holder.append(response)
+    try:
+        if response.status_code != 200:
+            raise Exception(f"Error from {target['name']} API: {response.text}")
+        parts = []
+        usage = {}
+        got_first = False
+        # chunk_size=None yields data as it arrives instead of buffering 512 bytes
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if cancel_event.is_set():
+                raise RequestCancelled(target["name"])
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices", []):
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    if not got_first:
+                        got_first = True
+                        on_first_token()
+                    parts.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+        if cancel_event.is_set():
+            raise RequestCancelled(target["name"])
+        return {"content": "".join(parts), "usage": usage, "http_status": response.status_code}
+    finally:
+        response.close()
+
+
+def hedged_completion(messages: List[Dict], chain: List[Dict], hedge_after: Optional[float] = None,
+                      history: Optional[LatencyHistory] = None, percentile: float = 95,
+                      health=None) -> Dict:
+    """
+    Run a chat completion across a fallback chain with hedging.
+
+    Target ``i + 1`` is started when target ``i`` has neither produced a first
+    token within its hedge delay nor finished, or as soon as target ``i``
+    fails. The first complete answer wins; all other in-flight requests are
+    cancelled.
+
+    Args:
+        messages: Chat messages to send
+        chain: Targets from ``build_fallback_chain`` in priority order
+        hedge_after: Fixed hedge delay in seconds; defaults to each target's
+            recent p95 time-to-first-token, or ``DEFAULT_HEDGE_AFTER``
+        history: Latency history to read delays from and record samples into;
+            pass the run's shared history (a fresh one is loaded if None)
+        percentile: Percentile of first-token latency used as the hedge delay
+        health: Optional ``circuit_breaker.HealthStore`` that receives the
+            outcome of every target that finished or failed (cancelled
+            requests are not counted)
+
+    Returns:
+        Dictionary with ``content``, ``usage``, ``provider``, ``model``,
+        ``first_token_latency``, ``latency`` and ``hedged`` (number of extra
+        requests started)
+
+    Raises:
+        Exception: If every target in the chain fails
+    """
+    if not chain:
+        raise ValueError("No providers configured in the fallback chain")
+    history = history or LatencyHistory()
+    done = threading.Condition()
+    cancel_event = threading.Event()
+    # Per launched target: 'running', 'streaming', 'failed' or 'complete'
+    status = []
+    started_at = []
+    errors = []
+    responses = []
+    winner = {}
+
+    def run(index):
+        target = chain[index]
+        started = time.monotonic()
+        first_token_at = []
+
+        def on_first_token():
+            first_token_at.append(time.monotonic() - started)
+            with done:
+                status[index] = 'streaming'
+                done.notify_all()
+
+        try:
+            result = stream_chat_completion(target, messages, on_first_token, cancel_event, responses)
+            total = time.monotonic() - started
+            history.record(target_key(target), first_token_at[0] if first_token_at else None, total)
+            if health is not None:
+                health.record_success(target_key(target), total)
+            with done:
+                status[index] = 'complete'
+                if not winner:
+                    winner.update(result, provider=target["name"], model=target["model"],
+                                  first_token_latency=first_token_at[0] if first_token_at else None,
+                                  latency=total)
+                done.notify_all()
+        except Exception as e:
+            if first_token_at:
+                history.record(target_key(target), first_token_at[0])
+            if not isinstance(e, RequestCancelled) and not cancel_event.is_set():
+                print(f"Provider {target['name']} failed: {str(e)}")
+                errors.append(f"{target['name']}: {str(e)}")
+                if health is not None:
+                    health.record_failure(target_key(target), str(e))
+            with done:
+                status[index] = 'failed'
+                done.notify_all()
+
+    def launch():
+        status.append('running')
+        started_at.append(time.monotonic())
+        threading.Thread(target=run, args=(len(status) - 1,), daemon=True).start()
+
+    with done:
+        launch()
+        while not winner:
+            in_flight = [i for i, st in enumerate(status) if st in ('running', 'streaming')]
+            can_hedge = len(status) < len(chain)
+            if not in_flight:
+                if not can_hedge:
+                    break
+                # Everything launched so far failed: fail over immediately
+                launch()
+                continue
+            if can_hedge and not any(status[i] == 'streaming' for i in in_flight):
+                latest = chain[len(status) - 1]
+                delay = hedge_after
+                if delay is None:
+                    delay = history.percentile(target_key(latest), percentile) or DEFAULT_HEDGE_AFTER
+                remaining = started_at[-1] + delay - time.monotonic()
+                if remaining <= 0:
+                    print(f"No first token from {latest['name']} after {delay:.1f}s, "
+                          f"hedging to {chain[len(status)]['name']}")
+                    launch()
+                    continue
+                done.wait(remaining)
+            else:
+                done.wait()
+
+    cancel_event.set()
+    for response in list(responses):
+        try:
+            response.close()
+        except Exception:
+            pass
+    try:
+        history.save()
+    except OSError as e:
+        print(f"Warning: could not save latency history: {str(e)}")
+    if not winner:
+        raise Exception("All providers failed: " + "; ".join(errors))
+    return dict(winner, hedged=len(status) - 1)
@@ -2,6 +2,8 @@ import os
 import re
 import anthropic
 import datetime
+import threading
+import time
 # Add OpenAI import
 try:
     import openai
@@ -9,40 +11,269 @@ except ImportError:
     openai = None
 from yaspin import yaspin
 from utils import clean_body
-# Add requests for OpenRouter API
-import requests
+from model_catalog import DIRECT_CONTEXT_WINDOWS, direct_model_table, route_model, usage_cost
+from circuit_breaker import HealthStore
+from clients import anthropic_client, http_session, openai_client
+from cost_log import append_entry
+from chunking import check_context
+from expansion import OUTLINE_OUTPUT_FORMAT
+from timeline import newsletter_timestamp
 import json
 
-def analyze_newsletters_unified(newsletters, num_topics=10, provider='openai', model=None):
+# Map provider to actual OpenRouter model ID
+OPENROUTER_MODEL_MAP = {
+    'claude': "anthropic/claude-sonnet-4",
+    'openai': "openai/gpt-4.1-mini",
+    'google': "google/gemini-2.5-flash"
+}
+
+# Models used when calling provider APIs directly (fallback path)
+DIRECT_MODEL_MAP = {
+    'claude': "claude-3-7-sonnet-20250219",
+    'openai': "gpt-4.1-2025-04-14"
+}
+
+# Follow-up calls allowed when a model stops on its output limit
+MAX_CONTINUATIONS = 3
+# Characters of each newsletter sent when content is not pre-ranked
+NEWSLETTER_CONTENT_CHARS = 3000
+CONTINUE_MESSAGE = "Continue exactly where you left off. Do not repeat anything you already wrote."
+
+# Seconds to wait for an OpenRouter response before treating the call as failed
+REQUEST_TIMEOUT = 300
+
+OPENROUTER_SYSTEM_MESSAGE = "You are an AI consultant helping summarize AI newsletter content for regular people. Your primary goal is to identify the MOST SIGNIFICANT developments across different domains of AI, based on what appears in the newsletters being analyzed. When writing headlines, focus on the substantive development rather than secondary features or demonstrations (e.g., 'Anthropic Launches Claude 3.7' rather than 'Claude AI Plays Pokémon'). Make the 'Why It Matters' section relevant to everyday life, and ensure the 'Practical Impact' section provides specific, actionable advice that regular people can implement. Be sure to include brand new developments (even if only mentioned in 1-2 newsletters) if they appear to be significant. Format your response with markdown headings and sections. For each topic, include source information and relevant links to the actual products/announcements. IMPORTANT: Ignore or exclude any sponsored, advertorial, or ad content when identifying and summarizing key developments. Do not include advertisers or sponsors as top content, even if they appear frequently."
+
+STRUCTURED_SYSTEM_MESSAGE = OPENROUTER_SYSTEM_MESSAGE.replace(
+    "Format your response with markdown headings and sections.",
+    "Respond with JSON only, following the schema given in the request."
+)
+
+COVERAGE_GUIDELINE = (
+    '- Stories marked "[Covered by N sources: ...]" were reported by several newsletters and are only shown once; '
+    'treat a higher N as a signal of importance and credit every listed source\n'
+)
+
+EXTRACT_GUIDELINE = (
+    '- Newsletters listed with "CANDIDATE STORIES" were pre-extracted into stories with an importance score '
+    'from 1 to 10; use the scores and how many newsletters carry a story to rank topics\n'
+)
+
+MARKDOWN_OUTPUT_FORMAT = """Format your response with markdown:
+
+### 1. [Topic Headline]
+- **What's New:** [Brief description of the development]
+
+- **Why It Matters:** [Explanation for regular users]
+
+- **Practical Impact:** [2-3 specific actions or opportunities]
+
+- **Source:** [Newsletter names that covered this topic]
+
+### 2. [Next Topic]
+...and so on
+"""
+
+JSON_OUTPUT_FORMAT = """Respond with ONLY a JSON object (no markdown, no commentary) of this shape:
+
+{"topics": [
+  {"headline": "Clear, concise headline",
+   "whats_new": "Brief description of the development",
+   "why_it_matters": "Explanation for regular users",
+   "actions": ["Specific action", "Another action"],
+   "sources": ["Newsletter name", "Another newsletter"],
+   "links": [{"title": "Product or announcement", "url": "https://..."}]}
+]}
+"""
+
+def openrouter_enabled():
+    """Return True unless ``USE_OPENROUTER`` turns OpenRouter off."""
+    return os.environ.get("USE_OPENROUTER", "true").lower() in ("true", "1", "yes")
+
+def direct_provider_for(provider, model=None):
+    """Return the direct API ('openai' or 'claude') serving a provider or direct model id."""
+    table = direct_model_table()
+    if model in table:
+        return table[model]['provider']
+    return 'openai' if provider == 'openai' or (model or '').startswith('openai/') else 'claude'
+
+def provider_chain(provider, model=None, use_openrouter=True):
     """
-    Process newsletters in a single step - identifying topics and generating summaries.
-    Now with OpenRouter support and custom model option.
+    Return the ``hedging.py`` fallback chain for a call.
+    
+    With OpenRouter on, the chain starts with OpenRouter serving ``model`` (or
+    the provider's OpenRouter model). With it off, only the direct APIs are
+    used, starting with the one serving the requested provider or direct
+    model id, which runs that model (or the provider's direct model).
+    
+    Raises:
+        ValueError: If no model is given and the provider is unknown
+    """
+    from hedging import build_fallback_chain
+    
+    if use_openrouter:
+        if not model:
+            if provider not in OPENROUTER_MODEL_MAP:
+                raise ValueError(f"Unknown model provider: {provider}")
+            model = OPENROUTER_MODEL_MAP[provider]
+        return build_fallback_chain(model)
+    direct_provider = direct_provider_for(provider, model)
+    if model not in direct_model_table():
+        model = DIRECT_MODEL_MAP[direct_provider]
+    name = 'anthropic' if direct_provider == 'claude' else 'openai'
+    chain = build_fallback_chain(model, use_openrouter=False)
+    for target in chain:
+        if target['name'] == name:
+            target['model'] = model
+    return sorted(chain, key=lambda target: target['name'] != name)
+
+def cleaned_content(nl):
+    """Return a newsletter's cleaned Markdown, reusing the ``content`` stored by the pipeline's clean stage."""
+    if 'content' in nl:
+        return nl['content']
+    return clean_body(nl['body'], nl.get('body_format'))
+
+def build_newsletter_content(newsletters, dedupe_stories=False, prerank_budget=None):
+    """
+    Clean newsletters and assemble the NEWSLETTER CONTENT block of the prompt.
     
     Args:
         newsletters: List of newsletter dictionaries
-        num_topics: Number of topics to identify and summarize (default: 10)
-        provider: 'openai', 'claude', or 'google'
-        model: Optional custom OpenRouter model name, overrides provider if specified
+        dedupe_stories: If True, near-duplicate stories across newsletters are
+            sent once with a "covered by N sources" annotation
+        prerank_budget: Optional token budget; if set, story blocks are ranked
+            locally with TF-IDF and only the top-scoring blocks that fit the
+            budget are kept (replacing the fixed per-newsletter truncation)
         
     Returns:
-        Tuple of (analysis_text, extracted_topic_titles)
+        The formatted newsletter content string
     """
-    # Prepare newsletter content
-    content_parts = []
+    cleaned = [cleaned_content(nl) for nl in newsletters]
+    if dedupe_stories and not prerank_budget:
+        # Truncate before clustering, so a shared story is kept in a copy that survives the cut
+        cleaned = [content[:NEWSLETTER_CONTENT_CHARS] for content in cleaned]
+    if dedupe_stories or prerank_budget:
+        documents = [
+            {'content': content, 'sender': nl['sender'], 'date': nl.get('date'),
+             'timestamp': newsletter_timestamp(nl)}
+            for content, nl in zip(cleaned, newsletters)
+        ]
+    if dedupe_stories:
+        from dedup import deduplicate_newsletter_content
+        cleaned = deduplicate_newsletter_content(documents)
+        for document, content in zip(documents, cleaned):
+            document['content'] = content
+    if prerank_budget:
+        from ranking import prerank_newsletter_content
+        cleaned = prerank_newsletter_content(documents, budget_tokens=prerank_budget)
     
-    for i, nl in enumerate(newsletters, 1):
-        clean_content = clean_body(nl['body'], nl.get('body_format'))
-        
+    content_parts = []
+    for i, (nl, clean_content) in enumerate(zip(newsletters, cleaned), 1):
+        if prerank_budget:
+            if not clean_content:
+                continue
+        elif dedupe_stories:
+            clean_content = f"{clean_content}..."  # Already truncated before deduplication
+        else:
+            clean_content = f"{clean_content[:NEWSLETTER_CONTENT_CHARS]}..."  # Truncate to manage token usage
         # Add structured newsletter entry with metadata
         content_parts.append(
             f"NEWSLETTER #{i}\n"
             f"SUBJECT: {nl['subject']}\n"
             f"SENDER: {nl['sender']}\n"
             f"DATE: {nl['date']}\n"
-            f"CONTENT:\n{clean_content[:3000]}...\n\n"  # Truncate to manage token usage
+            f"CONTENT:\n{clean_content}\n\n"
         )
     
-    newsletter_content = "\n".join(content_parts)
+    return "\n".join(content_parts)
+
+def build_incremental_content(newsletters, provider='openai', model=None, run_info=None, budget=None,
+                              health=None):
+    """
+    Assemble the NEWSLETTER CONTENT block from stored per-newsletter extracts.
+    
+    Newsletters without a stored extract for the current extraction prompt
+    version are extracted first (concurrently); all others reuse the stored
+    candidate stories, so LLM input grows with new mail rather than with the
+    length of the reporting window.
+    
+    Args:
+        newsletters: List of newsletter dictionaries
+        provider: 'claude', 'openai', 'google' or 'auto' to pick the extraction model
+        model: Optional custom OpenRouter model name for extraction
+        run_info: Optional dictionary that receives extraction stats under 'incremental'
+        budget: Optional ``budget.Budget``; each extraction call reserves its
+            estimated cost and is skipped (falling back to the newsletter text)
+            once the budget is used up
+        health: Optional ``HealthStore`` shared by the run's calls
+        
+    Returns:
+        The formatted newsletter content string
+    """
+    from extracts import extract_newsletters, format_extract
+    
+    cleaned = [cleaned_content(nl) for nl in newsletters]
+    use_openrouter = openrouter_enabled()
+    if not model and provider not in OPENROUTER_MODEL_MAP:
+        # Extraction is a small per-newsletter task: use the cheapest routed model
+        # (one topic's worth of output, so an empty prompt does not price every model at zero)
+        model = route_model("", num_topics=1, table=None if use_openrouter else direct_model_table())['model']
+    priced_model = model or (OPENROUTER_MODEL_MAP[provider] if use_openrouter else
+                             DIRECT_MODEL_MAP[direct_provider_for(provider)])
+    
+    def extract(prompt):
+        if budget is not None and budget.enabled:
+            from budget import estimate_call
+            budget.reserve(estimate_call(prompt, priced_model, num_topics=1), "Extraction call")
+        return complete_with_chain(prompt, provider, model, stage='extract', health=health)
+    
+    records, stats = extract_newsletters(newsletters, cleaned, extract)
+    print(f"Incremental analysis: {stats['reused']} extracts reused, {stats['extracted']} new, "
+          f"{stats['failed']} failed")
+    if run_info is not None:
+        run_info['incremental'] = stats
+    
+    content_parts = []
+    for i, (nl, record, clean_content) in enumerate(zip(newsletters, records, cleaned), 1):
+        header = f"NEWSLETTER #{i}\nSUBJECT: {nl['subject']}\nSENDER: {nl['sender']}\nDATE: {nl['date']}\n"
+        if record is not None:
+            content_parts.append(f"{header}CANDIDATE STORIES:\n{format_extract(record)}\n\n")
+        elif clean_content.strip():
+            # Extraction failed this run: fall back to the truncated newsletter text
+            content_parts.append(f"{header}CONTENT:\n{clean_content[:NEWSLETTER_CONTENT_CHARS]}...\n\n")
+    return "\n".join(content_parts)
+
+def build_analysis_prompt(newsletters, num_topics=10, provider='openai', model=None, dedupe_stories=False,
+                          prerank_budget=None, structured=False, incremental=False, run_info=None, budget=None,
+                          health=None):
+    """
+    Build the topic analysis prompt for a set of newsletters.
+    
+    Args:
+        newsletters: List of newsletter dictionaries
+        num_topics: Number of topics to identify and summarize
+        provider: Provider used for incremental extraction calls
+        model: Optional custom OpenRouter model used for incremental extraction calls
+        dedupe_stories: Send near-duplicate stories once, annotated with their source count
+        prerank_budget: Optional token budget for locally pre-ranked story blocks
+        structured: Ask for JSON topics instead of markdown
+        incremental: Use stored per-newsletter extracts as the newsletter content
+        run_info: Optional dictionary that receives incremental extraction stats
+        budget: Optional ``budget.Budget`` that incremental extraction calls reserve from
+        health: Optional ``HealthStore`` for incremental extraction calls
+        
+    Returns:
+        The prompt string
+    """
+    output_format = JSON_OUTPUT_FORMAT if structured else MARKDOWN_OUTPUT_FORMAT
+    if incremental:
+        newsletter_content = build_incremental_content(newsletters, provider, model, run_info=run_info, budget=budget,
+                                                       health=health)
+        dedupe_stories = False
+    else:
+        newsletter_content = build_newsletter_content(
+            newsletters, dedupe_stories=dedupe_stories, prerank_budget=prerank_budget
+        )
     
     # Build comprehensive prompt with source and link requirements
     prompt = f"""
@@ -56,20 +287,7 @@ For each topic:
 5. At the end of each topic, add:
    - A line starting with "**Source:**" that lists the newsletter(s) where this information came from (e.g., "**Source:** The Neuron, TLDR AI...")
 
-Format your response with markdown:
-
-### 1. [Topic Headline]
-- **What's New:** [Brief description of the development]
-
-- **Why It Matters:** [Explanation for regular users]
-
-- **Practical Impact:** [2-3 specific actions or opportunities]
-
-- **Source:** [Newsletter names that covered this topic]
-
-### 2. [Next Topic]
-...and so on
-
+{output_format}
 GUIDELINES:
 - Identify exactly {num_topics} topics unless there aren't enough distinct topics in the content
 - Sort topics by importance (most important first)
@@ -80,48 +298,501 @@ GUIDELINES:
 - "Why It Matters" should explain real-world implications, not just industry impact
 - "Practical Impact" must be truly actionable - what can regular people DO with this information?
 - For "Source" information, list the actual newsletter names (e.g., "The Neuron", "TLDR AI", "AI Breakfast")
-
+{COVERAGE_GUIDELINE if dedupe_stories else ""}{EXTRACT_GUIDELINE if incremental else ""}
 NEWSLETTER CONTENT:
 {newsletter_content}
 """
+    return prompt
+
+def extract_topic_titles(analysis_text):
+    """Return the topic headlines from a markdown analysis."""
+    return re.findall(r'###\s*\d+\.\s*(.*?)\n', analysis_text)
+
+def analyze_newsletters_unified(newsletters, num_topics=10, provider='openai', model=None, dedupe_stories=False,
+                                prerank_budget=None, min_tier=1, run_info=None, hedge=False, hedge_after=None,
+                                structured=False, incremental=False, two_step=False, expand_concurrency=None,
+                                budget=None, prompt=None, health=None, latency_history=None):
+    """
+    Process newsletters in a single step - identifying topics and generating summaries.
+    Now with OpenRouter support and custom model option.
+    
+    Args:
+        newsletters: List of newsletter dictionaries
+        num_topics: Number of topics to identify and summarize (default: 10)
+        provider: 'openai', 'claude', 'google', or 'auto' to route by prompt size and cost
+        model: Optional custom OpenRouter model name, overrides provider if specified
+        dedupe_stories: Send near-duplicate stories once, annotated with their source count
+        prerank_budget: Optional token budget for locally pre-ranked story blocks
+        min_tier: Minimum model quality tier when provider is 'auto'
+        run_info: Optional dictionary that is filled with details about the
+            call (e.g. the model actually used and any routing decision)
+        hedge: Stream through the provider fallback chain, hedging slow providers
+        hedge_after: Optional fixed hedge delay in seconds (default: recent p95)
+        structured: Ask for JSON topics matching ``topics.TOPIC_SCHEMA``, parse
+            them while streaming and render the markdown locally; the topic
+            objects are stored in ``run_info['topics']``
+        incremental: Reduce each newsletter to stored candidate-story extracts
+            (see ``extracts.py``), calling the LLM only for newsletters not
+            seen in earlier runs; the final call ranks and synthesizes the
+            extracts. Story dedupe and pre-ranking do not apply in this mode
+        two_step: First request only the ranked topic outline, then write each
+            topic's section in its own concurrent call (see ``expansion.py``);
+            not combined with ``structured``
+        expand_concurrency: Maximum concurrent expansion calls in two-step mode
+        budget: Optional ``budget.Budget``; the estimated cost is checked before
+            the analysis (downgrading the model or trimming content, or raising
+            ``budget.BudgetExceeded``) and reserved before every call
+        prompt: Optional analysis prompt already built by ``build_analysis_prompt``
+            with the same options (e.g. loaded from a run checkpoint, see ``runs.py``)
+        health: Optional ``HealthStore`` shared by every call of the run, so
+            breaker state is loaded once and saved without losing other runs' updates
+        latency_history: Optional ``hedging.LatencyHistory`` shared by the
+            run's hedged calls
+        
+    Returns:
+        Tuple of (analysis_text, extracted_topic_titles)
+    """
+    health = health or HealthStore()
+    if hedge and latency_history is None:
+        from hedging import LatencyHistory
+        latency_history = LatencyHistory()
+    if prompt is None:
+        prompt = build_analysis_prompt(
+            newsletters, num_topics=num_topics, provider=provider, model=model, dedupe_stories=dedupe_stories,
+            prerank_budget=prerank_budget, structured=structured, incremental=incremental, run_info=run_info,
+            budget=budget, health=health
+        )
     
     # Check if we should use OpenRouter
-    use_openrouter = os.environ.get("USE_OPENROUTER", "true").lower() in ("true", "1", "yes")
+    use_openrouter = openrouter_enabled()
     
-    # Call the appropriate LLM
-    analysis_text = ""
-    if use_openrouter:
-        print("Using OpenRouter for unified analysis")
-        analysis_text = analyze_with_openrouter(prompt, provider, model)
-    else:
-        if provider == 'openai':
-            client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-            response = client.chat.completions.create(
-                model="gpt-4.1-2025-04-14",
-                messages=[
-                    {"role": "system", "content": "You are an AI consultant helping summarize AI newsletter content for regular people."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            analysis_text = response.choices[0].message.content
-        else:  # Default to Claude if not OpenAI
-            anthropic_client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-            response = anthropic_client.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                max_tokens=3000,
-                system="You are an AI consultant helping summarize AI newsletter content for regular people.",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+    routing = None
+    if provider == 'auto' and not model:
+        provider, model, routing = route_analysis(prompt, provider, num_topics, min_tier, use_openrouter)
+    if run_info is not None:
+        run_info['provider'] = provider
+        run_info['model'] = model
+        run_info['routing'] = routing
+    
+    context_model = model or (OPENROUTER_MODEL_MAP.get(provider) if use_openrouter else
+                              DIRECT_MODEL_MAP.get(provider, DIRECT_MODEL_MAP['claude']))
+    budgeted = budget is not None and budget.enabled
+    if budgeted:
+        from budget import plan_within_budget
+        
+        def rebuild_prompt(content_tokens):
+            return build_analysis_prompt(
+                newsletters, num_topics=num_topics, provider=provider, model=model, dedupe_stories=dedupe_stories,
+                prerank_budget=min(content_tokens, prerank_budget or content_tokens), structured=structured
             )
-            analysis_text = response.content[0].text
+        
+        plan = plan_within_budget(
+            budget, prompt, context_model, num_topics, rebuild_prompt=None if incremental else rebuild_prompt,
+            can_switch_model=use_openrouter, min_tier=min_tier
+        )
+        print(f"Estimated analysis cost: ${plan['estimate']['cost']:.4f} on {plan['model']} ({budget.describe()})")
+        prompt = plan['prompt']
+        if plan['model'] != context_model:
+            model = context_model = plan['model']
+        if run_info is not None:
+            run_info['model'] = model
+            run_info['budget'] = {key: value for key, value in plan.items() if key != 'prompt'}
+    
+    def complete(prompt_text, topics=num_topics):
+        if budgeted:
+            from budget import estimate_call
+            budget.reserve(estimate_call(prompt_text, context_model, topics), "Analysis call")
+        if structured:
+            from topics import render_markdown
+            topics, stats = analyze_structured(prompt_text, provider, model, health=health,
+                                               budget=budget if budgeted else None)
+            return render_markdown(topics), topics, stats
+        return run_analysis_call(prompt_text, provider, model, use_openrouter, hedge, hedge_after, routing,
+                                 health=health, latency_history=latency_history), None, None
+    
+    # Guard against prompts larger than the model's context window
+    guard = check_context(prompt, context_model, num_topics)
+    if not guard['fits']:
+        analysis_text, topics, stats = analyze_in_chunks(
+            newsletters, guard, complete, num_topics=num_topics, provider=provider, model=model,
+            dedupe_stories=dedupe_stories, prerank_budget=prerank_budget, structured=structured,
+            incremental=incremental, run_info=run_info
+        )
+    elif two_step and not structured:
+        analysis_text = analyze_two_step(
+            prompt.replace(MARKDOWN_OUTPUT_FORMAT, OUTLINE_OUTPUT_FORMAT), newsletters,
+            lambda text, topics=num_topics: complete(text, topics)[0], num_topics=num_topics, dedupe_stories=dedupe_stories,
+            prerank_budget=prerank_budget, max_workers=expand_concurrency, run_info=run_info
+        )
+        if analysis_text is None:
+            analysis_text, topics, stats = complete(prompt)
+    else:
+        if structured:
+            print("Using structured JSON output for unified analysis")
+        analysis_text, topics, stats = complete(prompt)
+    
+    if structured:
+        if run_info is not None:
+            run_info['topics'] = topics
+            run_info['structured'] = stats
+        return analysis_text, [topic['headline'] for topic in topics]
     
     # Extract topic titles from the analysis for report metadata
-    topic_titles = re.findall(r'###\s*\d+\.\s*(.*?)\n', analysis_text)
+    topic_titles = extract_topic_titles(analysis_text)
     
     return analysis_text, topic_titles
 
-def analyze_with_openrouter(prompt, model_provider, custom_model=None):
+def merge_partial_analyses(partials, num_topics=10, provider='openai', model=None, budget=None, run_info=None,
+                           health=None):
+    """
+    Merge partial analyses of newsletter chunks into the final topics with one call.
+    
+    Used by the streaming pipeline (``pipeline.py``), which analyzes chunks
+    while later newsletters are still being fetched.
+    
+    Args:
+        partials: Markdown analyses of the chunks
+        num_topics: Number of topics in the final analysis
+        provider: 'openai', 'claude', 'google' or 'auto'
+        model: Optional custom OpenRouter model name
+        budget: Optional ``budget.Budget`` the merge call reserves from
+        run_info: Optional dictionary that receives the merge call's provider,
+            model and routing decision
+        health: Optional ``HealthStore`` shared with the chunk analyses
+        
+    Returns:
+        Tuple of (analysis_text, extracted_topic_titles)
+    """
+    from chunking import build_merge_prompt
+    
+    prompt = build_merge_prompt(partials, num_topics, MARKDOWN_OUTPUT_FORMAT)
+    use_openrouter = openrouter_enabled()
+    routing = None
+    if provider == 'auto' and not model:
+        provider, model, routing = route_analysis(prompt, provider, num_topics, use_openrouter=use_openrouter)
+    if budget is not None and budget.enabled:
+        from budget import estimate_call
+        context_model = model or (OPENROUTER_MODEL_MAP.get(provider) if use_openrouter else
+                                  DIRECT_MODEL_MAP.get(provider, DIRECT_MODEL_MAP['claude']))
+        budget.reserve(estimate_call(prompt, context_model, num_topics), "Merge call")
+    if run_info is not None:
+        run_info.update(provider=provider, model=model, routing=routing)
+    print(f"Merging {len(partials)} partial analyses")
+    analysis_text = run_analysis_call(prompt, provider, model, use_openrouter, routing=routing, health=health)
+    return analysis_text, extract_topic_titles(analysis_text)
+
+def route_analysis(prompt, provider='auto', num_topics=10, min_tier=1, use_openrouter=True):
+    """
+    Route an analysis prompt to the cheapest model that fits (``--llm-provider auto``).
+    
+    With OpenRouter off, only models with a direct client are considered
+    (``model_catalog.direct_model_table``), so the routed model is the one
+    that is actually called and its price is the one that is charged.
+    
+    Args:
+        prompt: The full prompt that will be sent
+        provider: The requested provider, kept when routing through OpenRouter
+        num_topics: Number of topics requested
+        min_tier: Minimum model quality tier
+        use_openrouter: Whether the call goes through OpenRouter
+        
+    Returns:
+        Tuple of (provider, model, routing decision)
+    """
+    if use_openrouter:
+        routing = route_model(prompt, num_topics=num_topics, min_tier=min_tier)
+    else:
+        routing = route_model(prompt, num_topics=num_topics, min_tier=min_tier, table=direct_model_table())
+        provider = routing['provider']
+    print(f"Auto-routing to {routing['model']} (~{routing['estimated_input_tokens']} input tokens, "
+          f"estimated cost ${routing['estimated_cost']:.4f}): {routing['reason']}")
+    return provider, routing['model'], routing
+
+def run_analysis_call(prompt, provider, model=None, use_openrouter=True, hedge=False, hedge_after=None,
+                      routing=None, health=None, latency_history=None):
+    """
+    Send an analysis prompt through the configured call path and return the text.
+    
+    Args:
+        prompt: The prompt to send
+        provider: 'openai', 'claude' or 'google'
+        model: Optional custom OpenRouter model name, or a direct model id when
+            ``use_openrouter`` is off (see ``model_catalog.DIRECT_MODEL_TABLE``)
+        use_openrouter: Route through OpenRouter (with direct-API fallback)
+        hedge: Use the hedged provider chain
+        hedge_after: Optional fixed hedge delay in seconds
+        routing: Optional routing decision passed through to the cost log
+        health: Optional ``HealthStore`` for the OpenRouter and hedged paths
+        latency_history: Optional ``hedging.LatencyHistory`` for the hedged path
+        
+    Returns:
+        The analysis text
+    """
+    if use_openrouter and hedge:
+        print("Using hedged provider chain for unified analysis")
+        return analyze_with_fallback(prompt, provider, model, hedge=True, hedge_after=hedge_after, health=health,
+                                     latency_history=latency_history)
+    elif use_openrouter:
+        print("Using OpenRouter for unified analysis")
+        return analyze_with_fallback(prompt, provider, model, routing=routing, health=health)
+    return complete_direct(
+        prompt, provider, model,
+        system="You are an AI consultant helping summarize AI newsletter content for regular people.",
+        routing=routing
+    )
+
+def complete_direct(prompt, provider='claude', model=None, system=None, routing=None, failed_attempts=0):
+    """
+    Send a prompt straight to the OpenAI or Anthropic API and log its usage and cost.
+    
+    The SDK's own retries (``retries_taken``) and ``failed_attempts`` made
+    elsewhere for the same answer are counted in the logged ``retries``.
+    
+    Args:
+        prompt: The prompt to send
+        provider: 'openai' or 'claude' (anything else uses Claude)
+        model: Optional direct model id from ``model_catalog.DIRECT_MODEL_TABLE``;
+            other ids (e.g. OpenRouter names) use the provider's default model
+        system: Optional system prompt
+        routing: Optional routing decision stored with the cost log entry
+        failed_attempts: Requests that already failed for this answer (e.g. OpenRouter
+            before the direct fallback)
+        
+    Returns:
+        The response text
+    """
+    if model in DIRECT_CONTEXT_WINDOWS:
+        provider = direct_model_table()[model]['provider']
+    else:
+        provider = 'openai' if provider == 'openai' else 'claude'
+        model = DIRECT_MODEL_MAP[provider]
+    system = system or "You are an AI consultant helping summarize newsletter content."
+    usage = {}
+    request_start = datetime.datetime.now().isoformat()
+    started = time.monotonic()
+    if provider == 'openai':
+        content = complete_openai_with_continuation(openai_client(), model, [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ], usage=usage)
+    else:
+        content = complete_anthropic_with_continuation(
+            anthropic_client(), model, system, [{"role": "user", "content": prompt}], usage=usage
+        )
+    latency = time.monotonic() - started
+    usage['total_tokens'] = usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+    usage['cost'] = usage_cost(model, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+    record_completion(model, "auto" if routing else provider, usage, request_start, latency,
+                      attempts=1 + usage.pop('retries', 0) + failed_attempts, routing=routing, direct=True)
+    print(f"Direct {provider} call: {usage['total_tokens']} tokens used with {model} in {latency:.1f}s "
+          f"(estimated cost ${usage['cost']})")
+    return content
+
+def create_counting_retries(endpoint, usage=None, **kwargs):
+    """
+    Call an SDK ``create`` endpoint, adding the retries the SDK made to ``usage['retries']``.
+    
+    The raw-response wrapper is the only place the OpenAI and Anthropic SDKs
+    report ``retries_taken``; the parsed response is returned as usual.
+    """
+    raw = endpoint.with_raw_response.create(**kwargs)
+    retries = getattr(raw, 'retries_taken', 0)
+    if usage is not None and isinstance(retries, int):
+        usage['retries'] = usage.get('retries', 0) + retries
+    return raw.parse()
+
+def add_usage(usage, prompt_tokens, completion_tokens):
+    """Add one response's token counts to a usage dictionary (ignoring missing counts)."""
+    if usage is None:
+        return
+    for key, value in (('prompt_tokens', prompt_tokens), ('completion_tokens', completion_tokens)):
+        if isinstance(value, int):
+            usage[key] = usage.get(key, 0) + value
+
+def analyze_two_step(outline_prompt, newsletters, complete, num_topics=10, dedupe_stories=False,
+                     prerank_budget=None, max_workers=None, run_info=None):
+    """
+    Generate the analysis as a ranked outline followed by parallel per-topic expansion.
+    
+    Args:
+        outline_prompt: Analysis prompt asking for the JSON topic outline
+        newsletters: List of newsletter dictionaries
+        complete: Function that sends a prompt and returns the reply text; an
+            optional second argument gives the number of topics the reply
+            covers (1 for an expansion call), for budget reservations
+        num_topics: Maximum number of topics
+        dedupe_stories, prerank_budget: Content options for the expansion prompts
+        max_workers: Maximum concurrent expansion calls (default ``DEFAULT_EXPAND_CONCURRENCY``)
+        run_info: Optional dictionary that receives stats under 'two_step'
+        
+    Returns:
+        The assembled markdown analysis, or None if no usable outline came back
+        (the caller then falls back to a single call)
+    """
+    from expansion import (
+        DEFAULT_EXPAND_CONCURRENCY,
+        assemble_analysis,
+        build_expansion_prompt,
+        expand_topics,
+        newsletters_for_topic,
+        parse_outline
+    )
+    
+    max_workers = max_workers or DEFAULT_EXPAND_CONCURRENCY
+    started = time.monotonic()
+    print("Two-step generation: requesting the ranked topic outline")
+    try:
+        outline = parse_outline(complete(outline_prompt), num_topics)
+    except ValueError as e:
+        print(f"Could not use the topic outline ({str(e)}); falling back to a single call")
+        return None
+    outline_latency = time.monotonic() - started
+    
+    prompts = [
+        build_expansion_prompt(topic, rank, build_newsletter_content(
+            newsletters_for_topic(topic, newsletters), dedupe_stories=dedupe_stories, prerank_budget=prerank_budget
+        ))
+        for rank, topic in enumerate(outline, 1)
+    ]
+    print(f"Expanding {len(outline)} topics with up to {max_workers} concurrent calls")
+    # Each expansion call writes a single topic
+    sections = expand_topics(outline, prompts, lambda text: complete(text, 1), max_workers=max_workers)
+    if run_info is not None:
+        run_info['two_step'] = {
+            "topics": len(outline),
+            "concurrency": max_workers,
+            "outline_latency": round(outline_latency, 3),
+            "latency": round(time.monotonic() - started, 3),
+        }
+    return assemble_analysis(outline, sections)
+
+def complete_openai_with_continuation(client, model, messages, usage=None):
+    """
+    Call the OpenAI chat API, continuing the answer if it stops on the output limit.
+    
+    Args:
+        client: ``openai.OpenAI`` client
+        model: Model id
+        messages: Chat messages
+        usage: Optional dictionary that accumulates ``prompt_tokens``,
+            ``completion_tokens`` and SDK ``retries`` over all calls
+        
+    Returns:
+        The full response text
+    """
+    response = create_counting_retries(client.chat.completions, usage, model=model, messages=messages)
+    add_usage(usage, getattr(response.usage, 'prompt_tokens', None), getattr(response.usage, 'completion_tokens', None))
+    content = response.choices[0].message.content
+    continuations = 0
+    while response.choices[0].finish_reason == "length" and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        print(f"Response stopped at the output limit; requesting continuation {continuations}")
+        response = create_counting_retries(client.chat.completions, usage, model=model, messages=messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": CONTINUE_MESSAGE}
+        ])
+        add_usage(usage, getattr(response.usage, 'prompt_tokens', None),
+                  getattr(response.usage, 'completion_tokens', None))
+        content += response.choices[0].message.content
+    return content
+
+def complete_anthropic_with_continuation(client, model, system, messages, max_tokens=3000, usage=None):
+    """
+    Call the Anthropic messages API, continuing the answer if it hits ``max_tokens``.
+    
+    The partial answer is sent back as a prefilled assistant turn, so the
+    model resumes mid-text instead of starting over.
+    
+    Args:
+        client: ``anthropic.Anthropic`` client
+        model: Model id
+        system: System prompt
+        messages: Conversation messages
+        max_tokens: Output token limit per call
+        usage: Optional dictionary that accumulates ``prompt_tokens``,
+            ``completion_tokens`` and SDK ``retries`` over all calls
+        
+    Returns:
+        The full response text
+    """
+    response = create_counting_retries(client.messages, usage, model=model, max_tokens=max_tokens, system=system,
+                                       messages=messages)
+    add_usage(usage, getattr(response.usage, 'input_tokens', None), getattr(response.usage, 'output_tokens', None))
+    content = response.content[0].text
+    continuations = 0
+    while response.stop_reason == "max_tokens" and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        print(f"Response stopped at the output limit; requesting continuation {continuations}")
+        # A prefilled assistant turn may not end with whitespace
+        content = content.rstrip()
+        response = create_counting_retries(
+            client.messages, usage, model=model, max_tokens=max_tokens, system=system,
+            messages=messages + [{"role": "assistant", "content": content}]
+        )
+        add_usage(usage, getattr(response.usage, 'input_tokens', None), getattr(response.usage, 'output_tokens', None))
+        content += response.content[0].text
+    return content
+
+def analyze_in_chunks(newsletters, guard, complete, num_topics=10, provider='openai', model=None,
+                      dedupe_stories=False, prerank_budget=None, structured=False, incremental=False,
+                      run_info=None):
+    """
+    Analyze newsletters that do not fit one request in balanced chunks, then merge.
+    
+    Newsletters are split along their boundaries into the smallest number of
+    balanced chunks that fit the context window, each chunk is analyzed
+    concurrently with the usual prompt, and a merge call combines the partial
+    topic lists into the final ``num_topics`` topics.
+    
+    Args:
+        newsletters: List of newsletter dictionaries
+        guard: Result of ``chunking.check_context`` for the full prompt
+        complete: Function taking a prompt and returning ``(text, topics, stats)``
+        num_topics: Number of topics in the final analysis
+        provider, model, dedupe_stories, prerank_budget, structured, incremental:
+            Options passed on to ``build_analysis_prompt`` for each chunk
+        run_info: Optional dictionary that receives the split under 'chunking'
+        
+    Returns:
+        Tuple of (analysis_text, topics, stats) from the merge call
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from chunking import MAX_CHUNK_WORKERS, build_merge_prompt, plan_chunks
+    from model_catalog import estimate_tokens
+    
+    def chunk_prompt(group):
+        return build_analysis_prompt(
+            group, num_topics=num_topics, provider=provider, model=model, dedupe_stories=dedupe_stories,
+            prerank_budget=prerank_budget, structured=structured, incremental=incremental
+        )
+    
+    overhead = estimate_tokens(build_analysis_prompt([], num_topics=num_topics, structured=structured))
+    sizes = [estimate_tokens(build_newsletter_content([nl])) for nl in newsletters]
+    groups = plan_chunks(sizes, overhead, guard['max_input_tokens'])
+    print(f"Prompt (~{guard['estimated_input_tokens']} tokens) exceeds the {guard['context_window']}-token "
+          f"context window of {guard['model']}; analyzing {len(newsletters)} newsletters in {len(groups)} chunks")
+    
+    prompts = [chunk_prompt([newsletters[i] for i in group]) for group in groups]
+    with ThreadPoolExecutor(max_workers=min(MAX_CHUNK_WORKERS, len(prompts))) as executor:
+        partials = list(executor.map(complete, prompts))
+    
+    output_format = JSON_OUTPUT_FORMAT if structured else MARKDOWN_OUTPUT_FORMAT
+    print(f"Merging {len(partials)} partial analyses")
+    result = complete(build_merge_prompt([text for text, _, _ in partials], num_topics, output_format))
+    
+    if run_info is not None:
+        run_info['chunking'] = {
+            "model": guard['model'],
+            "context_window": guard['context_window'],
+            "estimated_input_tokens": guard['estimated_input_tokens'],
+            "max_input_tokens": guard['max_input_tokens'],
+            "chunks": len(groups),
+            "newsletters_per_chunk": [len(group) for group in groups],
+            "estimated_tokens_per_chunk": [estimate_tokens(p) for p in prompts],
+        }
+    return result
+
+def analyze_with_openrouter(prompt, model_provider, custom_model=None, routing=None):
     """
     Route LLM requests through OpenRouter while maintaining the original provider choice
     or using a custom model if specified.
@@ -130,6 +801,8 @@ def analyze_with_openrouter(prompt, model_provider, custom_model=None):
         prompt: The prompt to send to the LLM
         model_provider: 'claude', 'openai', or 'google' to determine which model to use
         custom_model: Optional custom OpenRouter model name that overrides the model_provider
+        routing: Optional routing decision from ``model_catalog.route_model``; it is
+            stored with the cost log entry so estimates can be compared to actual cost
     
     Returns:
         The LLM response
@@ -138,26 +811,16 @@ def analyze_with_openrouter(prompt, model_provider, custom_model=None):
     if not openrouter_api_key:
         raise ValueError("OPENROUTER_API_KEY environment variable is required")
     
-    # Map provider to actual OpenRouter model ID
-    model_map = {
-        'claude': "anthropic/claude-sonnet-4",
-        'openai': "openai/gpt-4.1-mini",
-        'google': "google/gemini-2.5-flash"
-    }
-    
     # Choose between custom model or mapped provider
     if custom_model:
         model = custom_model
         print(f"Using custom OpenRouter model: {model}")
     else:
-        if model_provider not in model_map:
+        if model_provider not in OPENROUTER_MODEL_MAP:
             raise ValueError(f"Unknown model provider: {model_provider}")
-        model = model_map[model_provider]
+        model = OPENROUTER_MODEL_MAP[model_provider]
         print(f"Using mapped OpenRouter model: {model}")
     
-    # Prepare the system message based on the provider
-    system_message = "You are an AI consultant helping summarize AI newsletter content for regular people. Your primary goal is to identify the MOST SIGNIFICANT developments across different domains of AI, based on what appears in the newsletters being analyzed. When writing headlines, focus on the substantive development rather than secondary features or demonstrations (e.g., 'Anthropic Launches Claude 3.7' rather than 'Claude AI Plays Pokémon'). Make the 'Why It Matters' section relevant to everyday life, and ensure the 'Practical Impact' section provides specific, actionable advice that regular people can implement. Be sure to include brand new developments (even if only mentioned in 1-2 newsletters) if they appear to be significant. Format your response with markdown headings and sections. For each topic, include source information and relevant links to the actual products/announcements. IMPORTANT: Ignore or exclude any sponsored, advertorial, or ad content when identifying and summarizing key developments. Do not include advertisers or sponsors as top content, even if they appear frequently."
-    
     headers = {
         "Authorization": f"Bearer {openrouter_api_key}",
         "HTTP-Referer": "https://github.com/saadiq/newsletter_summary",  # Your application URL
@@ -168,88 +831,418 @@ def analyze_with_openrouter(prompt, model_provider, custom_model=None):
     data = {
         "model": model,
         "messages": [
-            {"role": "system", "content": system_message},
+            {"role": "system", "content": OPENROUTER_SYSTEM_MESSAGE},
             {"role": "user", "content": prompt}
         ]
     }
     
+    # Disable OpenRouter's lossy "middle-out" compression; oversized prompts are
+    # split into chunks before the call instead (see chunking.py)
+    data["transforms"] = []
+    
     # Add tracing tags for cost analysis
-    data["transforms"] = ["middle-out"]  # Enable detailed token breakdowns
     current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     data["route"] = f"newsletter_summary_{current_datetime}"  # For cost tracking
     
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers=headers,
-        data=json.dumps(data)
-    )
-    
-    if response.status_code != 200:
-        raise Exception(f"Error from OpenRouter API: {response.text}")
-    
-    result = response.json()
-    
-    # Log usage information
-    if 'usage' in result:
-        tokens = result['usage']['total_tokens']
-        # Optional: Save detailed cost data
-        cost_log = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "model": model,
-            "provider": model_provider if not custom_model else "custom",
-            "prompt_tokens": result['usage'].get('prompt_tokens', 0),
-            "completion_tokens": result['usage'].get('completion_tokens', 0),
-            "total_tokens": tokens,
-            "cost": result['usage'].get('cost', 0)
-        }
+    def post():
+        request_start = datetime.datetime.now().isoformat()
+        started = time.monotonic()
+        response = http_session().post(
+            "https://openrouter.ai/api/v1/chat/completions",
+            headers=headers,
+            data=json.dumps(data),
+            timeout=REQUEST_TIMEOUT
+        )
         
-        log_cost_data(cost_log)
+        if response.status_code != 200:
+            raise Exception(f"Error from OpenRouter API: {response.text}")
         
-        print(f"OpenRouter call: {tokens} tokens used with {model}")
-        if 'cost' in result['usage']:
-            print(f"Estimated cost: ${result['usage']['cost']}")
+        telemetry = {
+            "request_start": request_start,
+            "latency": time.monotonic() - started,
+            "http_status": response.status_code
+        }
+        return response.json(), telemetry
+    
+    def log_usage(result, telemetry, routing=None):
+        # Log usage information
+        if 'usage' in result:
+            tokens = result['usage']['total_tokens']
+            # Optional: Save detailed cost data
+            record_completion(
+                model,
+                "auto" if routing else (model_provider if not custom_model else "custom"),
+                result['usage'],
+                routing=routing,
+                **telemetry
+            )
+            
+            print(f"OpenRouter call: {tokens} tokens used with {model} in {telemetry['latency']:.1f}s")
+            if 'cost' in result['usage']:
+                print(f"Estimated cost: ${result['usage']['cost']}")
     
-    return result['choices'][0]['message']['content']
+    result, telemetry = post()
+    log_usage(result, telemetry, routing)
+    content = result['choices'][0]['message']['content']
+    
+    # Models that stop on the output limit are asked to continue where they left off
+    continuations = 0
+    while result['choices'][0].get('finish_reason') == 'length' and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        print(f"Response stopped at the output limit; requesting continuation {continuations}")
+        data["messages"] = data["messages"][:2] + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": CONTINUE_MESSAGE}
+        ]
+        result, telemetry = post()
+        log_usage(result, telemetry)
+        content += result['choices'][0]['message']['content']
+    
+    return content
 
-def log_cost_data(cost_data):
-    """Save cost data to a JSON file for later analysis"""
-    log_file = os.environ.get("OPENROUTER_COST_LOG", "openrouter_costs.json")
+def build_cost_entry(model, provider, usage, request_start, latency, first_token_latency=None,
+                     retries=0, http_status=None, **extra):
+    """
+    Build a cost log entry with token usage and latency telemetry.
     
-    # Create or append to the log file
-    if os.path.exists(log_file):
-        with open(log_file, 'r') as f:
-            try:
-                existing_data = json.load(f)
-            except json.JSONDecodeError:
-                existing_data = []
-    else:
-        existing_data = []
+    Args:
+        model: Model that answered
+        provider: Provider name stored with the entry
+        usage: Token usage dictionary from the API response
+        request_start: ISO timestamp of when the request was sent
+        latency: Total request latency in seconds
+        first_token_latency: Time to first token in seconds (streaming calls only)
+        retries: Additional requests made for this answer (failed or hedged attempts)
+        http_status: HTTP status of the answering request
+        **extra: Additional fields (e.g. ``stage``, ``structured``)
+        
+    Returns:
+        Dictionary for ``log_cost_data``; ``tokens_per_second`` is completion
+        tokens over generation time (latency after the first token when known)
+    """
+    completion_tokens = usage.get('completion_tokens', 0)
+    generation_time = latency - (first_token_latency or 0)
+    entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "model": model,
+        "provider": provider,
+        "prompt_tokens": usage.get('prompt_tokens', 0),
+        "completion_tokens": completion_tokens,
+        "total_tokens": usage.get('total_tokens', 0),
+        "cost": usage.get('cost', 0),
+        "request_start": request_start,
+        "first_token_latency": round(first_token_latency, 3) if first_token_latency is not None else None,
+        "latency": round(latency, 3),
+        "tokens_per_second": round(completion_tokens / generation_time, 2)
+        if completion_tokens and generation_time > 0 else None,
+        "retries": retries,
+        "http_status": http_status
+    }
+    entry.update(extra)
+    return entry
+
+def record_completion(model, provider, usage, request_start, latency, attempts=1, routing=None, **fields):
+    """
+    Log one answered completion with its usage, cost, timing and attempts.
     
-    existing_data.append(cost_data)
+    Every call path (OpenRouter, direct SDK, hedged and provider-chain calls)
+    records through here, so ``retries`` always counts the requests that were
+    really sent for the answer.
     
-    with open(log_file, 'w') as f:
-        json.dump(existing_data, f, indent=2)
+    Args:
+        model: Model that answered
+        provider: Provider name stored with the entry
+        usage: Token usage dictionary
+        request_start: ISO timestamp of when the first request was sent
+        latency: Latency of the answering request in seconds
+        attempts: Requests sent for this answer, including failed, retried and hedged ones
+        routing: Optional routing decision stored with the entry
+        **fields: Further ``build_cost_entry`` arguments (``first_token_latency``,
+            ``http_status``, ``stage``, ...)
+        
+    Returns:
+        The logged cost entry
+    """
+    entry = build_cost_entry(model, provider, usage, request_start, latency, retries=max(0, attempts - 1), **fields)
+    if routing:
+        entry["routing"] = routing
+    log_cost_data(entry)
+    return entry
+
+def log_cost_data(cost_data):
+    """Append cost data to the JSON Lines cost log for later analysis"""
+    append_entry(cost_data)
 
-def analyze_with_fallback(prompt, provider='openai', model=None):
-    """Try OpenRouter first, fall back to direct API if there's an error"""
+def analyze_with_fallback(prompt, provider='openai', model=None, hedge=False, hedge_after=None,
+                          routing=None, health=None, latency_history=None):
+    """
+    Try OpenRouter first, fall back to direct API if there's an error.
+    
+    Each provider/model pair has a circuit breaker (see ``circuit_breaker.py``)
+    whose state is persisted between runs: a provider whose circuit is open is
+    skipped immediately instead of waiting for its timeout, and is probed
+    again once its cooldown has passed.
+    
+    With ``hedge=True`` the request is streamed through the provider fallback
+    chain in ``hedging.py`` instead: if the primary has not produced a first
+    token within ``hedge_after`` seconds (default: its recent p95), the next
+    provider is tried in parallel and the first complete answer wins.
+    
+    Args:
+        prompt: The prompt to send to the LLM
+        provider: 'claude', 'openai', 'google' or 'auto' (with ``model`` set)
+        model: Optional custom OpenRouter model name that overrides the provider
+        hedge: Use the hedged provider chain
+        hedge_after: Optional fixed hedge delay in seconds
+        routing: Optional routing decision passed through to the cost log
+        health: Optional ``HealthStore`` (defaults to the shared state file)
+        latency_history: Optional ``hedging.LatencyHistory`` for the hedged chain
+        
+    Returns:
+        The LLM response text
+    """
+    health = health or HealthStore()
+    if hedge:
+        return analyze_with_hedging(prompt, provider, model, hedge_after, health=health, latency_history=latency_history)
+    
+    openrouter_key = f"openrouter:{model or OPENROUTER_MODEL_MAP.get(provider, provider)}"
+    failed_attempts = 0
+    if health.allow(openrouter_key):
+        started = time.monotonic()
+        try:
+            # Try OpenRouter
+            result = analyze_with_openrouter(prompt, provider, model, routing=routing)
+            health.record_success(openrouter_key, time.monotonic() - started)
+            return result
+        except ValueError:
+            # Configuration problems (missing key, unknown provider) say nothing about provider health
+            raise
+        except Exception as e:
+            health.record_failure(openrouter_key, str(e))
+            failed_attempts += 1
+            print(f"Error using OpenRouter: {str(e)}")
+    print("Falling back to direct API call...")
+    
+    direct_provider = 'openai' if provider == 'openai' or (model or '').startswith('openai/') else 'claude'
+    direct_key = f"{direct_provider}:{DIRECT_MODEL_MAP[direct_provider]}"
+    if not health.allow(direct_key):
+        raise Exception(f"No provider available: circuits open for {openrouter_key} and {direct_key}")
+    
+    started = time.monotonic()
     try:
-        # Try OpenRouter
-        return analyze_with_openrouter(prompt, provider, model)
+        result = analyze_with_llm_direct(prompt, [], direct_provider, failed_attempts=failed_attempts)
+        health.record_success(direct_key, time.monotonic() - started)
+        return result
     except Exception as e:
-        print(f"Error using OpenRouter: {str(e)}")
-        print("Falling back to direct API call...")
+        health.record_failure(direct_key, str(e))
+        raise
+
+def analyze_with_hedging(prompt, provider='openai', model=None, hedge_after=None, health=None, latency_history=None):
+    """
+    Run the prompt through the hedged provider fallback chain and log its cost.
+    
+    Args:
+        prompt: The prompt to send to the LLM
+        provider: 'claude', 'openai', or 'google' to pick the OpenRouter model
+        model: Optional custom OpenRouter model name that overrides the provider
+        hedge_after: Optional fixed hedge delay in seconds
+        health: Optional ``HealthStore``; providers with an open circuit are
+            left out of the chain and every outcome is recorded
+        latency_history: Optional ``hedging.LatencyHistory`` shared by the run's
+            hedged calls (a fresh one is loaded if None)
         
-        # Force direct API mode temporarily
-        old_setting = os.environ.get("USE_OPENROUTER", "true")
-        os.environ["USE_OPENROUTER"] = "false"
+    Returns:
+        The LLM response text from the first provider to finish
+    """
+    from hedging import build_fallback_chain, hedged_completion, target_key
+    
+    if not model:
+        if provider not in OPENROUTER_MODEL_MAP:
+            raise ValueError(f"Unknown model provider: {provider}")
+        model = OPENROUTER_MODEL_MAP[provider]
+    health = health or HealthStore()
+    chain = [target for target in build_fallback_chain(model) if health.allow(target_key(target))]
+    if not chain:
+        raise Exception("No provider available: circuits open for every provider in the fallback chain")
+    messages = [
+        {"role": "system", "content": OPENROUTER_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+    request_start = datetime.datetime.now().isoformat()
+    result = hedged_completion(messages, chain, hedge_after=hedge_after, history=latency_history, health=health)
+    print(f"Hedged call answered by {result['provider']} ({result['model']}) in {result['latency']:.1f}s"
+          + (f" after {result['hedged']} hedged request(s)" if result['hedged'] else ""))
+    
+    usage = result.get('usage') or {}
+    if usage:
+        record_completion(
+            result['model'], result['provider'], usage, request_start, result['latency'],
+            attempts=1 + result['hedged'],
+            first_token_latency=result.get('first_token_latency'),
+            http_status=result.get('http_status'),
+            hedged=result['hedged']
+        )
+    return result['content']
+
+def complete_with_chain(prompt, provider='openai', model=None, stage=None, health=None):
+    """
+    Send a short auxiliary prompt through the provider fallback chain.
+    
+    Used for per-newsletter extraction and similar helper calls: providers are
+    tried in order, skipping open circuits, and the cost is logged with the
+    given stage label.
+    
+    Args:
+        prompt: The prompt to send
+        provider: 'claude', 'openai', or 'google' to pick the model
+        model: Optional custom OpenRouter model name that overrides the provider,
+            or a direct model id when ``USE_OPENROUTER`` is off (see ``provider_chain``)
+        stage: Optional label stored with the cost log entry (e.g. 'extract')
+        health: Optional ``HealthStore`` for provider circuit breakers
         
+    Returns:
+        The response text
+    """
+    from hedging import stream_chat_completion, target_key
+    
+    chain = provider_chain(provider, model, openrouter_enabled())
+    health = health or HealthStore()
+    messages = [
+        {"role": "system", "content": "You are an AI consultant helping summarize newsletter content."},
+        {"role": "user", "content": prompt}
+    ]
+    errors = []
+    for target in chain:
+        key = target_key(target)
+        if not health.allow(key):
+            continue
+        request_start = datetime.datetime.now().isoformat()
+        started = time.monotonic()
+        first_token = []
         try:
-            # Use direct API
-            result = analyze_with_llm_direct(prompt, [], provider)
-            return result
-        finally:
-            # Restore setting
-            os.environ["USE_OPENROUTER"] = old_setting
+            result = stream_chat_completion(target, messages, lambda: first_token.append(time.monotonic() - started),
+                                            threading.Event())
+        except Exception as e:
+            health.record_failure(key, str(e))
+            errors.append(f"{target['name']}: {str(e)}")
+            continue
+        latency = time.monotonic() - started
+        health.record_success(key, latency)
+        usage = result.get('usage') or {}
+        if usage:
+            record_completion(
+                target['model'], target['name'], usage, request_start, latency,
+                attempts=1 + len(errors),
+                first_token_latency=first_token[0] if first_token else None,
+                http_status=result.get('http_status'),
+                stage=stage
+            )
+        return result['content']
+    raise Exception("All providers failed: " + ("; ".join(errors) or "no provider available"))
+
+def analyze_structured(prompt, provider='openai', model=None, health=None, budget=None):
+    """
+    Stream a JSON topic completion and validate each topic as it arrives.
+    
+    Providers in the ``hedging.py`` fallback chain are tried in order,
+    skipping any whose circuit is open. Topics are parsed incrementally from
+    the stream; malformed or truncated topics are then repaired one at a time
+    with small follow-up calls to the provider that answered. Repair calls
+    reserve from the budget, update the provider's breaker and are logged
+    like the main call.
+    
+    Args:
+        prompt: Prompt asking for output in ``JSON_OUTPUT_FORMAT``
+        provider: 'claude', 'openai', or 'google' to pick the model
+        model: Optional custom OpenRouter model name that overrides the provider,
+            or a direct model id when ``USE_OPENROUTER`` is off (see ``provider_chain``)
+        health: Optional ``HealthStore`` for provider circuit breakers
+        budget: Optional ``budget.Budget`` each repair call reserves from (the
+            caller reserves the main call)
+        
+    Returns:
+        Tuple of (list of topic dictionaries, stats dictionary with
+        ``parsed``, ``repaired`` and ``dropped`` counts)
+    """
+    from hedging import stream_chat_completion, target_key
+    from topics import StreamingTopicParser, collect_topics, response_format
+    
+    chain = provider_chain(provider, model, openrouter_enabled())
+    health = health or HealthStore()
+    messages = [
+        {"role": "system", "content": STRUCTURED_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+    errors = []
+    for target in chain:
+        key = target_key(target)
+        if not health.allow(key):
+            continue
+        parser = StreamingTopicParser()
+        results = []
+        
+        def on_delta(text):
+            for index, topic, raw in parser.feed(text):
+                results.append((index, topic, raw))
+                if topic is not None and topic.get('headline'):
+                    print(f"Topic {index + 1} received: {topic['headline']}")
+        
+        request_start = datetime.datetime.now().isoformat()
+        started = time.monotonic()
+        first_token = []
+        try:
+            result = stream_chat_completion(target, messages, lambda: first_token.append(time.monotonic() - started),
+                                            threading.Event(), on_delta=on_delta,
+                                            extra_body={"response_format": response_format()})
+        except Exception as e:
+            health.record_failure(key, str(e))
+            print(f"Provider {target['name']} failed: {str(e)}")
+            errors.append(f"{target['name']}: {str(e)}")
+            continue
+        latency = time.monotonic() - started
+        health.record_success(key, latency)
+        results.extend(parser.finish())
+        
+        usage = result.get('usage') or {}
+        if usage:
+            record_completion(
+                target['model'], target['name'], usage, request_start, latency,
+                attempts=1 + len(errors),
+                first_token_latency=first_token[0] if first_token else None,
+                http_status=result.get('http_status'),
+                structured=True
+            )
+        
+        def complete(repair_prompt, target=target, key=key):
+            if budget is not None and budget.enabled:
+                from budget import estimate_call
+                budget.reserve(estimate_call(repair_prompt, target['model'], num_topics=1), "Topic repair call")
+            if not health.allow(key):
+                raise Exception(f"Circuit open for {key}")
+            request_start = datetime.datetime.now().isoformat()
+            started = time.monotonic()
+            try:
+                reply = stream_chat_completion(target, [{"role": "user", "content": repair_prompt}],
+                                               lambda: None, threading.Event())
+            except Exception as e:
+                health.record_failure(key, str(e))
+                raise
+            latency = time.monotonic() - started
+            health.record_success(key, latency)
+            if reply.get('usage'):
+                record_completion(
+                    target['model'], target['name'], reply['usage'], request_start, latency,
+                    http_status=reply.get('http_status'),
+                    structured=True,
+                    stage='repair'
+                )
+            return reply['content']
+        
+        topics, stats = collect_topics(results, complete)
+        print(f"Structured output: {stats['parsed']} topics parsed, {stats['repaired']} repaired, "
+              f"{stats['dropped']} dropped")
+        return topics, stats
+    raise Exception("All providers failed: " + ("; ".join(errors) or "no provider available"))
 
 def check_openrouter_status():
     """Check if OpenRouter is operational and your account is properly configured"""
@@ -263,7 +1256,7 @@ def check_openrouter_status():
     }
     
     try:
-        response = requests.get(
+        response = http_session().get(
             "https://openrouter.ai/api/v1/auth/key",
             headers=headers
         )
@@ -276,7 +1269,7 @@ def check_openrouter_status():
     except Exception as e:
         return False, f"Error checking OpenRouter status: {str(e)}"
 
-def analyze_with_llm_direct(prompt, topics=None, provider='claude'):
+def analyze_with_llm_direct(prompt, topics=None, provider='claude', failed_attempts=0):
     """
     Generate analysis text directly from the LLM based on the provided prompt.
     This is a simplified version for fallback purposes.
@@ -285,28 +1278,9 @@ def analyze_with_llm_direct(prompt, topics=None, provider='claude'):
         prompt: The prompt to send to the LLM
         topics: Optional list of topics (not used in this function, but kept for API compatibility)
         provider: 'claude' or 'openai'
+        failed_attempts: Requests that already failed for this answer, counted in the cost log
         
     Returns:
         The LLM response text
     """
-    if provider == 'openai':
-        client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        response = client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
-            messages=[
-                {"role": "system", "content": "You are an AI consultant helping summarize newsletter content."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
-    else:  # Default to Claude
-        client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-        response = client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=3000,
-            system="You are an AI consultant helping summarize newsletter content.",
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.content[0].text
\ No newline at end of file
+    return complete_direct(prompt, provider, failed_attempts=failed_attempts)
@@ -6,11 +6,30 @@ load_dotenv('.env.local')
 
 import argparse
 import datetime
-from auth import authenticate_gmail
-from fetch import get_ai_newsletters
+import threading
+from auth import authenticate_gmail, thread_service_factory
+from fetch import get_ai_newsletters, list_message_ids
 from utils import clean_body
-from llm import analyze_newsletters_unified
-from report import generate_report
+from llm import (
+    DIRECT_MODEL_MAP,
+    analyze_newsletters_unified,
+    build_analysis_prompt,
+    cleaned_content,
+    extract_topic_titles,
+    log_cost_data
+)
+from breaking_news import DEFAULT_MAX_ITEMS
+from model_catalog import DIRECT_CONTEXT_WINDOWS
+from pipeline import print_stage_stats, run_newsletter_pipeline
+from publish import publish_report
+from report import FORMAT_EXTENSIONS, build_report_model, parse_formats, render_report
+from cost_log import new_run_id, set_run_context
+from budget import ABORT, DOWNGRADE, Budget, BudgetExceeded
+from circuit_breaker import HealthStore
+from hedging import LatencyHistory
+from website_verifier import verify_unverified_websites
+from timeline import annotate_newsletters
+from runs import RunCheckpoint, content_hash, corpus_from_newsletters, newsletters_from_corpus, response_artifact
 import json
 
 def get_default_model_name(provider):
@@ -22,7 +41,183 @@ def get_default_model_name(provider):
     }
     return model_map.get(provider, "unknown model")
 
-def main():
+def save_report(newsletters, topics, llm_analysis, days, model_info, breaking_news_section=True, formats=('md',),
+                publish=False, breaking_news_limit=DEFAULT_MAX_ITEMS, structured_topics=None):
+    """
+    Build the report model once and write it in every requested format to the output directory.
+
+    With ``publish``, the Markdown report is also published to the site in the
+    output directory (see ``publish.py``). ``structured_topics`` (structured
+    output mode) become the report's sections without re-parsing the Markdown.
+    
+    Returns:
+        Dictionary mapping each written report path to its contents
+    """
+    print("Generating report...")
+    model = build_report_model(newsletters, topics, llm_analysis, days, model_info, breaking_news_section,
+                               breaking_news_limit, structured_topics)
+    output_dir = os.environ.get("NEWSLETTER_SUMMARY_OUTPUT_DIR", "")
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    # Jekyll front matter for GitHub Pages when publishing to an output directory
+    rendered = render_report(model, formats, front_matter=bool(output_dir),
+                             site_url=os.environ.get("NEWSLETTER_SITE_URL", ""))
+    written = {}
+    for fmt, text in rendered.items():
+        report_filename = f"ai_newsletter_summary_{model['filename_date_range']}.{FORMAT_EXTENSIONS[fmt]}"
+        if output_dir:
+            report_filename = os.path.join(output_dir, report_filename)
+        with open(report_filename, 'w') as f:
+            f.write(text)
+        print(f"Report saved to {report_filename}")
+        written[report_filename] = text
+        if publish and fmt == 'md':
+            publish_report(output_dir or '.', report_filename, model=model, markdown=text)
+    return written
+
+def submit_batch_run(newsletters, args, label=None, budget=None, health=None):
+    """
+    Build the analysis prompt and submit it through the provider's batch API.
+
+    Raises:
+        BudgetExceeded: If the batch's estimated cost does not fit in ``budget``
+    """
+    from batch import BATCH_PRICE_FACTOR, submit_batch
+    from budget import estimate_call
+    from model_catalog import direct_model_table, route_model
+
+    prompt = build_analysis_prompt(
+        newsletters,
+        num_topics=args.num_topics,
+        provider=args.llm_provider,
+        dedupe_stories=args.dedupe_stories,
+        prerank_budget=args.prompt_budget if args.prerank else None,
+        incremental=args.incremental,
+        health=health
+    )
+    provider = args.llm_provider
+    if args.model:
+        # Checked against the direct model table when the options are parsed
+        provider, model = direct_model_table()[args.model]['provider'], args.model
+    elif provider == 'auto':
+        # Batch APIs are direct provider APIs: route among the models they can run
+        routing = route_model(prompt, num_topics=args.num_topics, min_tier=args.min_tier, table=direct_model_table())
+        provider, model = routing['provider'], routing['model']
+        print(f"Auto-routing the batch to {model} (estimated cost ${routing['estimated_cost']:.4f})")
+    elif provider in DIRECT_MODEL_MAP:
+        model = DIRECT_MODEL_MAP[provider]
+    else:
+        raise ValueError(f"Batch mode supports the 'openai' and 'claude' providers, not '{provider}'")
+    if budget is not None and budget.enabled:
+        estimate = estimate_call(prompt, model, args.num_topics, table=direct_model_table())
+        estimate['cost'] = round(estimate['cost'] * BATCH_PRICE_FACTOR, 6)
+        budget.reserve(estimate, "Batch analysis")
+        print(f"Estimated batch cost: ${estimate['cost']:.4f} on {model} ({budget.describe()})")
+    state = submit_batch(prompt, provider, model, context={
+        "newsletters": newsletters,
+        "days": args.days,
+        "label": label,
+        "breaking_news_section": args.breaking_news_section,
+        "formats": args.formats,
+        "publish": args.publish,
+        "breaking_news_limit": args.breaking_news_limit,
+        "model_info": {"provider": provider, "model": model},
+    })
+    print(f"Submitted batch {state['batch_id']} ({state['adapter']}) as run {state['run_id']}")
+    print(f"Collect the results later with: python main.py --collect {state['run_id']}")
+
+def collect_batch_runs(run_id=None):
+    """
+    Poll submitted batch runs and write the report for every completed one.
+    
+    A run is marked completed only after its report is written; if writing
+    fails, the fetched result stays in the run state and the next
+    ``--collect`` retries the report without logging the cost again.
+    """
+    from batch import BATCH_PRICE_FACTOR, collect_batch, complete_run, load_run_state, pending_runs, save_run_state
+    from model_catalog import usage_cost
+
+    run_ids = [run_id] if run_id else pending_runs()
+    if not run_ids:
+        print("No pending batch runs.")
+    for current_id in run_ids:
+        try:
+            state = load_run_state(current_id)
+            result = collect_batch(state)
+        except Exception as e:
+            print(f"Error collecting batch run {current_id}: {str(e)}")
+            continue
+        if result is None:
+            print(f"Batch run {current_id} is still pending")
+            continue
+        try:
+            if not state.get('cost_logged'):
+                usage = result.get('usage') or {}
+                cost = usage.get('cost')
+                if cost is None:
+                    cost = round(usage_cost(state['model'], usage.get('prompt_tokens', 0),
+                                            usage.get('completion_tokens', 0)) * BATCH_PRICE_FACTOR, 6)
+                log_cost_data({
+                    "timestamp": datetime.datetime.now().isoformat(),
+                    "model": state['model'],
+                    "provider": state['provider'],
+                    "prompt_tokens": usage.get('prompt_tokens', 0),
+                    "completion_tokens": usage.get('completion_tokens', 0),
+                    "total_tokens": usage.get('total_tokens', 0),
+                    "cost": cost,
+                    "batch": True,
+                    "run_id": current_id,
+                    "label": state['context'].get('label')
+                })
+                state['cost_logged'] = True
+                save_run_state(state)
+            context = state['context']
+            llm_analysis = result['content']
+            topics = extract_topic_titles(llm_analysis)
+            print(f"Batch run {current_id} completed with {len(topics)} topics")
+            model_info = dict(context['model_info'], timestamp=datetime.datetime.now().isoformat())
+            save_report(context['newsletters'], topics, llm_analysis, context['days'], model_info,
+                        context['breaking_news_section'], formats=context.get('formats', ['md']), publish=context.get('publish', False),
+                        breaking_news_limit=context.get('breaking_news_limit', DEFAULT_MAX_ITEMS))
+            complete_run(state)
+        except Exception as e:
+            print(f"Error writing the report of batch run {current_id} (its result is kept; "
+                  f"run --collect again): {str(e)}")
+
+def formats_arg(value):
+    """argparse type for --formats."""
+    try:
+        return parse_formats(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def verify_websites_in_background():
+    """Start verifying unverified newsletter websites in a thread; returns the thread."""
+    def run():
+        try:
+            results = verify_unverified_websites()
+            if results:
+                verified = sum(1 for result in results if result['verified'])
+                print(f"Verified {verified} of {len(results)} unverified newsletter websites")
+        except Exception as e:
+            print(f"Warning: website verification failed: {str(e)}")
+    thread = threading.Thread(target=run, name="website-verifier", daemon=True)
+    thread.start()
+    return thread
+
+def parse_args(argv=None):
+    """
+    Parse and check the command-line options.
+    
+    Args:
+        argv: Arguments to parse instead of ``sys.argv[1:]``
+        
+    Returns:
+        The parsed options
+        
+    Raises:
+        SystemExit: If the options are invalid or conflict (after printing the error)
+    """
     parser = argparse.ArgumentParser(description='Summarize AI newsletters from Gmail.')
     parser.add_argument('--days', type=int, default=7, 
                         help='Number of days to look back for newsletters (default: 7)')
@@ -34,8 +229,12 @@ def main():
                         help='Add a separate "Just In" section for latest newsletters (default: enabled)')
     parser.add_argument('--no-breaking-news-section', dest='breaking_news_section', action='store_false',
                         help='Do not add a separate "Just In" section')
-    parser.add_argument('--llm-provider', choices=['claude', 'openai', 'google'], default='openai',
-                        help='LLM provider for summarization: claude (Claude 3.7 Sonnet), openai (GPT-4.1), or google (Gemini 2.0 Flash)')
+    parser.add_argument('--breaking-news-limit', type=int, default=DEFAULT_MAX_ITEMS,
+                        help=f'Maximum number of "Just In" items, ranked by corroborating sources and recency (default: {DEFAULT_MAX_ITEMS})')
+    parser.add_argument('--llm-provider', choices=['claude', 'openai', 'google', 'auto'], default='openai',
+                        help='LLM provider for summarization: claude (Claude 3.7 Sonnet), openai (GPT-4.1), google (Gemini 2.0 Flash), or auto (cheapest model that fits the prompt)')
+    parser.add_argument('--min-tier', type=int, choices=[1, 2, 3], default=1,
+                        help='Minimum model quality tier for --llm-provider auto (1 = budget, 2 = standard, 3 = premium)')
     parser.add_argument('--model', type=str, default=None,
                         help='Specify a custom OpenRouter model (e.g., "google/gemini-2.5-flash-preview:thinking") overriding the provider selection')
     parser.add_argument('--label', type=str, default='DeFi Updates',
@@ -48,28 +247,147 @@ def main():
                         help='Only include emails sent to this recipient email address (optional)')
     parser.add_argument('--num-topics', type=int, default=10,
                         help='Number of topics to extract and summarize (default: 10)')
+    parser.add_argument('--dedupe-stories', action='store_true',
+                        help='Send near-duplicate stories covered by several newsletters to the LLM only once')
+    parser.add_argument('--prerank', action='store_true',
+                        help='Rank story blocks locally (TF-IDF) and send only the highest-signal ones to the LLM')
+    parser.add_argument('--prompt-budget', type=int, default=30000,
+                        help='Estimated token budget for newsletter content when --prerank is used (default: 30000)')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Stream through the provider fallback chain and start the next provider if the current one is slow to respond')
+    parser.add_argument('--hedge-after', type=float, default=None,
+                        help='Seconds to wait for a first token before hedging (default: the provider\'s recent p95)')
+    parser.add_argument('--structured-output', action='store_true',
+                        help='Ask the LLM for schema-validated JSON topics and render the markdown locally')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse stored per-newsletter story extracts and only extract newsletters not seen in earlier runs')
+    parser.add_argument('--two-step', action='store_true',
+                        help='Request the ranked topic list first, then write each topic in its own concurrent call')
+    parser.add_argument('--expand-concurrency', type=int, default=None,
+                        help='Maximum concurrent topic expansion calls with --two-step (default: 5)')
+    parser.add_argument('--max-cost', type=float, default=None,
+                        help='Maximum estimated spend for this run in USD')
+    parser.add_argument('--daily-budget', type=float, default=os.environ.get('NEWSLETTER_DAILY_BUDGET'),
+                        help='Maximum spend over the last 24 hours in USD, from the cost log (env: NEWSLETTER_DAILY_BUDGET)')
+    parser.add_argument('--monthly-budget', type=float, default=os.environ.get('NEWSLETTER_MONTHLY_BUDGET'),
+                        help='Maximum spend over the last 30 days in USD, from the cost log (env: NEWSLETTER_MONTHLY_BUDGET)')
+    parser.add_argument('--on-budget-exceeded', choices=[DOWNGRADE, ABORT], default=DOWNGRADE,
+                        help='Downgrade the model or trim content (default), or abort when the estimate exceeds the budget')
+    parser.add_argument('--formats', type=formats_arg, default=['md'],
+                        help='Comma-separated report formats to write: md, html, json, rss (default: md)')
+    parser.add_argument('--publish', action='store_true',
+                        help='Update the site index, latest report and archive pages in NEWSLETTER_SUMMARY_OUTPUT_DIR')
+    parser.add_argument('--verify-websites', action='store_true',
+                        help='Check unverified newsletter websites over HTTP while the analysis runs')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Fetch, clean and analyze concurrently through bounded queues and report per-stage time and memory')
+    parser.add_argument('--pipeline-chunk-tokens', type=int, default=None,
+                        help='With --pipeline, analyze newsletters in chunks of this many tokens while fetching continues (default: one chunk per context window)')
+    parser.add_argument('--resume', type=str, default=None, metavar='RUN_ID',
+                        help='Resume a failed or interrupted run from its last completed stage (pass the same options)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Submit the analysis through the provider batch API (cheaper, results within 24h) and exit; '
+                             '--model must then be a direct model id (e.g. gpt-4.1-mini)')
+    parser.add_argument('--collect', nargs='?', const='', default=None, metavar='RUN_ID',
+                        help='Collect finished batch runs (all pending runs, or only RUN_ID) and write their reports')
     parser.set_defaults(prioritize_recent=True, breaking_news_section=True)
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.batch and args.model and args.model not in DIRECT_CONTEXT_WINDOWS:
+        parser.error(f"--model {args.model} has no batch API; with --batch use one of the direct models: "
+                     f"{', '.join(DIRECT_CONTEXT_WINDOWS)}")
+    return args
+
+
+def main(argv=None, gmail_service=authenticate_gmail):
+    """
+    Run the newsletter summary from command-line arguments.
+    
+    Args:
+        argv: Arguments to parse instead of ``sys.argv[1:]``
+        gmail_service: Function returning an authenticated Gmail service; the
+            daemon (``daemon.py``) passes one that keeps the service warm
+        
+    Returns:
+        The run's ``runs.RunCheckpoint`` (its completed stages show how far the
+        run got), or None if no run was started
+    """
+    args = parse_args(argv)
+    if args.collect is not None:
+        collect_batch_runs(args.collect or None)
+        return
+    run = None
     try:
-        print("Authenticating with Gmail...")
-        service = authenticate_gmail()
         label_arg = None if args.no_label else args.label
-        print(f"Retrieving AI newsletters from the past {args.days} days... (label: {label_arg if label_arg else 'none'})")
+        if args.resume:
+            run = RunCheckpoint.open(args.resume)
+            print(f"Resuming run {run.run_id} (completed stages: {', '.join(run.completed()) or 'none'})")
+        else:
+            run = RunCheckpoint.create(new_run_id())
+            print(f"Starting run {run.run_id} (checkpoints in {run.path})")
+        set_run_context(run_id=run.run_id, label=label_arg)
         mock_data_env = os.environ.get("NEWSLETTER_SUMMARY_MOCK_DATA")
-        if mock_data_env:
-            newsletters = json.loads(mock_data_env)
+        streaming = args.pipeline and not args.batch
+        
+        # Each stage's checkpoint is reused only if it was built from the same upstream artifact and options
+        fetch_inputs = {
+            "days": args.days,
+            "label": label_arg,
+            "from_email": args.from_email,
+            "to_email": args.to_email,
+            "mock_data": content_hash(mock_data_env.encode('utf-8')) if mock_data_env else None
+        }
+        fetched = run.valid('fetch', fetch_inputs)
+        # Pipeline runs clean while fetching and keep no fetch checkpoint
+        clean_inputs = {"fetch": fetch_inputs, "messages": run.sha('fetch') if fetched else None}
+        message_ids = None
+        cleaned = run.valid('clean', clean_inputs)
+        if cleaned:
+            newsletters = newsletters_from_corpus(run.load('clean'))
+            print(f"Reusing {len(newsletters)} cleaned newsletters from run {run.run_id}")
+        elif fetched:
+            newsletters = run.load('fetch')
+            print(f"Reusing {len(newsletters)} fetched newsletters from run {run.run_id}")
+        elif mock_data_env:
+            newsletters = annotate_newsletters(json.loads(mock_data_env))
+            clean_inputs['messages'] = run.save('fetch', newsletters, fetch_inputs)
         else:
-            newsletters = get_ai_newsletters(
-                service,
-                days=args.days,
-                label=label_arg,
-                from_email=args.from_email,
-                to_email=args.to_email
-            )
-        print(f"Found {len(newsletters)} newsletters.")
-        if not newsletters:
+            print("Authenticating with Gmail...")
+            service = gmail_service()
+            print(f"Retrieving AI newsletters from the past {args.days} days... (label: {label_arg if label_arg else 'none'})")
+            if streaming:
+                # The pipeline fetches the messages itself, overlapped with cleaning and analysis
+                newsletters = None
+                message_ids = list_message_ids(
+                    service,
+                    days=args.days,
+                    label=label_arg,
+                    from_email=args.from_email,
+                    to_email=args.to_email
+                )
+            else:
+                newsletters = get_ai_newsletters(
+                    service,
+                    days=args.days,
+                    label=label_arg,
+                    from_email=args.from_email,
+                    to_email=args.to_email
+                )
+                clean_inputs['messages'] = run.save('fetch', newsletters, fetch_inputs)
+        found = len(message_ids) if newsletters is None else len(newsletters)
+        print(f"Found {found} newsletters.")
+        if not found:
             print("No newsletters found. Check your Gmail labels or date range.")
-            return
+            return run
+        
+        budget = Budget(max_cost=args.max_cost, daily_limit=args.daily_budget,
+                        monthly_limit=args.monthly_budget, action=args.on_budget_exceeded)
+        # One provider health store per run: loaded once, shared by every call
+        health = HealthStore()
+        if args.batch:
+            submit_batch_run(newsletters, args, label=label_arg, budget=budget, health=health)
+            return run
+        
+        verifier = verify_websites_in_background() if args.verify_websites else None
         
         # Direct LLM approach - combined topic extraction and summarization
         if args.model:
@@ -77,54 +395,130 @@ def main():
         else:
             print(f"Using direct LLM approach with {args.llm_provider} to extract and summarize {args.num_topics} topics...")
         
-        llm_analysis, topics = analyze_newsletters_unified(
-            newsletters, 
+        run_info = {}
+        analysis_options = dict(
             num_topics=args.num_topics,
             provider=args.llm_provider,
-            model=args.model
+            model=args.model,
+            dedupe_stories=args.dedupe_stories,
+            prerank_budget=args.prompt_budget if args.prerank else None,
+            min_tier=args.min_tier,
+            run_info=run_info,
+            hedge=args.hedge,
+            hedge_after=args.hedge_after,
+            structured=args.structured_output,
+            incremental=args.incremental,
+            two_step=args.two_step,
+            expand_concurrency=args.expand_concurrency,
+            budget=budget,
+            health=health,
+            latency_history=LatencyHistory() if args.hedge else None
         )
+        prompt_inputs = {
+            "corpus": None,
+            "num_topics": args.num_topics,
+            "provider": args.llm_provider,
+            "model": args.model,
+            "dedupe_stories": args.dedupe_stories,
+            "prerank_budget": analysis_options['prerank_budget'],
+            "structured": args.structured_output,
+            "incremental": args.incremental
+        }
+        response_options = {
+            "min_tier": args.min_tier,
+            "two_step": args.two_step,
+            "max_cost": args.max_cost,
+            "pipeline_chunk_tokens": args.pipeline_chunk_tokens if streaming else None
+        }
+        if streaming and not cleaned:
+            print("Fetching, cleaning and analyzing newsletters as a streaming pipeline...")
+            newsletters, llm_analysis, topics = run_newsletter_pipeline(
+                message_ids=message_ids,
+                # Fetch threads share the one authenticated service's credentials
+                service_factory=thread_service_factory(service) if message_ids is not None else None,
+                newsletters=newsletters,
+                analysis_options=analysis_options,
+                chunk_tokens=args.pipeline_chunk_tokens,
+                run_info=run_info
+            )
+            print_stage_stats(run_info['pipeline']['stages'])
+            run.save('clean', corpus_from_newsletters(newsletters), clean_inputs)
+            # Chunked analysis has no single prompt, so the response depends on the corpus directly
+            response_inputs = dict(prompt_inputs, corpus=run.sha('clean'), prompt=None, **response_options)
+            run.save('response', response_artifact(llm_analysis, topics, run_info),
+                     response_inputs)
+        else:
+            if not cleaned:
+                for nl in newsletters:
+                    nl['content'] = cleaned_content(nl)
+                run.save('clean', corpus_from_newsletters(newsletters), clean_inputs)
+            prompt_inputs['corpus'] = run.sha('clean')
+            response_inputs = dict(prompt_inputs, prompt=None, **response_options)
+            # A resumed pipeline run may have completed its analysis without a prompt checkpoint
+            reuse_response = streaming and run.valid('response', response_inputs)
+            if not reuse_response:
+                if run.valid('prompt', prompt_inputs):
+                    prompt = run.load('prompt')
+                else:
+                    prompt = build_analysis_prompt(
+                        newsletters, run_info=run_info, budget=budget, health=health,
+                        **{key: value for key, value in prompt_inputs.items() if key != 'corpus'}
+                    )
+                    run.save('prompt', prompt, prompt_inputs)
+                response_inputs = dict(prompt_inputs, prompt=run.sha('prompt'), **response_options)
+            if reuse_response or run.valid('response', response_inputs):
+                response = run.load('response')
+                llm_analysis, topics = response['analysis'], response['topics']
+                run_info.update(response['run_info'])
+                print(f"Reusing the LLM analysis from run {run.run_id}")
+            else:
+                llm_analysis, topics = analyze_newsletters_unified(newsletters, prompt=prompt, **analysis_options)
+                run.save('response', response_artifact(llm_analysis, topics, run_info),
+                         response_inputs)
         
         print(f"Identified and analyzed {len(topics)} topics")
         
         # Construct model_info dictionary
         model_info = {
             "provider": args.llm_provider,
-            "model": args.model if args.model else get_default_model_name(args.llm_provider),
-            "timestamp": datetime.datetime.now().isoformat()
+            "model": run_info.get('model') or args.model or get_default_model_name(run_info.get('provider', args.llm_provider)),
+            "timestamp": datetime.datetime.now().isoformat(),
+            "chunking": run_info.get('chunking'),
+            "budget": run_info.get('budget')
         }
         
-        print("Generating report...")
-        if not args.breaking_news_section:
-            def generate_report_without_breaking(newsletters, topics, llm_analysis, days, model_info):
-                report, filename = generate_report(newsletters, topics, llm_analysis, days, model_info)
-                import re
-                report = re.sub(r'\n## JUST IN: LATEST DEVELOPMENTS\n\n.*?\n\n## ', '\n\n## ', report, flags=re.DOTALL)
-                return report, filename
-            
-            report, filename_date_range = generate_report_without_breaking(newsletters, topics, llm_analysis, args.days, model_info)
+        if verifier:
+            # Let the report link to freshly verified homepages
+            verifier.join()
+        report_inputs = {
+            "response": run.sha('response'),
+            "days": args.days,
+            "breaking_news_section": args.breaking_news_section,
+            "breaking_news_limit": args.breaking_news_limit,
+            "formats": args.formats,
+            "publish": args.publish,
+            "output_dir": os.environ.get("NEWSLETTER_SUMMARY_OUTPUT_DIR", "")
+        }
+        if run.valid('report', report_inputs):
+            for report_filename, text in run.load('report')['files'].items():
+                if not os.path.exists(report_filename):
+                    with open(report_filename, 'w') as f:
+                        f.write(text)
+                print(f"Report already written by run {run.run_id}: {report_filename}")
         else:
-            report, filename_date_range = generate_report(newsletters, topics, llm_analysis, args.days, model_info)
-        
-        report_filename = f"ai_newsletter_summary_{filename_date_range}.md"
-        output_dir = os.environ.get("NEWSLETTER_SUMMARY_OUTPUT_DIR", "")
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
-            report_filename = os.path.join(output_dir, report_filename)
-            
-            # Add Jekyll front matter for GitHub Pages
-            jekyll_front_matter = f"""---
-layout: default
-title: DeFi Newsletter Summary - {datetime.datetime.now().strftime('%B %d, %Y')}
----
-
-"""
-            report = jekyll_front_matter + report
-            
-        with open(report_filename, 'w') as f:
-            f.write(report)
-        print(f"Report saved to {report_filename}")
+            written = save_report(newsletters, topics, llm_analysis, args.days, model_info, args.breaking_news_section,
+                                  formats=args.formats, publish=args.publish, breaking_news_limit=args.breaking_news_limit,
+                                  structured_topics=run_info.get('topics'))
+            run.save('report', {"files": written}, report_inputs)
+    except BudgetExceeded as e:
+        print(f"Budget exceeded: {str(e)}")
+        if run is not None:
+            print(f"Completed stages are kept; resume with: python main.py --resume {run.run_id}")
     except Exception as e:
         print(f"Error: {str(e)}")
+        if run is not None:
+            print(f"Completed stages are kept; resume with: python main.py --resume {run.run_id}")
+    return run
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
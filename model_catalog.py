@@ -0,0 +1,270 @@
+"""
+Local price and context-window table for OpenRouter models.
+
+The table drives automatic model routing: prompt tokens are estimated
+locally and the cheapest configured model whose context window and quality
+tier fit the request is chosen. The built-in defaults can be overridden with
+a JSON file (``MODEL_TABLE_PATH``, default ``model_table.json``), which can in
+turn be refreshed from a saved OpenRouter ``/api/v1/models`` response:
+
+    python model_catalog.py --refresh-from openrouter_models.json
+"""
+
+import argparse
+import json
+import math
+import os
+from typing import Dict, Optional
+
+# Prices are USD per million tokens. Tiers: 1 = budget, 2 = standard, 3 = premium.
+DEFAULT_MODEL_TABLE = {
+    "google/gemini-2.5-flash-lite": {
+        "context_window": 1048576, "input_price": 0.10, "output_price": 0.40, "tier": 1,
+    },
+    "openai/gpt-4.1-mini": {
+        "context_window": 1047576, "input_price": 0.40, "output_price": 1.60, "tier": 2,
+    },
+    "google/gemini-2.5-flash": {
+        "context_window": 1048576, "input_price": 0.30, "output_price": 2.50, "tier": 2,
+    },
+    "openai/gpt-4.1": {
+        "context_window": 1047576, "input_price": 2.00, "output_price": 8.00, "tier": 3,
+    },
+    "anthropic/claude-sonnet-4": {
+        "context_window": 200000, "input_price": 3.00, "output_price": 15.00, "tier": 3,
+    },
+}
+
+# Models with a direct SDK client, used for routing when OpenRouter is off
+# (``provider`` is the client that calls them)
+DIRECT_MODEL_TABLE = {
+    "gpt-4.1-nano": {
+        "provider": "openai", "context_window": 1047576, "input_price": 0.10, "output_price": 0.40, "tier": 1,
+    },
+    "gpt-4.1-mini": {
+        "provider": "openai", "context_window": 1047576, "input_price": 0.40, "output_price": 1.60, "tier": 2,
+    },
+    "gpt-4.1-2025-04-14": {
+        "provider": "openai", "context_window": 1047576, "input_price": 2.00, "output_price": 8.00, "tier": 3,
+    },
+    "claude-3-7-sonnet-20250219": {
+        "provider": "claude", "context_window": 200000, "input_price": 3.00, "output_price": 15.00, "tier": 3,
+    },
+}
+# Context windows of models called directly rather than through OpenRouter
+DIRECT_CONTEXT_WINDOWS = {model: entry["context_window"] for model, entry in DIRECT_MODEL_TABLE.items()}
+# Assumed for models missing from both tables
+DEFAULT_CONTEXT_WINDOW = 128000
+# Prices (USD per million tokens) of models called directly
+DIRECT_PRICES = {
+    model: {"input_price": entry["input_price"], "output_price": entry["output_price"]}
+    for model, entry in DIRECT_MODEL_TABLE.items()
+}
+
+CHARS_PER_TOKEN = 4
+# Headroom kept free in the context window for tokenizer estimation error
+CONTEXT_SAFETY_MARGIN = 0.1
+# Rough completion size per requested topic, used to reserve output tokens
+OUTPUT_TOKENS_PER_TOPIC = 300
+# Minimum quality tier by estimated input size: small digests can go to a
+# budget model, larger ones need more synthesis capacity. (input tokens, tier)
+SIZE_TIER_THRESHOLDS = [(0, 1), (8000, 2)]
+
+
+def model_table_path() -> str:
+    """Return the path of the local model table override file."""
+    return os.environ.get("MODEL_TABLE_PATH", "model_table.json")
+
+
+def load_model_table(path: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Load the model table, applying overrides from the local JSON file.
+
+    Entries in the file replace or extend the built-in defaults field by
+    field; an entry with ``"enabled": false`` removes a model from routing.
+
+    Args:
+        path: Optional override file path (defaults to ``model_table_path()``)
+
+    Returns:
+        Dictionary of model id to its table entry
+    """
+    table = {model: dict(entry) for model, entry in DEFAULT_MODEL_TABLE.items()}
+    path = path or model_table_path()
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            overrides = json.load(f)
+        for model, entry in overrides.items():
+            table.setdefault(model, {}).update(entry)
+    return {model: entry for model, entry in table.items() if entry.get("enabled", True)}
+
+
+def refresh_model_table(source_path: str, path: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Refresh local prices and context windows from a saved OpenRouter models listing.
+
+    Only models already present in the table are updated, so quality tiers
+    and enabled flags stay under local control.
+
+    Args:
+        source_path: Path to a JSON file with the ``/api/v1/models`` response
+        path: Local table file to write (defaults to ``model_table_path()``)
+
+    Returns:
+        The refreshed override table that was written
+    """
+    path = path or model_table_path()
+    with open(source_path, 'r') as f:
+        listing = json.load(f)
+    current = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            current = json.load(f)
+    known = set(DEFAULT_MODEL_TABLE) | set(current)
+    for model in listing.get("data", []):
+        model_id = model.get("id")
+        if model_id not in known:
+            continue
+        pricing = model.get("pricing", {})
+        entry = current.setdefault(model_id, {})
+        if model.get("context_length"):
+            entry["context_window"] = int(model["context_length"])
+        # OpenRouter reports prices per token as strings
+        if pricing.get("prompt") is not None:
+            entry["input_price"] = round(float(pricing["prompt"]) * 1_000_000, 6)
+        if pricing.get("completion") is not None:
+            entry["output_price"] = round(float(pricing["completion"]) * 1_000_000, 6)
+    with open(path, 'w') as f:
+        json.dump(current, f, indent=2)
+    return current
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text locally (about four characters per token)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def direct_model_table() -> Dict[str, Dict]:
+    """Return the routing table of models that can be called without OpenRouter."""
+    return {model: dict(entry) for model, entry in DIRECT_MODEL_TABLE.items()}
+
+
+def estimate_cost(model_entry: Dict, input_tokens: int, output_tokens: int) -> float:
+    """Estimate the USD cost of a call from a model table entry."""
+    return (input_tokens * model_entry["input_price"] + output_tokens * model_entry["output_price"]) / 1_000_000
+
+
+def fits_context(model_entry: Dict, input_tokens: int, output_tokens: int) -> bool:
+    """Return True if the request fits the model's context window with headroom."""
+    usable = model_entry["context_window"] * (1 - CONTEXT_SAFETY_MARGIN)
+    return input_tokens + output_tokens <= usable
+
+
+def context_window(model: str, table: Optional[Dict[str, Dict]] = None) -> int:
+    """Return the context window of a model, falling back to ``DEFAULT_CONTEXT_WINDOW``."""
+    table = table if table is not None else load_model_table()
+    if model in table:
+        return table[model]["context_window"]
+    return DIRECT_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def model_price(model: str, table: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    Return the input/output prices of a model for cost estimation.
+
+    Models missing from the table and ``DIRECT_PRICES`` are priced at the
+    highest configured input and output prices, so estimates err on the
+    expensive side.
+
+    Returns:
+        Dictionary with ``input_price``, ``output_price`` and ``known``
+    """
+    table = table if table is not None else load_model_table()
+    entry = table.get(model) or DIRECT_PRICES.get(model)
+    if entry:
+        return {"input_price": entry["input_price"], "output_price": entry["output_price"], "known": True}
+    prices = list(table.values()) + list(DIRECT_PRICES.values())
+    return {
+        "input_price": max(price["input_price"] for price in prices),
+        "output_price": max(price["output_price"] for price in prices),
+        "known": False,
+    }
+
+
+def usage_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Return the USD cost of a completed call from its token usage and the model's prices."""
+    return round(estimate_cost(model_price(model), prompt_tokens, completion_tokens), 6)
+
+
+def required_tier(input_tokens: int) -> int:
+    """Return the minimum quality tier for a prompt of the given size."""
+    tier = 1
+    for threshold, threshold_tier in SIZE_TIER_THRESHOLDS:
+        if input_tokens >= threshold:
+            tier = threshold_tier
+    return tier
+
+
+def route_model(prompt: str, num_topics: int = 10, min_tier: int = 1,
+                table: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    Pick the cheapest model whose context window and quality tier fit the prompt.
+
+    The required tier is the higher of ``min_tier`` and the size-based tier
+    from ``SIZE_TIER_THRESHOLDS``.
+
+    Args:
+        prompt: The full prompt that will be sent
+        num_topics: Number of topics requested, used to reserve output tokens
+        min_tier: Minimum acceptable quality tier regardless of prompt size
+        table: Optional model table (defaults to ``load_model_table()``)
+
+    Returns:
+        Routing decision dictionary with ``model``, ``provider`` (the direct
+        client for ``direct_model_table()`` entries, else None),
+        ``estimated_input_tokens``, ``estimated_output_tokens``,
+        ``estimated_cost``, ``min_tier``, ``candidates`` (number of eligible
+        models) and ``reason``
+
+    Raises:
+        ValueError: If no configured model fits the request
+    """
+    table = table if table is not None else load_model_table()
+    input_tokens = estimate_tokens(prompt)
+    output_tokens = num_topics * OUTPUT_TOKENS_PER_TOPIC
+    min_tier = max(min_tier, required_tier(input_tokens))
+    eligible = [
+        (estimate_cost(entry, input_tokens, output_tokens), -entry["tier"], model)
+        for model, entry in table.items()
+        if entry["tier"] >= min_tier and fits_context(entry, input_tokens, output_tokens)
+    ]
+    if not eligible:
+        raise ValueError(
+            f"No configured model fits ~{input_tokens} input tokens at quality tier {min_tier} or above"
+        )
+    cost, _, model = min(eligible)
+    return {
+        "model": model,
+        "provider": table[model].get("provider"),
+        "estimated_input_tokens": input_tokens,
+        "estimated_output_tokens": output_tokens,
+        "estimated_cost": round(cost, 6),
+        "min_tier": min_tier,
+        "candidates": len(eligible),
+        "reason": f"cheapest of {len(eligible)} models with tier >= {min_tier} and "
+                  f"context >= {input_tokens + output_tokens} tokens",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or refresh the local model price/context table")
+    parser.add_argument("--refresh-from", type=str, default=None,
+                        help="Path to a saved OpenRouter /api/v1/models JSON response")
+    args = parser.parse_args()
+
+    if args.refresh_from:
+        refresh_model_table(args.refresh_from)
+        print(f"Model table refreshed from {args.refresh_from} into {model_table_path()}")
+    for model, entry in sorted(load_model_table().items(), key=lambda item: item[1]["input_price"]):
+        print(f"{model}: tier {entry['tier']}, context {entry['context_window']:,}, "
+              f"${entry['input_price']}/M in, ${entry['output_price']}/M out")
@@ -0,0 +1,488 @@
+"""
+Streaming pipeline: fetch, clean and analyze newsletters concurrently.
+
+The sequential run fetches every email, then cleans them all while building
+the prompt, then calls the LLM, keeping every raw HTML body in memory until
+the end. With ``--pipeline`` the stages run at the same time, connected by
+bounded queues:
+
+- fetch: I/O threads download emails from Gmail (one API client per thread)
+- clean: a process pool converts HTML to Markdown; the raw body is dropped as
+  soon as its newsletter is cleaned (``body`` then holds the cleaned text)
+- analyze: cleaned newsletters are grouped into chunks of at most
+  ``chunk_tokens``; each full chunk is analyzed while fetching continues and
+  the partial analyses are merged at the end. If everything fits in one
+  chunk, the usual single analysis runs once all newsletters are in.
+
+A full queue blocks the stage feeding it (backpressure), so no more than
+``queue_size`` fetched-but-not-cleaned bodies are held at once. Each stage
+records its items, busy time, time blocked on a full queue, wall time and
+the peak resident memory seen while it ran; ``print_stage_stats`` shows them.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+QUEUE_SIZE = 32
+FETCH_WORKERS = 8
+CLEAN_WORKERS = max(1, min(4, os.cpu_count() or 1))
+POLL_SECONDS = 0.05
+
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """Raised inside stage threads after another stage failed."""
+
+
+def current_rss() -> int:
+    """Return the resident memory of this process in bytes (peak RSS where the current value is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if peak > 1 << 32 else peak * 1024
+
+
+class StageStats:
+    """Counters for one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.started = None
+        self.finished = None
+        self.peak_rss = 0
+        self.worker_peak_rss = None
+        self._lock = threading.Lock()
+
+    def record(self, busy: float) -> None:
+        """Count one processed item and sample memory."""
+        rss = current_rss()
+        with self._lock:
+            self.items += 1
+            self.busy += busy
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def start(self) -> None:
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def finish(self) -> None:
+        with self._lock:
+            self.finished = time.perf_counter()
+
+    def to_dict(self) -> Dict:
+        wall = (self.finished or time.perf_counter()) - self.started if self.started else 0.0
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "wall_seconds": round(wall, 3),
+            "busy_seconds": round(self.busy, 3),
+            "blocked_seconds": round(self.blocked, 3),
+            "peak_rss_mb": round(self.peak_rss / (1024 * 1024), 1),
+            "worker_peak_rss_mb": (round(self.worker_peak_rss / (1024 * 1024), 1)
+                                   if self.worker_peak_rss is not None else None),
+        }
+
+
+class Pipeline:
+    """Stages connected by bounded queues, fed from an iterable and drained by a sink."""
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stages = []
+        self.stats: List[StageStats] = []
+        self._abort = threading.Event()
+        self._error = None
+
+    def thread_stage(self, name: str, func: Callable, workers: int) -> "Pipeline":
+        """Add a stage that runs ``func(item)`` in ``workers`` threads and passes on its result."""
+        self.stages.append(('thread', name, func, workers))
+        return self
+
+    def process_stage(self, name: str, func: Callable, workers: int, args: Callable, apply: Callable) -> "Pipeline":
+        """
+        Add a stage that runs ``func(*args(item))`` in a process pool.
+
+        Args:
+            name: Stage name for the statistics
+            func: Picklable module-level function run in the worker processes
+            workers: Number of worker processes
+            args: Returns the (picklable) arguments for an item
+            apply: Called in this process as ``apply(item, result)``; returns the item passed on
+        """
+        self.stages.append(('process', name, func, workers, args, apply))
+        return self
+
+    def _put(self, q: queue.Queue, item, stats: Optional[StageStats] = None) -> None:
+        start = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        if stats is not None:
+            with stats._lock:
+                stats.blocked += time.perf_counter() - start
+
+    def _get(self, q: queue.Queue, timeout: Optional[float] = None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    raise
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None and not isinstance(error, PipelineAborted):
+            self._error = error
+        self._abort.set()
+
+    def _feed(self, items: Iterable, out_q: queue.Queue, stats: StageStats) -> None:
+        try:
+            stats.start()
+            for item in items:
+                stats.record(0.0)
+                self._put(out_q, item, stats)
+            self._put(out_q, _DONE)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            stats.finish()
+
+    def _run_threads(self, name, func, workers, in_q, out_q, stats) -> List[threading.Thread]:
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def work():
+            try:
+                stats.start()
+                while True:
+                    item = self._get(in_q)
+                    if item is _DONE:
+                        # Let the sibling workers see the end of input too
+                        self._put(in_q, _DONE)
+                        break
+                    start = time.perf_counter()
+                    result = func(item)
+                    stats.record(time.perf_counter() - start)
+                    self._put(out_q, result, stats)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    stats.finish()
+                    self._put(out_q, _DONE)
+            except BaseException as e:
+                self._fail(e)
+
+        return [threading.Thread(target=work, name=f"pipeline-{name}-{i}", daemon=True) for i in range(workers)]
+
+    def _run_processes(self, name, func, workers, args, apply, in_q, out_q, stats) -> List[threading.Thread]:
+        def dispatch():
+            try:
+                stats.start()
+                limit = workers * 2
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    pending = {}
+                    input_done = False
+                    while not input_done or pending:
+                        if self._abort.is_set():
+                            raise PipelineAborted()
+                        if pending:
+                            # Pass on finished items; wait for one if no more input may be taken
+                            block = input_done or len(pending) >= limit
+                            done, _ = wait(pending, timeout=POLL_SECONDS if block else 0,
+                                           return_when=FIRST_COMPLETED)
+                            for future in done:
+                                item, submitted = pending.pop(future)
+                                result = apply(item, future.result())
+                                stats.record(time.perf_counter() - submitted)
+                                self._put(out_q, result, stats)
+                            if block:
+                                continue
+                        try:
+                            item = self._get(in_q, timeout=POLL_SECONDS if pending else None)
+                        except queue.Empty:
+                            continue
+                        if item is _DONE:
+                            input_done = True
+                            continue
+                        pending[executor.submit(func, *args(item))] = (item, time.perf_counter())
+                stats.finish()
+                if resource is not None:
+                    # Peak of the worker processes, known once they have exited
+                    stats.worker_peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+                self._put(out_q, _DONE)
+            except BaseException as e:
+                self._fail(e)
+
+        return [threading.Thread(target=dispatch, name=f"pipeline-{name}", daemon=True)]
+
+    def run(self, items: Iterable, sink: Callable, source_name: str = 'source') -> List[Dict]:
+        """
+        Run the pipeline until every item has reached the sink.
+
+        Args:
+            items: Input items (consumed in a feeder thread)
+            sink: Called in this thread with every item leaving the last stage
+            source_name: Stage name of the feeder in the statistics
+
+        Returns:
+            Per-stage statistics (``StageStats.to_dict``), feeder and sink included
+
+        Raises:
+            The first exception raised by a stage or the sink
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        source_stats = StageStats(source_name)
+        self.stats = [source_stats]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], source_stats), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            stats = StageStats(stage[1])
+            self.stats.append(stats)
+            if stage[0] == 'thread':
+                threads += self._run_threads(*stage[1:], queues[i], queues[i + 1], stats)
+            else:
+                threads += self._run_processes(*stage[1:], queues[i], queues[i + 1], stats)
+        sink_stats = StageStats(getattr(sink, 'name', 'sink'))
+        self.stats.append(sink_stats)
+        for thread in threads:
+            thread.start()
+        try:
+            sink_stats.start()
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                sink(item)
+                sink_stats.record(time.perf_counter() - start)
+            finish = getattr(sink, 'finish', None)
+            if finish is not None:
+                start = time.perf_counter()
+                finish()
+                sink_stats.busy += time.perf_counter() - start
+            sink_stats.finish()
+        except BaseException as e:
+            self._fail(e)
+            close = getattr(sink, 'close', None)
+            if close is not None:
+                close()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+        return [stats.to_dict() for stats in self.stats]
+
+
+class ChunkedAnalysis:
+    """
+    Pipeline sink that analyzes cleaned newsletters in chunks as they arrive.
+
+    A chunk is dispatched (in a thread pool) as soon as adding the next
+    newsletter would exceed ``chunk_tokens``. ``finish`` runs the single
+    analysis if no chunk was dispatched, otherwise analyzes the last chunk
+    and merges the partial analyses.
+    """
+
+    name = 'analyze'
+
+    def __init__(self, analyze: Callable, merge: Callable, size: Callable, chunk_tokens: int,
+                 workers: int = 4):
+        """
+        Args:
+            analyze: ``analyze(newsletters)`` returns ``(analysis_text, topics)``
+            merge: ``merge(partial_texts)`` returns ``(analysis_text, topics)``
+            size: ``size(newsletter)`` returns its estimated prompt tokens
+            chunk_tokens: Newsletter content tokens per chunk
+            workers: Maximum concurrent chunk analyses
+        """
+        self.analyze = analyze
+        self.merge = merge
+        self.size = size
+        self.chunk_tokens = chunk_tokens
+        self.newsletters = []
+        self.chunks = []
+        self.result = None
+        self._buffer = []
+        self._buffer_tokens = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._futures = []
+
+    def __call__(self, nl: Dict) -> None:
+        tokens = self.size(nl)
+        if self._buffer and self._buffer_tokens + tokens > self.chunk_tokens:
+            self._dispatch()
+        self.newsletters.append(nl)
+        self._buffer.append(nl)
+        self._buffer_tokens += tokens
+
+    def _dispatch(self) -> None:
+        self.chunks.append(len(self._buffer))
+        self._futures.append(self._executor.submit(self.analyze, self._buffer))
+        self._buffer = []
+        self._buffer_tokens = 0
+
+    def finish(self):
+        """Analyze what is left and return ``(analysis_text, topics)``."""
+        try:
+            if not self._futures:
+                self.chunks = [len(self._buffer)] if self._buffer else []
+                self.result = self.analyze(self._buffer) if self._buffer else ("", [])
+                return self.result
+            if self._buffer:
+                self._dispatch()
+            partials = [future.result()[0] for future in self._futures]
+            self.result = self.merge(partials)
+            return self.result
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop the chunk analyses that have not started."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def release_raw_body(nl: Dict, content: str) -> Dict:
+    """Store cleaned content on a newsletter and drop its raw body."""
+    nl['content'] = content
+    # Later consumers (website guessing, breaking news) read links and the lead from the Markdown
+    nl['body'] = content
+    nl['body_format'] = 'markdown'
+    return nl
+
+
+def print_stage_stats(stats: List[Dict]) -> None:
+    """Print the per-stage statistics of a pipeline run."""
+    print(f"{'Stage':<10} {'Items':>6} {'Wall s':>8} {'Busy s':>8} {'Blocked s':>10} {'Peak RSS MB':>12} "
+          f"{'Workers MB':>11}")
+    for stage in stats:
+        workers = stage['worker_peak_rss_mb']
+        print(f"{stage['stage']:<10} {stage['items']:>6} {stage['wall_seconds']:>8.2f} {stage['busy_seconds']:>8.2f} "
+              f"{stage['blocked_seconds']:>10.2f} {stage['peak_rss_mb']:>12.1f} "
+              f"{'-' if workers is None else f'{workers:.1f}':>11}")
+
+
+def run_newsletter_pipeline(message_ids: Optional[Iterable[str]] = None, service_factory: Optional[Callable] = None,
+                            newsletters: Optional[Iterable[Dict]] = None, analysis_options: Optional[Dict] = None,
+                            chunk_tokens: Optional[int] = None, fetch_workers: int = FETCH_WORKERS,
+                            clean_workers: int = CLEAN_WORKERS, queue_size: int = QUEUE_SIZE,
+                            run_info: Optional[Dict] = None):
+    """
+    Fetch, clean and analyze newsletters as a streaming pipeline.
+
+    Args:
+        message_ids: Gmail message ids to fetch (with ``service_factory``)
+        service_factory: Returns a Gmail API client; called once per fetch thread, so it
+            should build cheap per-thread clients (see ``auth.thread_service_factory``)
+            rather than authenticate
+        newsletters: Already loaded newsletters (e.g. mock data) instead of message ids
+        analysis_options: Keyword arguments for ``llm.analyze_newsletters_unified``
+            (``num_topics``, ``provider``, ``model``, ``budget``, ...)
+        chunk_tokens: Newsletter content tokens per analysis chunk (default: what
+            fits the analysis model's context window in one request)
+        fetch_workers: Fetch threads
+        clean_workers: Cleaning processes
+        queue_size: Capacity of each queue between stages
+        run_info: Optional dictionary that receives the call details of the
+            analysis (of the merge call when there are several chunks) and,
+            under 'pipeline', the per-stage statistics and each chunk's
+            newsletter count and call details
+
+    Returns:
+        Tuple of (newsletters in fetch order, analysis_text, topic_titles)
+    """
+    from chunking import check_context
+    from fetch import fetch_newsletter
+    from llm import (OPENROUTER_MODEL_MAP, analyze_newsletters_unified, build_analysis_prompt,
+                     build_newsletter_content, merge_partial_analyses)
+    from model_catalog import estimate_tokens
+    from utils import clean_body
+
+    options = dict(analysis_options or {})
+    options.pop('run_info', None)
+    num_topics = options.get('num_topics', 10)
+    if chunk_tokens is None:
+        model = options.get('model') or OPENROUTER_MODEL_MAP.get(options.get('provider', 'openai'),
+                                                                 OPENROUTER_MODEL_MAP['openai'])
+        overhead = build_analysis_prompt([], num_topics=num_topics)
+        guard = check_context(overhead, model, num_topics)
+        chunk_tokens = guard['max_input_tokens'] - guard['estimated_input_tokens']
+
+    pipeline = Pipeline(queue_size=queue_size)
+    if newsletters is None:
+        local = threading.local()
+
+        def fetch(position_and_id):
+            position, message_id = position_and_id
+            if not hasattr(local, 'service'):
+                local.service = service_factory()
+            nl = fetch_newsletter(local.service, message_id)
+            nl['_position'] = position
+            return nl
+
+        items = enumerate(message_ids)
+        pipeline.thread_stage('fetch', fetch, fetch_workers)
+        source_name = 'list'
+    else:
+        def positioned(loaded):
+            for position, nl in enumerate(loaded):
+                nl['_position'] = position
+                yield nl
+
+        items = positioned(newsletters)
+        source_name = 'load'
+    pipeline.process_stage('clean', clean_body, clean_workers,
+                           args=lambda nl: (nl['body'], nl.get('body_format')), apply=release_raw_body)
+
+    # Chunks run concurrently, so each records its call details in its own dictionary
+    chunk_infos = {}
+
+    def analyze(group):
+        group = sorted(group, key=lambda nl: nl['_position'])
+        chunk_info = chunk_infos[group[0]['_position']] = {"newsletters": len(group)}
+        return analyze_newsletters_unified(group, run_info=chunk_info, **options)
+
+    def merge(partials):
+        return merge_partial_analyses(partials, num_topics=num_topics, provider=options.get('provider', 'openai'),
+                                      model=options.get('model'), budget=options.get('budget'), run_info=run_info,
+                                      health=options.get('health'))
+
+    sink = ChunkedAnalysis(analyze, merge, lambda nl: estimate_tokens(build_newsletter_content([nl])), chunk_tokens)
+    stats = pipeline.run(items, sink, source_name=source_name)
+    fetched = sorted(sink.newsletters, key=lambda nl: nl['_position'])
+    for nl in fetched:
+        del nl['_position']
+    analysis_text, topics = sink.result
+    if run_info is not None:
+        chunks = [chunk_infos[position] for position in sorted(chunk_infos)]
+        if len(chunks) == 1:
+            # A single chunk is the whole analysis
+            run_info.update({key: value for key, value in chunks[0].items() if key != 'newsletters'})
+        run_info['pipeline'] = {"stages": stats, "chunks": chunks, "chunk_tokens": chunk_tokens}
+    return fetched, analysis_text, topics
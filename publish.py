@@ -0,0 +1,360 @@
+"""
+Incremental publishing of reports to the GitHub Pages site in ``docs/``.
+
+Publishing a report updates only the pages it affects:
+
+- ``_published.jsonl``: the manifest, one JSON entry per published report,
+  appended (never rewritten) once the pages and state below are written
+- ``_publish_state.json``: the report count, the entries of the newest
+  archive page, which is all the pages below are rendered from, and an index
+  of every published file name (to skip republishing in O(1))
+- ``index.md``: the block between the ``published-reports`` markers lists the
+  newest report and the ones before it; the rest of the page is left as written
+- ``latest-report.md`` and ``report.md``: copies of the newest report
+- ``archive/<n>.md``: ``PAGE_SIZE`` reports per page, oldest page first; only
+  the newest page is rewritten (and the one before it when a new page starts)
+
+Every file is written atomically (temp file and rename) under a lock, and the
+work per report does not depend on the size of the archive. Files starting
+with an underscore are not served by Jekyll.
+
+Run ``python publish.py REPORT.md`` to publish a report that is already in
+the site directory, ``python publish.py --rebuild`` to build the manifest and
+pages from all reports there, or pass ``--publish`` to ``main.py``.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from file_lock import locked, write_atomic
+
+DEFAULT_SITE_DIR = 'docs'
+MANIFEST_FILE = '_published.jsonl'
+STATE_FILE = '_publish_state.json'
+INDEX_FILE = 'index.md'
+LATEST_FILES = ('latest-report.md', 'report.md')
+ARCHIVE_DIR = 'archive'
+PAGE_SIZE = 20
+RECENT_COUNT = 10
+TOPIC_COUNT = 5
+
+INDEX_START = '<!-- published-reports:start -->'
+INDEX_END = '<!-- published-reports:end -->'
+SITE_TITLE = 'DeFi Newsletter Summary'
+DEFAULT_INTRO = f"""# {SITE_TITLE}
+
+Welcome to the automated DeFi newsletter analysis site. This page displays the latest insights and summaries from DeFi newsletters.
+"""
+
+REPORT_FILE_PATTERN = re.compile(r'ai_newsletter_summary_(\d{8}_\d{4})_from_(\d{8})\.md$')
+TOPIC_PATTERN = re.compile(r'^### \d+\. (.+?)\s*$', re.MULTILINE)
+FRONT_MATTER_PATTERN = re.compile(r'\A---\n.*?\n---\n+', re.DOTALL)
+
+
+_write_atomic = write_atomic
+
+
+def entry_title(run_at: datetime.datetime) -> str:
+    """Return the link text of a report run at ``run_at``."""
+    return f"{run_at.strftime('%B %d, %Y')} Summary ({run_at.strftime('%H:%M')})"
+
+
+def entry_from_model(filename: str, model: Dict) -> Dict:
+    """
+    Build the manifest entry for a report from its report model.
+
+    Args:
+        filename: File name of the Markdown report in the site directory
+        model: Report model from ``report.build_report_model``
+
+    Returns:
+        The manifest entry
+    """
+    run_at = datetime.datetime.fromisoformat(model["run_at"])
+    return {
+        "file": filename,
+        "title": entry_title(run_at),
+        "run_at": model["run_at"],
+        "period_start": model.get("period_start"),
+        "period_end": model.get("period_end"),
+        "newsletters": model.get("newsletter_count"),
+        "topics": [section["title"] for section in model.get("sections", [])][:TOPIC_COUNT]
+                  or list(model.get("topics", []))[:TOPIC_COUNT],
+    }
+
+
+def entry_from_file(path: str) -> Dict:
+    """
+    Build the manifest entry for a report file written earlier.
+
+    The run time and period start come from the file name, the topics from
+    the numbered topic headings.
+
+    Raises:
+        ValueError: If the file name is not a report file name
+    """
+    filename = os.path.basename(path)
+    match = REPORT_FILE_PATTERN.match(filename)
+    if not match:
+        raise ValueError(f"{filename} is not a report file (ai_newsletter_summary_YYYYMMDD_HHMM_from_YYYYMMDD.md)")
+    run_at = datetime.datetime.strptime(match.group(1), '%Y%m%d_%H%M')
+    with open(path, 'r', encoding='utf-8') as f:
+        topics = TOPIC_PATTERN.findall(f.read())
+    return {
+        "file": filename,
+        "title": entry_title(run_at),
+        "run_at": run_at.isoformat(),
+        "period_start": datetime.datetime.strptime(match.group(2), '%Y%m%d').isoformat(),
+        "period_end": None,
+        "newsletters": None,
+        "topics": topics[:TOPIC_COUNT],
+    }
+
+
+def page_number(position: int, page_size: int = PAGE_SIZE) -> int:
+    """Return the archive page (from 1) holding the report at a 0-based position."""
+    return position // page_size + 1
+
+
+def render_archive_page(number: int, entries: List[Dict], newest: bool) -> str:
+    """
+    Render one archive page.
+
+    Args:
+        number: Page number (1 is the oldest)
+        entries: The page's entries, oldest first
+        newest: Whether this is the newest page (no link to a newer one)
+    """
+    lines = [
+        "---",
+        "layout: default",
+        f"title: {SITE_TITLE} - Archive Page {number}",
+        "---",
+        "",
+        f"# Report Archive - Page {number}",
+        "",
+    ]
+    for entry in reversed(entries):
+        lines.append(f"- [{entry['title']}](../{entry['file']})")
+    lines.append("")
+    navigation = []
+    if not newest:
+        navigation.append(f"[Newer reports](./{number + 1}.md)")
+    if number > 1:
+        navigation.append(f"[Older reports](./{number - 1}.md)")
+    navigation.append("[Home](../index.md)")
+    lines.append(" | ".join(navigation))
+    return "\n".join(lines) + "\n"
+
+
+def render_index_block(recent: List[Dict], count: int, page_size: int = PAGE_SIZE) -> str:
+    """
+    Render the generated part of ``index.md``.
+
+    Args:
+        recent: The newest entries, oldest first
+        count: Total number of published reports
+        page_size: Reports per archive page
+    """
+    latest = recent[-1]
+    lines = [
+        INDEX_START,
+        "## Latest Reports",
+        "",
+        f"### [Latest: {latest['title']}](./latest-report.md)",
+        f"### [Full Report](./{latest['file']})",
+    ]
+    if latest.get("topics"):
+        lines.append("Covering:")
+        lines.extend(f"- {topic}" for topic in latest["topics"])
+    generated = datetime.datetime.fromisoformat(latest["run_at"]).strftime('%B %d, %Y')
+    summary = f"**Generated:** {generated}"
+    if latest.get("newsletters"):
+        summary += f" | **Sources:** {latest['newsletters']} newsletters analyzed"
+    lines += ["", summary, ""]
+    previous = recent[-RECENT_COUNT:-1]
+    if previous:
+        lines += ["### Previous Reports"]
+        lines.extend(f"- [{entry['title']}](./{entry['file']})" for entry in reversed(previous))
+        lines.append("")
+    lines += [f"[All {count} reports](./{ARCHIVE_DIR}/{page_number(count - 1, page_size)}.md)", INDEX_END]
+    return "\n".join(lines)
+
+
+def update_index(text: str, block: str) -> str:
+    """
+    Replace the generated block of ``index.md``, keeping everything else.
+
+    An index without the markers keeps its text up to a ``## Latest Reports``
+    heading (the hand-written list it replaces), and the block is added below.
+    """
+    start = text.find(INDEX_START)
+    end = text.find(INDEX_END)
+    if start != -1 and end > start:
+        return text[:start] + block + text[end + len(INDEX_END):]
+    heading = text.find("## Latest Reports")
+    intro = (text[:heading] if heading != -1 else text).rstrip() or DEFAULT_INTRO.rstrip()
+    return f"{intro}\n\n{block}\n"
+
+
+def render_latest(markdown: str, entry: Dict) -> str:
+    """Return a report's Markdown as the latest-report page."""
+    body = FRONT_MATTER_PATTERN.sub('', markdown, count=1)
+    return f"""---
+layout: default
+title: Latest {SITE_TITLE}
+---
+
+*Permanent link: [{entry['title']}](./{entry['file']})*
+
+{body}"""
+
+
+def load_state(site_dir: str) -> Dict:
+    """
+    Return the publishing state of a site directory (empty if nothing was published).
+
+    ``published`` maps each published file name to its position in the
+    manifest; states written before it existed get it from the manifest once.
+    """
+    path = os.path.join(site_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {"count": 0, "page_size": PAGE_SIZE, "recent": [], "published": {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if "published" not in state:
+        state["published"] = published_index(read_manifest(site_dir))
+    return state
+
+
+def read_manifest(site_dir: str) -> List[Dict]:
+    """Return the entries of a site's manifest, oldest first."""
+    path = os.path.join(site_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def published_index(entries: List[Dict]) -> Dict[str, int]:
+    """Map the file names of published entries to their 1-based manifest position."""
+    return {entry["file"]: position for position, entry in enumerate(entries, 1)}
+
+
+def _write_pages(site_dir: str, state: Dict, markdown: str, rollover_entries: Optional[List[Dict]]) -> None:
+    count, page_size, recent = state["count"], state["page_size"], state["recent"]
+    archive_dir = os.path.join(site_dir, ARCHIVE_DIR)
+    os.makedirs(archive_dir, exist_ok=True)
+    page = page_number(count - 1, page_size)
+    on_page = count - (page - 1) * page_size
+    _write_atomic(os.path.join(archive_dir, f"{page}.md"), render_archive_page(page, recent[-on_page:], newest=True))
+    if rollover_entries:
+        # The previous page gains its link to the new one
+        _write_atomic(os.path.join(archive_dir, f"{page - 1}.md"),
+                      render_archive_page(page - 1, rollover_entries, newest=False))
+    index_path = os.path.join(site_dir, INDEX_FILE)
+    text = ''
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    _write_atomic(index_path, update_index(text, render_index_block(recent, count, page_size)))
+    for name in LATEST_FILES:
+        _write_atomic(os.path.join(site_dir, name), render_latest(markdown, recent[-1]))
+
+
+def publish_report(site_dir: str, report_path: str, model: Optional[Dict] = None,
+                   markdown: Optional[str] = None) -> bool:
+    """
+    Publish a Markdown report written to the site directory.
+
+    Args:
+        site_dir: The site directory (``docs/``)
+        report_path: Path of the Markdown report
+        model: Report model the report was rendered from; the entry is read from the file if None
+        markdown: The report's Markdown; read from the file if None
+
+    Returns:
+        True if the report was published, False if it had been published before
+    """
+    if markdown is None:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            markdown = f.read()
+    filename = os.path.basename(report_path)
+    entry = entry_from_model(filename, model) if model is not None else entry_from_file(report_path)
+    os.makedirs(site_dir, exist_ok=True)
+    with locked(os.path.join(site_dir, STATE_FILE)):
+        state = load_state(site_dir)
+        if filename in state["published"]:
+            return False
+        page_size = state["page_size"]
+        rollover = state["count"] > 0 and state["count"] % page_size == 0
+        rollover_entries = list(state["recent"]) if rollover else None
+        state["count"] += 1
+        state["recent"] = (state["recent"] + [entry])[-page_size:]
+        state["published"][filename] = state["count"]
+        _write_pages(site_dir, state, markdown, rollover_entries)
+        _write_atomic(os.path.join(site_dir, STATE_FILE), json.dumps(state, indent=2))
+        # Appended last, so a failed publish leaves no manifest entry behind
+        with open(os.path.join(site_dir, MANIFEST_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+    print(f"Published {filename} to {site_dir} ({state['count']} reports)")
+    return True
+
+
+def rebuild(site_dir: str = DEFAULT_SITE_DIR, page_size: int = PAGE_SIZE) -> int:
+    """
+    Rebuild the manifest, state and every page from the reports in a site directory.
+
+    This reads the whole archive and is meant for setting up publishing on an
+    existing site or recovering from a lost manifest.
+
+    Returns:
+        The number of reports found
+    """
+    paths = sorted(path for path in glob.glob(os.path.join(site_dir, 'ai_newsletter_summary_*.md'))
+                   if REPORT_FILE_PATTERN.match(os.path.basename(path)))
+    if not paths:
+        return 0
+    entries = [entry_from_file(path) for path in paths]
+    with locked(os.path.join(site_dir, STATE_FILE)):
+        _write_atomic(os.path.join(site_dir, MANIFEST_FILE), "".join(json.dumps(entry) + "\n" for entry in entries))
+        archive_dir = os.path.join(site_dir, ARCHIVE_DIR)
+        os.makedirs(archive_dir, exist_ok=True)
+        pages = page_number(len(entries) - 1, page_size)
+        for page in range(1, pages):
+            _write_atomic(os.path.join(archive_dir, f"{page}.md"),
+                          render_archive_page(page, entries[(page - 1) * page_size:page * page_size], newest=False))
+        state = {"count": len(entries), "page_size": page_size, "recent": entries[-page_size:],
+                 "published": published_index(entries)}
+        with open(paths[-1], 'r', encoding='utf-8') as f:
+            markdown = f.read()
+        _write_pages(site_dir, state, markdown, None)
+        _write_atomic(os.path.join(site_dir, STATE_FILE), json.dumps(state, indent=2))
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish reports to the GitHub Pages site")
+    parser.add_argument('report', nargs='?', help='Markdown report in the site directory to publish')
+    parser.add_argument('--site-dir', default=os.environ.get('NEWSLETTER_SUMMARY_OUTPUT_DIR') or DEFAULT_SITE_DIR,
+                        help='Site directory (default: NEWSLETTER_SUMMARY_OUTPUT_DIR or docs)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Rebuild the manifest and all pages from the reports in the site directory')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"Rebuilt {args.site_dir} from {rebuild(args.site_dir)} reports.")
+    elif args.report:
+        if not publish_report(args.site_dir, args.report):
+            print(f"{os.path.basename(args.report)} is already published.")
+    else:
+        parser.error("give a report to publish or --rebuild")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Streaming percentile estimation with the P² algorithm.
+
+The P² algorithm (Jain & Chlamtac, 1985) estimates a quantile from a stream
+using five markers, so memory stays constant however many samples arrive.
+``analyze_costs.py`` uses it to report latency and throughput percentiles
+per model without loading the whole cost log.
+"""
+
+from typing import Dict, Iterable, Optional
+
+
+class P2Quantile:
+    """Constant-memory estimator of one quantile."""
+
+    def __init__(self, p: float):
+        if not 0 < p < 1:
+            raise ValueError("Quantile must be between 0 and 1")
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float) -> None:
+        """Add one sample."""
+        self.count += 1
+        heights = self.heights
+        if self.count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        if x < heights[0]:
+            heights[0] = x
+            cell = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            cell = 3
+        else:
+            cell = next(i for i in range(4) if heights[i] <= x < heights[i + 1])
+        for i in range(cell + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the three middle markers towards their desired positions
+        n = self.positions
+        for i in (1, 2, 3):
+            offset = self.desired[i] - n[i]
+            if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (n[i + step] - n[i])
+                heights[i] = height
+                n[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        """Return the current estimate (exact for five or fewer samples), or None without samples."""
+        if not self.count:
+            return None
+        if self.count <= 5:
+            # Linear interpolation between the closest ranks
+            rank = self.p * (self.count - 1)
+            lower = int(rank)
+            upper = min(lower + 1, self.count - 1)
+            return self.heights[lower] + (self.heights[upper] - self.heights[lower]) * (rank - lower)
+        return self.heights[2]
+
+
+class StreamingPercentiles:
+    """A set of P² estimators for several percentiles of the same stream."""
+
+    def __init__(self, percentiles: Iterable[float] = (50, 95, 99)):
+        self.estimators = {pct: P2Quantile(pct / 100) for pct in percentiles}
+        self.count = 0
+
+    def add(self, x: float) -> None:
+        """Add one sample to every estimator."""
+        self.count += 1
+        for estimator in self.estimators.values():
+            estimator.add(x)
+
+    def values(self) -> Dict[float, Optional[float]]:
+        """Return ``{percentile: estimate}``."""
+        return {pct: estimator.value() for pct, estimator in self.estimators.items()}
@@ -0,0 +1,321 @@
+"""
+Local TF-IDF pre-ranking of newsletter story blocks.
+
+Scores every story block by how many sources mention it, how recent it is and
+how specific it is, then fills a prompt budget with the highest scoring blocks
+so only high-signal content reaches the LLM. Everything runs on the CPU with
+sparse SciPy matrices.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from dedup import split_story_blocks, sender_name
+from timeline import newsletter_timestamp
+
+DEFAULT_PROMPT_BUDGET = 30000  # estimated tokens of newsletter content
+CHARS_PER_TOKEN = 4
+
+# Weights for the three scoring signals
+COVERAGE_WEIGHT = 0.5
+RECENCY_WEIGHT = 0.25
+SPECIFICITY_WEIGHT = 0.25
+
+# Cosine similarity above which two blocks are considered the same story
+SAME_STORY_SIMILARITY = 0.3
+RECENCY_HALF_LIFE_HOURS = 48.0
+
+# Rows of the similarity matrix computed per batch, bounding peak memory
+_SIMILARITY_BATCH = 2048
+# Only each block's highest weighted terms take part in the similarity
+# product; shared filler words otherwise make it nearly dense
+SIMILARITY_TOP_TERMS = 24
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9\-\.']*[a-z0-9]|[a-z0-9]")
+_COVERAGE_RE = re.compile(r'^\[Covered by (\d+) sources')
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had
+has have having he her here hers herself him himself his how i if in into is it its itself just
+let me more most my myself new no nor not now of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them themselves then there these
+they this those through to too under until up very was we were what when where which while who
+whom why will with would you your yours yourself yourselves get got one two today week year
+click read more here subscribe newsletter email view browser unsubscribe sponsored
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into content tokens, dropping stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def build_tfidf_matrix(texts: Sequence[str], min_df: int = 1, max_df_ratio: float = 0.5):
+    """
+    Build an L2-normalized, sublinear TF-IDF matrix.
+
+    Args:
+        texts: Documents (story blocks) to vectorize
+        min_df: Minimum number of documents a term must appear in
+        max_df_ratio: Terms in a larger share of documents are dropped as
+            boilerplate (only once they appear in more than 10 documents, so
+            small corpora keep the terms their shared stories have in common)
+
+    Returns:
+        Tuple of (csr_matrix of shape (n_docs, n_terms), idf array, vocabulary dict)
+    """
+    vocabulary: Dict[str, int] = {}
+    indptr = [0]
+    indices = []
+    counts = []
+    for text in texts:
+        term_counts = Counter(tokenize(text))
+        for term, count in term_counts.items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+        indptr.append(len(indices))
+
+    n_docs = len(texts)
+    tf = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+        shape=(n_docs, len(vocabulary)),
+    )
+    df = np.bincount(tf.indices, minlength=len(vocabulary))
+    keep = (df >= min_df) & (df <= max(10, max_df_ratio * n_docs))
+    if not keep.all():
+        kept_columns = np.flatnonzero(keep)
+        tf = tf[:, kept_columns]
+        df = df[kept_columns]
+        terms = {index: term for term, index in vocabulary.items()}
+        vocabulary = {terms[old]: new for new, old in enumerate(kept_columns)}
+
+    idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+    tfidf = tf.copy()
+    tfidf.data = 1.0 + np.log(tfidf.data)
+    tfidf = tfidf.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    tfidf = sparse.diags(1.0 / norms) @ tfidf
+    return tfidf.tocsr(), idf, vocabulary
+
+
+def prune_rows(matrix, top_k: int):
+    """
+    Keep only the ``top_k`` largest entries of every CSR row and re-normalize.
+
+    Args:
+        matrix: CSR matrix with non-negative entries
+        top_k: Number of entries to keep per row
+
+    Returns:
+        New L2-normalized CSR matrix with at most ``top_k`` entries per row
+    """
+    matrix = matrix.tocsr()
+    row_of = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((-matrix.data, row_of))
+    rank = np.arange(len(order)) - matrix.indptr[row_of[order]]
+    keep = np.sort(order[rank < top_k])
+    row_lengths = np.bincount(row_of[keep], minlength=matrix.shape[0])
+    indptr = np.concatenate(([0], np.cumsum(row_lengths)))
+    pruned = sparse.csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+    norms = np.sqrt(np.asarray(pruned.multiply(pruned).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return (sparse.diags(1.0 / norms) @ pruned).tocsr()
+
+
+def source_coverage(tfidf, block_sources: np.ndarray, n_sources: int,
+                    threshold: float = SAME_STORY_SIMILARITY) -> np.ndarray:
+    """
+    Count how many other sources carry a similar block for every block.
+
+    The cosine similarity matrix is computed in row batches as a sparse
+    product, thresholded, and multiplied by a block-to-source incidence
+    matrix so the per-source counts never materialize densely. Rows are
+    pruned to their ``SIMILARITY_TOP_TERMS`` strongest terms first, which
+    keeps the product sparse without changing which blocks tell the same story.
+
+    Args:
+        tfidf: L2-normalized TF-IDF matrix (one row per block)
+        block_sources: Source index of each block
+        n_sources: Number of distinct sources
+        threshold: Minimum cosine similarity for two blocks to be the same story
+
+    Returns:
+        Integer array with the number of distinct *other* sources per block
+    """
+    n_blocks = tfidf.shape[0]
+    incidence = sparse.csr_matrix(
+        (np.ones(n_blocks), (np.arange(n_blocks), block_sources)), shape=(n_blocks, n_sources)
+    )
+    pruned = prune_rows(tfidf, SIMILARITY_TOP_TERMS)
+    transposed = pruned.T.tocsr()
+    coverage = np.zeros(n_blocks, dtype=np.int64)
+    for start in range(0, n_blocks, _SIMILARITY_BATCH):
+        stop = min(start + _SIMILARITY_BATCH, n_blocks)
+        similarity = (pruned[start:stop] @ transposed).tocsr()
+        similarity.data[similarity.data < threshold] = 0.0
+        similarity.eliminate_zeros()
+        sources_hit = (similarity @ incidence).tocsr()
+        sources_hit.data = np.ones_like(sources_hit.data)
+        # Every block matches itself, so its own source is always counted once
+        coverage[start:stop] = np.asarray(sources_hit.sum(axis=1)).ravel() - 1
+    return coverage
+
+
+def specificity_scores(tfidf, idf: np.ndarray, block_sources: np.ndarray, n_sources: int) -> np.ndarray:
+    """
+    Score how specific each block is.
+
+    Combines the mean IDF of a block's terms (concrete names and numbers are
+    rare) with the share of its TF-IDF mass carried by terms that several
+    sources use (cross-newsletter term frequency), which favours specific
+    terms that are trending over one-off typos or boilerplate.
+
+    Returns:
+        Array of scores in [0, 1]
+    """
+    presence = tfidf.copy()
+    presence.data = np.ones_like(presence.data)
+    n_blocks = tfidf.shape[0]
+    incidence = sparse.csr_matrix(
+        (np.ones(n_blocks), (block_sources, np.arange(n_blocks))), shape=(n_sources, n_blocks)
+    )
+    source_terms = (incidence @ presence).tocsr()
+    source_terms.data = np.ones_like(source_terms.data)
+    term_source_freq = np.asarray(source_terms.sum(axis=0)).ravel()
+    shared = ((term_source_freq >= 2) & (term_source_freq <= max(2, 0.5 * n_sources))).astype(np.float64)
+
+    term_counts = np.asarray(presence.sum(axis=1)).ravel()
+    term_counts[term_counts == 0] = 1.0
+    mean_idf = (presence @ idf) / term_counts
+    max_idf = idf.max() if len(idf) else 1.0
+    row_mass = np.asarray(tfidf.sum(axis=1)).ravel()
+    row_mass[row_mass == 0] = 1.0
+    shared_mass = (tfidf @ shared) / row_mass
+    return 0.5 * (mean_idf / max_idf) + 0.5 * shared_mass
+
+
+def recency_scores(timestamps: Sequence[Optional[float]],
+                   half_life_hours: float = RECENCY_HALF_LIFE_HOURS) -> np.ndarray:
+    """
+    Exponentially decay scores by age relative to the newest newsletter.
+
+    Newsletters without a parseable date get a neutral 0.5.
+    """
+    known = [t for t in timestamps if t is not None]
+    if not known:
+        return np.full(len(timestamps), 0.5)
+    newest = max(known)
+    ages = np.array([(newest - t) / 3600.0 if t is not None else np.nan for t in timestamps])
+    scores = np.power(0.5, ages / half_life_hours)
+    scores[np.isnan(scores)] = 0.5
+    return scores
+
+
+def rank_story_blocks(cleaned_newsletters: Sequence[Dict], min_words: int = 25) -> List[Dict]:
+    """
+    Split newsletters into story blocks and score every block.
+
+    Args:
+        cleaned_newsletters: Newsletter dictionaries with ``content`` (cleaned
+            markdown), ``sender`` and ``timestamp`` (or a ``date`` header) keys
+        min_words: Minimum words per story block
+
+    Returns:
+        List of block dictionaries sorted by descending ``score`` with keys
+        ``newsletter_index``, ``position``, ``text``, ``score``, ``sources``
+        (number of sources covering the story), ``recency``, ``specificity``
+        and ``vector`` (the block's TF-IDF row)
+    """
+    blocks = []
+    for index, nl in enumerate(cleaned_newsletters):
+        for position, text in enumerate(split_story_blocks(nl.get('content', ''), min_words=min_words)):
+            blocks.append({'newsletter_index': index, 'position': position, 'text': text})
+    if not blocks:
+        return []
+
+    source_ids: Dict[str, int] = {}
+    block_sources = np.array([
+        source_ids.setdefault(sender_name(cleaned_newsletters[b['newsletter_index']].get('sender', '')), len(source_ids))
+        for b in blocks
+    ])
+    tfidf, idf, _ = build_tfidf_matrix([b['text'] for b in blocks])
+    n_sources = len(source_ids)
+
+    coverage = source_coverage(tfidf, block_sources, n_sources) + 1
+    # Respect coverage counts already established by story deduplication
+    annotated = np.array([
+        int(m.group(1)) if (m := _COVERAGE_RE.match(b['text'])) else 1 for b in blocks
+    ])
+    coverage = np.maximum(coverage, annotated)
+    coverage_score = np.log1p(coverage - 1) / math.log1p(max(1, n_sources - 1)) if n_sources > 1 \
+        else np.zeros(len(blocks))
+
+    timestamps = [newsletter_timestamp(nl) for nl in cleaned_newsletters]
+    recency = recency_scores(timestamps)[[b['newsletter_index'] for b in blocks]]
+    specificity = specificity_scores(tfidf, idf, block_sources, n_sources)
+
+    scores = COVERAGE_WEIGHT * coverage_score + RECENCY_WEIGHT * recency + SPECIFICITY_WEIGHT * specificity
+    for i, block in enumerate(blocks):
+        block['score'] = float(scores[i])
+        block['sources'] = int(coverage[i])
+        block['recency'] = float(recency[i])
+        block['specificity'] = float(specificity[i])
+        block['vector'] = tfidf[i]
+    return sorted(blocks, key=lambda b: (-b['score'], b['newsletter_index'], b['position']))
+
+
+def select_within_budget(ranked_blocks: Sequence[Dict], budget_tokens: int = DEFAULT_PROMPT_BUDGET,
+                         redundancy_threshold: float = 0.8) -> List[Dict]:
+    """
+    Greedily fill the prompt budget with the highest scoring blocks.
+
+    Blocks that are near-copies (cosine similarity >= ``redundancy_threshold``)
+    of an already selected block are skipped so the budget is not spent twice
+    on the same story.
+
+    Returns:
+        Selected blocks in newsletter/document order
+    """
+    selected = []
+    selected_vectors = None
+    used = 0
+    for block in ranked_blocks:
+        cost = len(block['text']) // CHARS_PER_TOKEN + 1
+        if used + cost > budget_tokens:
+            continue
+        vector = block['vector']
+        if selected_vectors is not None:
+            if (selected_vectors @ vector.T).max() >= redundancy_threshold:
+                continue
+            selected_vectors = sparse.vstack([selected_vectors, vector]).tocsr()
+        else:
+            selected_vectors = vector
+        selected.append(block)
+        used += cost
+    return sorted(selected, key=lambda b: (b['newsletter_index'], b['position']))
+
+
+def prerank_newsletter_content(cleaned_newsletters: Sequence[Dict],
+                               budget_tokens: int = DEFAULT_PROMPT_BUDGET) -> List[str]:
+    """
+    Reduce each newsletter's content to its blocks that made the budget cut.
+
+    Args:
+        cleaned_newsletters: Newsletter dictionaries with ``content``, ``sender`` and ``date``
+        budget_tokens: Estimated token budget for all newsletter content
+
+    Returns:
+        List of content strings, one per input newsletter (empty if none of
+        its blocks were selected)
+    """
+    per_newsletter = [[] for _ in cleaned_newsletters]
+    for block in select_within_budget(rank_story_blocks(cleaned_newsletters), budget_tokens):
+        per_newsletter[block['newsletter_index']].append(block['text'])
+    return ["\n\n".join(parts) for parts in per_newsletter]
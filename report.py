@@ -1,182 +1,393 @@
-import re
-from collections import Counter
+"""
+Report model and renderers.
+
+``build_report_model`` gathers everything a report shows (header notes,
+date range, analysis, breaking news, sources, methodology) into one plain
+dictionary, applying section toggles as it goes. Renderers turn that model
+into Markdown (the GitHub Pages report), HTML email, JSON and RSS, so any set
+of formats is produced from a single build without re-parsing Markdown.
+"""
+
 import datetime
+import html
+import io
 import json
-import os
-from urllib.parse import urlparse
+import re
+from email.utils import format_datetime
+from typing import Dict, Iterable, List
 
-def generate_report(newsletters, topics, llm_analysis, days, model_info=None):
-    """Generate a final report with key insights."""
-    newsletter_sources = Counter([nl['sender'] for nl in newsletters])
-    newsletter_dates = []
-    newsletter_with_dates = []
-    for i, nl in enumerate(newsletters):
-        try:
-            from email.utils import parsedate_to_datetime
-            date_obj = parsedate_to_datetime(nl['date'])
-            newsletter_dates.append(date_obj)
-            newsletter_with_dates.append((i, nl, date_obj))
-        except Exception as e:
-            print(f"Warning: Could not parse date '{nl['date']}': {str(e)}")
-    if newsletter_dates:
-        earliest_date = min(newsletter_dates)
-        latest_date = max(newsletter_dates)
-        run_time = datetime.datetime.now()
-        date_range = f"## {earliest_date.strftime('%B %d')} to {latest_date.strftime('%B %d, %Y, %H:%M')} (summary run at {run_time.strftime('%Y-%m-%d %H:%M')})"
-        filename_date_range = f"{run_time.strftime('%Y%m%d_%H%M')}_from_{earliest_date.strftime('%Y%m%d')}"
+from breaking_news import DEFAULT_MAX_ITEMS, detect_breaking_news
+from timeline import Timeline
+from topics import render_topic_markdown
+from websites import DEFAULT_CACHE_PATH, get_resolver
+
+try:
+    from markdown_it import MarkdownIt
+except ImportError:  # HTML output falls back to escaped paragraphs
+    MarkdownIt = None
+
+REPORT_TITLE = "DEFI NEWSLETTER SUMMARY"
+ANALYSIS_HEADING = "TOP AI DEVELOPMENTS"
+BREAKING_NEWS_HEADING = "JUST IN: LATEST DEVELOPMENTS"
+BREAKING_NEWS_INTRO = "These items are from the most recent newsletters (last 24 hours) and may represent emerging trends:"
+SOURCES_HEADING = "NEWSLETTER SOURCES"
+METHODOLOGY = ("This report was generated by analyzing AI newsletters "
+               "with a focus on practical implications for regular users rather than industry competition.")
+
+# Output formats and their file extensions
+FORMAT_EXTENSIONS = {
+    'md': 'md',
+    'html': 'html',
+    'json': 'json',
+    'rss': 'xml',
+}
+
+
+def index_senders(newsletters):
+    """
+    Group newsletters by sender in a single pass.
+
+    Returns:
+        List of ``(sender, (count, first_newsletter))`` pairs, most frequent
+        first; ties keep the order senders were first seen (like
+        ``Counter.most_common``)
+    """
+    index = {}
+    for nl in newsletters:
+        entry = index.get(nl['sender'])
+        if entry is None:
+            index[nl['sender']] = [1, nl]
+        else:
+            entry[0] += 1
+    return sorted(((sender, tuple(entry)) for sender, entry in index.items()), key=lambda item: -item[1][0])
+
+
+def split_sections(llm_analysis):
+    """
+    Split the analysis Markdown into its topic sections.
+
+    Returns:
+        List of ``{"title", "markdown"}`` dictionaries, one per ``###`` heading
+        (the title without its number); text before the first heading is dropped
+    """
+    sections = []
+    for block in re.split(r'^(?=### )', llm_analysis, flags=re.MULTILINE):
+        if not block.startswith('### '):
+            continue
+        heading, _, body = block.partition('\n')
+        title = re.sub(r'^###\s*(\d+\.\s*)?', '', heading).strip()
+        sections.append({"title": title, "markdown": body.strip()})
+    return sections
+
+
+def sections_from_topics(structured_topics):
+    """
+    Build the topic sections from structured topics (see ``topics.py``).
+
+    Returns:
+        List of ``{"title", "markdown"}`` dictionaries like ``split_sections``,
+        each also carrying the topic's ``whats_new``, ``why_it_matters``,
+        ``actions``, ``sources`` and ``links``
+    """
+    sections = []
+    for number, topic in enumerate(structured_topics, 1):
+        _, _, body = render_topic_markdown(topic, number).partition('\n')
+        section = {"title": topic["headline"], "markdown": body.strip()}
+        section.update({key: topic[key] for key in ("whats_new", "why_it_matters", "actions", "sources", "links")
+                        if key in topic})
+        sections.append(section)
+    return sections
+
+
+def model_notes(model_info):
+    """Return the explanatory notes shown under the model header (chunking, budget downgrades)."""
+    notes = []
+    chunking = model_info.get("chunking")
+    if chunking:
+        notes.append(
+            f"The newsletters (~{chunking['estimated_input_tokens']:,} tokens) exceeded the "
+            f"{chunking['context_window']:,}-token context window of {chunking['model']}, so they were "
+            f"analyzed in {chunking['chunks']} chunks of {', '.join(str(n) for n in chunking['newsletters_per_chunk'])} "
+            f"newsletters and the results merged."
+        )
+    budget = model_info.get("budget")
+    if budget and budget.get("action") == "downgraded_model":
+        notes.append(
+            f"The estimated cost on {budget['original_model']} (${budget['original_cost']:.4f}) exceeded the "
+            f"remaining budget, so the analysis ran on {budget['model']} instead."
+        )
+    elif budget and budget.get("action") == "trimmed_content":
+        notes.append(
+            f"The estimated cost (${budget['original_cost']:.4f}) exceeded the remaining budget, so the "
+            f"newsletter content was trimmed to ~{budget['content_tokens']:,} tokens."
+        )
+    return notes
+
+
+def build_report_model(newsletters, topics, llm_analysis, days, model_info=None, breaking_news_section=True,
+                       breaking_news_limit=DEFAULT_MAX_ITEMS, structured_topics=None):
+    """
+    Build the format-independent report model.
+
+    Send times come from the newsletters' UTC ``timestamp`` (see
+    ``timeline.py``). Resolves newsletter homepages through the website cache
+    (saving it if entries changed). Sections that are switched off are left out here, so
+    renderers never have to remove them.
+
+    Args:
+        newsletters: Newsletter dictionaries
+        topics: Extracted topic titles
+        llm_analysis: Analysis Markdown from the LLM
+        days: Days covered, used when no newsletter date parses
+        model_info: Optional dictionary with ``model``, ``timestamp`` and notes data
+        breaking_news_section: Include the "just in" section
+        breaking_news_limit: Maximum number of "just in" items (see ``breaking_news.py``; None for all)
+        structured_topics: Topic objects from structured output mode; when given,
+            the sections are built from them instead of parsing ``llm_analysis``
+
+    Returns:
+        The report model dictionary
+    """
+    timeline = Timeline(newsletters)
+    timeline.warn_unparsed(newsletters)
+    run_time = datetime.datetime.now()
+    if timeline.latest:
+        earliest_date, latest_date = timeline.earliest, timeline.latest
+        date_range = f"{earliest_date.strftime('%B %d')} to {latest_date.strftime('%B %d, %Y, %H:%M')} UTC (summary run at {run_time.strftime('%Y-%m-%d %H:%M')})"
     else:
-        earliest_date = datetime.datetime.now() - datetime.timedelta(days=days)
-        run_time = datetime.datetime.now()
-        date_range = f"## Week of {earliest_date.strftime('%B %d')} to {run_time.strftime('%B %d, %Y, %H:%M')} (summary run at {run_time.strftime('%Y-%m-%d %H:%M')})"
-        filename_date_range = f"{run_time.strftime('%Y%m%d_%H%M')}_from_{earliest_date.strftime('%Y%m%d')}"
-    
-    very_recent_newsletters = []
-    cutoff_date = latest_date - datetime.timedelta(days=1)
-    for i, nl, date_obj in newsletter_with_dates:
-        if date_obj >= cutoff_date:
-            very_recent_newsletters.append(nl)
-    breaking_news_section = ""
-    if very_recent_newsletters:
-        breaking_news_section = "\n## JUST IN: LATEST DEVELOPMENTS\n\n"
-        breaking_news_section += "These items are from the most recent newsletters (last 24 hours) and may represent emerging trends:\n\n"
-        breaking_news_indicators = ['breaking', 'just in', 'just announced', 'new release', 
-                                   'launches', 'launched', 'announces', 'announced', 
-                                   'releases', 'released', 'introduces', 'introduced',
-                                   'unveils', 'unveiled', 'debuts', 'just now']
-        for nl in very_recent_newsletters:
-            subject = nl['subject']
-            clean_subject = re.sub(r'^\[.*?\]', '', subject).strip()
-            clean_subject = re.sub(r'^.*?:', '', clean_subject).strip()
-            highlight = any(indicator in subject.lower() for indicator in breaking_news_indicators)
-            if highlight:
-                breaking_news_section += f"- 🔥 **{clean_subject}** (via {nl['sender'].split('<')[0].strip()})\n"
-            else:
-                breaking_news_section += f"- {clean_subject} (via {nl['sender'].split('<')[0].strip()})\n"
-    
-    # Format the model information with a stylized header
-    model_section = ""
-    if model_info:
-        model_name = model_info["model"]
-        
-        # Add model section to the report
-        model_section = f"## Generated with {model_name}\n\n"
-    
-    report = f"""\
-# DEFI NEWSLETTER SUMMARY
-{model_section}{date_range}
-
-## TOP AI DEVELOPMENTS
-
-{llm_analysis}
-"""
+        earliest_date, latest_date = run_time - datetime.timedelta(days=days), None
+        date_range = f"Week of {earliest_date.strftime('%B %d')} to {run_time.strftime('%B %d, %Y, %H:%M')} (summary run at {run_time.strftime('%Y-%m-%d %H:%M')})"
+    filename_date_range = f"{run_time.strftime('%Y%m%d_%H%M')}_from_{earliest_date.strftime('%Y%m%d')}"
+
+    breaking_news = []
     if breaking_news_section:
-        report += breaking_news_section
-    # Load or initialize website cache
-    website_cache_path = 'newsletter_websites.json'
-    if os.path.exists(website_cache_path):
-        with open(website_cache_path, 'r') as f:
-            website_cache = json.load(f)
-    else:
-        website_cache = {}
-    # Curated mapping for known newsletters (extend as needed)
-    curated_websites = {
-        'the neuron': 'https://www.theneurondaily.com',
-        'tldr ai': 'https://www.tldrnewsletter.com',
-        'tldr': 'https://www.tldrnewsletter.com',
-        'the rundown ai': 'https://www.therundown.ai',
-        'ai breakfast': 'https://aibreakfast.substack.com',
-        "ben's bites": 'https://www.bensbites.co',
-        'alpha signal': 'https://alphasignal.ai',
-        'unwind ai': 'https://unwindai.com',
-        'simon willison': 'https://simonwillison.net',
-        'peter yang': 'https://creatoreconomy.so',
-        # Add more as needed
+        breaking_news = detect_breaking_news(newsletters, timeline, max_items=breaking_news_limit)
+
+    resolver = get_resolver(DEFAULT_CACHE_PATH)
+    sources = []
+    for source, (count, first_nl) in index_senders(newsletters):
+        match = re.match(r'(.*?)\s*<(.+?)>', source)
+        if match:
+            name, email = match.groups()
+        else:
+            name = source
+            email = None
+        url = resolver.resolve(name, email, first_nl['body'])
+        sources.append({"name": name.strip(), "url": url, "issues": count})
+    # Writes only if an entry changed
+    resolver.save()
+
+    methodology = METHODOLOGY
+    generated_with = None
+    generated_at = None
+    notes = []
+    if model_info:
+        generated_with = model_info["model"]
+        notes = model_notes(model_info)
+        generated_at = datetime.datetime.fromisoformat(model_info["timestamp"])
+        methodology += f" Analysis performed using {generated_with} on {generated_at.strftime('%Y-%m-%d %H:%M:%S')}."
+
+    return {
+        "title": REPORT_TITLE,
+        "generated_with": generated_with,
+        "generated_at": generated_at.isoformat() if generated_at else None,
+        "notes": notes,
+        "date_range": date_range,
+        "period_start": earliest_date.isoformat(),
+        "period_end": latest_date.isoformat() if latest_date else None,
+        "run_at": run_time.isoformat(),
+        "filename_date_range": filename_date_range,
+        "analysis": llm_analysis,
+        "topics": list(topics),
+        "sections": sections_from_topics(structured_topics) if structured_topics else split_sections(llm_analysis),
+        "breaking_news": breaking_news,
+        "newsletter_count": len(newsletters),
+        "sources": sources,
+        "methodology": methodology,
     }
-    def normalize(text):
-        return re.sub(r'[^a-z0-9]', '', text.lower())
-    def domain_from_email(email):
-        domain = email.split('@')[-1]
-        domain = re.sub(r'^(mail|news|info|newsletter)\.', '', domain)
-        return domain
-    def plausible_homepage_from_body(body, newsletter_name=None):
-        urls = re.findall(r'https?://[\w\.-]+(?:/[\w\-\./?%&=]*)?', body)
-        # Filter out forms, tracking, deep paths, etc.
-        filtered = [u for u in urls if not any(x in u for x in ['form', 'track', 'unsubscribe', 'pixel', 'img', 'logo', 'pricing', 'cdn-cgi', 'utm_', 'jwt_token', 'viewform'])]
-        # Prefer root domains
-        for url in filtered:
-            parsed = urlparse(url)
-            if parsed.path in ('', '/', '/home'):
-                return url
-        # As fallback, return first filtered
-        if filtered:
-            return filtered[0]
-        return None
-    report += f"""\
-## NEWSLETTER SOURCES
-
-This week's insights were gathered from {len(newsletters)} newsletters across {len(newsletter_sources)} sources:
 
-"""
-    for source, count in newsletter_sources.most_common():
-        matching_nl = next((nl for nl in newsletters if nl['sender'] == source), None)
-        if matching_nl:
-            match = re.match(r'(.*?)\s*<(.+?)>', source)
-            if match:
-                name, email = match.groups()
-            else:
-                name = source
-                email = None
-            cache_key = name.strip().lower()
-            cache_entry = website_cache.get(cache_key)
-            website_url = None
-            verified = False
-            # 1. Curated mapping
-            norm_name = normalize(name)
-            curated_match = None
-            for k, v in curated_websites.items():
-                if normalize(k) in norm_name:
-                    curated_match = v
-                    break
-            if cache_entry and cache_entry.get('verified'):
-                website_url = cache_entry['url']
-                verified = True
-            elif curated_match:
-                website_url = curated_match
-                verified = True
-            # 2. Sender domain if it matches newsletter name
-            if not website_url and email:
-                domain = domain_from_email(email)
-                if any(part in domain for part in norm_name.split() if len(part) > 3):
-                    website_url = f"https://{domain}"
-                    verified = False
-            # 3. Fallback: plausible homepage from body
-            if not website_url:
-                website_url = plausible_homepage_from_body(matching_nl['body'], newsletter_name=name)
-                verified = False
-            # Update cache
-            if website_url:
-                # If from curated, always mark as verified
-                if curated_match and website_url == curated_match:
-                    website_cache[cache_key] = {"url": website_url, "verified": True}
-                else:
-                    website_cache[cache_key] = {"url": website_url, "verified": verified}
-            # Format: - [Newsletter Name](Website URL) - N issues
-            if website_url:
-                report += f"- [{name.strip()}]({website_url}) - {count} issues\n"
+
+def render_markdown(model, front_matter=False):
+    """
+    Render the report as Markdown.
+
+    Args:
+        model: Report model from ``build_report_model``
+        front_matter: Prepend Jekyll front matter (for the GitHub Pages site)
+    """
+    out = io.StringIO()
+    if front_matter:
+        run_at = datetime.datetime.fromisoformat(model["run_at"])
+        out.write(f"""---
+layout: default
+title: DeFi Newsletter Summary - {run_at.strftime('%B %d, %Y')}
+---
+
+""")
+    out.write(f"# {model['title']}\n")
+    if model["generated_with"]:
+        out.write(f"## Generated with {model['generated_with']}\n\n")
+        for note in model["notes"]:
+            out.write(f"*{note}*\n\n")
+    out.write(f"## {model['date_range']}\n\n## {ANALYSIS_HEADING}\n\n{model['analysis']}\n")
+    if model["breaking_news"]:
+        out.write(f"\n## {BREAKING_NEWS_HEADING}\n\n{BREAKING_NEWS_INTRO}\n\n")
+        for item in model["breaking_news"]:
+            if item["highlight"]:
+                out.write(f"- 🔥 **{item['subject']}** (via {item['sender']})\n")
             else:
-                report += f"- {name.strip()} - {count} issues\n"
-    # Save updated cache
-    with open(website_cache_path, 'w') as f:
-        json.dump(website_cache, f, indent=2)
-    
-    report += "\n## METHODOLOGY\n"
-    report += "This report was generated by analyzing AI newsletters "
-    report += "with a focus on practical implications for regular users rather than industry competition."
-    
-    # Add model information to methodology section
-    if model_info:
-        model_name = model_info["model"]
-        timestamp = datetime.datetime.fromisoformat(model_info["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
-        report += f" Analysis performed using {model_name} on {timestamp}."
-    
-    return report, filename_date_range
\ No newline at end of file
+                out.write(f"- {item['subject']} (via {item['sender']})\n")
+    out.write(f"""\
+## {SOURCES_HEADING}
+
+This week's insights were gathered from {model['newsletter_count']} newsletters across {len(model['sources'])} sources:
+
+""")
+    for source in model["sources"]:
+        # Format: - [Newsletter Name](Website URL) - N issues
+        if source["url"]:
+            out.write(f"- [{source['name']}]({source['url']}) - {source['issues']} issues\n")
+        else:
+            out.write(f"- {source['name']} - {source['issues']} issues\n")
+    out.write(f"\n## METHODOLOGY\n{model['methodology']}")
+    return out.getvalue()
+
+
+def markdown_to_html(text):
+    """Convert Markdown to HTML (escaped paragraphs if markdown-it-py is missing)."""
+    if MarkdownIt is not None:
+        return MarkdownIt("commonmark", {"html": False}).render(text)
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    return "".join(f"<p>{html.escape(p).replace(chr(10), '<br>')}</p>\n" for p in paragraphs)
+
+
+def render_html(model):
+    """Render the report as a self-contained HTML email."""
+    escape = html.escape
+    out = io.StringIO()
+    out.write(f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{escape(model['title'].title())}</title>
+</head>
+<body style="font-family: -apple-system, Helvetica, Arial, sans-serif; max-width: 680px; margin: 0 auto; line-height: 1.5;">
+<h1>{escape(model['title'])}</h1>
+""")
+    if model["generated_with"]:
+        out.write(f"<h2>Generated with {escape(model['generated_with'])}</h2>\n")
+        for note in model["notes"]:
+            out.write(f"<p><em>{escape(note)}</em></p>\n")
+    out.write(f"<h2>{escape(model['date_range'])}</h2>\n<h2>{ANALYSIS_HEADING}</h2>\n")
+    out.write(markdown_to_html(model["analysis"]))
+    if model["breaking_news"]:
+        out.write(f"<h2>{BREAKING_NEWS_HEADING}</h2>\n<p>{escape(BREAKING_NEWS_INTRO)}</p>\n<ul>\n")
+        for item in model["breaking_news"]:
+            subject = f"<strong>{escape(item['subject'])}</strong>" if item["highlight"] else escape(item['subject'])
+            out.write(f"<li>{'🔥 ' if item['highlight'] else ''}{subject} (via {escape(item['sender'])})</li>\n")
+        out.write("</ul>\n")
+    out.write(f"<h2>{SOURCES_HEADING}</h2>\n<p>This week's insights were gathered from "
+              f"{model['newsletter_count']} newsletters across {len(model['sources'])} sources:</p>\n<ul>\n")
+    for source in model["sources"]:
+        name = escape(source["name"])
+        if source["url"]:
+            name = f'<a href="{escape(source["url"], quote=True)}">{name}</a>'
+        out.write(f"<li>{name} - {source['issues']} issues</li>\n")
+    out.write(f"</ul>\n<h2>METHODOLOGY</h2>\n<p>{escape(model['methodology'])}</p>\n</body>\n</html>\n")
+    return out.getvalue()
+
+
+def render_json(model):
+    """Render the report model as JSON."""
+    return json.dumps(model, indent=2, ensure_ascii=False) + "\n"
+
+
+def render_rss(model, site_url=""):
+    """
+    Render the report as an RSS 2.0 feed with one item per topic.
+
+    Args:
+        model: Report model from ``build_report_model``
+        site_url: Link of the channel (e.g. the GitHub Pages site)
+    """
+    escape = html.escape
+    pub_date = format_datetime(datetime.datetime.fromisoformat(model["run_at"]).astimezone())
+    out = io.StringIO()
+    out.write(f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>{escape(model['title'].title())}</title>
+<link>{escape(site_url)}</link>
+<description>{escape(model['date_range'])}</description>
+<lastBuildDate>{pub_date}</lastBuildDate>
+""")
+    for i, section in enumerate(model["sections"], 1):
+        out.write(f"""<item>
+<title>{escape(section['title'])}</title>
+<description>{escape(markdown_to_html(section['markdown']))}</description>
+<guid isPermaLink="false">{escape(model['filename_date_range'])}-{i}</guid>
+<pubDate>{pub_date}</pubDate>
+</item>
+""")
+    out.write("</channel>\n</rss>\n")
+    return out.getvalue()
+
+
+RENDERERS = {
+    'md': render_markdown,
+    'html': render_html,
+    'json': render_json,
+    'rss': render_rss,
+}
+
+
+def parse_formats(value: str) -> List[str]:
+    """
+    Parse a comma-separated list of output formats.
+
+    Raises:
+        ValueError: If a format is unknown or none is given
+    """
+    formats = []
+    for fmt in (part.strip().lower() for part in value.split(',')):
+        if not fmt:
+            continue
+        if fmt not in RENDERERS:
+            raise ValueError(f"Unknown report format '{fmt}' (choose from {', '.join(RENDERERS)})")
+        if fmt not in formats:
+            formats.append(fmt)
+    if not formats:
+        raise ValueError("No report format given")
+    return formats
+
+
+def render_report(model, formats: Iterable[str] = ('md',), front_matter=False, site_url="") -> Dict[str, str]:
+    """
+    Render a report model in several formats.
+
+    Args:
+        model: Report model from ``build_report_model``
+        formats: Format names from ``RENDERERS``
+        front_matter: Add Jekyll front matter to the Markdown output
+        site_url: Channel link for the RSS output
+
+    Returns:
+        Dictionary mapping each format to its rendered text
+    """
+    rendered = {}
+    for fmt in formats:
+        if fmt == 'md':
+            rendered[fmt] = render_markdown(model, front_matter=front_matter)
+        elif fmt == 'rss':
+            rendered[fmt] = render_rss(model, site_url=site_url)
+        else:
+            rendered[fmt] = RENDERERS[fmt](model)
+    return rendered
+
+
+def generate_report(newsletters, topics, llm_analysis, days, model_info=None, breaking_news_section=True,
+                    breaking_news_limit=DEFAULT_MAX_ITEMS, structured_topics=None):
+    """Generate a final report with key insights."""
+    model = build_report_model(newsletters, topics, llm_analysis, days, model_info, breaking_news_section,
+                               breaking_news_limit, structured_topics)
+    return render_markdown(model), model["filename_date_range"]
@@ -1,42 +1,33 @@
-import json
 import os
 
-CACHE_PATH = 'newsletter_websites.json'
+from websites import DEFAULT_CACHE_PATH, WebsiteResolver
+
+CACHE_PATH = DEFAULT_CACHE_PATH
 
 def main():
     if not os.path.exists(CACHE_PATH):
         print('No cache file found.')
         return
-    with open(CACHE_PATH, 'r') as f:
-        cache = json.load(f)
-    changed = False
-    for name, entry in list(cache.items()):
+    resolver = WebsiteResolver(CACHE_PATH)
+    for name, entry in resolver.unverified():
         url = entry.get('url')
-        verified = entry.get('verified', False)
-        if verified:
-            continue
         print(f"\nNewsletter: {name}")
         print(f"  Cached website: {url}")
         action = input("[a]ccept, [e]dit, [d]elete, [s]kip? (a/e/d/s): ").strip().lower()
         if action == 'a':
-            cache[name]['verified'] = True
-            changed = True
+            resolver.set(name, url, verified=True)
         elif action == 'e':
             new_url = input("Enter correct website URL: ").strip()
-            cache[name]['url'] = new_url
-            cache[name]['verified'] = True
-            changed = True
+            resolver.set(name, new_url, verified=True)
         elif action == 'd':
-            del cache[name]
-            changed = True
+            resolver.delete(name)
         elif action == 's':
             continue
-    if changed:
-        with open(CACHE_PATH, 'w') as f:
-            json.dump(cache, f, indent=2)
+    # Only writes if an entry changed; concurrent report runs' entries are kept
+    if resolver.save():
         print("\nCache updated.")
     else:
         print("\nNo changes made.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
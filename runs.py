@@ -0,0 +1,245 @@
+"""
+Checkpointed runs that can be resumed after a failure.
+
+Every run of ``main.py`` gets a directory under ``NEWSLETTER_RUNS_DIR``
+(default ``runs``), named after the run id, with one artifact per completed
+stage:
+
+- ``fetch``: the fetched messages (``messages.json.gz``)
+- ``clean``: the cleaned corpus, Markdown instead of raw HTML (``corpus.json.gz``)
+- ``prompt``: the packed analysis prompt (``prompt.txt.gz``)
+- ``response``: the raw LLM analysis and call details (``response.json``)
+- ``report``: the rendered report files (``report.json``)
+
+``manifest.json`` records, for each artifact, the SHA-256 of its file and
+the inputs it was built from (the hash of the upstream artifact and the
+options that affect it). ``python main.py --resume RUN_ID`` reuses every
+artifact whose file still matches its hash and whose inputs match the
+current options, and rebuilds the rest: changing e.g. ``--num-topics``
+keeps the fetched and cleaned newsletters but builds a new prompt and
+analysis. Saving an artifact drops the records of the stages after it, since
+they were built from the old version.
+
+Creating a run prunes old ones: runs older than ``RETENTION_DAYS`` are
+removed, and of the completed runs (with a report) only the newest
+``MAX_COMPLETED_RUNS`` are kept. Incomplete recent runs stay resumable.
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional
+
+STAGES = ['fetch', 'clean', 'prompt', 'response', 'report']
+ARTIFACT_FILES = {
+    'fetch': 'messages.json.gz',
+    'clean': 'corpus.json.gz',
+    'prompt': 'prompt.txt.gz',
+    'response': 'response.json',
+    'report': 'report.json',
+}
+# Newsletter fields kept in the cleaned corpus (the raw body is replaced by ``content``)
+CORPUS_FIELDS = ['id', 'subject', 'sender', 'date', 'timestamp']
+# Analysis details kept with the LLM response (used for the report's model info and structured sections)
+RESPONSE_RUN_INFO = ['provider', 'model', 'routing', 'chunking', 'budget', 'topics']
+RETENTION_DAYS = 30
+MAX_COMPLETED_RUNS = 20
+
+
+def runs_dir() -> str:
+    """Return the directory holding run checkpoints."""
+    return os.environ.get("NEWSLETTER_RUNS_DIR", "runs")
+
+
+def content_hash(data: bytes) -> str:
+    """Return the SHA-256 hex digest of some bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def inputs_hash(inputs: Dict) -> str:
+    """Return a stable hash of a stage's inputs (JSON-serialisable options and upstream hashes)."""
+    return content_hash(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8'))
+
+
+def encode_artifact(stage: str, data: Any) -> bytes:
+    """Serialise a stage's data; compressed artifacts use a fixed gzip timestamp so equal data hashes equally."""
+    if stage == 'prompt':
+        return gzip.compress(data.encode('utf-8'), mtime=0)
+    raw = json.dumps(data, sort_keys=True).encode('utf-8')
+    if ARTIFACT_FILES[stage].endswith('.gz'):
+        return gzip.compress(raw, mtime=0)
+    return raw
+
+
+def decode_artifact(stage: str, raw: bytes) -> Any:
+    """Inverse of ``encode_artifact``."""
+    if ARTIFACT_FILES[stage].endswith('.gz'):
+        raw = gzip.decompress(raw)
+    if stage == 'prompt':
+        return raw.decode('utf-8')
+    return json.loads(raw)
+
+
+def corpus_from_newsletters(newsletters: List[Dict]) -> List[Dict]:
+    """Return the cleaned corpus of newsletters carrying cleaned ``content``."""
+    return [dict({field: nl.get(field) for field in CORPUS_FIELDS}, content=nl['content']) for nl in newsletters]
+
+
+def newsletters_from_corpus(corpus: List[Dict]) -> List[Dict]:
+    """Rebuild newsletters from a cleaned corpus; the cleaned Markdown stands in for the body."""
+    return [dict(entry, body=entry['content'], body_format='markdown') for entry in corpus]
+
+
+def response_artifact(analysis: str, topics: List[str], run_info: Dict) -> Dict:
+    """Return the response checkpoint of an analysis and the call details the report needs."""
+    return {
+        "analysis": analysis,
+        "topics": topics,
+        "run_info": {key: run_info.get(key) for key in RESPONSE_RUN_INFO},
+    }
+
+
+def prune_runs(root: Optional[str] = None, retention_days: int = RETENTION_DAYS,
+               max_completed: int = MAX_COMPLETED_RUNS) -> List[str]:
+    """
+    Remove runs older than the retention period and completed runs beyond the newest ``max_completed``.
+
+    Directories without a readable manifest are left alone.
+
+    Returns:
+        The ids of the removed runs
+    """
+    root = root or runs_dir()
+    if not os.path.isdir(root):
+        return []
+    manifests = []
+    for run_id in os.listdir(root):
+        try:
+            with open(os.path.join(root, run_id, "manifest.json"), 'r') as f:
+                manifests.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=retention_days)).isoformat()
+    completed = 0
+    removed = []
+    for manifest in sorted(manifests, key=lambda m: m.get("created_at", ""), reverse=True):
+        expired = manifest.get("created_at", "") < cutoff
+        if STAGES[-1] in manifest.get("stages", {}):
+            completed += 1
+            expired = expired or completed > max_completed
+        if expired:
+            shutil.rmtree(os.path.join(root, manifest["run_id"]), ignore_errors=True)
+            removed.append(manifest["run_id"])
+    return removed
+
+
+class RunCheckpoint:
+    """Stage artifacts and manifest of one run."""
+
+    def __init__(self, run_id: str, manifest: Dict, root: Optional[str] = None):
+        self.run_id = run_id
+        self.path = os.path.join(root or runs_dir(), run_id)
+        self.manifest = manifest
+
+    @classmethod
+    def create(cls, run_id: str, root: Optional[str] = None) -> "RunCheckpoint":
+        """Start the checkpoints of a new run, pruning old runs first (see ``prune_runs``)."""
+        prune_runs(root)
+        run = cls(run_id, {"run_id": run_id, "created_at": datetime.datetime.now().isoformat(), "stages": {}}, root)
+        os.makedirs(run.path, exist_ok=True)
+        run._write_manifest()
+        return run
+
+    @classmethod
+    def open(cls, run_id: str, root: Optional[str] = None) -> "RunCheckpoint":
+        """
+        Open the checkpoints of an earlier run.
+
+        Raises:
+            FileNotFoundError: If there is no run with this id
+        """
+        path = os.path.join(root or runs_dir(), run_id, "manifest.json")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No checkpoints for run {run_id} in {root or runs_dir()}")
+        with open(path, 'r') as f:
+            return cls(run_id, json.load(f), root)
+
+    def _write_manifest(self) -> None:
+        path = os.path.join(self.path, "manifest.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def artifact_path(self, stage: str) -> str:
+        """Return the path of a stage's artifact file."""
+        return os.path.join(self.path, ARTIFACT_FILES[stage])
+
+    def sha(self, stage: str) -> Optional[str]:
+        """Return the recorded hash of a stage's artifact, or None if the stage has not completed."""
+        entry = self.manifest["stages"].get(stage)
+        return entry["sha256"] if entry else None
+
+    def valid(self, stage: str, inputs: Dict) -> bool:
+        """
+        Check that a stage's artifact can be reused.
+
+        The artifact must exist, its file must still hash to the recorded
+        value, and it must have been built from the same inputs.
+        """
+        entry = self.manifest["stages"].get(stage)
+        if entry is None:
+            return False
+        if entry["inputs"] != inputs_hash(inputs):
+            print(f"Checkpoint for stage '{stage}' is stale (inputs changed); rebuilding it")
+            return False
+        try:
+            with open(self.artifact_path(stage), 'rb') as f:
+                digest = content_hash(f.read())
+        except OSError:
+            digest = None
+        if digest != entry["sha256"]:
+            print(f"Checkpoint for stage '{stage}' is missing or modified; rebuilding it")
+            return False
+        return True
+
+    def load(self, stage: str) -> Any:
+        """Return a stage's artifact data (check it with ``valid`` first)."""
+        with open(self.artifact_path(stage), 'rb') as f:
+            return decode_artifact(stage, f.read())
+
+    def save(self, stage: str, data: Any, inputs: Dict) -> str:
+        """
+        Write a stage's artifact atomically and record it as completed.
+
+        The records of later stages are dropped, so they are rebuilt from this one.
+
+        Returns:
+            The artifact's hash
+        """
+        raw = encode_artifact(stage, data)
+        path = self.artifact_path(stage)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+        digest = content_hash(raw)
+        stages = self.manifest["stages"]
+        for later in STAGES[STAGES.index(stage) + 1:]:
+            stages.pop(later, None)
+        stages[stage] = {
+            "file": ARTIFACT_FILES[stage],
+            "sha256": digest,
+            "inputs": inputs_hash(inputs),
+            "bytes": len(raw),
+            "completed_at": datetime.datetime.now().isoformat(),
+        }
+        self._write_manifest()
+        return digest
+
+    def completed(self) -> List[str]:
+        """Return the recorded stages in pipeline order."""
+        return [stage for stage in STAGES if stage in self.manifest["stages"]]
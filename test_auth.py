@@ -3,7 +3,8 @@ import json
 import os
 import tempfile
 from unittest.mock import patch, mock_open, MagicMock
-from auth import authenticate_gmail, SCOPES
+import threading
+from auth import authenticate_gmail, cached_gmail_service, reset_gmail_service, SCOPES
 
 
 class TestAuthenticateGmail:
@@ -248,6 +249,27 @@ class TestAuthenticateGmail:
                         mock_flow.run_local_server.assert_called_once_with(port=0)
 
 
+class TestCachedGmailService:
+    """Test the per-thread service cache used by the daemon."""
+    
+    def test_service_reused_per_thread(self):
+        """Test that each thread authenticates once and reset forces a new service."""
+        reset_gmail_service()
+        with patch('auth.authenticate_gmail', side_effect=lambda: MagicMock()) as mock_auth:
+            first = cached_gmail_service()
+            assert cached_gmail_service() is first
+            other = []
+            thread = threading.Thread(target=lambda: other.append(cached_gmail_service()))
+            thread.start()
+            thread.join()
+            assert other[0] is not first
+            reset_gmail_service()
+            assert cached_gmail_service() is not first
+        
+        assert mock_auth.call_count == 3
+        reset_gmail_service()
+
+
 class TestScopesConfiguration:
     """Test the scopes configuration."""
     
@@ -327,4 +349,27 @@ class TestIntegration:
                             # Verify helpful error messages
                             print_calls = [call[0][0] for call in mock_print.call_args_list]
                             assert any("Error refreshing credentials" in msg for msg in print_calls)
-                            assert any("Delete token.json and reauthenticate" in msg for msg in print_calls)
\ No newline at end of file
+                            assert any("Delete token.json and reauthenticate" in msg for msg in print_calls)
+
+class TestThreadServiceFactory:
+    """Test per-thread Gmail services built from one authenticated service."""
+
+    def test_threads_share_credentials_without_authenticating(self):
+        """Test that each built service has its own HTTP client but the same credentials and no auth."""
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build_from_document
+        from auth import thread_service_factory
+
+        document = {"rootUrl": "https://gmail.googleapis.com/", "servicePath": "", "name": "gmail",
+                    "version": "v1", "resources": {}}
+        credentials = Credentials(token='token')
+        service = build_from_document(document, credentials=credentials)
+
+        with patch('auth.authenticate_gmail') as mock_auth, patch('auth.build') as mock_build:
+            factory = thread_service_factory(service)
+            first, second = factory(), factory()
+
+        mock_auth.assert_not_called()
+        mock_build.assert_not_called()
+        assert first._http is not second._http
+        assert first._http.credentials is credentials and second._http.credentials is credentials
@@ -0,0 +1,248 @@
+import pytest
+import json
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from batch import (
+    AnthropicBatchAdapter,
+    BatchAdapter,
+    LocalFileAdapter,
+    OpenAIBatchAdapter,
+    COMPLETED,
+    FAILED,
+    PENDING,
+    collect_batch,
+    complete_run,
+    load_run_state,
+    parse_openai_results,
+    pending_runs,
+    submit_batch
+)
+
+
+@pytest.fixture
+def batch_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("NEWSLETTER_BATCH_DIR", str(tmp_path / 'batch_runs'))
+    monkeypatch.setenv("BATCH_ADAPTER", "local")
+    return tmp_path / 'batch_runs'
+
+
+class TestRequestFormats:
+    """Test provider batch JSONL request lines."""
+
+    def test_openai_request(self):
+        """Test the OpenAI /v1/chat/completions batch line."""
+        line = OpenAIBatchAdapter(client=MagicMock()).build_request("analysis", "Prompt", "gpt-4.1")
+
+        assert line["custom_id"] == "analysis"
+        assert line["url"] == "/v1/chat/completions"
+        assert line["body"]["model"] == "gpt-4.1"
+        assert line["body"]["messages"][-1] == {"role": "user", "content": "Prompt"}
+
+    def test_anthropic_request(self):
+        """Test the Anthropic message batch request."""
+        line = AnthropicBatchAdapter(client=MagicMock()).build_request("analysis", "Prompt", "claude-model")
+
+        assert line["params"]["model"] == "claude-model"
+        assert line["params"]["messages"] == [{"role": "user", "content": "Prompt"}]
+        assert "system" in line["params"]
+
+    def test_parse_openai_results_skips_errors(self):
+        """Test that failed lines are left out of the results."""
+        text = "\n".join([
+            json.dumps({"custom_id": "a", "response": {"body": {
+                "choices": [{"message": {"content": "Answer"}}], "usage": {"total_tokens": 5}}}}),
+            json.dumps({"custom_id": "b", "response": None, "error": {"message": "boom"}}),
+        ])
+
+        results = parse_openai_results(text)
+
+        assert results == {"a": {"content": "Answer", "usage": {"total_tokens": 5}}}
+
+
+class TestOpenAIBatchAdapter:
+    """Test the OpenAI adapter against a mocked client."""
+
+    def test_submit_status_and_results(self, tmp_path):
+        """Test file upload, batch creation and result download."""
+        client = MagicMock()
+        client.files.create.return_value = SimpleNamespace(id="file_1")
+        client.batches.create.return_value = SimpleNamespace(id="batch_1")
+        client.batches.retrieve.return_value = SimpleNamespace(status="completed", output_file_id="out_1")
+        client.files.content.return_value = SimpleNamespace(text=json.dumps({
+            "custom_id": "analysis",
+            "response": {"body": {"choices": [{"message": {"content": "Done"}}], "usage": {}}}
+        }))
+        requests_path = tmp_path / 'requests.jsonl'
+        requests_path.write_text("{}\n")
+        adapter = OpenAIBatchAdapter(client=client)
+
+        assert adapter.submit(str(requests_path)) == "batch_1"
+        assert client.batches.create.call_args[1]["input_file_id"] == "file_1"
+        assert adapter.status("batch_1") == COMPLETED
+        assert adapter.results("batch_1")["analysis"]["content"] == "Done"
+
+    def test_status_mapping(self):
+        """Test that provider statuses map to pending and failed."""
+        client = MagicMock()
+        adapter = OpenAIBatchAdapter(client=client)
+
+        client.batches.retrieve.return_value = SimpleNamespace(status="in_progress")
+        assert adapter.status("b") == PENDING
+        client.batches.retrieve.return_value = SimpleNamespace(status="expired")
+        assert adapter.status("b") == FAILED
+
+
+class TestBatchRun:
+    """Test the submit/collect cycle with the local file adapter."""
+
+    def test_submit_then_collect(self, batch_dir):
+        """Test that a run is pending until results exist and then completes."""
+        adapter = LocalFileAdapter()
+        state = submit_batch("Analyze this", "openai", "gpt-4.1", {"days": 7}, adapter=adapter)
+
+        assert pending_runs() == [state["run_id"]]
+        assert collect_batch(load_run_state(state["run_id"]), adapter=adapter) is None
+
+        adapter.fulfil(state["batch_id"], lambda body: "### 1. Topic\n" + body["messages"][-1]["content"])
+        result = collect_batch(load_run_state(state["run_id"]), adapter=adapter)
+
+        assert result["content"] == "### 1. Topic\nAnalyze this"
+        collected = load_run_state(state["run_id"])
+        assert collected["result"] == result and pending_runs() == [state["run_id"]]
+        complete_run(collected)
+        assert load_run_state(state["run_id"])["status"] == COMPLETED
+        assert pending_runs() == []
+
+    def test_failed_batch(self, batch_dir):
+        """Test that a failed batch is marked failed and reported."""
+        adapter = LocalFileAdapter()
+        state = submit_batch("Analyze this", "openai", "gpt-4.1", {}, adapter=adapter)
+        open(os.path.join(adapter.directory, state["batch_id"], "failed"), 'w').close()
+
+        with pytest.raises(Exception, match="failed"):
+            collect_batch(state, adapter=adapter)
+        assert load_run_state(state["run_id"])["status"] == FAILED
+
+    def test_main_batch_round_trip(self, batch_dir):
+        """Test that --batch submits and --collect finishes the report from saved state."""
+        import main
+
+        newsletters = [{
+            'id': 'm1', 'subject': 'Newsletter', 'sender': 'Sender <s@example.com>',
+            'date': 'Mon, 1 Jan 2024 10:00:00 +0000', 'body': 'Story text', 'body_format': 'plain'
+        }]
+        args = SimpleNamespace(
+            model=None, num_topics=3, llm_provider='claude', dedupe_stories=False, prerank=False,
+            prompt_budget=30000, incremental=False, min_tier=1, days=7, breaking_news_section=False,
+            formats=['md', 'rss'], publish=True, breaking_news_limit=5
+        )
+        main.submit_batch_run(newsletters, args)
+        run_id = pending_runs()[0]
+        state = load_run_state(run_id)
+        assert state["model"] == "claude-3-7-sonnet-20250219"
+        LocalFileAdapter().fulfil(state["batch_id"], lambda body: "### 1. Batched Topic\nText\n")
+
+        with patch('main.save_report') as mock_save:
+            with patch('main.log_cost_data') as mock_log:
+                main.collect_batch_runs()
+
+        saved_newsletters, topics, analysis, days, model_info, breaking = mock_save.call_args[0]
+        assert saved_newsletters == newsletters
+        assert topics == ["Batched Topic"]
+        assert days == 7 and breaking is False
+        assert mock_save.call_args[1]["formats"] == ['md', 'rss']
+        assert mock_save.call_args[1]["publish"] is True
+        assert mock_save.call_args[1]["breaking_news_limit"] == 5
+        assert model_info["provider"] == "claude"
+        assert mock_log.call_args[0][0]["batch"] is True
+        assert pending_runs() == []
+
+    def test_failed_report_keeps_the_result(self, batch_dir):
+        """Test that a run whose report fails stays collectable without polling or logging its cost again."""
+        import main
+
+        adapter = LocalFileAdapter()
+        context = {'newsletters': [], 'days': 7, 'breaking_news_section': False,
+                   'model_info': {'provider': 'openai', 'model': 'gpt-4.1'}}
+        state = submit_batch("Analyze this", "openai", "gpt-4.1", context, adapter=adapter)
+        adapter.fulfil(state["batch_id"], lambda body: "### 1. Topic\nText\n")
+
+        with patch('main.save_report', side_effect=OSError("disk full")), patch('main.log_cost_data') as mock_log:
+            main.collect_batch_runs()
+        assert pending_runs() == [state["run_id"]]
+        assert load_run_state(state["run_id"])["result"]["content"] == "### 1. Topic\nText\n"
+
+        with patch('main.save_report') as mock_save, patch('main.log_cost_data') as mock_log_again, \
+                patch.object(LocalFileAdapter, 'status', side_effect=AssertionError("polled again")):
+            main.collect_batch_runs()
+        mock_save.assert_called_once()
+        assert mock_log.call_count == 1 and mock_log_again.call_count == 0
+        assert load_run_state(state["run_id"])["status"] == COMPLETED
+
+    def test_main_batch_respects_budget(self, batch_dir):
+        """Test that a batch whose estimated cost exceeds the budget is not submitted."""
+        import main
+        from budget import Budget, BudgetExceeded
+
+        newsletters = [{
+            'id': 'm1', 'subject': 'Newsletter', 'sender': 'Sender <s@example.com>',
+            'date': 'Mon, 1 Jan 2024 10:00:00 +0000', 'body': 'Story text', 'body_format': 'plain'
+        }]
+        args = SimpleNamespace(
+            model=None, num_topics=3, llm_provider='claude', dedupe_stories=False, prerank=False,
+            prompt_budget=30000, incremental=False, min_tier=1, days=7, breaking_news_section=False,
+            formats=['md'], publish=False, breaking_news_limit=5
+        )
+
+        with pytest.raises(BudgetExceeded, match="Batch analysis"):
+            main.submit_batch_run(newsletters, args, budget=Budget(max_cost=0.0001))
+
+        assert pending_runs() == []
+        budget = Budget(max_cost=1.0)
+        main.submit_batch_run(newsletters, args, budget=budget)
+        assert len(pending_runs()) == 1
+        assert 0 < budget.committed < 0.02
+
+
+class TestBatchOptions:
+    """Test adapter selection and model options of batch runs."""
+
+    def test_adapter_is_abstract(self):
+        """Test that an adapter missing a method cannot be created."""
+        class Incomplete(BatchAdapter):
+            def build_request(self, custom_id, prompt, model):
+                return {}
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_collect_uses_the_submitting_adapter(self, batch_dir, monkeypatch):
+        """Test that a run is collected through the adapter it was submitted with, not BATCH_ADAPTER."""
+        state = submit_batch("Analyze this", "openai", "gpt-4.1", {})
+        LocalFileAdapter().fulfil(state["batch_id"], lambda body: "### 1. Topic\n")
+        monkeypatch.delenv("BATCH_ADAPTER")
+
+        with patch('batch.OpenAIBatchAdapter') as mock_openai:
+            result = collect_batch(load_run_state(state["run_id"]))
+
+        mock_openai.assert_not_called()
+        assert result["content"] == "### 1. Topic\n"
+
+    def test_model_option(self, batch_dir):
+        """Test that --model picks a direct batch model and an OpenRouter-only model is rejected."""
+        import main
+
+        newsletters = [{'id': 'm1', 'subject': 'Newsletter', 'sender': 'Sender <s@example.com>',
+                        'date': 'Mon, 1 Jan 2024 10:00:00 +0000', 'body': 'Story text', 'body_format': 'plain'}]
+        args = SimpleNamespace(
+            model='gpt-4.1-mini', num_topics=3, llm_provider='claude', dedupe_stories=False, prerank=False,
+            prompt_budget=30000, incremental=False, min_tier=1, days=7, breaking_news_section=False,
+            formats=['md'], publish=False, breaking_news_limit=5
+        )
+        main.submit_batch_run(newsletters, args)
+        state = load_run_state(pending_runs()[0])
+        assert (state["provider"], state["model"]) == ('openai', 'gpt-4.1-mini')
+
+        with pytest.raises(SystemExit):
+            main.main(['--batch', '--model', 'google/gemini-2.5-flash'])
@@ -0,0 +1,124 @@
+import pytest
+from breaking_news import (
+    BREAKING_NEWS_INDICATORS,
+    KeywordMatcher,
+    clean_subject,
+    detect_breaking_news,
+    lead_paragraph
+)
+from timeline import parse_timestamp
+
+
+@pytest.fixture(autouse=True)
+def fresh_parse_cache():
+    """Parse dates anew in every test."""
+    parse_timestamp.cache_clear()
+    yield
+
+
+def newsletter(subject, sender, hour, body='<p>Nothing special today.</p>', day=2):
+    return {
+        'subject': subject,
+        'sender': f"{sender} <news@{sender.lower().replace(' ', '')}.com>",
+        'date': f"Tue, {day:02d} Jan 2024 {hour:02d}:00:00 +0000",
+        'body': body,
+    }
+
+
+class TestKeywordMatcher:
+    """Test the Aho-Corasick indicator matcher."""
+
+    def test_matches_all_keywords_in_one_pass(self):
+        """Test that overlapping and multi-word keywords are all found."""
+        matcher = KeywordMatcher(['just in', 'just announced', 'announced', 'in'])
+
+        assert matcher.find("It was JUST ANNOUNCED, just in time") == ['just announced', 'announced', 'just in', 'in']
+
+    def test_failure_links(self):
+        """Test that a partial phrase falls back to a shorter match."""
+        matcher = KeywordMatcher(['new model release', 'model release'])
+
+        assert matcher.matches("a new model model release") == {'model release'}
+
+    def test_whole_words_only(self):
+        """Test that keywords inside longer words do not match."""
+        matcher = KeywordMatcher(BREAKING_NEWS_INDICATORS)
+
+        assert matcher.matches("Company relaunches app to adjust insights") == set()
+        assert matcher.matches("OpenAI launches GPT") == {'launches'}
+
+    def test_same_result_as_substring_scan_on_words(self):
+        """Test agreement with a naive per-keyword scan on word-separated text."""
+        matcher = KeywordMatcher(BREAKING_NEWS_INDICATORS)
+        text = "breaking: the team just now unveiled a new release and announces debuts"
+
+        expected = {k for k in BREAKING_NEWS_INDICATORS if f" {k} " in f" {text.replace(':', '')} "}
+        assert matcher.matches(text) == expected
+
+
+class TestHelpers:
+    """Test subject cleaning and lead extraction."""
+
+    def test_clean_subject(self):
+        """Test that tags and newsletter prefixes are removed."""
+        assert clean_subject('[AI Weekly] Newsletter: Big News') == 'Big News'
+
+    def test_lead_paragraph(self):
+        """Test that the first non-empty paragraph is returned without markup."""
+        body = '<style>p {}</style><p> </p><p>OpenAI <b>announced</b> a model.</p><p>More</p>'
+
+        assert lead_paragraph(body) == 'OpenAI announced a model.'
+        assert lead_paragraph('First para\n\nSecond') == 'First para'
+        assert len(lead_paragraph('word ' * 500, max_chars=50)) == 50
+
+
+class TestDetectBreakingNews:
+    """Test selecting, merging and ranking breaking news."""
+
+    def test_only_recent_window(self):
+        """Test that newsletters older than the window are left out."""
+        newsletters = [newsletter('Old story', 'A', 10, day=1), newsletter('Fresh story', 'B', 12, day=2)]
+
+        items = detect_breaking_news(newsletters, window_hours=24)
+
+        assert [item['subject'] for item in items] == ['Fresh story']
+
+    def test_near_identical_subjects_merged(self):
+        """Test that the same story from several sources becomes one corroborated item."""
+        newsletters = [
+            newsletter('AI Daily: OpenAI launches new reasoning model today', 'AI Daily', 8),
+            newsletter('OpenAI launches new reasoning model today!', 'Tech Brief', 9),
+            newsletter('[Weekly] OpenAI launches a new reasoning model today', 'Weekly', 10),
+            newsletter('Unrelated update on chips', 'Chip News', 11),
+        ]
+
+        items = detect_breaking_news(newsletters)
+
+        assert len(items) == 2
+        assert items[0]['sources'] == ['AI Daily', 'Tech Brief', 'Weekly']
+        assert items[0]['sender'] == 'AI Daily, Tech Brief, Weekly'
+        assert items[0]['highlight'] and items[0]['indicators'] == ['launches']
+        assert items[1]['subject'] == 'Unrelated update on chips'
+
+    def test_lead_paragraph_indicators(self):
+        """Test that an indicator in the lead paragraph highlights the item."""
+        newsletters = [newsletter('Weekly roundup', 'A', 9, body='<p>Google just announced Gemini 3.</p>')]
+
+        item, = detect_breaking_news(newsletters)
+
+        assert item['highlight'] and item['indicators'] == ['just announced', 'announced']
+
+    def test_ranked_by_recency_and_capped(self):
+        """Test that single-source items rank newest first and the cap applies."""
+        newsletters = [newsletter(f"Story number {word}", f"Source {i}", i)
+                       for i, word in enumerate(['alpha', 'beta', 'gamma', 'delta', 'epsilon'])]
+
+        items = detect_breaking_news(newsletters, max_items=3)
+
+        assert [item['subject'] for item in items] == ['Story number epsilon', 'Story number delta',
+                                                       'Story number gamma']
+
+    def test_no_dates(self):
+        """Test that undated newsletters produce no items."""
+        assert detect_breaking_news([{'subject': 'x', 'sender': 'y', 'date': 'bad', 'body': ''}]) == []
+        assert detect_breaking_news([]) == []
@@ -0,0 +1,150 @@
+import pytest
+import datetime
+import json
+from budget import (
+    ABORT,
+    Budget,
+    BudgetExceeded,
+    estimate_call,
+    plan_within_budget,
+    spent_since
+)
+
+
+TEST_TABLE = {
+    "cheap/small": {"context_window": 16000, "input_price": 0.05, "output_price": 0.10, "tier": 1},
+    "mid/large": {"context_window": 1000000, "input_price": 0.40, "output_price": 1.60, "tier": 2},
+    "mid/expensive": {"context_window": 1000000, "input_price": 1.00, "output_price": 4.00, "tier": 2},
+    "premium/model": {"context_window": 200000, "input_price": 3.00, "output_price": 15.00, "tier": 3},
+}
+
+# 10,000 estimated input tokens; with 10 topics, 3,000 reserved output tokens
+PROMPT = "x" * 40000
+
+
+@pytest.fixture
+def cost_log(tmp_path, monkeypatch):
+    """Point the cost log at a temporary file."""
+    path = str(tmp_path / 'costs.jsonl')
+    monkeypatch.setenv("OPENROUTER_COST_LOG", path)
+    return path
+
+
+class TestEstimateCall:
+    """Test pre-call cost estimation."""
+
+    def test_estimate_known_model(self):
+        """Test that input and reserved output tokens are priced from the table."""
+        estimate = estimate_call(PROMPT, "premium/model", num_topics=10, table=TEST_TABLE)
+
+        assert estimate["input_tokens"] == 10000
+        assert estimate["output_tokens"] == 3000
+        assert estimate["cost"] == pytest.approx(0.075)
+        assert estimate["priced"]
+
+    def test_estimate_unknown_model_uses_highest_prices(self):
+        """Test that an unknown model is priced at the most expensive rates."""
+        estimate = estimate_call(PROMPT, "unknown/model", num_topics=10, table=TEST_TABLE)
+
+        assert not estimate["priced"]
+        assert estimate["cost"] == pytest.approx(0.075)
+
+
+class TestBudget:
+    """Test limits, prior spend and reservations."""
+
+    def test_disabled_without_limits(self):
+        """Test that a budget without limits never restricts calls."""
+        budget = Budget()
+
+        assert not budget.enabled
+        assert budget.remaining() is None
+        budget.reserve({"model": "premium/model", "cost": 100.0})
+
+    def test_remaining_uses_tightest_limit(self):
+        """Test that the smallest headroom across limits applies."""
+        budget = Budget(max_cost=1.0, daily_limit=5.0, spent_day=4.5)
+
+        assert budget.remaining() == pytest.approx(0.5)
+
+    def test_reserve_accumulates_and_raises(self):
+        """Test that reservations add up until a call no longer fits."""
+        budget = Budget(max_cost=0.10)
+        budget.reserve({"model": "m", "cost": 0.06})
+
+        with pytest.raises(BudgetExceeded):
+            budget.reserve({"model": "m", "cost": 0.06})
+        assert budget.committed == pytest.approx(0.06)
+
+    def test_prior_spend_read_from_cost_log(self, cost_log):
+        """Test that daily and monthly spend come from the cost log windows."""
+        now = datetime.datetime.now()
+        entries = [
+            {"timestamp": (now - datetime.timedelta(days=40)).isoformat(), "cost": 5.0},
+            {"timestamp": (now - datetime.timedelta(days=10)).isoformat(), "cost": 2.0},
+            {"timestamp": (now - datetime.timedelta(hours=2)).isoformat(), "cost": 0.5},
+        ]
+        with open(cost_log, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+        budget = Budget(daily_limit=1.0, monthly_limit=10.0)
+
+        assert budget.spent_day == pytest.approx(0.5)
+        assert budget.spent_month == pytest.approx(2.5)
+        assert spent_since(now - datetime.timedelta(days=100)) == pytest.approx(7.5)
+        assert budget.remaining() == pytest.approx(0.5)
+
+
+class TestPlanWithinBudget:
+    """Test downgrading an analysis to fit the budget."""
+
+    def test_within_budget_keeps_plan(self):
+        """Test that an affordable analysis is left unchanged."""
+        plan = plan_within_budget(Budget(max_cost=1.0), PROMPT, "premium/model", table=TEST_TABLE)
+
+        assert plan["action"] == "within_budget"
+        assert plan["model"] == "premium/model"
+        assert plan["prompt"] == PROMPT
+
+    def test_downgrades_to_best_affordable_model(self):
+        """Test that the highest affordable tier wins, then the cheapest model."""
+        plan = plan_within_budget(Budget(max_cost=0.01), PROMPT, "premium/model", table=TEST_TABLE)
+
+        assert plan["action"] == "downgraded_model"
+        assert plan["model"] == "mid/large"
+        assert plan["original_cost"] == pytest.approx(0.075)
+        assert plan["estimate"]["cost"] == pytest.approx(0.0088)
+
+    def test_downgrade_respects_min_tier(self):
+        """Test that no model below the minimum tier is chosen."""
+        with pytest.raises(BudgetExceeded):
+            plan_within_budget(Budget(max_cost=0.005), PROMPT, "premium/model", min_tier=2, table=TEST_TABLE)
+
+    def test_trims_content_when_model_is_fixed(self):
+        """Test that the prompt is rebuilt with an affordable content budget."""
+        requested = []
+
+        def rebuild(content_tokens):
+            requested.append(content_tokens)
+            return "x" * (content_tokens * 4)
+
+        plan = plan_within_budget(Budget(max_cost=0.07), PROMPT, "premium/model", rebuild_prompt=rebuild,
+                                  can_switch_model=False, table=TEST_TABLE)
+
+        assert plan["action"] == "trimmed_content"
+        assert plan["model"] == "premium/model"
+        assert len(requested) == 1
+        assert plan["content_tokens"] == requested[0]
+        assert plan["estimate"]["cost"] <= 0.07
+
+    def test_abort_action_raises(self):
+        """Test that the abort action never downgrades."""
+        with pytest.raises(BudgetExceeded):
+            plan_within_budget(Budget(max_cost=0.01, action=ABORT), PROMPT, "premium/model", table=TEST_TABLE)
+
+    def test_raises_when_nothing_fits(self):
+        """Test that an unaffordable analysis raises after all downgrades."""
+        with pytest.raises(BudgetExceeded):
+            plan_within_budget(Budget(max_cost=0.0001), PROMPT, "premium/model",
+                               rebuild_prompt=lambda tokens: PROMPT, table=TEST_TABLE)
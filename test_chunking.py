@@ -0,0 +1,79 @@
+import pytest
+from chunking import (
+    build_merge_prompt,
+    check_context,
+    partition_balanced,
+    plan_chunks
+)
+
+
+TABLE = {"small/model": {"context_window": 10000, "input_price": 0.1, "output_price": 0.1, "tier": 1}}
+
+
+class TestCheckContext:
+    """Test the pre-flight context check."""
+
+    def test_fits(self):
+        """Test that a small prompt fits with output tokens reserved."""
+        guard = check_context("x" * 4000, "small/model", num_topics=5, table=TABLE)
+
+        assert guard["fits"]
+        assert guard["estimated_input_tokens"] == 1000
+        assert guard["max_input_tokens"] == 9000 - 1500
+
+    def test_too_large(self):
+        """Test that a prompt beyond the usable window is flagged."""
+        guard = check_context("x" * 40000, "small/model", num_topics=5, table=TABLE)
+
+        assert not guard["fits"]
+
+    def test_unknown_and_direct_models(self):
+        """Test context windows for direct API models and unknown models."""
+        assert check_context("", "claude-3-7-sonnet-20250219", table=TABLE)["context_window"] == 200000
+        assert check_context("", "unknown/model", table=TABLE)["context_window"] == 128000
+
+
+class TestPartition:
+    """Test balanced splitting along newsletter boundaries."""
+
+    def test_partition_is_balanced(self):
+        """Test that group totals are close to each other."""
+        sizes = [900, 100, 500, 500, 400, 600, 300, 700]
+
+        groups = partition_balanced(sizes, 2)
+        totals = [sum(sizes[i] for i in group) for group in groups]
+
+        assert sorted(i for group in groups for i in group) == list(range(len(sizes)))
+        assert max(totals) - min(totals) <= 200
+        assert all(group == sorted(group) for group in groups)
+
+    def test_plan_uses_fewest_fitting_chunks(self):
+        """Test that the chunk count grows only as far as needed."""
+        sizes = [300] * 10
+
+        groups = plan_chunks(sizes, overhead_tokens=200, max_input_tokens=1200)
+
+        assert len(groups) == 4
+        assert all(sum(sizes[i] for i in group) <= 1000 for group in groups)
+
+    def test_plan_single_chunk_when_it_fits(self):
+        """Test that no split happens when everything fits."""
+        assert plan_chunks([10, 20], overhead_tokens=5, max_input_tokens=100) == [[0, 1]]
+
+    def test_oversized_newsletter(self):
+        """Test that a newsletter larger than the budget is an error."""
+        with pytest.raises(ValueError, match="single newsletter"):
+            plan_chunks([50, 5000], overhead_tokens=100, max_input_tokens=1000)
+
+
+class TestMergePrompt:
+    """Test the merge pass prompt."""
+
+    def test_merge_prompt_lists_partials(self):
+        """Test that every partial analysis and the output format are included."""
+        prompt = build_merge_prompt(["### 1. A\n", "### 1. B\n"], 5, "FORMAT HERE")
+
+        assert "PARTIAL ANALYSIS #1\n### 1. A" in prompt
+        assert "PARTIAL ANALYSIS #2\n### 1. B" in prompt
+        assert "5 most significant" in prompt
+        assert "FORMAT HERE" in prompt
@@ -0,0 +1,165 @@
+import pytest
+import json
+import os
+import tempfile
+from circuit_breaker import (
+    CircuitBreaker,
+    HealthStore,
+    CLOSED,
+    OPEN,
+    HALF_OPEN,
+    BASE_COOLDOWN,
+    FAILURE_THRESHOLD,
+    SLOW_CALL_SECONDS
+)
+
+
+@pytest.fixture
+def state_path():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield os.path.join(tmpdir, 'llm_health.json')
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions."""
+
+    def test_opens_after_consecutive_failures(self):
+        """Test that repeated failures open the breaker and block calls."""
+        breaker = CircuitBreaker('openrouter:m')
+        for _ in range(FAILURE_THRESHOLD - 1):
+            breaker.record_failure("timeout", now=1000.0)
+        assert breaker.state == CLOSED
+        assert breaker.allow_request(now=1000.0)
+
+        breaker.record_failure("timeout", now=1000.0)
+
+        assert breaker.state == OPEN
+        assert not breaker.allow_request(now=1001.0)
+
+    def test_success_resets_consecutive_failures(self):
+        """Test that a success in between keeps the breaker closed."""
+        breaker = CircuitBreaker('openrouter:m')
+        breaker.record_failure("error", now=0.0)
+        breaker.record_failure("error", now=0.0)
+        breaker.record_success(1.0)
+        breaker.record_failure("error", now=0.0)
+
+        assert breaker.state == CLOSED
+
+    def test_opens_on_high_error_rate(self):
+        """Test that an error rate above the threshold opens the breaker."""
+        breaker = CircuitBreaker('openrouter:m')
+        for _ in range(5):
+            breaker.record_success(1.0)
+            breaker.record_failure("error", now=0.0)
+
+        assert breaker.state == OPEN
+
+    def test_slow_calls_are_counted_separately(self):
+        """Test that slow successes are counted as slow without opening the breaker."""
+        breaker = CircuitBreaker('openrouter:m')
+        for _ in range(FAILURE_THRESHOLD):
+            breaker.record_success(SLOW_CALL_SECONDS + 1)
+        breaker.record_success(1.0)
+
+        assert breaker.state == CLOSED
+        assert breaker.error_rate == 0.0
+        assert breaker.slow_calls == FAILURE_THRESHOLD
+        assert breaker.slow_calls == CircuitBreaker('openrouter:m', breaker.to_dict()).slow_calls
+
+    def test_half_open_allows_single_probe(self):
+        """Test that one probe is allowed after the cooldown and success closes the breaker."""
+        breaker = CircuitBreaker('openrouter:m')
+        breaker.trip(now=1000.0)
+
+        assert not breaker.allow_request(now=1000.0 + BASE_COOLDOWN - 1)
+        assert breaker.allow_request(now=1000.0 + BASE_COOLDOWN)
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow_request(now=1000.0 + BASE_COOLDOWN + 1)
+
+        breaker.record_success(2.0)
+
+        assert breaker.state == CLOSED
+        assert breaker.allow_request(now=1000.0 + BASE_COOLDOWN + 2)
+
+    def test_failed_probe_backs_off(self):
+        """Test that a failed probe reopens the breaker with a longer cooldown."""
+        breaker = CircuitBreaker('openrouter:m')
+        breaker.trip(now=0.0)
+        assert breaker.allow_request(now=BASE_COOLDOWN)
+
+        breaker.record_failure("still down", now=BASE_COOLDOWN)
+
+        assert breaker.state == OPEN
+        assert breaker.next_probe_at == BASE_COOLDOWN + 2 * BASE_COOLDOWN
+
+
+class TestHealthStore:
+    """Test persisted health state."""
+
+    def test_state_survives_reload(self, state_path):
+        """Test that an open circuit is still open in the next run."""
+        store = HealthStore(state_path)
+        for _ in range(FAILURE_THRESHOLD):
+            store.record_failure('openrouter:m', "503 Service Unavailable")
+
+        reloaded = HealthStore(state_path)
+
+        assert reloaded.breaker('openrouter:m').state == OPEN
+        assert reloaded.breaker('openrouter:m').last_error == "503 Service Unavailable"
+        assert not reloaded.allow('openrouter:m')
+        assert reloaded.allow('openai:other')
+
+    def test_half_open_transition_is_persisted(self, state_path):
+        """Test that a probe in progress is visible to a concurrent run."""
+        store = HealthStore(state_path)
+        store.breaker('openrouter:m').trip(now=0.0)
+
+        assert store.allow('openrouter:m')
+
+        with open(state_path) as f:
+            assert json.load(f)['openrouter:m']['state'] == HALF_OPEN
+        assert not HealthStore(state_path).allow('openrouter:m')
+
+    def test_corrupted_file_starts_fresh(self, state_path):
+        """Test that an unreadable state file does not block calls."""
+        with open(state_path, 'w') as f:
+            f.write("{not json")
+
+        store = HealthStore(state_path)
+
+        assert store.allow('openrouter:m')
+
+    def test_path_from_environment(self, state_path, monkeypatch):
+        """Test that the state file location can be set in the environment."""
+        monkeypatch.setenv("LLM_HEALTH_STATE", state_path)
+        HealthStore().record_success('openrouter:m', 1.0)
+
+        assert os.path.exists(state_path)
+
+    def test_concurrent_stores_keep_each_others_updates(self, state_path):
+        """Test that a save merges into the file instead of overwriting another run's breakers."""
+        first = HealthStore(state_path)
+        second = HealthStore(state_path)
+        for _ in range(FAILURE_THRESHOLD):
+            first.record_failure('openrouter:a', "timeout")
+
+        second.record_success('openrouter:b', 1.0)
+
+        with open(state_path) as f:
+            data = json.load(f)
+        assert data['openrouter:a']['state'] == OPEN
+        assert data['openrouter:b']['outcomes'] == [1]
+        assert second.breaker('openrouter:a').state == OPEN
+
+    def test_parallel_saves_use_their_own_temp_files(self, state_path):
+        """Test that saves from many threads all land and leave no temporary files behind."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        stores = [HealthStore(state_path) for _ in range(8)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: stores[i].record_success(f'openrouter:{i}', 1.0), range(8)))
+
+        with open(state_path) as f:
+            assert sorted(json.load(f)) == sorted(f'openrouter:{i}' for i in range(8))
+        assert [name for name in os.listdir(os.path.dirname(state_path)) if name.endswith('.tmp')] == []
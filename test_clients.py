@@ -0,0 +1,84 @@
+import pytest
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+import clients
+from clients import (
+    anthropic_client,
+    close_clients,
+    http_session,
+    openai_client
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    """Start and end every test with no shared clients."""
+    close_clients()
+    yield
+    close_clients()
+
+
+class TestClientRegistry:
+    """Test the shared sync client registry."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "test_key"})
+    def test_client_is_built_once_and_shared(self):
+        """Test that the client is created lazily and reused by every caller."""
+        with patch('clients.openai.OpenAI') as mock_openai:
+            assert mock_openai.call_count == 0
+
+            first = openai_client()
+            second = openai_client()
+
+        assert first is second
+        mock_openai.assert_called_once()
+        kwargs = mock_openai.call_args[1]
+        assert kwargs['api_key'] == "test_key"
+        assert kwargs['timeout'].read == clients.READ_TIMEOUT
+        assert kwargs['timeout'].connect == clients.CONNECT_TIMEOUT
+        assert kwargs['max_retries'] == clients.MAX_RETRIES
+        kwargs['http_client'].close()
+
+    def test_concurrent_first_use_builds_one_client(self):
+        """Test that threads racing on first use still share a single client."""
+        with patch('clients.anthropic.Anthropic') as mock_anthropic:
+            mock_anthropic.side_effect = lambda **kwargs: MagicMock()
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda _: anthropic_client(), range(16)))
+
+        assert len({id(client) for client in results}) == 1
+        mock_anthropic.assert_called_once()
+
+    def test_close_clients(self):
+        """Test that closing releases the clients and the next call builds a new one."""
+        with patch('clients.openai.OpenAI') as mock_openai:
+            mock_openai.side_effect = lambda **kwargs: MagicMock()
+            first = openai_client()
+            close_clients()
+            second = openai_client()
+
+        first.close.assert_called_once()
+        assert second is not first
+
+    def test_close_errors_are_not_raised(self, capsys):
+        """Test that a failing close only prints a warning."""
+        with patch('clients.anthropic.Anthropic') as mock_anthropic:
+            mock_anthropic.return_value.close.side_effect = Exception("already closed")
+            anthropic_client()
+            close_clients()
+
+        assert "could not close API client" in capsys.readouterr().out
+
+
+class TestHttpSession:
+    """Test the shared requests session."""
+
+    def test_session_is_shared_and_pooled(self):
+        """Test that every caller gets the same pooled session until the registry is closed."""
+        first = http_session()
+
+        assert http_session() is first
+        assert first.get_adapter("https://openrouter.ai")._pool_maxsize == clients.MAX_CONNECTIONS
+        close_clients()
+        assert http_session() is not first
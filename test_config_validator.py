@@ -8,6 +8,7 @@ from config_validator import (
     validate_newsletter_websites_json,
     validate_environment_variables,
     validate_credentials_files,
+    validate_cost_log,
     validate_all_configuration,
     print_validation_report,
     ConfigValidationError
@@ -281,6 +282,31 @@ class TestValidateEnvironmentVariables:
         assert "NEWSLETTER_SUMMARY_OUTPUT_DIR does not exist" in errors[0]
 
 
+class TestValidateCostLog:
+    """Test cost log validation."""
+    
+    def test_validate_cost_log_valid(self, tmp_path):
+        """Test that JSON Lines, legacy array and missing logs are valid."""
+        jsonl = tmp_path / 'costs.jsonl'
+        jsonl.write_text('{"cost": 0.1}\n\n{"cost": 0.2}\n')
+        legacy = tmp_path / 'costs.json'
+        legacy.write_text('[\n  {"cost": 0.1}\n]')
+        
+        assert validate_cost_log(str(jsonl)) == (True, [])
+        assert validate_cost_log(str(legacy)) == (True, [])
+        assert validate_cost_log(str(tmp_path / 'missing.jsonl')) == (True, [])
+    
+    def test_validate_cost_log_malformed_lines(self, tmp_path):
+        """Test that malformed lines are reported with their line numbers."""
+        path = tmp_path / 'costs.jsonl'
+        path.write_text('{"cost": 0.1}\nnot json\n[1, 2]\n{"cost": 0.2}\n')
+        
+        is_valid, errors = validate_cost_log(str(path))
+        
+        assert is_valid == False
+        assert "2 malformed line(s): 2, 3" in errors[0]
+
+
 class TestValidateCredentialsFiles:
     """Test credentials files validation."""
     
@@ -0,0 +1,112 @@
+import pytest
+import json
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from cost_log import (
+    DEFAULT_LOG,
+    LEGACY_LOG,
+    append_entry,
+    iter_entries,
+    log_files,
+    migrate_legacy_log,
+    set_run_context
+)
+
+
+def _append_many(path, worker, count):
+    for i in range(count):
+        append_entry({"worker": worker, "i": i, "pad": "x" * 200}, path=path)
+
+
+class TestAppendEntry:
+    """Test appending to the JSON Lines cost log."""
+
+    def test_concurrent_threads_and_processes(self, tmp_path):
+        """Test that concurrent writers neither lose nor interleave entries."""
+        path = str(tmp_path / 'costs.jsonl')
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_append_many, args=(path, f"p{n}", 50)) for n in range(3)]
+        for process in processes:
+            process.start()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda n: _append_many(path, f"t{n}", 50), range(4)))
+        for process in processes:
+            process.join()
+
+        with open(path, 'r') as f:
+            entries = [json.loads(line) for line in f]
+
+        assert len(entries) == 350
+        assert len({(e['worker'], e['i']) for e in entries}) == 350
+
+    def test_run_context(self, tmp_path):
+        """Test that run id and label are added to every entry unless the entry sets them."""
+        path = str(tmp_path / 'costs.jsonl')
+        set_run_context(run_id="run1", label="AI")
+        try:
+            append_entry({"cost": 0.1}, path=path)
+            append_entry({"cost": 0.2, "run_id": "batch1"}, path=path)
+        finally:
+            set_run_context(run_id=None, label=None)
+        append_entry({"cost": 0.3}, path=path)
+
+        entries = list(iter_entries(path))
+
+        assert entries[0] == {"run_id": "run1", "label": "AI", "cost": 0.1}
+        assert entries[1]["run_id"] == "batch1"
+        assert entries[2] == {"cost": 0.3}
+
+    def test_rotation(self, tmp_path):
+        """Test that the log rotates by size and keeps a bounded number of backups."""
+        path = str(tmp_path / 'costs.jsonl')
+        for i in range(50):
+            append_entry({"i": i, "pad": "x" * 80}, path=path, max_bytes=500, backup_count=3)
+
+        assert os.path.getsize(path) <= 500
+        assert os.path.exists(f"{path}.3")
+        assert not os.path.exists(f"{path}.4")
+        streamed = [entry["i"] for entry in iter_entries(path)]
+        assert streamed == sorted(streamed)
+        assert streamed[-1] == 49
+        assert [entry["i"] for entry in iter_entries(path, include_rotated=False)][-1] == 49
+
+
+class TestMigration:
+    """Test conversion of the old JSON-array log."""
+
+    def test_default_legacy_file_is_imported(self, tmp_path, monkeypatch):
+        """Test that openrouter_costs.json is imported into the default JSON Lines log."""
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.delenv("OPENROUTER_COST_LOG", raising=False)
+        with open(LEGACY_LOG, 'w') as f:
+            json.dump([{"cost": 0.1}, {"cost": 0.2}], f, indent=2)
+
+        assert log_files() == [LEGACY_LOG]
+        assert [e["cost"] for e in iter_entries()] == [0.1, 0.2]
+
+        append_entry({"cost": 0.3})
+
+        assert [e["cost"] for e in iter_entries()] == [0.1, 0.2, 0.3]
+        assert log_files() == [DEFAULT_LOG]
+        assert os.path.exists(f"{LEGACY_LOG}.migrated")
+
+    def test_corrupt_legacy_file_is_moved_aside(self, tmp_path):
+        """Test that an unparseable array log is kept for inspection, not appended to."""
+        path = str(tmp_path / 'costs.json')
+        with open(path, 'w') as f:
+            f.write('[{"cost": 0.1}, {"co')
+
+        assert migrate_legacy_log(path) == 0
+
+        assert not os.path.exists(path)
+        assert os.path.exists(f"{path}.corrupt")
+
+    def test_jsonl_log_is_left_alone(self, tmp_path):
+        """Test that an existing JSON Lines log is not migrated again."""
+        path = str(tmp_path / 'costs.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"cost": 0.1}\n')
+
+        assert migrate_legacy_log(path) == 0
+        assert [e["cost"] for e in iter_entries(path)] == [0.1]
@@ -0,0 +1,205 @@
+import pytest
+import datetime
+import json
+import os
+from unittest.mock import patch
+from analyze_costs import analyze_openrouter_costs
+from cost_log import append_entry
+from cost_store import CostStore
+
+
+def entry(days_ago=0, cost=0.01, model="openai/gpt-4.1", provider="openai", label="AI", run_id="run1", **extra):
+    timestamp = (datetime.datetime.now() - datetime.timedelta(days=days_ago)).isoformat()
+    return dict({"timestamp": timestamp, "model": model, "provider": provider, "label": label, "run_id": run_id,
+                 "prompt_tokens": 80, "completion_tokens": 20, "total_tokens": 100, "cost": cost}, **extra)
+
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    """Point the cost log at a temporary file."""
+    path = str(tmp_path / 'costs.jsonl')
+    monkeypatch.setenv("OPENROUTER_COST_LOG", path)
+    return path
+
+
+class TestIngest:
+    """Test incremental import of the cost log."""
+
+    def test_incremental_import(self, log_path, tmp_path):
+        """Test that a persistent store only imports entries added since the last import."""
+        db_path = str(tmp_path / 'costs.db')
+        for i in range(3):
+            append_entry(entry(cost=0.01))
+
+        store = CostStore(db_path)
+        assert store.ingest() == 3
+        assert store.ingest() == 0
+        store.close()
+
+        append_entry(entry(cost=0.02))
+        store = CostStore(db_path)
+        assert store.ingest() == 1
+        assert store.totals()["runs"] == 4
+        assert store.totals()["cost"] == pytest.approx(0.05)
+
+    def test_partial_line_is_picked_up_later(self, log_path):
+        """Test that a line still being written is not consumed until it is complete."""
+        line = json.dumps(entry())
+        with open(log_path, 'w') as f:
+            f.write(line + "\n" + line[:20])
+        store = CostStore()
+
+        assert store.ingest() == 1
+
+        with open(log_path, 'a') as f:
+            f.write(line[20:] + "\n")
+        assert store.ingest() == 1
+        assert store.totals()["runs"] == 2
+
+    def test_rotation_is_not_counted_twice(self, log_path):
+        """Test that rotated files keep their ingested offset."""
+        store = CostStore()
+        for i in range(10):
+            append_entry(entry(), max_bytes=1000)
+            store.ingest()
+        for i in range(10):
+            append_entry(entry(), max_bytes=1000)
+
+        store.ingest()
+
+        assert os.path.exists(f"{log_path}.1")
+        assert store.totals()["runs"] == 20
+
+    def test_legacy_array_is_migrated(self, log_path):
+        """Test that an old JSON-array log is converted before import."""
+        with open(log_path, 'w') as f:
+            json.dump([entry(), entry()], f, indent=2)
+
+        store = CostStore()
+
+        assert store.ingest() == 2
+        assert store.ingest() == 0
+
+
+class TestAggregations:
+    """Test the SQL aggregations."""
+
+    def test_breakdowns(self, log_path):
+        """Test per-day, per-label, per-run and per-model rollups."""
+        append_entry(entry(days_ago=2, label="AI", run_id="a", cost=0.01))
+        append_entry(entry(days_ago=2, label="AI", run_id="a", cost=0.01, model="anthropic/claude"))
+        append_entry(entry(days_ago=1, label="DeFi", run_id="b", cost=0.05))
+        append_entry(entry(days_ago=40, label="AI", run_id="old", cost=1.0))
+        append_entry({"timestamp": "not a date", "cost": 5})
+        store = CostStore()
+        store.ingest()
+        since = (datetime.datetime.now() - datetime.timedelta(days=30)).timestamp()
+
+        by_day = store.breakdown("day", since)
+        by_label = {row["key"]: row for row in store.breakdown("label", since)}
+        by_run = store.breakdown("run", since)
+        by_model = store.breakdown("model", since)
+
+        assert [row["runs"] for row in by_day] == [2, 1]
+        assert by_label["AI"]["cost"] == pytest.approx(0.02)
+        assert by_label["DeFi"]["runs"] == 1
+        assert [row["key"] for row in by_run] == ["a", "b"]
+        assert by_model[0]["key"] == "openai/gpt-4.1"
+        assert store.totals()["runs"] == 4
+        with pytest.raises(ValueError):
+            store.breakdown("timestamp; DROP TABLE cost_entries")
+
+    def test_routing_accuracy(self, log_path):
+        """Test estimated versus actual cost for auto-routed calls."""
+        append_entry(entry(cost=0.02, routing={"estimated_cost": 0.01, "estimated_input_tokens": 40}))
+        append_entry(entry(cost=0.02))
+        store = CostStore()
+        store.ingest()
+
+        rows = store.routing_accuracy()
+
+        assert len(rows) == 1
+        assert rows[0]["estimated_cost"] == pytest.approx(0.01)
+        assert rows[0]["actual_tokens"] == 80
+
+    def test_latency_percentiles(self, log_path):
+        """Test per-model latency and throughput percentiles."""
+        for i in range(1, 101):
+            append_entry(entry(model="fast", latency=i / 10, tokens_per_second=100.0, first_token_latency=0.2))
+        append_entry(entry(model="slow", latency=30.0))
+        append_entry(entry(model="untimed"))
+        store = CostStore()
+        store.ingest()
+
+        rows = {row["model"]: row for row in store.latency_percentiles()}
+
+        assert set(rows) == {"fast", "slow"}
+        assert rows["fast"]["calls"] == 100
+        assert rows["fast"]["latency"][50] == pytest.approx(5.0, rel=0.1)
+        assert rows["fast"]["latency"][99] == pytest.approx(9.9, rel=0.05)
+        assert rows["fast"]["tokens_per_second"][95] == 100.0
+        assert rows["slow"]["latency"][50] == 30.0
+        assert rows["slow"]["first_token_latency"] == {}
+
+    def test_old_database_is_upgraded(self, tmp_path):
+        """Test that a database from before the telemetry columns gains them on open."""
+        import sqlite3
+        db_path = str(tmp_path / 'old.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE cost_entries (id INTEGER PRIMARY KEY, ts REAL NOT NULL, timestamp TEXT NOT NULL, "
+                     "day TEXT NOT NULL, model TEXT, provider TEXT, label TEXT, run_id TEXT, prompt_tokens INTEGER, "
+                     "completion_tokens INTEGER, total_tokens INTEGER, cost REAL, estimated_cost REAL, "
+                     "estimated_input_tokens INTEGER)")
+        conn.commit()
+        conn.close()
+
+        store = CostStore(db_path)
+
+        columns = {row["name"] for row in store.conn.execute("PRAGMA table_info(cost_entries)")}
+        assert {"latency", "tokens_per_second", "http_status"} <= columns
+
+    def test_uses_indexes(self):
+        """Test that time-window and model queries use the indexes."""
+        store = CostStore()
+
+        plan = store.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT SUM(cost) FROM cost_entries WHERE model = ? AND ts >= ?", ("m", 0)
+        ).fetchall()
+
+        assert "idx_cost_entries_model" in " ".join(row[-1] for row in plan)
+
+
+class TestAnalyzeCosts:
+    """Test the cost analysis report."""
+
+    def test_report_with_rollups(self, log_path, capsys):
+        """Test the report totals and the requested rollups."""
+        append_entry(entry(label="AI", run_id="a", cost=0.01))
+        append_entry(entry(label="DeFi", run_id="b", cost=0.03))
+
+        analyze_openrouter_costs(days=30, rollups=["label", "run"])
+
+        out = capsys.readouterr().out
+        assert "Total runs: 2" in out
+        assert "Total cost: $0.0400" in out
+        assert "COST BY LABEL:" in out and "  DeFi: $0.0300 - 1 calls" in out
+        assert "COST BY RUN:" in out
+        assert "LATENCY AND THROUGHPUT BY MODEL:" not in out
+
+    def test_report_latency(self, log_path, capsys):
+        """Test the latency section of the report."""
+        for i in range(10):
+            append_entry(entry(latency=2.0, tokens_per_second=50.0))
+
+        analyze_openrouter_costs(days=30)
+
+        out = capsys.readouterr().out
+        assert "openai/gpt-4.1: 10 timed calls" in out
+        assert "Latency: p50 2.0s, p95 2.0s, p99 2.0s" in out
+        assert "Throughput: p50 50.0 tok/s" in out
+
+    def test_no_log(self, log_path, capsys):
+        """Test the message when there is no cost log."""
+        analyze_openrouter_costs()
+
+        assert "No cost log file found." in capsys.readouterr().out
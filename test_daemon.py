@@ -0,0 +1,166 @@
+import pytest
+import json
+import os
+import random
+from types import SimpleNamespace
+from daemon import (
+    Scheduler,
+    format_status,
+    hold_lock,
+    job_argv,
+    load_config
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def completed_run(run_id='run1', stages=('fetch', 'clean', 'prompt', 'response', 'report')):
+    return SimpleNamespace(run_id=run_id, completed=lambda: list(stages))
+
+
+def write_config(tmp_path, jobs):
+    path = tmp_path / 'daemon.json'
+    path.write_text(json.dumps({"jobs": jobs}))
+    return str(path)
+
+
+class TestConfig:
+    """Test job config loading."""
+
+    def test_job_argv(self):
+        """Test that label, recipient and extra options become main.py arguments."""
+        assert job_argv({'label': 'AI', 'to_email': 'me@example.com', 'days': 1, 'args': ['--publish']}) == [
+            '--label', 'AI', '--to-email', 'me@example.com', '--days', '1', '--publish']
+        assert job_argv({'label': None}) == ['--no-label']
+        assert job_argv({}) == []
+
+    def test_load_config(self, tmp_path):
+        """Test that jobs get their arguments and default jitter."""
+        path = write_config(tmp_path, [{'name': 'daily', 'every_minutes': 60, 'label': 'AI'}])
+
+        job, = load_config(path)
+
+        assert job['argv'] == ['--label', 'AI']
+        assert job['jitter_seconds'] == 60
+
+    @pytest.mark.parametrize("jobs, message", [
+        ([], "No jobs"),
+        ([{'every_minutes': 60}], "needs a name"),
+        ([{'name': 'a', 'every_minutes': 60}, {'name': 'a', 'every_minutes': 5}], "Duplicate"),
+        ([{'name': 'a', 'every_minutes': 0}], "positive every_minutes"),
+        ([{'name': 'a', 'every_minutes': 5, 'args': ['--bogus']}], "invalid options"),
+        ([{'name': 'a', 'every_minutes': 5, 'args': ['--batch', '--model', 'openai/gpt-4.1']}], "invalid options"),
+    ])
+    def test_invalid_config(self, tmp_path, jobs, message):
+        """Test that bad configs are rejected before serving."""
+        with pytest.raises(ValueError, match=message):
+            load_config(write_config(tmp_path, jobs))
+
+
+class TestScheduler:
+    """Test scheduling, running and status of jobs."""
+
+    def make_scheduler(self, tmp_path, jobs, run_job, clock=None):
+        for job in jobs:
+            job.setdefault('jitter_seconds', 0)
+            job['argv'] = job_argv(job)
+        return Scheduler(jobs, str(tmp_path / 'state'), run_job=run_job, clock=clock or FakeClock(),
+                         rng=random.Random(1))
+
+    def test_jitter_delays_first_run(self, tmp_path):
+        """Test that each run starts within the jitter window after its slot."""
+        scheduler = self.make_scheduler(tmp_path, [{'name': 'a', 'every_minutes': 60, 'jitter_seconds': 300}],
+                                        run_job=None)
+
+        state = scheduler.status['jobs']['a']
+        assert state['slot'] == 1000.0
+        assert 1000.0 <= state['next_run'] <= 1300.0
+
+    def test_jobs_run_one_at_a_time_and_skip_missed_slots(self, tmp_path):
+        """Test that due jobs run sequentially and a long run skips the slots it overran."""
+        clock = FakeClock()
+        calls = []
+
+        def run_job(argv):
+            calls.append((argv, clock.now))
+            clock.now += 90
+            if len(calls) == 3:
+                scheduler.stop()
+            return completed_run()
+
+        scheduler = self.make_scheduler(tmp_path, [{'name': 'a', 'every_minutes': 1, 'label': 'A'},
+                                                   {'name': 'b', 'every_minutes': 2, 'label': 'B'}],
+                                        run_job, clock)
+        scheduler.serve()
+
+        assert calls == [(['--label', 'A'], 1000.0), (['--label', 'B'], 1090.0), (['--label', 'A'], 1180.0)]
+        jobs = scheduler.status['jobs']
+        # Slots that passed while a job was running are skipped, not run back to back
+        assert jobs['a']['slot'] == 1300.0
+        assert jobs['b']['slot'] == 1240.0
+        assert jobs['a']['runs'] == 2 and jobs['a']['last_status'] == 'ok'
+
+    def test_failures_and_env(self, tmp_path, monkeypatch):
+        """Test that errors and incomplete runs are recorded and job env is restored."""
+        monkeypatch.delenv('NEWSLETTER_SUMMARY_OUTPUT_DIR', raising=False)
+        seen = []
+
+        def run_job(argv):
+            seen.append(os.environ.get('NEWSLETTER_SUMMARY_OUTPUT_DIR'))
+            if len(seen) == 1:
+                raise RuntimeError("boom")
+            return completed_run('run2', stages=('fetch',))
+
+        scheduler = self.make_scheduler(tmp_path, [{'name': 'a', 'every_minutes': 5, 'env': {
+            'NEWSLETTER_SUMMARY_OUTPUT_DIR': 'docs'}}], run_job)
+        scheduler.run('a')
+        scheduler.run('a')
+
+        state = scheduler.status['jobs']['a']
+        assert seen == ['docs', 'docs']
+        assert 'NEWSLETTER_SUMMARY_OUTPUT_DIR' not in os.environ
+        assert state['failures'] == 2
+        assert state['last_status'] == 'incomplete' and state['last_run_id'] == 'run2'
+
+    def test_job_exit_is_a_failure(self, tmp_path):
+        """Test that a job exiting on bad options is counted as failed and rescheduled."""
+        def run_job(argv):
+            raise SystemExit(2)
+
+        scheduler = self.make_scheduler(tmp_path, [{'name': 'a', 'every_minutes': 5}], run_job)
+        scheduler.run('a')
+
+        state = scheduler.status['jobs']['a']
+        assert scheduler.status['running'] is None
+        assert state['failures'] == 1 and state['last_status'] == 'error: exited with status 2'
+        assert state['next_run'] == 1300.0
+
+    def test_status_file(self, tmp_path):
+        """Test that the status file is written and rendered."""
+        scheduler = self.make_scheduler(tmp_path, [{'name': 'daily', 'every_minutes': 60}],
+                                        run_job=lambda argv: completed_run())
+        scheduler.run('daily')
+
+        with open(tmp_path / 'state' / 'status.json') as f:
+            status = json.load(f)
+        text = format_status(status)
+
+        assert status['running'] is None
+        assert f"Daemon pid {os.getpid()} running" in text
+        assert "daily" in text and "ok (run run1)" in text
+
+
+def test_single_daemon_per_state_dir(tmp_path):
+    """Test that a second daemon cannot take the lock."""
+    lock_file = hold_lock(str(tmp_path))
+    try:
+        with pytest.raises(RuntimeError, match="already running"):
+            hold_lock(str(tmp_path))
+    finally:
+        lock_file.close()
@@ -0,0 +1,195 @@
+import pytest
+import numpy as np
+from dedup import (
+    split_story_blocks,
+    shingle_hashes,
+    minhash_signatures,
+    lsh_candidate_pairs,
+    cluster_signatures,
+    cluster_story_blocks,
+    coverage_annotation,
+    deduplicate_newsletter_content
+)
+
+
+LAUNCH_STORY = (
+    "OpenAI released a new reasoning model today that beats previous benchmarks on math, "
+    "coding and science tasks. The model will be available to Plus subscribers next week "
+    "and to API customers later this month according to the company blog post."
+)
+LAUNCH_STORY_REWORDED = (
+    "OpenAI released a new reasoning model on Tuesday that beats previous benchmarks on math, "
+    "coding and science tasks. The model will be available to Plus subscribers next week "
+    "and to API customers later this month according to the company blog post."
+)
+OTHER_STORY = (
+    "Google is adding a document summarization feature to Workspace that lets office users "
+    "condense long reports into bullet points, with a rollout planned for enterprise "
+    "customers first and consumer accounts over the following quarter."
+)
+
+
+class TestSplitStoryBlocks:
+    """Test splitting cleaned newsletter text into story blocks."""
+
+    def test_split_on_headings(self):
+        """Test that headings start a new block once the current one is long enough."""
+        text = f"# Launch\n\n{LAUNCH_STORY}\n\n# Workspace\n\n{OTHER_STORY}"
+        blocks = split_story_blocks(text)
+
+        assert len(blocks) == 2
+        assert blocks[0].startswith("# Launch")
+        assert blocks[1].startswith("# Workspace")
+
+    def test_split_paragraphs_without_headings(self):
+        """Test that paragraphs close a block once it holds min_words, so plain newsletters split per story."""
+        text = f"{LAUNCH_STORY}\n\n{OTHER_STORY}\n\nBeta access opens Friday."
+        blocks = split_story_blocks(text)
+
+        assert blocks == [LAUNCH_STORY, f"{OTHER_STORY}\n\nBeta access opens Friday."]
+
+    def test_heading_stays_with_its_paragraph(self):
+        """Test that a heading is never a block of its own, even with a tiny min_words."""
+        text = f"# Launch\n\n{LAUNCH_STORY}\n\n# Workspace\n\n{OTHER_STORY}"
+
+        assert split_story_blocks(text, min_words=1) == [f"# Launch\n\n{LAUNCH_STORY}",
+                                                         f"# Workspace\n\n{OTHER_STORY}"]
+
+    def test_split_on_horizontal_rules(self):
+        """Test that horizontal rules separate blocks and are dropped."""
+        text = f"{LAUNCH_STORY}\n\n---\n\n{OTHER_STORY}"
+        blocks = split_story_blocks(text)
+
+        assert len(blocks) == 2
+        assert "---" not in blocks[0]
+
+    def test_short_fragments_join_previous_block(self):
+        """Test that fragments below min_words are merged into the block before them."""
+        text = f"{LAUNCH_STORY}\n\n---\n\nBeta access opens Friday."
+        blocks = split_story_blocks(text)
+
+        assert blocks == [f"{LAUNCH_STORY}\n\nBeta access opens Friday."]
+
+    def test_short_leading_fragment_joins_next_block(self):
+        """Test that a short fragment before the first rule is kept with the next block."""
+        text = f"Today's issue\n\n---\n\n{LAUNCH_STORY}"
+        blocks = split_story_blocks(text)
+
+        assert blocks == [f"Today's issue\n\n{LAUNCH_STORY}"]
+
+    def test_short_newsletter_keeps_its_only_block(self):
+        """Test that a newsletter shorter than min_words is not dropped."""
+        assert split_story_blocks("OpenAI ships a new model.") == ["OpenAI ships a new model."]
+
+    def test_empty_text(self):
+        """Test that empty input yields no blocks."""
+        assert split_story_blocks("") == []
+        assert split_story_blocks(None) == []
+
+
+class TestMinhash:
+    """Test MinHash signatures and LSH clustering."""
+
+    def test_shingle_hashes_unique_and_sorted(self):
+        """Test that shingle hashes are deduplicated."""
+        hashes = shingle_hashes("a b c a b c a b c")
+
+        assert hashes.dtype == np.uint32
+        assert len(hashes) == len(set(hashes.tolist()))
+        assert np.all(np.diff(hashes.astype(np.int64)) > 0)
+
+    def test_signatures_are_deterministic(self):
+        """Test that signatures do not depend on process hash seeds."""
+        sets = [shingle_hashes(LAUNCH_STORY), shingle_hashes(OTHER_STORY)]
+
+        assert np.array_equal(minhash_signatures(sets), minhash_signatures(sets))
+
+    def test_similar_blocks_share_signature_positions(self):
+        """Test that estimated Jaccard similarity tracks textual similarity."""
+        sigs = minhash_signatures([
+            shingle_hashes(LAUNCH_STORY),
+            shingle_hashes(LAUNCH_STORY_REWORDED),
+            shingle_hashes(OTHER_STORY),
+        ])
+
+        near = np.mean(sigs[0] == sigs[1])
+        far = np.mean(sigs[0] == sigs[2])
+        assert near > 0.6
+        assert far < 0.1
+
+    def test_batching_matches_single_block_signatures(self):
+        """Test that batched computation equals computing each block alone."""
+        texts = [f"{LAUNCH_STORY} variant {i}" for i in range(50)]
+        sets = [shingle_hashes(t) for t in texts]
+
+        batched = minhash_signatures(sets)
+        for i, shingles in enumerate(sets):
+            assert np.array_equal(batched[i], minhash_signatures([shingles])[0])
+
+    def test_empty_blocks_never_match(self):
+        """Test that blocks without shingles are not clustered together."""
+        sigs = minhash_signatures([shingle_hashes(""), shingle_hashes("")])
+
+        assert lsh_candidate_pairs(sigs) == set()
+        assert cluster_signatures(sigs) == [[0], [1]]
+
+    def test_bands_must_divide_signature(self):
+        """Test that an invalid band count is rejected."""
+        sigs = minhash_signatures([shingle_hashes(LAUNCH_STORY)], num_perm=128)
+
+        with pytest.raises(ValueError, match="must be divisible"):
+            lsh_candidate_pairs(sigs, bands=30)
+
+    def test_cluster_signatures_groups_duplicates(self):
+        """Test that near-duplicates are clustered and distinct blocks are not."""
+        sigs = minhash_signatures([
+            shingle_hashes(LAUNCH_STORY),
+            shingle_hashes(OTHER_STORY),
+            shingle_hashes(LAUNCH_STORY_REWORDED),
+        ])
+
+        assert cluster_signatures(sigs) == [[0, 2], [1]]
+
+
+class TestClusterStoryBlocks:
+    """Test newsletter-level clustering and prompt content rebuilding."""
+
+    def test_cluster_sources_and_attribution(self):
+        """Test that clusters record every distinct source and the first newsletter."""
+        newsletters = [
+            {'content': LAUNCH_STORY, 'sender': 'The Neuron <hi@theneurondaily.com>'},
+            {'content': f"{OTHER_STORY}\n\n---\n\n{LAUNCH_STORY_REWORDED}", 'sender': 'TLDR AI <dan@tldr.tech>'},
+        ]
+        clusters = cluster_story_blocks(newsletters)
+
+        launch = next(c for c in clusters if len(c['members']) == 2)
+        assert launch['newsletter_index'] == 0
+        assert launch['sources'] == ['The Neuron', 'TLDR AI']
+
+    def test_coverage_annotation(self):
+        """Test the coverage marker is only produced for multi-source stories."""
+        assert coverage_annotation(['The Neuron']) is None
+        assert coverage_annotation(['The Neuron', 'TLDR AI']) == "[Covered by 2 sources: The Neuron, TLDR AI]"
+
+    def test_deduplicate_newsletter_content(self):
+        """Test that a shared story is sent once with its coverage annotation."""
+        newsletters = [
+            {'content': LAUNCH_STORY, 'sender': 'The Neuron <hi@theneurondaily.com>'},
+            {'content': f"{OTHER_STORY}\n\n---\n\n{LAUNCH_STORY_REWORDED}", 'sender': 'TLDR AI <dan@tldr.tech>'},
+        ]
+        contents = deduplicate_newsletter_content(newsletters)
+
+        assert contents[0].startswith("[Covered by 2 sources: The Neuron, TLDR AI]")
+        assert "OpenAI released" not in contents[1]
+        assert contents[1] == OTHER_STORY
+
+    def test_same_sender_counts_once(self):
+        """Test that repeated issues from one sender do not inflate coverage."""
+        newsletters = [
+            {'content': LAUNCH_STORY, 'sender': 'The Neuron <hi@theneurondaily.com>'},
+            {'content': LAUNCH_STORY_REWORDED, 'sender': 'The Neuron <hi@theneurondaily.com>'},
+        ]
+        contents = deduplicate_newsletter_content(newsletters)
+
+        assert "Covered by" not in contents[0]
+        assert contents[1] == ""
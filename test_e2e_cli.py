@@ -11,6 +11,7 @@ def test_e2e_cli_report_generation():
         env = os.environ.copy()
         env['PYTHONPATH'] = os.getcwd()
         env['NEWSLETTER_SUMMARY_OUTPUT_DIR'] = tmpdir
+        env['NEWSLETTER_RUNS_DIR'] = os.path.join(tmpdir, 'runs')
         # Provide mock data as JSON
         mock_newsletters = [
             {
@@ -39,6 +40,7 @@ def test_e2e_cli_report_generation_no_label():
         env = os.environ.copy()
         env['PYTHONPATH'] = os.getcwd()
         env['NEWSLETTER_SUMMARY_OUTPUT_DIR'] = tmpdir
+        env['NEWSLETTER_RUNS_DIR'] = os.path.join(tmpdir, 'runs')
         # Provide mock data as JSON
         mock_newsletters = [
             {
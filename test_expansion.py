@@ -0,0 +1,139 @@
+import pytest
+import json
+import threading
+import time
+from budget import BudgetExceeded
+from expansion import (
+    FALLBACK_CONTENT_TOKENS,
+    assemble_analysis,
+    build_expansion_prompt,
+    expand_topics,
+    newsletters_for_topic,
+    parse_outline,
+    relevant_blocks
+)
+
+
+OUTLINE = {"topics": [
+    {"headline": "OpenAI ships GPT-5", "summary": "New model.", "sources": ["The Neuron", "TLDR AI"]},
+    {"headline": "EU AI Act update", "summary": "New rules.", "sources": ["Ben's Bites"]},
+    {"headline": "", "summary": "No headline"},
+]}
+
+NEWSLETTERS = [
+    {'subject': 'GPT-5 is here', 'sender': 'The Neuron <news@theneuron.ai>', 'date': 'x', 'body': 'a'},
+    {'subject': 'TLDR AI 2024-01-01', 'sender': 'TLDR <dan@tldrnewsletter.com>', 'date': 'x', 'body': 'b'},
+    {'subject': 'Weekly', 'sender': "Ben's Bites <ben@bensbites.co>", 'date': 'x', 'body': 'c'},
+]
+
+
+class TestParseOutline:
+    """Test parsing of the first-step outline."""
+
+    def test_parse_outline(self):
+        """Test that topics without headlines are skipped and the count is capped."""
+        outline = parse_outline("```json\n" + json.dumps(OUTLINE) + "\n```", num_topics=5)
+
+        assert [t["headline"] for t in outline] == ["OpenAI ships GPT-5", "EU AI Act update"]
+        assert outline[0]["sources"] == ["The Neuron", "TLDR AI"]
+        assert len(parse_outline(json.dumps(OUTLINE), num_topics=1)) == 1
+
+    def test_invalid_outline(self):
+        """Test that unusable replies raise ValueError."""
+        with pytest.raises(ValueError):
+            parse_outline("### 1. Markdown instead", 5)
+        with pytest.raises(ValueError):
+            parse_outline('{"topics": []}', 5)
+
+
+class TestNewslettersForTopic:
+    """Test selecting source newsletters for an expansion."""
+
+    def test_matches_sources(self):
+        """Test that source names are matched against senders and subjects."""
+        topic = parse_outline(json.dumps(OUTLINE), 5)[0]
+
+        matched = newsletters_for_topic(topic, NEWSLETTERS)
+
+        assert [nl['body'] for nl in matched] == ['a', 'b']
+
+    def test_falls_back_to_similar_blocks(self):
+        """Test that an unmatched topic gets the most similar story blocks within the token bound."""
+        topic = {"headline": "Robot vacuum recall", "summary": "A robot vacuum maker recalls units.",
+                 "sources": ["Unknown Weekly"]}
+        newsletters = [
+            {'subject': 'Daily', 'sender': 'A <a@a.com>', 'content': "## Chips\n\nNew chip export rules.\n\n"
+             "## Robots\n\nThe robot vacuum recall covers 10,000 units."},
+            {'subject': 'Weekly', 'sender': 'B <b@b.com>', 'content': "Funding round for a search startup."},
+        ]
+
+        selected = newsletters_for_topic(topic, newsletters)
+        bounded = relevant_blocks(topic, newsletters, budget_tokens=20)
+
+        assert sum(len(nl['content']) for nl in selected) <= 4 * FALLBACK_CONTENT_TOKENS
+        assert [nl['subject'] for nl in selected] == ['Daily']
+        assert len(bounded) == 1 and 'robot vacuum recall' in bounded[0]['content']
+        assert 'chip export' not in bounded[0]['content']
+
+
+class TestExpandTopics:
+    """Test concurrent expansion and assembly."""
+
+    def test_expansion_runs_concurrently_in_rank_order(self):
+        """Test that expansions overlap in time and keep rank order."""
+        outline = [{"headline": f"Topic {i}", "summary": "", "sources": []} for i in range(6)]
+        prompts = [build_expansion_prompt(topic, i + 1, "content") for i, topic in enumerate(outline)]
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def complete(prompt):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.2 if "Topic 0" in prompt else 0.1)
+            with lock:
+                active.pop()
+            return f"- **What's New:** about {prompt.split('TOPIC: ')[1].splitlines()[0]}"
+
+        started = time.monotonic()
+        sections = expand_topics(outline, prompts, complete, max_workers=3)
+        elapsed = time.monotonic() - started
+
+        assert [s.split("about ")[1] for s in sections] == [f"Topic {i}" for i in range(6)]
+        assert max(peak) == 3
+        assert elapsed < 0.5
+
+    def test_failed_expansion_uses_outline(self):
+        """Test that a failed topic falls back to its outline summary."""
+        outline = parse_outline(json.dumps(OUTLINE), 5)
+
+        def complete(prompt):
+            if "EU AI Act" in prompt:
+                raise Exception("timeout")
+            return "- **What's New:** Full section"
+
+        sections = expand_topics(outline, ["OpenAI ships GPT-5", "EU AI Act update"], complete)
+
+        assert sections[0] == "- **What's New:** Full section"
+        assert sections[1].startswith("- **What's New:** New rules.")
+        assert "Ben's Bites" in sections[1]
+
+    def test_budget_stop_is_raised(self):
+        """Test that running out of budget stops the expansion instead of falling back."""
+        outline = parse_outline(json.dumps(OUTLINE), 5)
+
+        def complete(prompt):
+            raise BudgetExceeded("over budget")
+
+        with pytest.raises(BudgetExceeded):
+            expand_topics(outline, ["OpenAI ships GPT-5", "EU AI Act update"], complete)
+
+    def test_assemble_analysis(self):
+        """Test that sections are numbered in rank order and repeated headings are removed."""
+        outline = parse_outline(json.dumps(OUTLINE), 5)
+
+        analysis = assemble_analysis(outline, ["### OpenAI ships GPT-5\n- **What's New:** A", "- **What's New:** B"])
+
+        assert analysis.index("### 1. OpenAI ships GPT-5") < analysis.index("### 2. EU AI Act update")
+        assert analysis.count("OpenAI ships GPT-5") == 1
@@ -0,0 +1,180 @@
+import pytest
+import datetime
+import json
+import os
+import tempfile
+from budget import BudgetExceeded
+from extracts import (
+    ExtractStore,
+    PROMPT_VERSION,
+    build_extraction_prompt,
+    extract_newsletters,
+    format_extract,
+    message_key,
+    parse_extract
+)
+
+
+def _newsletter(i, **overrides):
+    newsletter = {
+        'id': f'msg{i}',
+        'subject': f'Newsletter {i}',
+        'sender': f'Sender {i} <sender{i}@example.com>',
+        'date': 'Mon, 1 Jan 2024 10:00:00 +0000',
+    }
+    newsletter.update(overrides)
+    return newsletter
+
+
+REPLY = json.dumps({"stories": [
+    {"title": "Minor update", "summary": "Small fix.", "importance": 2, "links": []},
+    {"title": "Big launch", "summary": "New model.", "importance": 9, "links": ["https://example.com/launch"]},
+]})
+
+
+@pytest.fixture
+def store_path():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield os.path.join(tmpdir, 'extracts.json')
+
+
+class TestParseExtract:
+    """Test parsing of extraction replies."""
+
+    def test_parse_and_normalise(self):
+        """Test that importance is clamped and bad entries are skipped."""
+        reply = "```json\n" + json.dumps({"stories": [
+            {"title": "A", "summary": "x", "importance": 15, "links": ["https://a", 3]},
+            {"summary": "no title"},
+            {"title": "B", "importance": "high"},
+        ]}) + "\n```"
+
+        stories = parse_extract(reply)
+
+        assert [s['title'] for s in stories] == ["A", "B"]
+        assert stories[0]['importance'] == 10
+        assert stories[0]['links'] == ["https://a"]
+        assert stories[1]['importance'] == 5
+
+    def test_invalid_reply(self):
+        """Test that a reply without a stories list is rejected."""
+        with pytest.raises(ValueError):
+            parse_extract("Here are the stories: ...")
+        with pytest.raises(ValueError):
+            parse_extract('{"items": []}')
+
+
+class TestMessageKey:
+    """Test store keys."""
+
+    def test_uses_message_id(self):
+        """Test that the Gmail message id is the key when present."""
+        assert message_key(_newsletter(1)) == 'msg1'
+
+    def test_falls_back_to_hash(self):
+        """Test that newsletters without an id get a stable content key."""
+        newsletter = _newsletter(1, id=None)
+        assert message_key(newsletter) == message_key(dict(newsletter))
+        assert message_key(newsletter).startswith("h:")
+
+
+class TestExtractNewsletters:
+    """Test incremental extraction against the store."""
+
+    def test_only_unseen_newsletters_are_extracted(self, store_path):
+        """Test that stored extracts are reused on the next run."""
+        prompts = []
+
+        def complete(prompt):
+            prompts.append(prompt)
+            return REPLY
+
+        records, stats = extract_newsletters([_newsletter(1), _newsletter(2)], ["one", "two"], complete,
+                                             store=ExtractStore(store_path))
+        assert stats == {'reused': 0, 'extracted': 2, 'failed': 0}
+
+        records, stats = extract_newsletters([_newsletter(1), _newsletter(2), _newsletter(3)],
+                                             ["one", "two", "three"], complete, store=ExtractStore(store_path))
+
+        assert stats == {'reused': 2, 'extracted': 1, 'failed': 0}
+        assert len(prompts) == 3
+        assert "Newsletter 3" in prompts[-1]
+        assert all(record['stories'][1]['title'] == "Big launch" for record in records)
+
+    def test_failed_extraction_is_retried_next_run(self, store_path):
+        """Test that a failed extraction is not stored."""
+        records, stats = extract_newsletters([_newsletter(1)], ["one"], lambda prompt: "not json",
+                                             store=ExtractStore(store_path))
+
+        assert records == [None]
+        assert stats['failed'] == 1
+        assert 'msg1' not in ExtractStore(store_path)
+
+    def test_budget_stop_keeps_completed_extracts(self, store_path):
+        """Test that running out of budget raises after storing the extracts that completed."""
+        def complete(prompt):
+            if "Newsletter 2" in prompt:
+                raise BudgetExceeded("over budget")
+            return REPLY
+
+        with pytest.raises(BudgetExceeded):
+            extract_newsletters([_newsletter(1), _newsletter(2)], ["one", "two"], complete,
+                                store=ExtractStore(store_path))
+
+        assert 'msg1' in ExtractStore(store_path)
+        assert 'msg2' not in ExtractStore(store_path)
+
+    def test_prompt_version_change_invalidates_extracts(self, store_path):
+        """Test that extracts made with another prompt version are ignored."""
+        extract_newsletters([_newsletter(1)], ["one"], lambda prompt: REPLY, store=ExtractStore(store_path))
+
+        assert 'msg1' in ExtractStore(store_path)
+        assert 'msg1' not in ExtractStore(store_path, prompt_version="other")
+
+    def test_old_extracts_are_pruned(self, store_path):
+        """Test that extracts beyond the retention period are dropped on save."""
+        store = ExtractStore(store_path)
+        old = (datetime.datetime.now() - datetime.timedelta(days=60)).isoformat()
+        store.put('old', {'stories': [], 'extracted_at': old})
+        store.put('new', {'stories': [], 'extracted_at': datetime.datetime.now().isoformat()})
+        store.save()
+
+        with open(store_path) as f:
+            saved = json.load(f)
+        assert set(saved[PROMPT_VERSION]) == {'new'}
+
+    def test_save_merges_with_other_runs(self, store_path):
+        """Test that saving keeps extracts written meanwhile by another run and other prompt versions."""
+        now = datetime.datetime.now().isoformat()
+        first, second = ExtractStore(store_path), ExtractStore(store_path)
+        other = ExtractStore(store_path, prompt_version="other")
+        first.put('msg1', {'stories': [], 'extracted_at': now})
+        other.put('msg9', {'stories': [], 'extracted_at': now})
+        first.save()
+        other.save()
+        second.put('msg2', {'stories': [], 'extracted_at': now})
+        second.save()
+
+        with open(store_path) as f:
+            saved = json.load(f)
+        assert set(saved[PROMPT_VERSION]) == {'msg1', 'msg2'}
+        assert set(saved['other']) == {'msg9'}
+        assert 'msg1' in second
+
+
+class TestFormatting:
+    """Test prompt construction and extract formatting."""
+
+    def test_extraction_prompt_is_bounded(self):
+        """Test that very long newsletters are cut before extraction."""
+        prompt = build_extraction_prompt(_newsletter(1), "x" * 50000)
+
+        assert "SUBJECT: Newsletter 1" in prompt
+        assert prompt.count("x") < 13000
+
+    def test_format_extract_orders_by_importance(self):
+        """Test that the most important stories are listed first."""
+        text = format_extract({'stories': parse_extract(REPLY)})
+
+        assert text.index("Big launch") < text.index("Minor update")
+        assert "[importance 9] Big launch: New model. (links: https://example.com/launch)" in text
@@ -58,6 +58,7 @@ def test_get_ai_newsletters_success(monkeypatch):
     assert len(newsletters) == 2
     assert newsletters[0]['subject'] == 'Test 1'
     assert newsletters[1]['subject'] == 'Test 2'
+    assert [nl['id'] for nl in newsletters] == ['1', '2']
 
 def test_get_ai_newsletters_no_messages(monkeypatch):
     messages_data = []
@@ -0,0 +1,43 @@
+import threading
+from file_lock import locked, thread_lock
+
+
+class TestLocked:
+    """Test the per-path file locks."""
+
+    def test_same_path_shares_a_lock(self, tmp_path):
+        """Test that every spelling of a path gets the same in-process lock."""
+        path = tmp_path / 'state.json'
+
+        assert thread_lock(str(path)) is thread_lock(str(tmp_path / '.' / 'state.json'))
+        assert thread_lock(str(path)) is not thread_lock(str(tmp_path / 'other.json'))
+
+    def test_different_paths_do_not_block(self, tmp_path):
+        """Test that holding one file's lock does not serialise writers of another."""
+        acquired = threading.Event()
+
+        def other_writer():
+            with locked(str(tmp_path / 'b.json')):
+                acquired.set()
+
+        with locked(str(tmp_path / 'a.json')):
+            thread = threading.Thread(target=other_writer)
+            thread.start()
+            assert acquired.wait(5)
+        thread.join()
+
+    def test_same_path_blocks(self, tmp_path):
+        """Test that a second writer of the same file waits for the first."""
+        path = str(tmp_path / 'a.json')
+        acquired = threading.Event()
+
+        def second_writer():
+            with locked(path):
+                acquired.set()
+
+        with locked(path):
+            thread = threading.Thread(target=second_writer)
+            thread.start()
+            assert not acquired.wait(0.2)
+        thread.join()
+        assert acquired.is_set()
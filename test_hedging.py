@@ -0,0 +1,309 @@
+import pytest
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from circuit_breaker import HealthStore
+from hedging import (
+    LatencyHistory,
+    build_fallback_chain,
+    hedged_completion,
+    target_key
+)
+
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible streaming chat completions endpoint."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        server.requests.append(json.loads(self.rfile.read(length)))
+        if server.status != 200:
+            body = b'{"error": "stub failure"}'
+            self.send_response(server.status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        time.sleep(server.first_token_delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for word in server.words:
+                chunk = {"choices": [{"delta": {"content": word}}]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                time.sleep(server.chunk_delay)
+            usage = {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}}
+            self.write_chunk(f"data: {json.dumps(usage)}\n\n".encode())
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+            server.completed += 1
+        except (BrokenPipeError, ConnectionResetError):
+            server.cancelled += 1
+
+
+@pytest.fixture
+def stub_server():
+    """Start stub servers on free ports; configure delays per server."""
+    servers = []
+
+    def start(first_token_delay=0.0, chunk_delay=0.0, words=("Hello", " world"), status=200):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubChatHandler)
+        server.daemon_threads = True
+        server.first_token_delay = first_token_delay
+        server.chunk_delay = chunk_delay
+        server.words = list(words)
+        server.status = status
+        server.requests = []
+        server.completed = 0
+        server.cancelled = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _target(name, server, model='test/model'):
+    return {
+        'name': name,
+        'base_url': f"http://127.0.0.1:{server.server_address[1]}/v1",
+        'api_key': 'test_key',
+        'model': model,
+    }
+
+
+@pytest.fixture
+def history():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield LatencyHistory(os.path.join(tmpdir, 'latency.json'))
+
+
+MESSAGES = [{"role": "user", "content": "Summarize"}]
+
+
+class TestLatencyHistory:
+    """Test the on-disk latency history."""
+
+    def test_percentile_requires_samples(self, history):
+        """Test that no percentile is reported before enough samples exist."""
+        history.record('openrouter:m', first_token=1.0)
+        assert history.percentile('openrouter:m', 95) is None
+
+    def test_percentile_and_persistence(self, history):
+        """Test that samples survive a save/load round trip."""
+        for value in [1.0, 2.0, 3.0, 4.0, 10.0]:
+            history.record('openrouter:m', first_token=value, total=value * 2)
+        history.save()
+
+        reloaded = LatencyHistory(history.path)
+        assert reloaded.percentile('openrouter:m', 95) == 10.0
+        assert reloaded.percentile('openrouter:m', 50) == 3.0
+        assert reloaded.percentile('openrouter:m', 50, metric='total') == 6.0
+
+    def test_history_is_bounded(self, history):
+        """Test that only the most recent samples are kept."""
+        bounded = LatencyHistory(history.path, size=5)
+        for value in range(20):
+            bounded.record('k', first_token=float(value))
+
+        assert bounded.percentile('k', 0) == 15.0
+
+    def test_concurrent_histories_keep_each_others_samples(self, history):
+        """Test that a save appends to the file instead of overwriting another run's samples."""
+        other = LatencyHistory(history.path)
+        history.record('openrouter:a', first_token=1.0)
+        other.record('openrouter:b', first_token=2.0)
+
+        history.save()
+        other.save()
+
+        with open(history.path) as f:
+            data = json.load(f)
+        assert data['openrouter:a']['first_token'] == [1.0]
+        assert data['openrouter:b']['first_token'] == [2.0]
+
+    def test_parallel_saves_use_their_own_temp_files(self, history):
+        """Test that saves from many threads all land and leave no temporary files behind."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def record_and_save(i):
+            history.record(f'k{i}', first_token=float(i))
+            history.save()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(record_and_save, range(8)))
+
+        with open(history.path) as f:
+            assert sorted(json.load(f)) == sorted(f'k{i}' for i in range(8))
+        assert [name for name in os.listdir(os.path.dirname(history.path)) if name.endswith('.tmp')] == []
+
+
+class TestBuildFallbackChain:
+    """Test fallback chain resolution."""
+
+    def test_skips_targets_without_keys(self):
+        """Test that providers without a configured API key are skipped."""
+        spec = [
+            {"name": "openrouter", "base_url": "https://openrouter.ai/api/v1/", "api_key_env": "TEST_OR_KEY"},
+            {"name": "openai", "base_url": "https://api.openai.com/v1", "api_key_env": "TEST_MISSING_KEY",
+             "model": "gpt-4.1"},
+        ]
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setenv("TEST_OR_KEY", "abc")
+            mp.delenv("TEST_MISSING_KEY", raising=False)
+            chain = build_fallback_chain("openai/gpt-4.1-mini", spec)
+
+        assert len(chain) == 1
+        assert chain[0]['model'] == "openai/gpt-4.1-mini"
+        assert chain[0]['base_url'] == "https://openrouter.ai/api/v1"
+
+    def test_skips_openrouter_when_disabled(self):
+        """Test that OpenRouter entries are left out when OpenRouter is off."""
+        with pytest.MonkeyPatch.context() as mp:
+            for key in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY"):
+                mp.setenv(key, "k")
+            chain = build_fallback_chain("openai/gpt-4.1-mini", use_openrouter=False)
+
+        assert [target['name'] for target in chain] == ['openai', 'anthropic']
+
+    def test_chain_from_environment(self):
+        """Test that the chain can be configured as JSON in the environment."""
+        spec = [{"name": "local", "base_url": "http://127.0.0.1:1/v1", "api_key": "k", "model": "m"}]
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setenv("LLM_FALLBACK_CHAIN", json.dumps(spec))
+            chain = build_fallback_chain("unused")
+
+        assert chain == [{"name": "local", "base_url": "http://127.0.0.1:1/v1", "api_key": "k", "model": "m"}]
+
+
+class TestHedgedCompletion:
+    """Test hedged execution against local stub servers."""
+
+    def test_fast_primary_wins_without_hedging(self, stub_server, history):
+        """Test that a responsive primary is used alone."""
+        primary = stub_server()
+        secondary = stub_server()
+        chain = [_target('primary', primary), _target('secondary', secondary)]
+
+        result = hedged_completion(MESSAGES, chain, hedge_after=1.0, history=history)
+
+        assert result['content'] == "Hello world"
+        assert result['provider'] == 'primary'
+        assert result['hedged'] == 0
+        assert result['usage']['total_tokens'] == 13
+        assert secondary.requests == []
+        assert primary.requests[0]['stream'] is True
+
+    def test_slow_primary_is_hedged(self, stub_server, history):
+        """Test that the secondary is started and wins when the primary stalls."""
+        primary = stub_server(first_token_delay=3.0)
+        secondary = stub_server(words=("Fast", " answer"))
+        chain = [_target('primary', primary), _target('secondary', secondary)]
+
+        started = time.monotonic()
+        result = hedged_completion(MESSAGES, chain, hedge_after=0.2, history=history)
+
+        assert result['provider'] == 'secondary'
+        assert result['content'] == "Fast answer"
+        assert result['hedged'] == 1
+        assert time.monotonic() - started < 2.0
+        assert len(secondary.requests) == 1
+
+    def test_streaming_primary_is_not_hedged(self, stub_server, history):
+        """Test that a primary that already produced a first token is not hedged."""
+        primary = stub_server(chunk_delay=0.3, words=("a", "b", "c"))
+        secondary = stub_server()
+        chain = [_target('primary', primary), _target('secondary', secondary)]
+
+        result = hedged_completion(MESSAGES, chain, hedge_after=0.2, history=history)
+
+        assert result['provider'] == 'primary'
+        assert result['content'] == "abc"
+        assert secondary.requests == []
+
+    def test_loser_is_cancelled(self, stub_server, history):
+        """Test that the losing stream is closed once a winner completes."""
+        primary = stub_server(first_token_delay=0.3, chunk_delay=0.2, words=["x"] * 30)
+        secondary = stub_server()
+        chain = [_target('primary', primary), _target('secondary', secondary)]
+
+        result = hedged_completion(MESSAGES, chain, hedge_after=0.1, history=history)
+        time.sleep(1.5)
+
+        assert result['provider'] == 'secondary'
+        assert primary.completed == 0
+
+    def test_error_fails_over_immediately(self, stub_server, history):
+        """Test that a failing primary triggers the next provider without waiting."""
+        primary = stub_server(status=500)
+        secondary = stub_server()
+        chain = [_target('primary', primary), _target('secondary', secondary)]
+
+        started = time.monotonic()
+        result = hedged_completion(MESSAGES, chain, hedge_after=10.0, history=history)
+
+        assert result['provider'] == 'secondary'
+        assert time.monotonic() - started < 2.0
+
+    def test_all_providers_fail(self, stub_server, history):
+        """Test that an error is raised when every provider fails."""
+        chain = [_target('primary', stub_server(status=500)), _target('secondary', stub_server(status=503))]
+
+        with pytest.raises(Exception, match="All providers failed"):
+            hedged_completion(MESSAGES, chain, hedge_after=0.1, history=history)
+
+    def test_hedge_delay_uses_recorded_p95(self, stub_server, history):
+        """Test that the default hedge delay comes from latency history."""
+        primary = stub_server(first_token_delay=3.0)
+        secondary = stub_server()
+        chain = [_target('primary', primary), _target('secondary', secondary)]
+        for _ in range(10):
+            history.record(target_key(chain[0]), first_token=0.2)
+
+        started = time.monotonic()
+        result = hedged_completion(MESSAGES, chain, history=history)
+
+        assert result['provider'] == 'secondary'
+        assert time.monotonic() - started < 2.0
+
+    def test_latency_samples_are_saved(self, stub_server, history):
+        """Test that winners record first-token and total latency to disk."""
+        primary = stub_server(first_token_delay=0.05)
+        chain = [_target('primary', primary)]
+
+        hedged_completion(MESSAGES, chain, history=history)
+
+        with open(history.path) as f:
+            saved = json.load(f)
+        assert len(saved[target_key(chain[0])]['first_token']) == 1
+        assert len(saved[target_key(chain[0])]['total']) == 1
+
+    def test_outcomes_are_recorded_in_health_store(self, stub_server, history):
+        """Test that failures and successes reach the circuit breakers."""
+        primary = stub_server(status=500)
+        secondary = stub_server()
+        chain = [_target('primary', primary), _target('secondary', secondary)]
+        health = HealthStore(os.path.join(os.path.dirname(history.path), 'health.json'))
+
+        hedged_completion(MESSAGES, chain, hedge_after=10.0, history=history, health=health)
+
+        assert health.breaker(target_key(chain[0])).consecutive_failures == 1
+        assert health.breaker(target_key(chain[1])).outcomes == [1]
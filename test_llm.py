@@ -9,8 +9,43 @@ from llm import (
     log_cost_data,
     analyze_with_fallback,
     check_openrouter_status,
-    analyze_with_llm_direct
+    analyze_with_llm_direct,
+    build_cost_entry,
+    complete_with_chain,
+    provider_chain
 )
+from budget import ABORT, Budget, BudgetExceeded
+from circuit_breaker import HealthStore
+from clients import close_clients
+
+
+def raw_response(response, retries_taken=0):
+    """Wrap a mocked SDK response like the SDKs' ``with_raw_response`` results."""
+    return MagicMock(parse=MagicMock(return_value=response), retries_taken=retries_taken)
+
+
+@pytest.fixture(autouse=True)
+def health_state(tmp_path, monkeypatch):
+    """Keep provider circuit breaker state out of the working directory."""
+    path = str(tmp_path / 'llm_health.json')
+    monkeypatch.setenv("LLM_HEALTH_STATE", path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def cost_log(tmp_path, monkeypatch):
+    """Keep cost log entries of direct calls out of the working directory."""
+    path = str(tmp_path / 'costs.jsonl')
+    monkeypatch.setenv("OPENROUTER_COST_LOG", path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def shared_clients():
+    """Drop shared SDK clients so each test builds its own patched client."""
+    close_clients()
+    yield
+    close_clients()
 
 
 class TestAnalyzeNewslettersUnified:
@@ -117,6 +152,322 @@ class TestAnalyzeNewslettersUnified:
             assert "Newsletter 1" in call_args
             assert "Newsletter 2" in call_args
     
+    def test_analyze_newsletters_unified_dedupe_stories(self):
+        """Test that near-duplicate stories are sent once with a coverage note."""
+        story = (
+            "OpenAI released a new reasoning model today that beats previous benchmarks on math, "
+            "coding and science tasks. The model will be available to Plus subscribers next week "
+            "and to API customers later this month according to the company blog post."
+        )
+        newsletters = [
+            {
+                'subject': 'Newsletter 1',
+                'sender': 'The Neuron <hi@theneurondaily.com>',
+                'date': '2024-01-01',
+                'body': f'<p>{story}</p>',
+                'body_format': 'html'
+            },
+            {
+                'subject': 'Newsletter 2',
+                'sender': 'TLDR AI <dan@tldr.tech>',
+                'date': '2024-01-02',
+                'body': f'<p>{story.replace("today", "on Tuesday")}</p>',
+                'body_format': 'html'
+            }
+        ]
+        
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            mock_openrouter.return_value = "### 1. Combined Topic"
+            
+            analyze_newsletters_unified(newsletters, dedupe_stories=True)
+            
+            call_args = mock_openrouter.call_args[0][0]
+            assert call_args.count("OpenAI released") == 1
+            assert "[Covered by 2 sources: The Neuron, TLDR AI]" in call_args
+            assert "NEWSLETTER #2" in call_args
+
+    def test_analyze_newsletters_unified_dedupe_keeps_story_past_truncation(self):
+        """Test that a shared story past the cut in one newsletter is sent from the copy within it."""
+        story = (
+            "OpenAI released a new reasoning model today that beats previous benchmarks on math, "
+            "coding and science tasks. The model will be available to Plus subscribers next week "
+            "and to API customers later this month according to the company blog post."
+        )
+        filler = "".join(f"<h2>Item {i}</h2><p>{' '.join(f'filler{i}x{j}' for j in range(40))}</p>" for i in range(12))
+        newsletters = [
+            {'subject': 'Newsletter 1', 'sender': 'The Neuron <hi@theneurondaily.com>', 'date': '2024-01-01',
+             'body': f'{filler}<h2>Launch</h2><p>{story}</p>', 'body_format': 'html'},
+            {'subject': 'Newsletter 2', 'sender': 'TLDR AI <dan@tldr.tech>', 'date': '2024-01-02',
+             'body': f'<h2>Launch</h2><p>{story}</p>', 'body_format': 'html'}
+        ]
+        
+        with patch('llm.analyze_with_openrouter', return_value="### 1. Topic") as mock_openrouter:
+            analyze_newsletters_unified(newsletters, dedupe_stories=True)
+            
+        assert mock_openrouter.call_args[0][0].count("OpenAI released") == 1
+    
+    def test_analyze_newsletters_unified_prerank_budget(self):
+        """Test that pre-ranking replaces truncation and keeps a short newsletter's only block."""
+        story = " ".join(f"word{i}" for i in range(60))
+        newsletters = [
+            {
+                'subject': 'Newsletter 1',
+                'sender': 'sender1@example.com',
+                'date': 'Mon, 01 Jan 2024 12:00:00 +0000',
+                'body': f'<p>{story}</p>',
+                'body_format': 'html'
+            },
+            {
+                'subject': 'Newsletter 2',
+                'sender': 'sender2@example.com',
+                'date': 'Mon, 01 Jan 2024 12:00:00 +0000',
+                'body': '<p>Too short to be a story</p>',
+                'body_format': 'html'
+            }
+        ]
+        
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            mock_openrouter.return_value = "### 1. Test Topic"
+            
+            analyze_newsletters_unified(newsletters, prerank_budget=1000)
+            
+            call_args = mock_openrouter.call_args[0][0]
+            assert "NEWSLETTER #1" in call_args
+            assert "word59" in call_args
+            assert "NEWSLETTER #2" in call_args
+            assert "Too short to be a story" in call_args
+    
+    def test_analyze_newsletters_unified_auto_routing(self):
+        """Test that auto mode routes to a table model and reports the decision."""
+        newsletters = [
+            {
+                'subject': 'Test Newsletter',
+                'sender': 'test@example.com',
+                'date': '2024-01-01',
+                'body': '<p>Test content</p>',
+                'body_format': 'html'
+            }
+        ]
+        run_info = {}
+        
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            mock_openrouter.return_value = "### 1. Test Topic"
+            
+            analyze_newsletters_unified(newsletters, provider='auto', run_info=run_info)
+            
+            routing = mock_openrouter.call_args[1]['routing']
+            assert mock_openrouter.call_args[0][2] == routing['model']
+            assert run_info['model'] == routing['model']
+            assert routing['estimated_cost'] > 0
+    
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test_key", "OPENROUTER_COST_LOG": "unused.json"})
+    def test_analyze_newsletters_unified_structured(self):
+        """Test that structured mode streams JSON topics and renders markdown locally."""
+        newsletters = [
+            {
+                'subject': 'Test Newsletter',
+                'sender': 'test@example.com',
+                'date': '2024-01-01',
+                'body': '<p>Test content</p>',
+                'body_format': 'html'
+            }
+        ]
+        topic = {
+            "headline": "Structured Topic", "whats_new": "New", "why_it_matters": "Matters",
+            "actions": ["Act"], "sources": ["Test Newsletter"], "links": []
+        }
+        completion = json.dumps({"topics": [topic, {"headline": "Broken"}]})
+        
+        def fake_stream(target, messages, on_first_token, cancel_event, on_delta=None, extra_body=None, **kwargs):
+            if on_delta is None:
+                return {"content": json.dumps(dict(topic, headline="Repaired Topic")), "usage": {}}
+            for i in range(0, len(completion), 5):
+                on_delta(completion[i:i + 5])
+            return {"content": completion, "usage": {"total_tokens": 10}}
+        
+        run_info = {}
+        with patch('hedging.stream_chat_completion', side_effect=fake_stream) as mock_stream:
+            with patch('llm.log_cost_data') as mock_log:
+                analysis, titles = analyze_newsletters_unified(newsletters, structured=True, run_info=run_info)
+        
+        assert titles == ["Structured Topic", "Repaired Topic"]
+        assert "### 1. Structured Topic" in analysis
+        assert run_info['structured'] == {"parsed": 1, "repaired": 1, "dropped": 0}
+        assert mock_stream.call_args_list[0][1]['extra_body']['response_format']['type'] == 'json_schema'
+        assert '"topics"' in mock_stream.call_args_list[0][0][1][1]['content']
+        assert mock_log.call_args[0][0]['structured'] is True
+    
+    def test_analyze_newsletters_unified_structured_repairs_are_budgeted(self, health_state):
+        """Test that topic repair calls reserve from the budget, are logged and update provider health."""
+        from budget import Budget
+        newsletters = [{'subject': 'N', 'sender': 's@example.com', 'date': '2024-01-01',
+                        'body': '<p>Test content</p>', 'body_format': 'html'}]
+        topic = {
+            "headline": "Topic", "whats_new": "New", "why_it_matters": "Matters",
+            "actions": ["Act"], "sources": ["N"], "links": []
+        }
+        completion = json.dumps({"topics": [topic, {"headline": "Broken"}]})
+        
+        def fake_stream(target, messages, on_first_token, cancel_event, on_delta=None, extra_body=None, **kwargs):
+            if on_delta is None:
+                return {"content": json.dumps(dict(topic, headline="Repaired")), "usage": {"total_tokens": 5}}
+            on_delta(completion)
+            return {"content": completion, "usage": {"total_tokens": 10}}
+        
+        budget = Budget(max_cost=10.0)
+        health = MagicMock()
+        health.allow.return_value = True
+        with patch('hedging.stream_chat_completion', side_effect=fake_stream), \
+                patch('llm.log_cost_data') as mock_log, \
+                patch.object(budget, 'reserve', wraps=budget.reserve) as mock_reserve:
+            analyze_newsletters_unified(newsletters, structured=True, budget=budget, health=health)
+        
+        assert [call[0][1] for call in mock_reserve.call_args_list] == ["Analysis call", "Topic repair call"]
+        assert [call[0][0].get('stage') for call in mock_log.call_args_list] == [None, 'repair']
+        assert health.record_success.call_count == 2
+    
+    def test_analyze_newsletters_unified_incremental(self, tmp_path, monkeypatch):
+        """Test that a second run only extracts newsletters it has not seen."""
+        monkeypatch.setenv("NEWSLETTER_EXTRACTS", str(tmp_path / 'extracts.json'))
+        newsletters = [
+            {
+                'id': f'msg{i}',
+                'subject': f'Newsletter {i}',
+                'sender': f'sender{i}@example.com',
+                'date': '2024-01-01',
+                'body': f'<p>Story number {i} about a model launch</p>',
+                'body_format': 'html'
+            }
+            for i in range(3)
+        ]
+        reply = json.dumps({"stories": [{"title": "Model launch", "summary": "A launch.", "importance": 7,
+                                         "links": ["https://example.com"]}]})
+        
+        with patch('llm.complete_with_chain', return_value=reply) as mock_extract:
+            with patch('llm.analyze_with_openrouter', return_value="### 1. Topic\n") as mock_openrouter:
+                analyze_newsletters_unified(newsletters[:2], incremental=True)
+                assert mock_extract.call_count == 2
+                
+                run_info = {}
+                analyze_newsletters_unified(newsletters, incremental=True, run_info=run_info)
+                
+                assert mock_extract.call_count == 3
+                assert "Newsletter 2" in mock_extract.call_args[0][0]
+                assert run_info['incremental'] == {'reused': 2, 'extracted': 1, 'failed': 0}
+                prompt = mock_openrouter.call_args[0][0]
+                assert prompt.count("CANDIDATE STORIES:") == 3
+                assert "[importance 7] Model launch" in prompt
+                assert "<p>" not in prompt
+
+    def test_analyze_newsletters_unified_shares_health_store(self, tmp_path, monkeypatch):
+        """Test that extraction and analysis calls use the run's one health store."""
+        monkeypatch.setenv("NEWSLETTER_EXTRACTS", str(tmp_path / 'extracts.json'))
+        newsletters = [{'id': f'msg{i}', 'subject': f'Newsletter {i}', 'sender': 's@example.com',
+                        'date': '2024-01-01', 'body': f'<p>Story {i}</p>', 'body_format': 'html'} for i in range(2)]
+        reply = json.dumps({"stories": [{"title": "Story", "summary": "A story.", "importance": 5, "links": []}]})
+        health = MagicMock()
+        health.allow.return_value = True
+
+        with patch('llm.HealthStore') as mock_store, \
+                patch('llm.complete_with_chain', return_value=reply) as mock_extract, \
+                patch('llm.analyze_with_openrouter', return_value="### 1. Topic\n"):
+            analyze_newsletters_unified(newsletters, incremental=True, health=health)
+
+        mock_store.assert_not_called()
+        assert all(call[1]['health'] is health for call in mock_extract.call_args_list)
+        health.record_success.assert_called_once()
+
+    def test_analyze_newsletters_unified_shares_latency_history(self):
+        """Test that hedged calls use the run's latency history."""
+        newsletters = [{'subject': 'N', 'sender': 's@example.com', 'date': '2024-01-01',
+                        'body': '<p>Story</p>', 'body_format': 'html'}]
+        history = MagicMock()
+
+        with patch('llm.analyze_with_fallback', return_value="### 1. Topic\n") as mock_fallback:
+            analyze_newsletters_unified(newsletters, hedge=True, latency_history=history)
+
+        assert mock_fallback.call_args[1]['latency_history'] is history
+    
+    def test_analyze_newsletters_unified_splits_oversized_prompt(self, tmp_path, monkeypatch):
+        """Test that a prompt beyond the context window is chunked and merged."""
+        table_path = tmp_path / 'model_table.json'
+        table_path.write_text(json.dumps({"openai/gpt-4.1-mini": {"context_window": 8000}}))
+        monkeypatch.setenv("MODEL_TABLE_PATH", str(table_path))
+        newsletters = [
+            {
+                'subject': f'Newsletter {i}',
+                'sender': f'sender{i}@example.com',
+                'date': '2024-01-01',
+                'body': f'Story {i}. ' + 'word ' * 800,
+                'body_format': 'plain'
+            }
+            for i in range(8)
+        ]
+        run_info = {}
+        
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            mock_openrouter.side_effect = lambda prompt, *args, **kwargs: (
+                "### 1. Merged Topic\n" if "PARTIAL ANALYSIS" in prompt else "### 1. Chunk Topic\n"
+            )
+            
+            analysis, topics = analyze_newsletters_unified(newsletters, run_info=run_info)
+        
+        chunking = run_info['chunking']
+        assert chunking['chunks'] >= 2
+        assert sum(chunking['newsletters_per_chunk']) == 8
+        assert mock_openrouter.call_count == chunking['chunks'] + 1
+        merge_prompt = mock_openrouter.call_args_list[-1][0][0]
+        assert "PARTIAL ANALYSIS #2" in merge_prompt
+        chunk_prompts = [call[0][0] for call in mock_openrouter.call_args_list[:-1]]
+        for i in range(8):
+            assert sum(f"Newsletter {i}\n" in prompt for prompt in chunk_prompts) == 1
+        assert topics == ["Merged Topic"]
+    
+    def test_analyze_newsletters_unified_two_step(self):
+        """Test that two-step mode requests an outline and expands each topic separately."""
+        newsletters = [
+            {'subject': 'GPT news', 'sender': 'The Neuron <a@theneuron.ai>', 'date': '2024-01-01',
+             'body': 'GPT-5 launched.', 'body_format': 'plain'},
+            {'subject': 'Policy', 'sender': "Ben's Bites <b@bensbites.co>", 'date': '2024-01-01',
+             'body': 'EU AI Act update.', 'body_format': 'plain'},
+        ]
+        outline = json.dumps({"topics": [
+            {"headline": "GPT-5 launches", "summary": "New model.", "sources": ["The Neuron"]},
+            {"headline": "EU AI Act update", "summary": "New rules.", "sources": ["Ben's Bites"]},
+        ]})
+        run_info = {}
+        
+        def respond(prompt, *args, **kwargs):
+            if "TOPIC: " in prompt:
+                return "- **What's New:** Expanded " + prompt.split("TOPIC: ")[1].splitlines()[0]
+            return outline
+        
+        with patch('llm.analyze_with_openrouter', side_effect=respond) as mock_openrouter:
+            analysis, topics = analyze_newsletters_unified(
+                newsletters, num_topics=2, two_step=True, expand_concurrency=2, run_info=run_info
+            )
+        
+        assert topics == ["GPT-5 launches", "EU AI Act update"]
+        assert "Expanded EU AI Act update" in analysis
+        assert mock_openrouter.call_count == 3
+        assert '{"topics"' in mock_openrouter.call_args_list[0][0][0]
+        expansion = [call[0][0] for call in mock_openrouter.call_args_list if "TOPIC: EU" in call[0][0]][0]
+        assert "EU AI Act update." in expansion and "GPT-5 launched." not in expansion
+        assert run_info['two_step']['topics'] == 2
+        assert run_info['two_step']['concurrency'] == 2
+    
+    def test_analyze_newsletters_unified_two_step_bad_outline(self):
+        """Test that an unusable outline falls back to a single analysis call."""
+        newsletters = [{'subject': 'Test', 'sender': 'test@example.com', 'date': '2024-01-01', 'body': 'Content'}]
+        
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            mock_openrouter.side_effect = ["not json", "### 1. Single Call Topic\n"]
+            
+            analysis, topics = analyze_newsletters_unified(newsletters, two_step=True)
+        
+        assert topics == ["Single Call Topic"]
+        assert mock_openrouter.call_count == 2
+    
     @patch.dict(os.environ, {"USE_OPENROUTER": "false"})
     def test_analyze_newsletters_unified_direct_openai(self):
         """Test direct OpenAI API call when OpenRouter is disabled."""
@@ -135,13 +486,13 @@ class TestAnalyzeNewslettersUnified:
         
         with patch('llm.openai.OpenAI') as mock_openai:
             mock_client = MagicMock()
-            mock_client.chat.completions.create.return_value = mock_response
+            mock_client.chat.completions.with_raw_response.create.return_value = raw_response(mock_response)
             mock_openai.return_value = mock_client
             
             result, topics = analyze_newsletters_unified(newsletters, provider='openai')
             
             assert result == "### 1. Test Topic"
-            mock_client.chat.completions.create.assert_called_once()
+            mock_client.chat.completions.with_raw_response.create.assert_called_once()
     
     @patch.dict(os.environ, {"USE_OPENROUTER": "false"})
     def test_analyze_newsletters_unified_direct_claude(self):
@@ -161,13 +512,106 @@ class TestAnalyzeNewslettersUnified:
         
         with patch('llm.anthropic.Anthropic') as mock_anthropic:
             mock_client = MagicMock()
-            mock_client.messages.create.return_value = mock_response
+            mock_client.messages.with_raw_response.create.return_value = raw_response(mock_response)
             mock_anthropic.return_value = mock_client
             
             result, topics = analyze_newsletters_unified(newsletters, provider='claude')
             
             assert result == "### 1. Test Topic"
-            mock_client.messages.create.assert_called_once()
+            mock_client.messages.with_raw_response.create.assert_called_once()
+    
+    @patch.dict(os.environ, {"USE_OPENROUTER": "false"})
+    def test_analyze_newsletters_unified_direct_auto_routing(self, cost_log):
+        """Test that auto mode without OpenRouter routes among direct models and logs the decision and cost."""
+        newsletters = [{'subject': 'Test', 'sender': 'test@example.com', 'date': '2024-01-01',
+                        'body': '<p>Test content</p>'}]
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock(finish_reason="stop")]
+        mock_response.choices[0].message.content = "### 1. Test Topic"
+        mock_response.usage.prompt_tokens = 1000
+        mock_response.usage.completion_tokens = 500
+        run_info = {}
+        
+        with patch('llm.openai.OpenAI') as mock_openai:
+            mock_openai.return_value.chat.completions.with_raw_response.create.return_value = raw_response(mock_response)
+            
+            analyze_newsletters_unified(newsletters, provider='auto', run_info=run_info)
+        
+        assert mock_openai.return_value.chat.completions.with_raw_response.create.call_args[1]['model'] == "gpt-4.1-nano"
+        assert run_info['model'] == "gpt-4.1-nano"
+        with open(cost_log) as f:
+            entry = json.loads(f.readline())
+        assert entry['model'] == "gpt-4.1-nano" and entry['routing']['model'] == "gpt-4.1-nano"
+        assert entry['cost'] == pytest.approx((1000 * 0.10 + 500 * 0.40) / 1_000_000)
+
+
+class TestBudgetEnforcement:
+    """Test budget checks in the unified analysis."""
+
+    newsletters = [{
+        'subject': 'AI Weekly',
+        'sender': 'ai@newsletter.com',
+        'date': '2024-01-01',
+        'body': '<p>' + 'Model release news. ' * 500 + '</p>',
+        'body_format': 'html'
+    }]
+
+    @pytest.fixture(autouse=True)
+    def model_table(self, tmp_path, monkeypatch):
+        """Use the built-in model table."""
+        monkeypatch.setenv("MODEL_TABLE_PATH", str(tmp_path / 'missing.json'))
+
+    def test_over_budget_downgrades_model(self):
+        """Test that an unaffordable model is swapped for an affordable one."""
+        run_info = {}
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            mock_openrouter.return_value = "### 1. Topic\n- **What's New:** Test"
+            analyze_newsletters_unified(self.newsletters, provider='claude', run_info=run_info,
+                                        budget=Budget(max_cost=0.02))
+
+        assert 'openai/gpt-4.1-mini' in mock_openrouter.call_args[0]
+        assert run_info['model'] == 'openai/gpt-4.1-mini'
+        assert run_info['budget']['action'] == 'downgraded_model'
+        assert run_info['budget']['original_model'] == 'anthropic/claude-sonnet-4'
+
+    def test_abort_raises_before_calling(self):
+        """Test that the abort action stops the run before any call."""
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            with pytest.raises(BudgetExceeded):
+                analyze_newsletters_unified(self.newsletters, provider='claude',
+                                            budget=Budget(max_cost=0.02, action=ABORT))
+
+        mock_openrouter.assert_not_called()
+
+    def test_two_step_reserves_one_topic_per_expansion(self):
+        """Test that expansion calls reserve one topic each and a budget stop is not swallowed."""
+        outline = json.dumps({"topics": [
+            {"headline": f"Topic {i}", "summary": "S.", "sources": ["ai"]} for i in range(3)
+        ]})
+        budget = Budget(max_cost=10.0)
+        reserved = []
+        reserve = budget.reserve
+
+        def record(estimate, what="LLM call"):
+            reserved.append(estimate['output_tokens'])
+            reserve(estimate, what)
+
+        def respond(prompt, *args, **kwargs):
+            return "- **What's New:** Expanded" if "TOPIC: " in prompt else outline
+
+        with patch.object(budget, 'reserve', side_effect=record):
+            with patch('llm.analyze_with_openrouter', side_effect=respond):
+                analyze_newsletters_unified(self.newsletters, provider='claude', num_topics=3,
+                                            two_step=True, budget=budget)
+
+        # The outline call covers every topic, each expansion call a single one
+        assert reserved == [3 * reserved[1]] + [reserved[1]] * 3
+
+        with patch.object(budget, 'reserve', side_effect=[None, None, BudgetExceeded("over")]):
+            with patch('llm.analyze_with_openrouter', side_effect=respond):
+                with pytest.raises(BudgetExceeded):
+                    analyze_newsletters_unified(self.newsletters, provider='claude', num_topics=3,
+                                                two_step=True, expand_concurrency=1, budget=budget)
 
 
 class TestAnalyzeWithOpenrouter:
@@ -183,7 +627,7 @@ class TestAnalyzeWithOpenrouter:
             'usage': {'total_tokens': 100, 'prompt_tokens': 50, 'completion_tokens': 50}
         }
         
-        with patch('llm.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.return_value = mock_response
             with patch('llm.log_cost_data') as mock_log:
                 result = analyze_with_openrouter("Test prompt", "openai")
@@ -192,6 +636,75 @@ class TestAnalyzeWithOpenrouter:
                 mock_post.assert_called_once()
                 mock_log.assert_called_once()
     
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test_key"})
+    def test_analyze_with_openrouter_logs_routing_decision(self):
+        """Test that routing estimates are stored next to the actual cost."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            'choices': [{'message': {'content': 'Test response'}}],
+            'usage': {'total_tokens': 100, 'prompt_tokens': 50, 'completion_tokens': 50, 'cost': 0.002}
+        }
+        routing = {'model': 'openai/gpt-4.1-mini', 'estimated_cost': 0.001}
+        
+        with patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock_response
+            with patch('llm.log_cost_data') as mock_log:
+                analyze_with_openrouter("Test prompt", "auto", "openai/gpt-4.1-mini", routing=routing)
+                
+                logged = mock_log.call_args[0][0]
+                assert logged['provider'] == 'auto'
+                assert logged['routing'] == routing
+                assert logged['cost'] == 0.002
+    
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test_key"})
+    def test_analyze_with_openrouter_logs_latency(self):
+        """Test that the cost entry records request timing and HTTP status."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            'choices': [{'message': {'content': 'Test response'}}],
+            'usage': {'total_tokens': 100, 'prompt_tokens': 50, 'completion_tokens': 50}
+        }
+        
+        with patch('requests.Session.post', return_value=mock_response):
+            with patch('llm.log_cost_data') as mock_log:
+                analyze_with_openrouter("Test prompt", "openai")
+        
+        logged = mock_log.call_args[0][0]
+        assert logged['http_status'] == 200
+        assert logged['latency'] >= 0
+        assert logged['request_start'] <= logged['timestamp']
+        assert logged['first_token_latency'] is None
+        assert logged['retries'] == 0
+    
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test_key"})
+    def test_analyze_with_openrouter_disables_middle_out(self):
+        """Test that OpenRouter's lossy middle-out transform is turned off."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'choices': [{'message': {'content': 'Test response'}}]}
+        
+        with patch('requests.Session.post', return_value=mock_response) as mock_post:
+            analyze_with_openrouter("Test prompt", "openai")
+        
+        assert json.loads(mock_post.call_args[1]['data'])['transforms'] == []
+    
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test_key"})
+    def test_analyze_with_openrouter_continues_truncated_response(self):
+        """Test that a response cut off at the output limit is continued."""
+        truncated = MagicMock(status_code=200)
+        truncated.json.return_value = {'choices': [{'message': {'content': 'First half, '}, 'finish_reason': 'length'}]}
+        finished = MagicMock(status_code=200)
+        finished.json.return_value = {'choices': [{'message': {'content': 'second half.'}, 'finish_reason': 'stop'}]}
+        
+        with patch('requests.Session.post', side_effect=[truncated, finished]) as mock_post:
+            result = analyze_with_openrouter("Test prompt", "openai")
+        
+        assert result == "First half, second half."
+        messages = json.loads(mock_post.call_args[1]['data'])['messages']
+        assert messages[-2] == {"role": "assistant", "content": "First half, "}
+    
     def test_analyze_with_openrouter_missing_key(self):
         """Test error when OpenRouter API key is missing."""
         with patch.dict(os.environ, {}, clear=True):
@@ -208,7 +721,7 @@ class TestAnalyzeWithOpenrouter:
             'usage': {'total_tokens': 100}
         }
         
-        with patch('llm.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.return_value = mock_response
             with patch('llm.log_cost_data'):
                 analyze_with_openrouter("Test prompt", "openai", "custom/model")
@@ -224,7 +737,7 @@ class TestAnalyzeWithOpenrouter:
         mock_response.status_code = 400
         mock_response.text = "Bad request"
         
-        with patch('llm.requests.post') as mock_post:
+        with patch('requests.Session.post') as mock_post:
             mock_post.return_value = mock_response
             
             with pytest.raises(Exception, match="Error from OpenRouter API"):
@@ -240,7 +753,7 @@ class TestAnalyzeWithOpenrouter:
 class TestLogCostData:
     """Test the cost logging functionality."""
     
-    def test_log_cost_data_new_file(self):
+    def test_log_cost_data_new_file(self, tmp_path):
         """Test logging to a new file."""
         cost_data = {
             "timestamp": "2024-01-01T00:00:00",
@@ -248,70 +761,135 @@ class TestLogCostData:
             "total_tokens": 100,
             "cost": 0.001
         }
+        log_path = str(tmp_path / 'costs.jsonl')
         
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
-            tmp_file_path = tmp_file.name
+        with patch.dict(os.environ, {"OPENROUTER_COST_LOG": log_path}):
+            log_cost_data(cost_data)
         
-        try:
-            # Remove the file so we test new file creation
-            os.unlink(tmp_file_path)
-            
-            with patch.dict(os.environ, {"OPENROUTER_COST_LOG": tmp_file_path}):
-                log_cost_data(cost_data)
-                
-                # Check that file was created and contains the data
-                with open(tmp_file_path, 'r') as f:
-                    logged_data = json.load(f)
-                
-                assert len(logged_data) == 1
-                assert logged_data[0] == cost_data
-        finally:
-            if os.path.exists(tmp_file_path):
-                os.unlink(tmp_file_path)
-    
-    def test_log_cost_data_append_to_existing(self):
-        """Test appending to existing cost log file."""
+        with open(log_path, 'r') as f:
+            lines = f.read().splitlines()
+        
+        assert len(lines) == 1
+        assert json.loads(lines[0]) == cost_data
+    
+    def test_log_cost_data_append_to_existing(self, tmp_path):
+        """Test that entries are appended as JSON lines."""
+        log_path = str(tmp_path / 'costs.jsonl')
+        existing_data = {"timestamp": "2024-01-01T00:00:00", "cost": 0.001}
+        new_data = {"timestamp": "2024-01-02T00:00:00", "cost": 0.002}
+        with open(log_path, 'w') as f:
+            f.write(json.dumps(existing_data) + "\n")
+        
+        with patch.dict(os.environ, {"OPENROUTER_COST_LOG": log_path}):
+            log_cost_data(new_data)
+        
+        with open(log_path, 'r') as f:
+            logged_data = [json.loads(line) for line in f]
+        
+        assert logged_data == [existing_data, new_data]
+    
+    def test_log_cost_data_migrates_legacy_array(self, tmp_path):
+        """Test that an old JSON-array log is converted before appending."""
+        log_path = str(tmp_path / 'costs.json')
         existing_data = [{"timestamp": "2024-01-01T00:00:00", "cost": 0.001}]
         new_data = {"timestamp": "2024-01-02T00:00:00", "cost": 0.002}
+        with open(log_path, 'w') as f:
+            json.dump(existing_data, f, indent=2)
         
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
-            json.dump(existing_data, tmp_file)
-            tmp_file_path = tmp_file.name
+        with patch.dict(os.environ, {"OPENROUTER_COST_LOG": log_path}):
+            log_cost_data(new_data)
         
-        try:
-            with patch.dict(os.environ, {"OPENROUTER_COST_LOG": tmp_file_path}):
-                log_cost_data(new_data)
-                
-                # Check that data was appended
-                with open(tmp_file_path, 'r') as f:
-                    logged_data = json.load(f)
-                
-                assert len(logged_data) == 2
-                assert logged_data[0] == existing_data[0]
-                assert logged_data[1] == new_data
-        finally:
-            os.unlink(tmp_file_path)
-    
-    def test_log_cost_data_corrupted_file(self):
-        """Test handling of corrupted JSON file."""
+        with open(log_path, 'r') as f:
+            logged_data = [json.loads(line) for line in f]
+        
+        assert logged_data == [existing_data[0], new_data]
+    
+    def test_log_cost_data_corrupted_file(self, tmp_path):
+        """Test that a partial line left in the log does not swallow the new entry."""
+        log_path = str(tmp_path / 'costs.jsonl')
         cost_data = {"timestamp": "2024-01-01T00:00:00", "cost": 0.001}
+        with open(log_path, 'w') as f:
+            f.write("invalid json content")
         
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
-            tmp_file.write("invalid json content")
-            tmp_file_path = tmp_file.name
+        with patch.dict(os.environ, {"OPENROUTER_COST_LOG": log_path}):
+            log_cost_data(cost_data)
         
-        try:
-            with patch.dict(os.environ, {"OPENROUTER_COST_LOG": tmp_file_path}):
-                log_cost_data(cost_data)
-                
-                # Check that file was overwritten with new data
-                with open(tmp_file_path, 'r') as f:
-                    logged_data = json.load(f)
-                
-                assert len(logged_data) == 1
-                assert logged_data[0] == cost_data
-        finally:
-            os.unlink(tmp_file_path)
+        with open(log_path, 'r') as f:
+            lines = f.read().splitlines()
+        
+        assert lines[0] == "invalid json content"
+        assert json.loads(lines[1]) == cost_data
+
+
+class TestLatencyTelemetry:
+    """Test latency and throughput fields in cost entries."""
+    
+    def test_build_cost_entry_throughput(self):
+        """Test that throughput is measured over the time after the first token."""
+        entry = build_cost_entry("model", "openrouter", {"completion_tokens": 300, "total_tokens": 400},
+                                 "2024-01-01T00:00:00", 2.0, first_token_latency=0.5, retries=1, http_status=200)
+        
+        assert entry['tokens_per_second'] == 200.0
+        assert entry['latency'] == 2.0
+        assert entry['retries'] == 1
+        assert build_cost_entry("model", "openrouter", {}, "2024-01-01T00:00:00", 1.0)['tokens_per_second'] is None
+    
+    def test_complete_with_chain_records_retries_and_first_token(self):
+        """Test that failed providers count as retries and the first token time is kept."""
+        chain = [
+            {'name': 'primary', 'model': 'a/model', 'base_url': 'https://primary', 'api_key': 'k'},
+            {'name': 'backup', 'model': 'b/model', 'base_url': 'https://backup', 'api_key': 'k'},
+        ]
+        
+        def stream(target, messages, on_first_token, cancel_event, **kwargs):
+            if target['name'] == 'primary':
+                raise Exception("502 Bad Gateway")
+            on_first_token()
+            return {"content": "ok", "usage": {"completion_tokens": 10, "total_tokens": 20}, "http_status": 200}
+        
+        with patch('hedging.build_fallback_chain', return_value=chain):
+            with patch('hedging.stream_chat_completion', side_effect=stream):
+                with patch('llm.log_cost_data') as mock_log:
+                    assert complete_with_chain("Prompt", stage='extract') == "ok"
+        
+        logged = mock_log.call_args[0][0]
+        assert logged['model'] == 'b/model'
+        assert logged['retries'] == 1
+        assert logged['first_token_latency'] is not None
+        assert logged['http_status'] == 200
+        assert logged['stage'] == 'extract'
+
+    def test_provider_chain_without_openrouter(self, monkeypatch):
+        """Test that with OpenRouter off the chain holds only direct APIs, the requested one first."""
+        for key in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY"):
+            monkeypatch.setenv(key, "k")
+        monkeypatch.delenv("LLM_FALLBACK_CHAIN", raising=False)
+
+        chain = provider_chain('claude', use_openrouter=False)
+        routed = provider_chain('auto', 'gpt-4.1-nano', use_openrouter=False)
+
+        assert [(t['name'], t['model']) for t in chain] == [('anthropic', 'claude-3-7-sonnet-20250219'),
+                                                           ('openai', 'gpt-4.1-2025-04-14')]
+        assert (routed[0]['name'], routed[0]['model']) == ('openai', 'gpt-4.1-nano')
+        assert provider_chain('openai')[0]['name'] == 'openrouter'
+
+    def test_extraction_without_openrouter_is_routed_and_priced_direct(self, tmp_path, monkeypatch):
+        """Test that extraction with OpenRouter off uses a direct model for the call and the budget."""
+        from budget import Budget
+        from llm import build_incremental_content
+        monkeypatch.setenv("USE_OPENROUTER", "false")
+        monkeypatch.setenv("NEWSLETTER_EXTRACTS", str(tmp_path / 'extracts.json'))
+        newsletters = [{'id': 'm1', 'subject': 'N', 'sender': 's@example.com', 'date': '2024-01-01',
+                        'body': '<p>Story</p>', 'body_format': 'html'}]
+        reply = json.dumps({"stories": [{"title": "S", "summary": "A story.", "importance": 5, "links": []}]})
+        budget = Budget(max_cost=10.0)
+
+        with patch('llm.complete_with_chain', return_value=reply) as mock_extract, \
+                patch('budget.estimate_call', wraps=__import__('budget').estimate_call) as mock_estimate:
+            build_incremental_content(newsletters, provider='auto', budget=budget)
+
+        assert mock_extract.call_args[0][2] == 'gpt-4.1-nano'
+        assert mock_estimate.call_args[0][1] == 'gpt-4.1-nano'
 
 
 class TestAnalyzeWithFallback:
@@ -341,6 +919,80 @@ class TestAnalyzeWithFallback:
                 mock_openrouter.assert_called_once()
                 mock_direct.assert_called_once()
 
+    def test_analyze_with_fallback_leaves_environment_alone(self, monkeypatch):
+        """Test that the direct fallback does not flip USE_OPENROUTER for other threads."""
+        monkeypatch.delenv("USE_OPENROUTER", raising=False)
+        seen = []
+
+        def direct(*args, **kwargs):
+            seen.append(os.environ.get("USE_OPENROUTER"))
+            return "Fallback response"
+
+        with patch('llm.analyze_with_openrouter', side_effect=Exception("OpenRouter error")), \
+                patch('llm.analyze_with_llm_direct', side_effect=direct):
+            analyze_with_fallback("Test prompt")
+
+        assert seen == [None]
+
+    def test_analyze_with_fallback_records_provider_health(self, health_state):
+        """Test that call outcomes are persisted per provider and model."""
+        with patch('llm.analyze_with_openrouter', side_effect=Exception("OpenRouter error")):
+            with patch('llm.analyze_with_llm_direct', return_value="Fallback response"):
+                analyze_with_fallback("Test prompt")
+        
+        with open(health_state) as f:
+            saved = json.load(f)
+        assert saved["openrouter:openai/gpt-4.1-mini"]["consecutive_failures"] == 1
+        assert saved["openai:gpt-4.1-2025-04-14"]["outcomes"] == [1]
+
+    def test_analyze_with_fallback_skips_open_circuit(self, health_state):
+        """Test that a provider with an open circuit is skipped without being called."""
+        health = HealthStore(health_state)
+        for _ in range(3):
+            health.record_failure("openrouter:openai/gpt-4.1-mini", "timeout")
+        
+        with patch('llm.analyze_with_openrouter') as mock_openrouter:
+            with patch('llm.analyze_with_llm_direct', return_value="Direct response") as mock_direct:
+                result = analyze_with_fallback("Test prompt")
+        
+        assert result == "Direct response"
+        mock_openrouter.assert_not_called()
+        mock_direct.assert_called_once()
+
+    def test_analyze_with_fallback_all_circuits_open(self, health_state):
+        """Test that the run fails fast when every provider's circuit is open."""
+        health = HealthStore(health_state)
+        for _ in range(3):
+            health.record_failure("openrouter:openai/gpt-4.1-mini", "timeout")
+            health.record_failure("openai:gpt-4.1-2025-04-14", "timeout")
+        
+        with patch('llm.analyze_with_llm_direct') as mock_direct:
+            with pytest.raises(Exception, match="circuits open"):
+                analyze_with_fallback("Test prompt")
+        mock_direct.assert_not_called()
+
+
+    @patch.dict(os.environ, {"OPENROUTER_COST_LOG": "unused.json"})
+    def test_analyze_with_fallback_hedged(self):
+        """Test that hedged mode runs the provider chain and logs the winner's cost."""
+        result = {
+            'content': 'Hedged response', 'provider': 'openai', 'model': 'gpt-4.1-2025-04-14',
+            'latency': 1.5, 'first_token_latency': 0.4, 'hedged': 1,
+            'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+        }
+        with patch('hedging.build_fallback_chain') as mock_chain:
+            mock_chain.return_value = [{'name': 'openrouter'}, {'name': 'openai'}]
+            with patch('hedging.hedged_completion', return_value=result) as mock_hedged:
+                with patch('llm.log_cost_data') as mock_log:
+                    response = analyze_with_fallback("Test prompt", provider='claude', hedge=True, hedge_after=2.0)
+                    
+                    assert response == 'Hedged response'
+                    mock_chain.assert_called_once_with("anthropic/claude-sonnet-4")
+                    assert mock_hedged.call_args[1]['hedge_after'] == 2.0
+                    logged = mock_log.call_args[0][0]
+                    assert logged['provider'] == 'openai'
+                    assert logged['hedged'] == 1
+
 
 class TestCheckOpenrouterStatus:
     """Test the OpenRouter status checking function."""
@@ -363,7 +1015,7 @@ class TestCheckOpenrouterStatus:
             "rate_limit_remaining": "999"
         }
         
-        with patch('llm.requests.get') as mock_get:
+        with patch('requests.Session.get') as mock_get:
             mock_get.return_value = mock_response
             
             success, message = check_openrouter_status()
@@ -380,7 +1032,7 @@ class TestCheckOpenrouterStatus:
         mock_response.status_code = 401
         mock_response.text = "Unauthorized"
         
-        with patch('llm.requests.get') as mock_get:
+        with patch('requests.Session.get') as mock_get:
             mock_get.return_value = mock_response
             
             success, message = check_openrouter_status()
@@ -392,7 +1044,7 @@ class TestCheckOpenrouterStatus:
     @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test_key"})
     def test_check_openrouter_status_exception(self):
         """Test status check with network exception."""
-        with patch('llm.requests.get') as mock_get:
+        with patch('requests.Session.get') as mock_get:
             mock_get.side_effect = Exception("Network error")
             
             success, message = check_openrouter_status()
@@ -413,13 +1065,13 @@ class TestAnalyzeWithLlmDirect:
         
         with patch('llm.openai.OpenAI') as mock_openai:
             mock_client = MagicMock()
-            mock_client.chat.completions.create.return_value = mock_response
+            mock_client.chat.completions.with_raw_response.create.return_value = raw_response(mock_response)
             mock_openai.return_value = mock_client
             
             result = analyze_with_llm_direct("Test prompt", provider='openai')
             
             assert result == "OpenAI response"
-            mock_client.chat.completions.create.assert_called_once()
+            mock_client.chat.completions.with_raw_response.create.assert_called_once()
     
     def test_analyze_with_llm_direct_claude(self):
         """Test direct Claude API call."""
@@ -429,13 +1081,65 @@ class TestAnalyzeWithLlmDirect:
         
         with patch('llm.anthropic.Anthropic') as mock_anthropic:
             mock_client = MagicMock()
-            mock_client.messages.create.return_value = mock_response
+            mock_client.messages.with_raw_response.create.return_value = raw_response(mock_response)
             mock_anthropic.return_value = mock_client
             
             result = analyze_with_llm_direct("Test prompt", provider='claude')
             
             assert result == "Claude response"
-            mock_client.messages.create.assert_called_once()
+            mock_client.messages.with_raw_response.create.assert_called_once()
+    
+    def test_analyze_with_llm_direct_reuses_client(self):
+        """Test that repeated direct calls share one SDK client."""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "OpenAI response"
+        
+        with patch('llm.openai.OpenAI') as mock_openai:
+            mock_openai.return_value.chat.completions.with_raw_response.create.return_value = raw_response(mock_response)
+            
+            analyze_with_llm_direct("First prompt", provider='openai')
+            analyze_with_llm_direct("Second prompt", provider='openai')
+            
+            mock_openai.assert_called_once()
+            assert mock_openai.return_value.chat.completions.with_raw_response.create.call_count == 2
+    
+    def test_analyze_with_llm_direct_claude_continuation(self):
+        """Test that a Claude answer stopped at max_tokens is resumed from a prefill."""
+        first = MagicMock(stop_reason="max_tokens")
+        first.content = [MagicMock(text="Partial answer ")]
+        second = MagicMock(stop_reason="end_turn")
+        second.content = [MagicMock(text=" and the rest.")]
+        
+        with patch('llm.anthropic.Anthropic') as mock_anthropic:
+            mock_client = MagicMock()
+            mock_client.messages.with_raw_response.create.side_effect = [raw_response(first), raw_response(second)]
+            mock_anthropic.return_value = mock_client
+            
+            result = analyze_with_llm_direct("Test prompt", provider='claude')
+        
+        assert result == "Partial answer and the rest."
+        messages = mock_client.messages.with_raw_response.create.call_args[1]['messages']
+        assert messages[-1] == {"role": "assistant", "content": "Partial answer"}
+    
+    def test_direct_call_counts_sdk_and_failed_attempts(self, cost_log):
+        """Test that SDK retries and an earlier failed OpenRouter attempt are logged as retries."""
+        mock_response = MagicMock(stop_reason="end_turn")
+        mock_response.content = [MagicMock(text="Claude response")]
+        mock_response.usage.input_tokens = 100
+        mock_response.usage.output_tokens = 50
+        
+        with patch('llm.anthropic.Anthropic') as mock_anthropic:
+            mock_anthropic.return_value.messages.with_raw_response.create.return_value = raw_response(
+                mock_response, retries_taken=2)
+            with patch('llm.analyze_with_openrouter', side_effect=Exception("OpenRouter error")):
+                analyze_with_fallback("Test prompt", provider='claude')
+        
+        with open(cost_log) as f:
+            entry = json.loads(f.readline())
+        assert entry['direct'] is True
+        assert entry['retries'] == 3
+        assert entry['prompt_tokens'] == 100 and entry['cost'] > 0
     
     def test_analyze_with_llm_direct_default_provider(self):
         """Test that Claude is used as default provider."""
@@ -445,13 +1149,13 @@ class TestAnalyzeWithLlmDirect:
         
         with patch('llm.anthropic.Anthropic') as mock_anthropic:
             mock_client = MagicMock()
-            mock_client.messages.create.return_value = mock_response
+            mock_client.messages.with_raw_response.create.return_value = raw_response(mock_response)
             mock_anthropic.return_value = mock_client
             
             result = analyze_with_llm_direct("Test prompt")
             
             assert result == "Default response"
-            mock_client.messages.create.assert_called_once()
+            mock_client.messages.with_raw_response.create.assert_called_once()
 
 
 class TestTopicExtraction:
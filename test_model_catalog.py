@@ -0,0 +1,149 @@
+import pytest
+import json
+import os
+import tempfile
+from model_catalog import (
+    DEFAULT_MODEL_TABLE,
+    direct_model_table,
+    load_model_table,
+    refresh_model_table,
+    estimate_tokens,
+    estimate_cost,
+    fits_context,
+    model_price,
+    required_tier,
+    route_model,
+    usage_cost
+)
+
+
+TEST_TABLE = {
+    "cheap/small": {"context_window": 16000, "input_price": 0.05, "output_price": 0.10, "tier": 1},
+    "mid/large": {"context_window": 1000000, "input_price": 0.40, "output_price": 1.60, "tier": 2},
+    "mid/expensive": {"context_window": 1000000, "input_price": 1.00, "output_price": 4.00, "tier": 2},
+    "premium/model": {"context_window": 200000, "input_price": 3.00, "output_price": 15.00, "tier": 3},
+}
+
+
+class TestModelTable:
+    """Test loading and refreshing the local model table."""
+
+    def test_load_defaults_without_file(self):
+        """Test that the built-in table is used when no override file exists."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            table = load_model_table(os.path.join(tmpdir, 'missing.json'))
+
+        assert set(table) == set(DEFAULT_MODEL_TABLE)
+
+    def test_load_applies_overrides_and_disables(self):
+        """Test that overrides merge field by field and can disable models."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model_table.json')
+            with open(path, 'w') as f:
+                json.dump({
+                    "openai/gpt-4.1-mini": {"input_price": 0.5},
+                    "anthropic/claude-sonnet-4": {"enabled": False},
+                    "new/model": {"context_window": 8000, "input_price": 0.01, "output_price": 0.02, "tier": 1},
+                }, f)
+            table = load_model_table(path)
+
+        assert table["openai/gpt-4.1-mini"]["input_price"] == 0.5
+        assert table["openai/gpt-4.1-mini"]["tier"] == 2
+        assert "anthropic/claude-sonnet-4" not in table
+        assert "new/model" in table
+
+    def test_refresh_from_openrouter_listing(self):
+        """Test refreshing prices and context windows for known models only."""
+        listing = {"data": [
+            {"id": "openai/gpt-4.1-mini", "context_length": 500000,
+             "pricing": {"prompt": "0.0000005", "completion": "0.000002"}},
+            {"id": "unknown/model", "context_length": 1000, "pricing": {"prompt": "0.1"}},
+        ]}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(tmpdir, 'models.json')
+            path = os.path.join(tmpdir, 'model_table.json')
+            with open(source, 'w') as f:
+                json.dump(listing, f)
+            refresh_model_table(source, path)
+            table = load_model_table(path)
+
+        assert table["openai/gpt-4.1-mini"]["context_window"] == 500000
+        assert table["openai/gpt-4.1-mini"]["input_price"] == pytest.approx(0.5)
+        assert table["openai/gpt-4.1-mini"]["output_price"] == pytest.approx(2.0)
+        assert "unknown/model" not in table
+
+
+class TestEstimates:
+    """Test local token and cost estimation."""
+
+    def test_estimate_tokens(self):
+        """Test the four-characters-per-token estimate."""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("abcde") == 2
+
+    def test_estimate_cost(self):
+        """Test cost estimation from per-million prices."""
+        entry = {"input_price": 2.0, "output_price": 8.0}
+        assert estimate_cost(entry, 1_000_000, 500_000) == pytest.approx(6.0)
+
+    def test_fits_context_keeps_headroom(self):
+        """Test that the safety margin is kept free in the context window."""
+        entry = {"context_window": 10000}
+        assert fits_context(entry, 8000, 1000)
+        assert not fits_context(entry, 9000, 500)
+
+    def test_model_price_known_and_unknown(self):
+        """Test table, direct-API and worst-case pricing."""
+        assert model_price("mid/large", TEST_TABLE) == {"input_price": 0.40, "output_price": 1.60, "known": True}
+        assert model_price("gpt-4.1-2025-04-14", TEST_TABLE)["known"]
+
+        unknown = model_price("unknown/model", TEST_TABLE)
+        assert not unknown["known"]
+        assert unknown["input_price"] == 3.00
+        assert unknown["output_price"] == 15.00
+
+    def test_required_tier_scales_with_size(self):
+        """Test that larger prompts require a higher tier."""
+        assert required_tier(1000) == 1
+        assert required_tier(50000) == 2
+
+
+class TestRouteModel:
+    """Test automatic model routing."""
+
+    def test_small_prompt_uses_cheapest_model(self):
+        """Test that a small digest goes to the budget model."""
+        decision = route_model("x" * 4000, num_topics=5, table=TEST_TABLE)
+
+        assert decision["model"] == "cheap/small"
+        assert decision["estimated_input_tokens"] == 1000
+        assert decision["estimated_output_tokens"] == 1500
+
+    def test_large_prompt_skips_small_context(self):
+        """Test that a large prompt moves to the cheapest model with enough context and tier."""
+        decision = route_model("x" * 400000, table=TEST_TABLE)
+
+        assert decision["model"] == "mid/large"
+        assert decision["min_tier"] == 2
+        assert decision["estimated_cost"] == pytest.approx((100000 * 0.40 + 3000 * 1.60) / 1_000_000)
+
+    def test_min_tier_is_respected(self):
+        """Test that an explicit minimum tier excludes cheaper models."""
+        decision = route_model("x" * 4000, min_tier=3, table=TEST_TABLE)
+
+        assert decision["model"] == "premium/model"
+
+    def test_direct_table_routes_to_direct_models(self):
+        """Test that routing without OpenRouter picks a model with a direct client, cheapest first."""
+        small = route_model("x" * 4000, table=direct_model_table())
+        premium = route_model("x" * 4000, min_tier=3, table=direct_model_table())
+
+        assert (small["model"], small["provider"]) == ("gpt-4.1-nano", "openai")
+        assert (premium["model"], premium["provider"]) == ("gpt-4.1-2025-04-14", "openai")
+        assert usage_cost("gpt-4.1-nano", 1_000_000, 0) == pytest.approx(0.10)
+
+    def test_no_model_fits(self):
+        """Test that an error is raised when nothing fits."""
+        with pytest.raises(ValueError, match="No configured model fits"):
+            route_model("x" * 4000, min_tier=3, table={"cheap/small": TEST_TABLE["cheap/small"]})
@@ -0,0 +1,182 @@
+import pytest
+import threading
+import time
+from unittest.mock import patch
+from pipeline import (
+    ChunkedAnalysis,
+    Pipeline,
+    release_raw_body,
+    run_newsletter_pipeline
+)
+from test_fetch_api import DummyService
+
+
+def html_newsletter(i):
+    return {
+        'id': str(i),
+        'subject': f"Issue {i}",
+        'sender': f"Source {i} <news@source{i}.com>",
+        'date': 'Mon, 1 Jan 2024 10:00:00 +0000',
+        'body': f"<html><body><p>Story number {i}</p></body></html>",
+        'body_format': 'html',
+    }
+
+
+class TestPipeline:
+    """Test the generic bounded-queue runner."""
+
+    def test_items_flow_through_all_stages(self):
+        """Test that every item passes the thread and process stages and stats are kept."""
+        results = []
+        pipeline = Pipeline(queue_size=4)
+        pipeline.thread_stage('upper', str.upper, workers=3)
+        pipeline.process_stage('length', len, workers=2, args=lambda item: (item,),
+                               apply=lambda item, result: (item, result))
+
+        stats = pipeline.run([f"item{i}" for i in range(20)], results.append)
+
+        assert sorted(results) == sorted((f"ITEM{i}", len(f"item{i}")) for i in range(20))
+        assert [stage['stage'] for stage in stats] == ['source', 'upper', 'length', 'sink']
+        assert all(stage['items'] == 20 for stage in stats)
+        assert stats[2]['peak_rss_mb'] > 0
+
+    def test_backpressure_bounds_items_in_flight(self):
+        """Test that a slow sink stops the source from running ahead."""
+        produced = []
+        consumed = []
+        lock = threading.Lock()
+
+        def source():
+            for i in range(60):
+                with lock:
+                    produced.append(i)
+                yield i
+
+        def slow_sink(item):
+            time.sleep(0.002)
+            with lock:
+                consumed.append(item)
+                in_flight.append(len(produced) - len(consumed))
+
+        in_flight = []
+        pipeline = Pipeline(queue_size=2)
+        pipeline.thread_stage('pass', lambda item: item, workers=2)
+
+        stats = pipeline.run(source(), slow_sink)
+
+        assert len(consumed) == 60
+        # Two queues of two, two workers holding one item each, and the item being produced
+        assert max(in_flight) <= 7
+        assert stats[0]['blocked_seconds'] > 0
+
+    def test_stage_error_is_raised(self):
+        """Test that a failing stage stops the run and its error reaches the caller."""
+        def fail_on_five(item):
+            if item == 5:
+                raise ValueError("bad item")
+            return item
+
+        pipeline = Pipeline(queue_size=2)
+        pipeline.thread_stage('check', fail_on_five, workers=2)
+
+        with pytest.raises(ValueError, match="bad item"):
+            pipeline.run(range(1000), lambda item: None)
+
+
+class TestChunkedAnalysis:
+    """Test chunked analysis in the pipeline sink."""
+
+    def test_single_chunk_runs_one_analysis(self):
+        """Test that newsletters fitting one chunk get the usual single analysis."""
+        calls = []
+        sink = ChunkedAnalysis(lambda group: calls.append(list(group)) or ("text", ["T"]),
+                               lambda partials: pytest.fail("no merge expected"), lambda nl: 10, chunk_tokens=100)
+        for i in range(5):
+            sink({'n': i})
+
+        assert sink.finish() == ("text", ["T"])
+        assert len(calls) == 1 and len(calls[0]) == 5
+        assert sink.chunks == [5]
+
+    def test_full_chunks_are_analyzed_and_merged(self):
+        """Test that chunks are dispatched as they fill and the partials merged."""
+        merged = []
+        sink = ChunkedAnalysis(lambda group: (f"partial of {len(group)}", []),
+                               lambda partials: merged.append(partials) or ("merged", ["M"]),
+                               lambda nl: 40, chunk_tokens=100)
+        for i in range(5):
+            sink({'n': i})
+
+        assert sink.finish() == ("merged", ["M"])
+        assert sink.chunks == [2, 2, 1]
+        assert merged == [["partial of 2", "partial of 2", "partial of 1"]]
+
+
+class TestRunNewsletterPipeline:
+    """Test the fetch, clean and analyze pipeline."""
+
+    def test_loaded_newsletters_are_cleaned_and_analyzed(self):
+        """Test that raw bodies are replaced by Markdown and the analysis sees every newsletter in order."""
+        newsletters = [html_newsletter(i) for i in range(6)]
+        run_info = {}
+
+        with patch('llm.analyze_newsletters_unified', return_value=("### 1. Topic\n", ["Topic"])) as mock_analyze:
+            result, analysis, topics = run_newsletter_pipeline(
+                newsletters=newsletters, analysis_options={'num_topics': 3}, run_info=run_info, clean_workers=2
+            )
+
+        assert analysis == "### 1. Topic\n" and topics == ["Topic"]
+        analyzed = mock_analyze.call_args[0][0]
+        assert [nl['id'] for nl in analyzed] == [str(i) for i in range(6)]
+        assert [nl['id'] for nl in result] == [str(i) for i in range(6)]
+        assert '<p>' not in result[0]['body'] and 'Story number 0' in result[0]['content']
+        assert result[0]['body_format'] == 'markdown'
+        assert '_position' not in result[0]
+        assert [stage['stage'] for stage in run_info['pipeline']['stages']] == ['load', 'clean', 'analyze']
+
+    def test_fetches_with_one_client_per_thread(self):
+        """Test fetching message ids through the thread pool."""
+        messages = [{'id': str(i), 'subject': f"Test {i}", 'date': 'Mon, 1 Jan 2024 10:00:00 +0000',
+                     'from': f"s{i}@example.com", 'to': 'me@example.com'} for i in range(10)]
+        clients = []
+
+        def service_factory():
+            clients.append(threading.get_ident())
+            return DummyService(messages)
+
+        with patch('llm.analyze_newsletters_unified', return_value=("", [])):
+            result, _, _ = run_newsletter_pipeline(
+                message_ids=[m['id'] for m in messages], service_factory=service_factory, fetch_workers=3,
+                clean_workers=1, chunk_tokens=10 ** 6
+            )
+
+        assert [nl['subject'] for nl in result] == [f"Test {i}" for i in range(10)]
+        assert len(clients) == len(set(clients)) <= 3
+
+    def test_small_chunks_are_merged(self):
+        """Test that chunked runs merge the partial analyses and keep each chunk's call details apart."""
+        newsletters = [html_newsletter(i) for i in range(4)]
+        run_info = {}
+
+        def analyze(group, run_info=None, **options):
+            run_info['model'] = f"model-{group[0]['id']}"
+            return "partial", []
+
+        with patch('llm.analyze_newsletters_unified', side_effect=analyze) as mock_analyze, \
+                patch('llm.merge_partial_analyses', return_value=("merged", ["M"])) as mock_merge:
+            _, analysis, topics = run_newsletter_pipeline(newsletters=newsletters, chunk_tokens=1, clean_workers=1,
+                                                          run_info=run_info)
+
+        assert (analysis, topics) == ("merged", ["M"])
+        assert mock_analyze.call_count == 4
+        assert mock_merge.call_args[0][0] == ["partial"] * 4
+        assert mock_merge.call_args[1]['run_info'] is run_info
+        assert run_info['pipeline']['chunks'] == [{"newsletters": 1, "model": f"model-{i}"} for i in range(4)]
+        assert 'model' not in run_info
+
+
+def test_release_raw_body():
+    """Test that the cleaned text replaces the raw body."""
+    nl = release_raw_body({'body': '<p>x</p>', 'body_format': 'html'}, 'x')
+
+    assert nl == {'body': 'x', 'content': 'x', 'body_format': 'markdown'}
@@ -0,0 +1,172 @@
+import pytest
+import json
+import os
+from unittest.mock import patch
+import publish
+from publish import (
+    INDEX_END,
+    INDEX_START,
+    entry_from_file,
+    load_state,
+    publish_report,
+    rebuild
+)
+
+
+def write_report(site_dir, day, minute=0, topics=('Topic A', 'Topic B')):
+    """Write a report file as save_report names it and return its path."""
+    filename = f"ai_newsletter_summary_202401{day:02d}_10{minute:02d}_from_20240101.md"
+    path = os.path.join(site_dir, filename)
+    body = "".join(f"### {i}. {topic}\nText\n\n" for i, topic in enumerate(topics, 1))
+    with open(path, 'w') as f:
+        f.write(f"---\nlayout: default\ntitle: Report\n---\n\n# DEFI NEWSLETTER SUMMARY\n\n{body}")
+    return path
+
+
+def read(site_dir, name):
+    with open(os.path.join(site_dir, name)) as f:
+        return f.read()
+
+
+@pytest.fixture
+def site_dir(tmp_path):
+    """An empty site directory with a hand-written index."""
+    (tmp_path / 'index.md').write_text("# My Site\n\nIntro text.\n\n## Latest Reports\n\n- old hand-written link\n")
+    return str(tmp_path)
+
+
+class TestPublishReport:
+    """Test publishing one report at a time."""
+
+    def test_first_report(self, site_dir):
+        """Test that the index, latest pages, archive and manifest are created."""
+        path = write_report(site_dir, 2)
+
+        assert publish_report(site_dir, path)
+
+        index = read(site_dir, 'index.md')
+        assert index.startswith("# My Site\n\nIntro text.")
+        assert "old hand-written link" not in index
+        assert INDEX_START in index and INDEX_END in index
+        assert f"(./{os.path.basename(path)})" in index
+        assert "- Topic A" in index
+        latest = read(site_dir, 'latest-report.md')
+        assert "title: Latest DeFi Newsletter Summary" in latest
+        assert latest.count("---\nlayout") == 1
+        assert read(site_dir, 'report.md') == latest
+        assert os.path.basename(path) in read(site_dir, 'archive/1.md')
+        assert len(read(site_dir, '_published.jsonl').splitlines()) == 1
+
+    def test_index_keeps_text_around_block(self, site_dir):
+        """Test that later publishes only replace the generated block."""
+        publish_report(site_dir, write_report(site_dir, 2))
+        with open(os.path.join(site_dir, 'index.md'), 'a') as f:
+            f.write("\nFooter text\n")
+
+        publish_report(site_dir, write_report(site_dir, 3))
+
+        index = read(site_dir, 'index.md')
+        assert index.count(INDEX_START) == 1
+        assert index.endswith("Footer text\n")
+        assert "### Previous Reports" in index
+
+    def test_republish_is_skipped(self, site_dir):
+        """Test that publishing the newest report again changes nothing."""
+        path = write_report(site_dir, 2)
+        publish_report(site_dir, path)
+
+        assert not publish_report(site_dir, path)
+        assert load_state(site_dir)["count"] == 1
+
+    def test_republish_of_an_older_report_is_skipped(self, site_dir):
+        """Test that a report that has left the newest archive page is still recognised."""
+        first = write_report(site_dir, 1)
+        with patch('publish.PAGE_SIZE', 2):
+            for path in [first] + [write_report(site_dir, day) for day in (2, 3)]:
+                publish_report(site_dir, path)
+
+            assert not publish_report(site_dir, first)
+        state = load_state(site_dir)
+        assert state["count"] == 3
+        assert state["published"][os.path.basename(first)] == 1
+
+    def test_state_without_index_is_migrated(self, site_dir):
+        """Test that a state written before the name index gets it from the manifest."""
+        path = write_report(site_dir, 2)
+        publish_report(site_dir, path)
+        state_path = os.path.join(site_dir, '_publish_state.json')
+        with open(state_path) as f:
+            state = json.load(f)
+        del state["published"]
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+
+        assert load_state(site_dir)["published"] == {os.path.basename(path): 1}
+        assert not publish_report(site_dir, path)
+
+    def test_only_affected_pages_are_written(self, site_dir):
+        """Test that a report rewrites the newest archive page, plus the previous one on rollover."""
+        with patch('publish.PAGE_SIZE', 2):
+            for day in (1, 2, 3):
+                publish_report(site_dir, write_report(site_dir, day))
+            with patch('publish._write_atomic', wraps=publish._write_atomic) as mock_write:
+                publish_report(site_dir, write_report(site_dir, 4))
+            written = sorted(os.path.relpath(call.args[0], site_dir) for call in mock_write.call_args_list)
+            with patch('publish._write_atomic', wraps=publish._write_atomic) as mock_write:
+                publish_report(site_dir, write_report(site_dir, 5))
+            rolled = sorted(os.path.relpath(call.args[0], site_dir) for call in mock_write.call_args_list)
+
+        assert written == ['_publish_state.json', 'archive/2.md', 'index.md', 'latest-report.md', 'report.md']
+        assert rolled == ['_publish_state.json', 'archive/2.md', 'archive/3.md', 'index.md',
+                          'latest-report.md', 'report.md']
+        assert "[Newer reports](./3.md)" in read(site_dir, 'archive/2.md')
+        assert "[Older reports](./2.md)" in read(site_dir, 'archive/3.md')
+        assert len(load_state(site_dir)["recent"]) == 2
+
+    def test_failed_publish_leaves_no_manifest_entry(self, site_dir):
+        """Test that a publish failing while writing pages adds no manifest entry and can be retried."""
+        path = write_report(site_dir, 2)
+        with patch('publish._write_atomic', side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                publish_report(site_dir, path)
+
+        assert not os.path.exists(os.path.join(site_dir, '_published.jsonl'))
+        assert publish_report(site_dir, path)
+        assert len(read(site_dir, '_published.jsonl').splitlines()) == 1
+
+    def test_entry_from_model(self, site_dir):
+        """Test that a report model supplies the entry's sources count and topics."""
+        path = write_report(site_dir, 2)
+        model = {"run_at": "2024-01-02T10:00:00", "period_start": "2024-01-01T00:00:00+00:00",
+                 "period_end": "2024-01-02T09:00:00+00:00", "newsletter_count": 8,
+                 "sections": [{"title": "Model Topic", "markdown": ""}], "topics": []}
+
+        publish_report(site_dir, path, model=model, markdown="# Report\n")
+
+        entry = json.loads(read(site_dir, '_published.jsonl'))
+        assert entry["newsletters"] == 8 and entry["topics"] == ["Model Topic"]
+        assert "**Sources:** 8 newsletters analyzed" in read(site_dir, 'index.md')
+
+
+class TestRebuild:
+    """Test rebuilding the site from existing reports."""
+
+    def test_rebuild_matches_incremental(self, tmp_path):
+        """Test that a rebuild produces the same pages as publishing one by one."""
+        incremental, rebuilt = tmp_path / 'incremental', tmp_path / 'rebuilt'
+        incremental.mkdir()
+        rebuilt.mkdir()
+        with patch('publish.PAGE_SIZE', 2):
+            for day in range(1, 6):
+                publish_report(str(incremental), write_report(str(incremental), day))
+                write_report(str(rebuilt), day)
+            assert rebuild(str(rebuilt), page_size=2) == 5
+
+        for name in ('index.md', 'latest-report.md', '_published.jsonl', 'archive/1.md', 'archive/2.md',
+                     'archive/3.md'):
+            assert read(str(rebuilt), name) == read(str(incremental), name)
+
+    def test_entry_from_file_rejects_other_files(self, tmp_path):
+        """Test that only report file names are accepted."""
+        with pytest.raises(ValueError):
+            entry_from_file(str(tmp_path / 'notes.md'))
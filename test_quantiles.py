@@ -0,0 +1,65 @@
+import pytest
+import random
+from quantiles import P2Quantile, StreamingPercentiles
+
+
+def exact(samples, p):
+    ordered = sorted(samples)
+    rank = p * (len(ordered) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class TestP2Quantile:
+    """Test the P² streaming quantile estimator."""
+
+    @pytest.mark.parametrize("p", [0.5, 0.95, 0.99])
+    def test_estimate_close_to_exact(self, p):
+        """Test that the estimate is close to the exact quantile of a skewed distribution."""
+        rng = random.Random(42)
+        samples = [rng.lognormvariate(2, 0.6) for _ in range(20000)]
+        estimator = P2Quantile(p)
+        for x in samples:
+            estimator.add(x)
+
+        assert estimator.value() == pytest.approx(exact(samples, p), rel=0.05)
+
+    def test_small_sample_is_exact(self):
+        """Test that up to five samples give the exact interpolated quantile."""
+        estimator = P2Quantile(0.5)
+        assert estimator.value() is None
+        for x in [5, 1, 3, 2]:
+            estimator.add(x)
+
+        assert estimator.value() == 2.5
+
+    def test_sorted_input(self):
+        """Test that monotonically increasing input is tracked."""
+        estimator = P2Quantile(0.95)
+        for x in range(1, 1001):
+            estimator.add(x)
+
+        assert estimator.value() == pytest.approx(950, rel=0.02)
+
+    def test_invalid_quantile(self):
+        """Test that quantiles outside (0, 1) are rejected."""
+        with pytest.raises(ValueError):
+            P2Quantile(1.5)
+
+
+class TestStreamingPercentiles:
+    """Test the multi-percentile wrapper."""
+
+    def test_values(self):
+        """Test that every requested percentile is reported with constant state."""
+        stats = StreamingPercentiles((50, 99))
+        for x in range(10000):
+            stats.add(x % 100)
+
+        values = stats.values()
+
+        assert stats.count == 10000
+        assert values[50] == pytest.approx(50, abs=3)
+        assert values[99] == pytest.approx(99, abs=2)
+        assert all(len(e.heights) == 5 for e in stats.estimators.values())
@@ -0,0 +1,149 @@
+import pytest
+import numpy as np
+from scipy import sparse
+from ranking import (
+    tokenize,
+    build_tfidf_matrix,
+    prune_rows,
+    source_coverage,
+    recency_scores,
+    rank_story_blocks,
+    select_within_budget,
+    prerank_newsletter_content
+)
+
+
+LAUNCH = (
+    "OpenAI launched GPT-5 with a 400k token context window, revised API pricing for developers "
+    "and a new reasoning mode that the company says halves hallucinations on factual benchmarks "
+    "while remaining available to ChatGPT Plus subscribers."
+)
+LAUNCH_REWORDED = (
+    "GPT-5 is here: OpenAI launched the model with a 400k token context window and revised API "
+    "pricing for developers, plus a reasoning mode the company says halves hallucinations on "
+    "factual benchmarks for ChatGPT Plus subscribers."
+)
+GARDEN = (
+    "Spring is a good season for planting tomatoes in raised beds with plenty of compost, steady "
+    "watering and full sunlight, and patient gardeners are rewarded with a generous harvest by "
+    "the middle of summer in most temperate climates."
+)
+SPONSOR = (
+    "Try our productivity suite free for thirty days and discover why thousands of teams rely on "
+    "calendar sync, shared task boards and automated reminders to stay organized across every "
+    "project without juggling tabs or spreadsheets anymore."
+)
+
+
+def _newsletter(content, sender, date='Mon, 01 Jan 2024 12:00:00 +0000'):
+    return {'content': content, 'sender': sender, 'date': date}
+
+
+class TestTfidf:
+    """Test the sparse TF-IDF construction."""
+
+    def test_tokenize_drops_stopwords(self):
+        """Test that stopwords and single characters are removed."""
+        assert tokenize("The GPT-5 model is here, a big deal") == ['gpt-5', 'model', 'big', 'deal']
+
+    def test_rows_are_l2_normalized(self):
+        """Test that every non-empty row has unit length."""
+        tfidf, idf, vocabulary = build_tfidf_matrix([LAUNCH, GARDEN, SPONSOR])
+
+        assert sparse.issparse(tfidf)
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        assert np.allclose(norms, 1.0)
+        assert len(idf) == len(vocabulary) == tfidf.shape[1]
+
+    def test_prune_rows_keeps_top_terms(self):
+        """Test that pruning keeps the strongest entries per row."""
+        matrix = sparse.csr_matrix(np.array([[0.1, 0.5, 0.3, 0.0], [0.0, 0.0, 0.2, 0.9]]))
+        pruned = prune_rows(matrix, 2)
+
+        assert pruned[0].nnz == 2
+        assert set(pruned[0].indices) == {1, 2}
+        assert set(pruned[1].indices) == {2, 3}
+        assert np.isclose(pruned[0].multiply(pruned[0]).sum(), 1.0)
+
+
+class TestScoring:
+    """Test story block scoring signals."""
+
+    def test_source_coverage_counts_other_sources(self):
+        """Test that coverage counts distinct other sources with a similar block."""
+        tfidf, _, _ = build_tfidf_matrix([LAUNCH, LAUNCH_REWORDED, GARDEN, LAUNCH])
+        coverage = source_coverage(tfidf, np.array([0, 1, 2, 0]), 3)
+
+        assert coverage.tolist() == [1, 1, 0, 1]
+
+    def test_recency_scores_decay_with_age(self):
+        """Test that older newsletters score lower and unknown dates are neutral."""
+        scores = recency_scores([100 * 3600.0, 52 * 3600.0, None], half_life_hours=48)
+
+        assert scores[0] == pytest.approx(1.0)
+        assert scores[1] == pytest.approx(0.5)
+        assert scores[2] == pytest.approx(0.5)
+
+    def test_rank_prefers_multi_source_stories(self):
+        """Test that a story covered by two sources outranks single-source blocks."""
+        newsletters = [
+            _newsletter(f"{LAUNCH}\n\n---\n\n{SPONSOR}", 'The Neuron <hi@theneurondaily.com>'),
+            _newsletter(f"{GARDEN}\n\n---\n\n{LAUNCH_REWORDED}", 'TLDR AI <dan@tldr.tech>'),
+        ]
+        ranked = rank_story_blocks(newsletters)
+
+        assert len(ranked) == 4
+        assert {ranked[0]['text'], ranked[1]['text']} == {LAUNCH, LAUNCH_REWORDED}
+        assert ranked[0]['sources'] == 2
+
+    def test_rank_respects_dedup_annotations(self):
+        """Test that coverage counts from story deduplication are honoured."""
+        newsletters = [
+            _newsletter(f"[Covered by 3 sources: A, B, C]\n{GARDEN}", 'A <a@example.com>'),
+            _newsletter(SPONSOR, 'D <d@example.com>'),
+        ]
+        ranked = rank_story_blocks(newsletters)
+
+        assert ranked[0]['sources'] == 3
+
+    def test_rank_empty_input(self):
+        """Test that newsletters without story blocks rank to nothing."""
+        assert rank_story_blocks([_newsletter("", 'A <a@example.com>')]) == []
+
+
+class TestBudgetSelection:
+    """Test filling the prompt budget."""
+
+    def test_budget_is_respected(self):
+        """Test that selected blocks fit inside the token budget."""
+        newsletters = [
+            _newsletter(f"{LAUNCH}\n\n---\n\n{SPONSOR}", 'The Neuron <hi@theneurondaily.com>'),
+            _newsletter(f"{GARDEN}\n\n---\n\n{LAUNCH_REWORDED}", 'TLDR AI <dan@tldr.tech>'),
+        ]
+        budget = len(LAUNCH) // 4 + len(GARDEN) // 4 + 2
+        selected = select_within_budget(rank_story_blocks(newsletters), budget)
+
+        assert sum(len(b['text']) // 4 + 1 for b in selected) <= budget
+        assert any('GPT-5' in b['text'] for b in selected)
+
+    def test_redundant_copies_are_skipped(self):
+        """Test that exact copies of a selected block do not use the budget twice."""
+        newsletters = [
+            _newsletter(LAUNCH, 'The Neuron <hi@theneurondaily.com>'),
+            _newsletter(LAUNCH, 'TLDR AI <dan@tldr.tech>'),
+            _newsletter(GARDEN, 'Garden Weekly <hi@garden.com>'),
+        ]
+        selected = select_within_budget(rank_story_blocks(newsletters), 10000)
+
+        assert [b['text'] for b in selected].count(LAUNCH) == 1
+
+    def test_prerank_newsletter_content_keeps_order(self):
+        """Test that content is regrouped per newsletter in document order."""
+        newsletters = [
+            _newsletter(f"{LAUNCH}\n\n---\n\n{SPONSOR}", 'The Neuron <hi@theneurondaily.com>'),
+            _newsletter(GARDEN, 'Garden Weekly <hi@garden.com>'),
+        ]
+        contents = prerank_newsletter_content(newsletters, budget_tokens=10000)
+
+        assert contents[0] == f"{LAUNCH}\n\n{SPONSOR}"
+        assert contents[1] == GARDEN
@@ -4,7 +4,25 @@ import os
 import tempfile
 import datetime
 from unittest.mock import patch, mock_open, MagicMock
-from report import generate_report
+from report import (
+    build_report_model,
+    generate_report,
+    index_senders,
+    parse_formats,
+    render_markdown,
+    render_report
+)
+from timeline import parse_timestamp
+from websites import reset_resolvers
+
+
+@pytest.fixture(autouse=True)
+def fresh_website_cache():
+    """Load the website cache and parse dates anew in every test."""
+    reset_resolvers()
+    parse_timestamp.cache_clear()
+    yield
+    reset_resolvers()
 
 
 class TestGenerateReport:
@@ -104,14 +122,11 @@ class TestGenerateReport:
             mock_datetime.strftime = datetime.datetime.strftime
             mock_datetime.timedelta = datetime.timedelta
             
-            with patch('report.parsedate_to_datetime') as mock_parse:
-                mock_parse.return_value = recent_date
-                
-                with patch('builtins.open', mock_open(read_data='{}')):
-                    with patch('os.path.exists', return_value=False):
-                        report, _ = generate_report(
-                            newsletters, [], "Test analysis", 7
-                        )
+            with patch('builtins.open', mock_open(read_data='{}')):
+                with patch('os.path.exists', return_value=False):
+                    report, _ = generate_report(
+                        newsletters, [], "Test analysis", 7
+                    )
         
         # Check breaking news section
         assert "## JUST IN: LATEST DEVELOPMENTS" in report
@@ -406,14 +421,11 @@ class TestGenerateReport:
             mock_datetime.strftime = datetime.datetime.strftime
             mock_datetime.timedelta = datetime.timedelta
             
-            with patch('report.parsedate_to_datetime') as mock_parse:
-                mock_parse.return_value = recent_date
-                
-                with patch('builtins.open', mock_open(read_data='{}')):
-                    with patch('os.path.exists', return_value=False):
-                        report, _ = generate_report(
-                            newsletters, [], "Test analysis", 7
-                        )
+            with patch('builtins.open', mock_open(read_data='{}')):
+                with patch('os.path.exists', return_value=False):
+                    report, _ = generate_report(
+                        newsletters, [], "Test analysis", 7
+                    )
         
         # Check that subjects were cleaned
         assert "🔥 **New AI Model Released**" in report
@@ -477,4 +489,124 @@ class TestGenerateReport:
         
         # Check that report handles empty newsletters gracefully
         assert "# AI NEWSLETTER SUMMARY" in report
-        assert "0 newsletters across 0 sources" in report
\ No newline at end of file
+        assert "0 newsletters across 0 sources" in report
+
+class TestSenderIndex:
+    """Test the single-pass sender index."""
+
+    def test_index_senders_counts_and_order(self):
+        """Test counts, first issue per sender and most-common ordering."""
+        newsletters = [
+            {'sender': 'A <a@a.com>', 'body': 'first a'},
+            {'sender': 'B <b@b.com>', 'body': 'first b'},
+            {'sender': 'B <b@b.com>', 'body': 'second b'},
+            {'sender': 'C <c@c.com>', 'body': 'first c'},
+        ]
+
+        sources = index_senders(newsletters)
+
+        assert [sender for sender, _ in sources] == ['B <b@b.com>', 'A <a@a.com>', 'C <c@c.com>']
+        assert sources[0][1][0] == 2
+        assert sources[0][1][1]['body'] == 'first b'
+
+
+class TestReportModel:
+    """Test building the report model and rendering it in several formats."""
+
+    newsletters = [
+        {
+            'subject': '[AI] Daily: Lab launches new model',
+            'sender': 'The Neuron <news@theneurondaily.com>',
+            'date': 'Tue, 02 Jan 2024 09:00:00 +0000',
+            'body': '<p>Read more</p>'
+        },
+        {
+            'subject': 'Weekly roundup',
+            'sender': 'Other Letter <hello@other.example.com>',
+            'date': 'Mon, 01 Jan 2024 08:00:00 +0000',
+            'body': '<p>Visit https://other.example.com/ now</p>'
+        },
+    ]
+    analysis = "### 1. New Model\n- **What's New:** A <b>faster</b> model\n\n### 2. Agents\n- Tools"
+    model_info = {"model": "test/model", "timestamp": "2024-01-02T10:00:00"}
+
+    @pytest.fixture(autouse=True)
+    def website_cache(self, tmp_path, monkeypatch):
+        """Keep the website cache in a temporary directory."""
+        monkeypatch.chdir(tmp_path)
+
+    def build(self, **kwargs):
+        return build_report_model(self.newsletters, ['New Model', 'Agents'], self.analysis, 7,
+                                  self.model_info, **kwargs)
+
+    def test_model_contents(self):
+        """Test sections, sources and breaking news in the model."""
+        model = self.build()
+
+        assert [section['title'] for section in model['sections']] == ['New Model', 'Agents']
+        assert model['sources'][0] == {'name': 'The Neuron', 'url': 'https://www.theneurondaily.com', 'issues': 1}
+        assert model['breaking_news'][0]['highlight']
+        assert model['generated_with'] == 'test/model'
+
+    def test_structured_topics_become_sections(self):
+        """Test that structured topics are used for the sections instead of parsing the Markdown."""
+        topic = {"headline": "Structured Topic", "whats_new": "News.", "why_it_matters": "Matters.",
+                 "actions": ["Try it"], "sources": ["The Neuron"],
+                 "links": [{"title": "Post", "url": "https://example.com/post"}]}
+
+        model = self.build(structured_topics=[topic])
+
+        section, = model['sections']
+        assert section['title'] == 'Structured Topic'
+        assert section['actions'] == ['Try it']
+        assert section['links'] == [{"title": "Post", "url": "https://example.com/post"}]
+        assert section['markdown'].startswith("- **What's New:** News.")
+
+    def test_breaking_news_toggle_applied_in_model(self):
+        """Test that a disabled section is left out of the model and every format."""
+        model = self.build(breaking_news_section=False)
+        rendered = render_report(model, ['md', 'html'])
+
+        assert model['breaking_news'] == []
+        assert 'JUST IN' not in rendered['md'] and 'JUST IN' not in rendered['html']
+        assert '## NEWSLETTER SOURCES' in rendered['md']
+        assert '## METHODOLOGY' in rendered['md']
+
+    def test_markdown_front_matter(self):
+        """Test that Jekyll front matter is added on request only."""
+        model = self.build()
+
+        assert render_markdown(model, front_matter=True).startswith('---\nlayout: default\n')
+        assert render_markdown(model).startswith('# DEFI NEWSLETTER SUMMARY\n')
+
+    def test_html_escapes_and_links(self):
+        """Test that the HTML email escapes model text and links sources."""
+        html = render_report(self.build(), ['html'])['html']
+
+        assert '<strong>What\'s New:</strong>' in html
+        assert '<b>faster</b>' not in html
+        assert '<a href="https://www.theneurondaily.com">The Neuron</a> - 1 issues' in html
+
+    def test_json_round_trip(self):
+        """Test that the JSON output is the model itself."""
+        model = self.build()
+
+        assert json.loads(render_report(model, ['json'])['json']) == model
+
+    def test_rss_has_item_per_topic(self):
+        """Test that the RSS feed is well-formed with one item per topic."""
+        import xml.etree.ElementTree as ET
+
+        feed = render_report(self.build(), ['rss'], site_url='https://example.com')['rss']
+        channel = ET.fromstring(feed).find('channel')
+
+        assert channel.find('link').text == 'https://example.com'
+        assert [item.find('title').text for item in channel.findall('item')] == ['New Model', 'Agents']
+
+    def test_parse_formats(self):
+        """Test parsing and validating the --formats list."""
+        assert parse_formats('md, HTML,md,rss') == ['md', 'html', 'rss']
+        with pytest.raises(ValueError):
+            parse_formats('md,pdf')
+        with pytest.raises(ValueError):
+            parse_formats(',')
@@ -0,0 +1,187 @@
+import pytest
+import datetime
+import json
+import os
+import sys
+from unittest.mock import patch
+from runs import (
+    RunCheckpoint,
+    corpus_from_newsletters,
+    newsletters_from_corpus,
+    prune_runs,
+    response_artifact
+)
+
+
+@pytest.fixture
+def runs_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("NEWSLETTER_RUNS_DIR", str(tmp_path / 'runs'))
+    return tmp_path / 'runs'
+
+
+class TestRunCheckpoint:
+    """Test stage artifacts and their manifest."""
+
+    def test_artifacts_round_trip(self, runs_dir):
+        """Test that every stage's data is saved compactly and loaded back unchanged."""
+        run = RunCheckpoint.create('run1')
+        data = {
+            'fetch': [{'id': 'm1', 'body': '<p>x</p>' * 100}],
+            'clean': [{'id': 'm1', 'content': 'x'}],
+            'prompt': 'Analyze these newsletters ' * 100,
+            'response': {'analysis': '### 1. T', 'topics': ['T'], 'run_info': {}},
+            'report': {'files': {'report.md': '# Report'}},
+        }
+        for stage, value in data.items():
+            run.save(stage, value, {'stage': stage})
+
+        reopened = RunCheckpoint.open('run1')
+        assert reopened.completed() == ['fetch', 'clean', 'prompt', 'response', 'report']
+        for stage, value in data.items():
+            assert reopened.valid(stage, {'stage': stage})
+            assert reopened.load(stage) == value
+        assert os.path.getsize(reopened.artifact_path('prompt')) < len(data['prompt'])
+
+    def test_equal_data_hashes_equally(self, runs_dir):
+        """Test that the compressed artifacts are deterministic."""
+        first = RunCheckpoint.create('run1').save('clean', [{'id': 'a', 'content': 'x'}], {})
+        second = RunCheckpoint.create('run2').save('clean', [{'id': 'a', 'content': 'x'}], {})
+
+        assert first == second
+
+    def test_changed_inputs_are_stale(self, runs_dir):
+        """Test that an artifact built from other inputs is not reused."""
+        run = RunCheckpoint.create('run1')
+        run.save('prompt', 'prompt text', {'corpus': 'abc', 'num_topics': 10})
+
+        assert run.valid('prompt', {'corpus': 'abc', 'num_topics': 10})
+        assert not run.valid('prompt', {'corpus': 'abc', 'num_topics': 5})
+        assert not run.valid('prompt', {'corpus': 'def', 'num_topics': 10})
+
+    def test_modified_or_missing_artifact_is_invalid(self, runs_dir):
+        """Test that the content hash catches edited and deleted artifacts."""
+        run = RunCheckpoint.create('run1')
+        run.save('response', {'analysis': 'text'}, {})
+        run.save('report', {'files': {}}, {})
+        with open(run.artifact_path('response'), 'w') as f:
+            f.write('{"analysis": "edited"}')
+        os.remove(run.artifact_path('report'))
+
+        assert not run.valid('response', {})
+        assert not run.valid('report', {})
+
+    def test_saving_a_stage_drops_later_stages(self, runs_dir):
+        """Test that rebuilding an artifact invalidates everything built from it."""
+        run = RunCheckpoint.create('run1')
+        for stage in ['fetch', 'clean', 'prompt']:
+            run.save(stage, 'text' if stage == 'prompt' else [], {})
+
+        run.save('clean', [{'id': 'new', 'content': 'y'}], {})
+
+        assert run.completed() == ['fetch', 'clean']
+        assert RunCheckpoint.open('run1').completed() == ['fetch', 'clean']
+
+    def test_unknown_run(self, runs_dir):
+        """Test that resuming an unknown run fails clearly."""
+        with pytest.raises(FileNotFoundError, match="missing"):
+            RunCheckpoint.open('missing')
+
+
+def make_run(run_id, days_old, completed):
+    """Create a run dated ``days_old`` days ago, with a report if ``completed``."""
+    created_at = (datetime.datetime.now() - datetime.timedelta(days=days_old)).isoformat()
+    run = RunCheckpoint(run_id, {"run_id": run_id, "created_at": created_at, "stages": {}})
+    os.makedirs(run.path)
+    run.save('report' if completed else 'fetch', {'files': {}} if completed else [], {})
+    return run
+
+
+class TestPruneRuns:
+    """Test the run retention policy."""
+
+    def test_old_runs_are_removed(self, runs_dir):
+        """Test that runs past the retention period are removed, complete or not."""
+        make_run('old_done', 40, completed=True)
+        make_run('old_failed', 40, completed=False)
+        make_run('recent_failed', 1, completed=False)
+
+        removed = prune_runs(retention_days=30)
+
+        assert sorted(removed) == ['old_done', 'old_failed']
+        assert os.listdir(runs_dir) == ['recent_failed']
+
+    def test_only_newest_completed_runs_are_kept(self, runs_dir):
+        """Test that completed runs beyond the limit are removed oldest first and incomplete ones stay."""
+        for i in range(4):
+            make_run(f'done{i}', 10 - i, completed=True)
+        make_run('failed', 20, completed=False)
+
+        assert sorted(prune_runs(max_completed=2)) == ['done0', 'done1']
+        assert sorted(os.listdir(runs_dir)) == ['done2', 'done3', 'failed']
+
+    def test_create_prunes(self, runs_dir):
+        """Test that starting a run prunes expired runs and leaves unknown directories alone."""
+        make_run('old', 40, completed=True)
+        os.makedirs(runs_dir / 'notes')
+
+        RunCheckpoint.create('new')
+
+        assert sorted(os.listdir(runs_dir)) == ['new', 'notes']
+
+
+class TestHelpers:
+    """Test the corpus and response conversions."""
+
+    def test_corpus_round_trip(self):
+        """Test that the corpus keeps the cleaned content and drops the raw body."""
+        newsletters = [{'id': 'm1', 'subject': 'S', 'sender': 'A', 'date': 'D', 'timestamp': 1.0,
+                        'body': '<p>raw</p>', 'body_format': 'html', 'content': 'raw'}]
+
+        corpus = corpus_from_newsletters(newsletters)
+
+        assert corpus == [{'id': 'm1', 'subject': 'S', 'sender': 'A', 'date': 'D', 'timestamp': 1.0,
+                           'content': 'raw'}]
+        assert newsletters_from_corpus(corpus)[0]['body'] == 'raw'
+        assert newsletters_from_corpus(corpus)[0]['body_format'] == 'markdown'
+
+    def test_response_artifact_keeps_report_details(self):
+        """Test that only serialisable call details used by the report are kept."""
+        run_info = {'model': 'm', 'provider': 'openai', 'budget': None, 'pipeline': {'stages': object()}}
+
+        artifact = response_artifact('text', ['T'], run_info)
+
+        assert artifact['run_info']['model'] == 'm'
+        assert 'pipeline' not in artifact['run_info']
+        json.dumps(artifact)
+
+
+class TestResume:
+    """Test resuming main.py runs."""
+
+    def test_failed_analysis_resumes_from_prompt(self, runs_dir, tmp_path, monkeypatch, capsys):
+        """Test that a run failing at the LLM call resumes without fetching or building the prompt again."""
+        import main
+
+        monkeypatch.setenv("NEWSLETTER_SUMMARY_OUTPUT_DIR", str(tmp_path / 'out'))
+        monkeypatch.setenv("NEWSLETTER_SUMMARY_MOCK_DATA", json.dumps([{
+            'subject': 'Newsletter', 'sender': 'Sender <s@example.com>',
+            'date': 'Mon, 1 Jan 2024 10:00:00 +0000', 'body': '<p>Story text</p>'
+        }]))
+        monkeypatch.setattr(sys, 'argv', ['main.py', '--days', '1', '--num-topics', '3'])
+        with patch('main.analyze_newsletters_unified', side_effect=RuntimeError("provider down")):
+            main.main()
+        run_id = os.listdir(runs_dir)[0]
+        assert "resume with: python main.py --resume " + run_id in capsys.readouterr().out
+        assert RunCheckpoint.open(run_id).completed() == ['fetch', 'clean', 'prompt']
+
+        monkeypatch.setattr(sys, 'argv', ['main.py', '--days', '1', '--num-topics', '3', '--resume', run_id])
+        with patch('main.analyze_newsletters_unified', return_value=("### 1. Topic\n", ["Topic"])) as mock_analyze, \
+                patch('main.annotate_newsletters') as mock_fetch, \
+                patch('main.build_analysis_prompt') as mock_prompt:
+            main.main()
+
+        mock_fetch.assert_not_called()
+        mock_prompt.assert_not_called()
+        assert 'Story text' in mock_analyze.call_args[1]['prompt']
+        assert RunCheckpoint.open(run_id).completed() == ['fetch', 'clean', 'prompt', 'response', 'report']
+        assert os.listdir(tmp_path / 'out')
@@ -0,0 +1,113 @@
+import pytest
+import datetime
+from email.utils import parsedate_tz
+from unittest.mock import patch
+from timeline import (
+    Timeline,
+    annotate_newsletters,
+    newsletter_timestamp,
+    parse_timestamp,
+    to_utc
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_parse_cache():
+    """Parse dates anew in every test."""
+    parse_timestamp.cache_clear()
+    yield
+    parse_timestamp.cache_clear()
+
+
+def utc_timestamp(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc).timestamp()
+
+
+class TestParseTimestamp:
+    """Test parsing Date headers into UTC timestamps."""
+
+    def test_rfc2822_with_offset(self):
+        """Test that the UTC offset is applied."""
+        assert parse_timestamp('Mon, 01 Jan 2024 12:00:00 +0100') == utc_timestamp(2024, 1, 1, 11)
+        assert parse_timestamp('Mon, 01 Jan 2024 06:00:00 -0500') == utc_timestamp(2024, 1, 1, 11)
+
+    def test_naive_dates_are_utc(self):
+        """Test that dates without a zone are taken as UTC."""
+        assert parse_timestamp('Mon, 01 Jan 2024 12:00:00') == utc_timestamp(2024, 1, 1, 12)
+        assert parse_timestamp('2024-01-01T12:00:00') == utc_timestamp(2024, 1, 1, 12)
+
+    def test_iso_with_offset(self):
+        """Test the ISO 8601 fallback used by mock data."""
+        assert parse_timestamp('2024-01-01T12:00:00+02:00') == utc_timestamp(2024, 1, 1, 10)
+
+    def test_unparseable_values(self):
+        """Test that invalid, empty and missing values give None."""
+        assert parse_timestamp('not a date') is None
+        assert parse_timestamp('') is None
+        assert parse_timestamp(None) is None
+
+    def test_repeated_headers_parsed_once(self):
+        """Test that a repeated header value is served from the cache."""
+        with patch('timeline.parsedate_tz', wraps=parsedate_tz) as mock_parse:
+            for _ in range(5):
+                parse_timestamp('Mon, 01 Jan 2024 12:00:00 +0000')
+
+        assert mock_parse.call_count == 1
+
+    def test_annotate_stores_timestamp(self):
+        """Test that ingestion stores the timestamp and lookups reuse it."""
+        newsletters = annotate_newsletters([{'date': 'Mon, 01 Jan 2024 12:00:00 +0000'}, {'date': 'bad'}])
+
+        assert newsletters[0]['timestamp'] == utc_timestamp(2024, 1, 1, 12)
+        assert newsletters[1]['timestamp'] is None
+        assert newsletter_timestamp({'date': 'bad', 'timestamp': 42.0}) == 42.0
+
+
+class TestTimeline:
+    """Test the per-run timeline index."""
+
+    def test_mixed_timezones_are_ordered(self):
+        """Test that earliest and latest compare send times across zones."""
+        timeline = Timeline([
+            {'date': 'Mon, 01 Jan 2024 12:00:00 +0000'},
+            {'date': 'Mon, 01 Jan 2024 09:00:00 -0500'},  # 14:00 UTC
+            {'date': 'Mon, 01 Jan 2024 13:00:00 +0200'},  # 11:00 UTC
+        ])
+
+        assert timeline.earliest == datetime.datetime(2024, 1, 1, 11, tzinfo=datetime.timezone.utc)
+        assert timeline.latest == datetime.datetime(2024, 1, 1, 14, tzinfo=datetime.timezone.utc)
+
+    def test_recent_and_since(self):
+        """Test that window lookups return indices in input order."""
+        timeline = Timeline([
+            {'date': 'Wed, 03 Jan 2024 12:00:00 +0000'},
+            {'date': 'Mon, 01 Jan 2024 12:00:00 +0000'},
+            {'date': 'Tue, 02 Jan 2024 18:00:00 +0000'},
+            {'date': 'bad'},
+        ])
+
+        assert timeline.recent(24) == [0, 2]
+        assert timeline.since(utc_timestamp(2024, 1, 3)) == [0]
+        assert timeline.unparsed == [3]
+
+    def test_no_parseable_dates(self):
+        """Test that an empty or undated run has no range and no recent items."""
+        timeline = Timeline([{'date': 'bad'}])
+
+        assert timeline.earliest is None and timeline.latest is None
+        assert timeline.recent() == []
+        assert Timeline([]).recent() == []
+
+    def test_warn_unparsed_once(self):
+        """Test that unparseable headers produce a single warning."""
+        newsletters = [{'date': 'bad'}, {'date': 'worse'}, {'date': 'Mon, 01 Jan 2024 12:00:00 +0000'}]
+
+        with patch('builtins.print') as mock_print:
+            Timeline(newsletters).warn_unparsed(newsletters)
+
+        mock_print.assert_called_once()
+        assert "Could not parse date 'bad' and 1 other date headers" in mock_print.call_args[0][0]
+
+    def test_to_utc(self):
+        """Test converting a timestamp back to an aware datetime."""
+        assert to_utc(utc_timestamp(2024, 1, 1, 12)).isoformat() == '2024-01-01T12:00:00+00:00'
@@ -0,0 +1,169 @@
+import pytest
+import json
+from topics import (
+    StreamingTopicParser,
+    validate_topic,
+    collect_topics,
+    repair_topic,
+    render_markdown,
+    strip_code_fence,
+    response_format
+)
+
+
+def _topic(headline="OpenAI ships GPT-5", **overrides):
+    topic = {
+        "headline": headline,
+        "whats_new": "A new model was released.",
+        "why_it_matters": "Better answers for everyday tasks.",
+        "actions": ["Try it in ChatGPT", "Compare it with your current tool"],
+        "sources": ["The Neuron", "TLDR AI"],
+        "links": [{"title": "Announcement", "url": "https://openai.com/gpt-5"}],
+    }
+    topic.update(overrides)
+    return topic
+
+
+def _feed_in_chunks(parser, text, size=7):
+    results = []
+    for i in range(0, len(text), size):
+        results.extend(parser.feed(text[i:i + size]))
+    return results
+
+
+class TestValidateTopic:
+    """Test schema validation of single topics."""
+
+    def test_valid_topic(self):
+        """Test that a complete topic has no errors."""
+        assert validate_topic(_topic()) == []
+
+    def test_missing_and_wrong_fields(self):
+        """Test that missing fields and wrong types are reported."""
+        topic = _topic(actions=[], links="https://example.com")
+        del topic["why_it_matters"]
+
+        errors = validate_topic(topic)
+
+        assert any("why_it_matters" in e for e in errors)
+        assert any("actions" in e for e in errors)
+        assert any("links" in e for e in errors)
+
+    def test_non_object(self):
+        """Test that a non-object value is rejected."""
+        assert validate_topic(["not", "a", "topic"]) == ["topic is not an object"]
+
+
+class TestStreamingTopicParser:
+    """Test incremental parsing of streamed topic JSON."""
+
+    def test_topics_are_emitted_as_they_close(self):
+        """Test that each topic is returned as soon as its object is complete."""
+        first, second = _topic("First"), _topic("Second")
+        text = json.dumps({"topics": [first, second]})
+        parser = StreamingTopicParser()
+
+        cut = text.index('"Second"')
+        early = parser.feed(text[:cut])
+        late = parser.feed(text[cut:])
+
+        assert [(i, t) for i, t, _ in early] == [(0, first)]
+        assert [(i, t) for i, t, _ in late] == [(1, second)]
+
+    def test_braces_inside_strings_are_ignored(self):
+        """Test that brackets and escaped quotes inside strings do not confuse the parser."""
+        topic = _topic('Headline with {braces} and [brackets] and a \\"quote\\"')
+        text = "```json\n" + json.dumps({"topics": [topic]}) + "\n```"
+
+        results = _feed_in_chunks(StreamingTopicParser(), text)
+
+        assert len(results) == 1
+        assert results[0][1] == topic
+
+    def test_malformed_topic_is_isolated(self):
+        """Test that an invalid topic does not affect its neighbours."""
+        good = json.dumps(_topic("Good"))
+        text = '{"topics": [' + good + ', {"headline": "Bad", "actions": ["x",], sources: []}, ' + good + ']}'
+
+        results = _feed_in_chunks(StreamingTopicParser(), text)
+
+        assert [t is not None for _, t, _ in results] == [True, False, True]
+        assert '"Bad"' in results[1][2]
+
+    def test_truncated_completion(self):
+        """Test that an unterminated last topic is returned by finish()."""
+        text = '{"topics": [' + json.dumps(_topic("Done")) + ', {"headline": "Cut off", "whats_'
+        parser = StreamingTopicParser()
+
+        results = _feed_in_chunks(parser, text) + parser.finish()
+
+        assert len(results) == 2
+        assert results[1][0] == 1
+        assert results[1][1] is None
+
+
+class TestCollectTopics:
+    """Test validation and per-topic repair."""
+
+    def test_only_malformed_topics_are_repaired(self):
+        """Test that the repair function is called once, for the bad topic only."""
+        prompts = []
+
+        def complete(prompt):
+            prompts.append(prompt)
+            return "```json\n" + json.dumps(_topic("Repaired")) + "\n```"
+
+        results = [(0, _topic("Good"), "{}"), (1, None, '{"headline": "Broken"'), (2, _topic("Also good"), "{}")]
+        topics, stats = collect_topics(results, complete)
+
+        assert [t["headline"] for t in topics] == ["Good", "Repaired", "Also good"]
+        assert stats == {"parsed": 2, "repaired": 1, "dropped": 0}
+        assert len(prompts) == 1
+        assert '{"headline": "Broken"' in prompts[0]
+
+    def test_unrepairable_topic_is_dropped(self):
+        """Test that a topic is dropped after the repair attempts are used up."""
+        calls = []
+
+        def complete(prompt):
+            calls.append(prompt)
+            return "still not json"
+
+        topic = repair_topic('{"headline":', ["invalid"], complete, attempts=2)
+
+        assert topic is None
+        assert len(calls) == 2
+
+    def test_without_repair_function(self):
+        """Test that malformed topics are dropped when no repair is possible."""
+        topics, stats = collect_topics([(0, {"headline": "Partial"}, "{}")])
+
+        assert topics == []
+        assert stats["dropped"] == 1
+
+
+class TestRendering:
+    """Test local markdown rendering."""
+
+    def test_render_markdown(self):
+        """Test that rendered topics follow the report's markdown format."""
+        markdown = render_markdown([_topic("First"), _topic("Second")])
+
+        assert "### 1. First\n" in markdown
+        assert "### 2. Second\n" in markdown
+        assert "- **What's New:** A new model was released." in markdown
+        assert "  - Try it in ChatGPT" in markdown
+        assert "- **Source:** The Neuron, TLDR AI" in markdown
+        assert "[Announcement](https://openai.com/gpt-5)" in markdown
+
+    def test_strip_code_fence(self):
+        """Test that fenced JSON replies are unwrapped."""
+        assert strip_code_fence('```json\n{"a": 1}\n```') == '{"a": 1}'
+        assert strip_code_fence('{"a": 1}') == '{"a": 1}'
+
+    def test_response_format_uses_schema(self):
+        """Test that the request field wraps the topic schema."""
+        fmt = response_format()
+
+        assert fmt["type"] == "json_schema"
+        assert fmt["json_schema"]["schema"]["properties"]["topics"]["items"]["required"][0] == "headline"
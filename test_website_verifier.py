@@ -0,0 +1,228 @@
+import pytest
+import asyncio
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from website_verifier import (
+    CheckCache,
+    build_client,
+    parse_page,
+    score_check,
+    title_match,
+    verify_candidates,
+    verify_unverified_websites
+)
+from websites import WebsiteResolver
+
+
+HOMEPAGE = (
+    '<html><head><title>The Test Letter | Weekly AI news</title>'
+    '<link rel="canonical" href="/"></head><body>Welcome</body></html>'
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serve a few fixed routes and count the requests per method and path."""
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, send_body):
+        self.server.requests.append((self.command, self.path))
+        if self.path == '/':
+            self.send_page(200, HOMEPAGE, send_body)
+        elif self.path == '/old':
+            self.send_response(301)
+            self.send_header('Location', '/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/nohead' and self.command == 'HEAD':
+            self.send_page(405, '', send_body)
+        elif self.path == '/nohead':
+            self.send_page(200, HOMEPAGE.replace('href="/"', 'href="/nohead"'), send_body)
+        elif self.path == '/slow':
+            time.sleep(1)
+            self.send_page(200, HOMEPAGE, send_body)
+        else:
+            self.send_page(404, 'Not found', send_body)
+
+    def send_page(self, status, html, send_body):
+        body = html.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+
+@pytest.fixture
+def stub_server():
+    """Run a local HTTP stub and return its base URL and request log."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", server.requests
+    server.shutdown()
+    server.server_close()
+
+
+def verify(candidates, cache=None, **kwargs):
+    return asyncio.run(verify_candidates(candidates, cache, **kwargs))
+
+
+class TestScoring:
+    """Test page parsing and scoring without the network."""
+
+    def test_parse_page_title_and_canonical(self):
+        """Test extracting the title and an absolute canonical URL."""
+        page = parse_page(HOMEPAGE, 'https://example.com/welcome')
+
+        assert page == {'title': 'The Test Letter | Weekly AI news', 'canonical': 'https://example.com/'}
+
+    def test_title_match(self):
+        """Test whole-name and partial word matches."""
+        assert title_match('The Test Letter', 'The Test Letter | Weekly') == 1.0
+        assert title_match('Test Digest', 'Test Letter') == 0.5
+        assert title_match('Test Letter', None) == 0.0
+
+    def test_score_requires_success_status(self):
+        """Test that error responses and unreachable sites score zero."""
+        assert score_check('Test', 'https://example.com', {'status': 404})[0] == 0.0
+        assert score_check('Test', 'https://example.com', {'status': None, 'error': 'ConnectError'})[0] == 0.0
+
+    def test_score_penalizes_foreign_canonical(self):
+        """Test that a canonical URL on another domain loses the canonical points."""
+        check = {'status': 200, 'title': 'Test Letter', 'canonical': 'https://other.com/'}
+        same = dict(check, canonical='https://www.example.com/')
+
+        assert score_check('Test Letter', 'https://example.com', check)[0] == pytest.approx(0.8)
+        assert score_check('Test Letter', 'https://example.com', same)[0] == pytest.approx(1.0)
+
+
+class TestVerifyCandidates:
+    """Test concurrent verification against a local HTTP stub."""
+
+    def test_homepage_is_verified(self, stub_server):
+        """Test that a matching homepage passes."""
+        base, _ = stub_server
+
+        result, = verify([('The Test Letter', f"{base}/")])
+
+        assert result['verified']
+        assert result['score'] == pytest.approx(1.0)
+        assert result['homepage'] == f"{base}/"
+
+    def test_redirect_is_followed(self, stub_server):
+        """Test that a redirect to the homepage is followed and reported."""
+        base, _ = stub_server
+
+        result, = verify([('The Test Letter', f"{base}/old")])
+
+        assert result['verified']
+        assert result['homepage'] == f"{base}/"
+
+    def test_missing_page_fails_after_head(self, stub_server):
+        """Test that a 404 stops after the HEAD request."""
+        base, requests = stub_server
+
+        result, = verify([('The Test Letter', f"{base}/missing")])
+
+        assert not result['verified']
+        assert result['score'] == 0.0
+        assert requests == [('HEAD', '/missing')]
+
+    def test_head_not_allowed_falls_back_to_get(self, stub_server):
+        """Test that servers rejecting HEAD are still checked with GET."""
+        base, requests = stub_server
+
+        result, = verify([('The Test Letter', f"{base}/nohead")])
+
+        assert ('GET', '/nohead') in requests
+        assert result['score'] == pytest.approx(0.8)
+        assert result['verified']
+
+    def test_timeout_is_reported(self, stub_server):
+        """Test that a slow site fails with a timeout instead of hanging."""
+        base, _ = stub_server
+
+        async def run():
+            async with build_client(read_timeout=0.2) as client:
+                return await verify_candidates([('The Test Letter', f"{base}/slow")], client=client)
+
+        result, = asyncio.run(run())
+
+        assert not result['verified']
+        assert 'Timeout' in result['reasons'][0]
+
+    def test_domain_checked_once_and_cached(self, stub_server, tmp_path):
+        """Test that one domain is fetched once per run and not again within the TTL."""
+        base, requests = stub_server
+        cache = CheckCache(str(tmp_path / 'checks.json'))
+
+        first = verify([('The Test Letter', f"{base}/"), ('Test Letter Daily', f"{base}/")], cache)
+        fetched = len(requests)
+        cache.save()
+        second = verify([('The Test Letter', f"{base}/")], CheckCache(str(tmp_path / 'checks.json')))
+
+        assert fetched == 2  # one HEAD and one GET
+        assert len(requests) == fetched
+        assert [result['verified'] for result in first] == [True, True]
+        assert second[0]['cached'] and second[0]['verified']
+
+    def test_expired_cache_is_refetched(self, stub_server, tmp_path):
+        """Test that facts older than the TTL are checked again."""
+        base, requests = stub_server
+        cache = CheckCache(str(tmp_path / 'checks.json'), ttl=datetime.timedelta(days=1))
+        stale = (datetime.datetime.now() - datetime.timedelta(days=2)).isoformat()
+        cache.put(base[len('http://'):], {'status': 500, 'checked_at': stale})
+
+        result, = verify([('The Test Letter', f"{base}/")], cache)
+
+        assert result['verified'] and not result['cached']
+        assert requests
+
+    def test_save_keeps_entries_from_other_processes(self, tmp_path):
+        """Test that saving merges with entries another cache instance saved meanwhile."""
+        path = str(tmp_path / 'checks.json')
+        now = datetime.datetime.now().isoformat()
+        first, second = CheckCache(path), CheckCache(path)
+        first.put('one.example', {'status': 200, 'checked_at': now})
+        second.put('two.example', {'status': 200, 'checked_at': now})
+
+        assert first.save() and second.save()
+
+        with open(path) as f:
+            assert set(json.load(f)) == {'one.example', 'two.example'}
+        assert second.get('one.example')
+
+
+class TestVerifyUnverifiedWebsites:
+    """Test updating the website cache from verification results."""
+
+    def test_marks_passing_entries_verified(self, stub_server, tmp_path):
+        """Test that passing guesses are verified and failing ones left for review."""
+        base, _ = stub_server
+        cache_path = tmp_path / 'newsletter_websites.json'
+        cache_path.write_text(json.dumps({
+            'the test letter': {'url': f"{base}/old", 'verified': False},
+            'broken letter': {'url': f"http://localhost:{base.rsplit(':', 1)[1]}/missing", 'verified': False},
+        }))
+        resolver = WebsiteResolver(str(cache_path))
+
+        results = verify_unverified_websites(resolver, CheckCache(str(tmp_path / 'checks.json')))
+
+        saved = json.loads(cache_path.read_text())
+        assert len(results) == 2
+        assert saved['the test letter'] == {'url': f"{base}/", 'verified': True}
+        assert saved['broken letter']['verified'] is False
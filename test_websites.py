@@ -0,0 +1,115 @@
+import pytest
+import json
+import os
+from websites import WebsiteResolver, curated_website, get_resolver, reset_resolvers
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    """Return a website cache path with one verified and one unverified entry."""
+    path = tmp_path / 'newsletter_websites.json'
+    path.write_text(json.dumps({
+        'the neuron': {'url': 'https://example.com/neuron', 'verified': True},
+        'ai weekly': {'url': 'https://www.aiweekly.co', 'verified': True},
+        'guess': {'url': 'https://guess.example.com', 'verified': False},
+    }))
+    reset_resolvers()
+    yield str(path)
+    reset_resolvers()
+
+
+class TestCuratedWebsite:
+    """Test the curated website mapping."""
+
+    def test_curated_website_matches_normalized_name(self):
+        """Test that curated keys match regardless of case and punctuation."""
+        assert curated_website("Ben's Bites Daily") == 'https://www.bensbites.co'
+        assert curated_website("Unknown Letter") is None
+
+
+class TestWebsiteResolver:
+    """Test lookups, dirty tracking and persistence."""
+
+    def test_resolve_prefers_verified_cache(self, cache_path):
+        """Test that a verified cache entry wins over the curated mapping."""
+        resolver = WebsiteResolver(cache_path)
+
+        assert resolver.resolve('The Neuron', None, '') == 'https://example.com/neuron'
+        assert not resolver.dirty
+
+    def test_resolve_uses_normalized_name_and_domain_indexes(self, cache_path):
+        """Test lookups by normalized name and by verified homepage domain."""
+        resolver = WebsiteResolver(cache_path)
+
+        assert resolver.get('The-Neuron!')['url'] == 'https://example.com/neuron'
+        assert resolver.resolve('AIW Digest', 'digest@news.aiweekly.co', '') == 'https://www.aiweekly.co'
+        assert resolver.entries['aiw digest'] == {'url': 'https://www.aiweekly.co', 'verified': False}
+
+    def test_resolve_records_body_guess(self, cache_path):
+        """Test that a homepage found in the body is cached as unverified."""
+        resolver = WebsiteResolver(cache_path)
+
+        url = resolver.resolve('Other', None, 'Visit https://other.example.com/ today')
+
+        assert url == 'https://other.example.com/'
+        assert resolver.dirty == {'other'}
+
+    def test_save_skips_write_when_clean(self, cache_path):
+        """Test that an unchanged cache is not rewritten."""
+        resolver = WebsiteResolver(cache_path)
+        mtime = os.stat(cache_path).st_mtime_ns
+        resolver.resolve('The Neuron', None, '')
+
+        assert resolver.save() is False
+        assert os.stat(cache_path).st_mtime_ns == mtime
+
+    def test_save_merges_concurrent_changes(self, cache_path):
+        """Test that saving keeps entries another process wrote meanwhile."""
+        first = WebsiteResolver(cache_path)
+        second = WebsiteResolver(cache_path)
+        first.set('Alpha', 'https://alpha.example.com', verified=False)
+        second.set('Beta', 'https://beta.example.com', verified=False)
+        second.delete('guess')
+
+        assert first.save()
+        assert second.save()
+        with open(cache_path) as f:
+            data = json.load(f)
+
+        assert 'alpha' in data and 'beta' in data
+        assert 'guess' not in data
+        assert 'the neuron' in data
+        assert not os.path.exists(f"{cache_path}.tmp")
+
+    def test_unverified_entries(self, cache_path):
+        """Test listing entries that still need review."""
+        resolver = WebsiteResolver(cache_path)
+
+        assert [name for name, _ in resolver.unverified()] == ['guess']
+
+    def test_invalid_file_starts_empty(self, tmp_path):
+        """Test that an unreadable cache does not stop report generation."""
+        path = tmp_path / 'newsletter_websites.json'
+        path.write_text('not json')
+
+        assert WebsiteResolver(str(path)).entries == {}
+
+
+class TestGetResolver:
+    """Test the process-wide resolver registry."""
+
+    def test_same_instance_per_path(self, cache_path):
+        """Test that the cache is loaded once per process."""
+        assert get_resolver(cache_path) is get_resolver(cache_path)
+
+    def test_reloads_clean_resolver_after_external_edit(self, cache_path):
+        """Test that edits made by the review script are picked up."""
+        resolver = get_resolver(cache_path)
+        editor = WebsiteResolver(cache_path)
+        editor.set('guess', 'https://guess.example.com', verified=True)
+        editor.save()
+        # Make sure the stamp differs even on coarse-grained filesystems
+        os.utime(cache_path, ns=(0, 0))
+
+        assert get_resolver(cache_path) is resolver
+        assert resolver.entries['guess']['verified'] is True
@@ -0,0 +1,110 @@
+"""
+Timezone-normalized timeline of newsletter send times.
+
+Date headers are parsed once, at ingestion, into a UTC POSIX timestamp
+stored with each newsletter under ``timestamp`` (None if the header cannot
+be parsed). The parser is memoized, so the many newsletters that share a
+header value only pay for parsing once; naive values are taken as UTC, so
+every timestamp compares safely with every other.
+
+A ``Timeline`` indexes those timestamps once per run. Recency weighting
+(``ranking.py``), the breaking-news cutoff and the report's date range and
+file name (``report.py``) are lookups on it instead of separate parsing
+passes.
+"""
+
+import bisect
+import calendar
+from datetime import datetime, timezone
+from email.utils import parsedate_tz
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+TIMESTAMP_KEY = 'timestamp'
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value) -> Optional[float]:
+    """
+    Parse a Date header (RFC 2822, or ISO 8601 as used by mock data) into a UTC POSIX timestamp.
+
+    Naive dates are taken as UTC.
+
+    Returns:
+        The timestamp, or None if the value cannot be parsed
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    parsed = parsedate_tz(value)
+    if parsed is not None:
+        # parsedate_tz gives the UTC offset in seconds, or None for naive dates
+        try:
+            return float(calendar.timegm(parsed[:6] + (0, 1, 0)) - (parsed[9] or 0))
+        except (OverflowError, ValueError):
+            return None
+    try:
+        when = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+
+def newsletter_timestamp(nl: Dict) -> Optional[float]:
+    """Return a newsletter's stored timestamp, parsing its Date header if none is stored."""
+    if TIMESTAMP_KEY in nl:
+        return nl[TIMESTAMP_KEY]
+    return parse_timestamp(nl.get('date'))
+
+
+def annotate_newsletters(newsletters: Sequence[Dict]) -> Sequence[Dict]:
+    """Store the parsed UTC timestamp on every newsletter that does not have one yet; returns the list."""
+    for nl in newsletters:
+        if TIMESTAMP_KEY not in nl:
+            nl[TIMESTAMP_KEY] = parse_timestamp(nl.get('date'))
+    return newsletters
+
+
+def to_utc(timestamp: float) -> datetime:
+    """Return an aware UTC datetime for a POSIX timestamp."""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+class Timeline:
+    """Sorted index of newsletter timestamps for one run."""
+
+    def __init__(self, newsletters: Sequence[Dict]):
+        self.timestamps: List[Optional[float]] = [newsletter_timestamp(nl) for nl in newsletters]
+        self.unparsed = [i for i, ts in enumerate(self.timestamps) if ts is None]
+        self._order = sorted((ts, i) for i, ts in enumerate(self.timestamps) if ts is not None)
+        self._sorted = [ts for ts, _ in self._order]
+
+    @property
+    def earliest(self) -> Optional[datetime]:
+        """Send time of the oldest newsletter (UTC), or None if no date parsed."""
+        return to_utc(self._sorted[0]) if self._sorted else None
+
+    @property
+    def latest(self) -> Optional[datetime]:
+        """Send time of the newest newsletter (UTC), or None if no date parsed."""
+        return to_utc(self._sorted[-1]) if self._sorted else None
+
+    def since(self, cutoff: float) -> List[int]:
+        """Return the indices of newsletters sent at or after a timestamp, in input order."""
+        start = bisect.bisect_left(self._sorted, cutoff)
+        return sorted(i for _, i in self._order[start:])
+
+    def recent(self, hours: float = 24) -> List[int]:
+        """Return the indices of newsletters sent within ``hours`` of the newest one, in input order."""
+        if not self._sorted:
+            return []
+        return self.since(self._sorted[-1] - hours * 3600)
+
+    def warn_unparsed(self, newsletters: Sequence[Dict]) -> None:
+        """Print one warning for all newsletters whose Date header could not be parsed."""
+        if not self.unparsed:
+            return
+        example = newsletters[self.unparsed[0]].get('date')
+        print(f"Warning: Could not parse date '{example}'"
+              + (f" and {len(self.unparsed) - 1} other date headers" if len(self.unparsed) > 1 else ""))
@@ -0,0 +1,267 @@
+"""
+Structured topic model for JSON output mode.
+
+In structured mode the LLM returns ``{"topics": [...]}`` where every topic
+matches ``TOPIC_SCHEMA``. The completion is parsed incrementally while it
+streams: each topic object is validated as soon as its closing brace
+arrives, so a malformed topic can be repaired on its own instead of
+re-running the whole completion. Markdown for the report is rendered locally
+from the validated topics.
+"""
+
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+TOPIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "headline": {"type": "string"},
+        "whats_new": {"type": "string"},
+        "why_it_matters": {"type": "string"},
+        "actions": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "sources": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "links": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "url": {"type": "string"}},
+                "required": ["title", "url"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["headline", "whats_new", "why_it_matters", "actions", "sources", "links"],
+    "additionalProperties": False,
+}
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"topics": {"type": "array", "items": TOPIC_SCHEMA}},
+    "required": ["topics"],
+    "additionalProperties": False,
+}
+
+MAX_REPAIR_ATTEMPTS = 2
+
+
+def response_format() -> Dict:
+    """Return the ``response_format`` request field for OpenAI-compatible APIs."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "newsletter_topics", "strict": True, "schema": RESPONSE_SCHEMA},
+    }
+
+
+def validate_topic(topic) -> List[str]:
+    """
+    Check a parsed topic against ``TOPIC_SCHEMA``.
+
+    Args:
+        topic: Parsed JSON value for one topic
+
+    Returns:
+        List of human-readable problems (empty if the topic is valid)
+    """
+    if not isinstance(topic, dict):
+        return ["topic is not an object"]
+    errors = []
+    for field in ("headline", "whats_new", "why_it_matters"):
+        if not isinstance(topic.get(field), str) or not topic[field].strip():
+            errors.append(f"'{field}' must be a non-empty string")
+    for field in ("actions", "sources"):
+        value = topic.get(field)
+        if not isinstance(value, list) or not value or not all(isinstance(v, str) and v.strip() for v in value):
+            errors.append(f"'{field}' must be a non-empty list of strings")
+    links = topic.get("links")
+    if not isinstance(links, list):
+        errors.append("'links' must be a list")
+    else:
+        for link in links:
+            if not isinstance(link, dict) or not isinstance(link.get("url"), str) or \
+                    not isinstance(link.get("title"), str):
+                errors.append("each link must be an object with string 'title' and 'url'")
+                break
+    return errors
+
+
+class StreamingTopicParser:
+    """
+    Incremental parser that extracts topic objects from a streamed completion.
+
+    Text is fed in arbitrary chunks. The parser tracks string/escape state and
+    nesting depth; the first array it meets is taken as the topic list and
+    every object directly inside it is emitted once its closing brace arrives.
+    Anything before the JSON (e.g. a markdown code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.depth = 0
+        self.array_depth = None
+        self.in_string = False
+        self.escaped = False
+        self.topic_start = None
+        self.count = 0
+
+    def feed(self, text: str) -> List[Tuple[int, Optional[Dict], str]]:
+        """
+        Consume a chunk of completion text.
+
+        Args:
+            text: Next chunk of streamed output
+
+        Returns:
+            List of ``(index, topic, raw)`` for topics completed by this chunk;
+            ``topic`` is None if the raw object text is not valid JSON
+        """
+        completed = []
+        for char in text:
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char in '[{':
+                self.depth += 1
+                if char == '[' and self.array_depth is None:
+                    self.array_depth = self.depth
+                elif char == '{' and self.array_depth is not None and self.depth == self.array_depth + 1:
+                    self.topic_start = len(self.buffer) - 1
+            elif char in ']}':
+                if char == '}' and self.topic_start is not None and self.depth == self.array_depth + 1:
+                    raw = "".join(self.buffer[self.topic_start:])
+                    completed.append((self.count, parse_topic(raw), raw))
+                    self.count += 1
+                    self.topic_start = None
+                self.depth -= 1
+        return completed
+
+    def finish(self) -> List[Tuple[int, Optional[Dict], str]]:
+        """Return an unterminated trailing topic (e.g. from a truncated completion), if any."""
+        if self.topic_start is None:
+            return []
+        raw = "".join(self.buffer[self.topic_start:])
+        self.topic_start = None
+        self.count += 1
+        return [(self.count - 1, None, raw)]
+
+
+def parse_topic(raw: str) -> Optional[Dict]:
+    """Parse one topic object, returning None if it is not valid JSON."""
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+
+def strip_code_fence(text: str) -> str:
+    """Remove a surrounding markdown code fence from a JSON reply."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def repair_prompt(raw: str, errors: List[str]) -> str:
+    """Build the prompt asking the model to fix one malformed topic."""
+    return (
+        "The following topic object from a newsletter summary is malformed or incomplete.\n"
+        f"Problems: {'; '.join(errors)}\n\n"
+        "Return ONLY a corrected JSON object (no markdown, no commentary) matching this JSON schema:\n"
+        f"{json.dumps(TOPIC_SCHEMA)}\n\n"
+        "Keep the original content wherever possible.\n\n"
+        f"Topic object:\n{raw}"
+    )
+
+
+def repair_topic(raw: str, errors: List[str], complete: Callable[[str], str],
+                 attempts: int = MAX_REPAIR_ATTEMPTS) -> Optional[Dict]:
+    """
+    Ask the model to fix a single malformed topic.
+
+    Args:
+        raw: The raw (possibly truncated) topic text
+        errors: Problems found in the topic
+        complete: Function that sends a prompt and returns the reply text
+        attempts: Maximum number of repair calls
+
+    Returns:
+        The repaired topic, or None if it could not be repaired
+    """
+    for _ in range(attempts):
+        try:
+            reply = complete(repair_prompt(raw, errors))
+        except Exception as e:
+            print(f"Topic repair call failed: {str(e)}")
+            continue
+        topic = parse_topic(strip_code_fence(reply))
+        errors = validate_topic(topic) if topic is not None else ["reply is not valid JSON"]
+        if not errors:
+            return topic
+        raw = reply
+    return None
+
+
+def collect_topics(results: List[Tuple[int, Optional[Dict], str]],
+                   complete: Optional[Callable[[str], str]] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Validate parsed topics and repair only the malformed ones.
+
+    Args:
+        results: ``(index, topic, raw)`` tuples from ``StreamingTopicParser``
+        complete: Optional function used to repair malformed topics; without
+            it malformed topics are dropped
+
+    Returns:
+        Tuple of (valid topics in order, stats dictionary with ``parsed``,
+        ``repaired`` and ``dropped`` counts)
+    """
+    topics = []
+    stats = {"parsed": 0, "repaired": 0, "dropped": 0}
+    for index, topic, raw in results:
+        errors = validate_topic(topic) if topic is not None else ["invalid or truncated JSON"]
+        if not errors:
+            topics.append(topic)
+            stats["parsed"] += 1
+            continue
+        print(f"Topic {index + 1} is malformed ({'; '.join(errors)})")
+        repaired = repair_topic(raw, errors, complete) if complete else None
+        if repaired is not None:
+            topics.append(repaired)
+            stats["repaired"] += 1
+        else:
+            print(f"Dropping topic {index + 1}: could not repair it")
+            stats["dropped"] += 1
+    return topics, stats
+
+
+def render_topic_markdown(topic: Dict, number: int) -> str:
+    """Render one topic in the report's markdown format."""
+    lines = [
+        f"### {number}. {topic['headline']}",
+        f"- **What's New:** {topic['whats_new']}",
+        "",
+        f"- **Why It Matters:** {topic['why_it_matters']}",
+        "",
+        "- **Practical Impact:**",
+    ]
+    lines.extend(f"  - {action}" for action in topic['actions'])
+    lines.append("")
+    lines.append(f"- **Source:** {', '.join(topic['sources'])}")
+    if topic.get('links'):
+        lines.append("")
+        lines.append("- **Links:** " + ", ".join(f"[{link['title']}]({link['url']})" for link in topic['links']))
+    return "\n".join(lines) + "\n"
+
+
+def render_markdown(topics: List[Dict]) -> str:
+    """Render all topics as the analysis section of the report."""
+    return "\n".join(render_topic_markdown(topic, i) for i, topic in enumerate(topics, 1))
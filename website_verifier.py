@@ -0,0 +1,361 @@
+"""
+Non-interactive verification of guessed newsletter homepages.
+
+Guesses from the sender domain or a link in the newsletter body are cached
+as unverified (see ``websites.py``). This module checks them over HTTP
+instead of waiting for a manual review: every candidate gets a ``HEAD``
+request (to drop dead links cheaply) and a ``GET`` of the first part of the
+page, following redirects, with a shared connection limit and timeouts. The
+page is scored by:
+
+- status code: only a final 2xx response can pass
+- canonical URL: the page's ``rel="canonical"`` link (or the final URL after
+  redirects) stays on the candidate's domain and is a homepage, not a deep link
+- title match: how much of the newsletter name occurs in the page ``<title>``
+
+Fetched page facts are cached per domain in ``website_checks.json`` with a
+TTL, so each domain is fetched at most once per period however many
+newsletters point at it. Scores are computed from the cached facts for each
+newsletter name.
+
+Run ``python website_verifier.py`` to verify the unverified cache entries,
+or pass ``--verify-websites`` to ``main.py``.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+from file_lock import locked, write_atomic
+from websites import DEFAULT_CACHE_PATH, WebsiteResolver, get_resolver, normalize, url_domain
+
+DEFAULT_CHECKS_PATH = 'website_checks.json'
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 10.0
+MAX_CONNECTIONS = 10
+# Re-check a domain after this long
+RESULT_TTL = datetime.timedelta(days=7)
+# Only the start of the page is read; the head is enough for title and canonical
+MAX_PAGE_BYTES = 64 * 1024
+# Candidates scoring at least this are marked verified
+VERIFY_THRESHOLD = 0.7
+
+STATUS_WEIGHT = 0.4
+CANONICAL_WEIGHT = 0.2
+TITLE_WEIGHT = 0.4
+
+USER_AGENT = "newsletter-summary-website-verifier/1.0"
+
+
+def checks_path() -> str:
+    """Return the path of the verification result cache."""
+    return os.environ.get("WEBSITE_CHECKS_PATH", DEFAULT_CHECKS_PATH)
+
+
+def parse_page(html: str, base_url: str) -> Dict[str, Optional[str]]:
+    """
+    Extract the title and canonical URL from the start of an HTML page.
+
+    Returns:
+        Dictionary with ``title`` and ``canonical`` (absolute), either may be None
+    """
+    found = re.search(r'<title[^>]*>(.*?)</title>', html, re.IGNORECASE | re.DOTALL)
+    title = re.sub(r'\s+', ' ', found.group(1)).strip() if found else None
+    canonical = None
+    for tag in re.findall(r'<link\b[^>]*>', html, re.IGNORECASE):
+        if re.search(r'rel=["\']?canonical["\'\s>]', tag, re.IGNORECASE):
+            href = re.search(r'href=["\']([^"\']+)["\']', tag, re.IGNORECASE)
+            if href:
+                canonical = urljoin(base_url, href.group(1).strip())
+            break
+    return {"title": title or None, "canonical": canonical}
+
+
+def title_match(name: str, title: Optional[str]) -> float:
+    """
+    Return how well a page title matches a newsletter name, from 0 to 1.
+
+    The whole normalized name inside the normalized title scores 1;
+    otherwise the share of the name's words (longer than two characters)
+    found in the title.
+    """
+    if not title:
+        return 0.0
+    norm_title = normalize(title)
+    norm_name = normalize(name)
+    if norm_name and norm_name in norm_title:
+        return 1.0
+    words = [normalize(word) for word in re.split(r'\s+', name) if len(normalize(word)) > 2]
+    if not words:
+        return 0.0
+    return sum(1 for word in words if word in norm_title) / len(words)
+
+
+def score_check(name: str, url: str, check: Dict) -> Tuple[float, List[str]]:
+    """
+    Score fetched page facts as the homepage of a newsletter.
+
+    Args:
+        name: Newsletter name
+        url: Candidate homepage URL
+        check: Page facts from ``fetch_page``
+
+    Returns:
+        Tuple of (score from 0 to 1, list of reasons)
+    """
+    status = check.get("status")
+    if check.get("error") or status is None:
+        return 0.0, [f"unreachable: {check.get('error') or 'no response'}"]
+    if not 200 <= status < 300:
+        return 0.0, [f"status {status}"]
+    score = STATUS_WEIGHT
+    reasons = [f"status {status}"]
+
+    identity = check.get("canonical") or check.get("final_url") or url
+    parsed = urlparse(identity)
+    if url_domain(identity) == url_domain(url) and parsed.path in ('', '/', '/home'):
+        score += CANONICAL_WEIGHT
+        reasons.append("canonical homepage on the same domain")
+    else:
+        reasons.append(f"canonical URL is {identity}")
+
+    match = title_match(name, check.get("title"))
+    score += TITLE_WEIGHT * match
+    reasons.append(f"title match {match:.0%}" + (f" ({check['title']!r})" if check.get("title") else ""))
+    return round(score, 3), reasons
+
+
+class CheckCache:
+    """Page facts per domain with a time-to-live, stored as JSON."""
+
+    def __init__(self, path: Optional[str] = None, ttl: datetime.timedelta = RESULT_TTL):
+        self.path = path or checks_path()
+        self.ttl = ttl
+        self.checks: Dict[str, Dict] = self._read()
+        self.dirty = False
+        self._changed: Dict[str, Dict] = {}
+
+    def _read(self) -> Dict[str, Dict]:
+        """Read the cache file, or return an empty cache if it is missing or unreadable."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: could not read website check cache {self.path} ({str(e)})")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def get(self, domain: str, now: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        """Return the cached facts for a domain if they are younger than the TTL."""
+        check = self.checks.get(domain)
+        if not check:
+            return None
+        now = now or datetime.datetime.now()
+        try:
+            checked_at = datetime.datetime.fromisoformat(check["checked_at"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return check if now - checked_at < self.ttl else None
+
+    def put(self, domain: str, check: Dict) -> None:
+        """Store the facts for a domain."""
+        self.checks[domain] = check
+        self._changed[domain] = check
+        self.dirty = True
+
+    def save(self) -> bool:
+        """
+        Merge the changed entries into the cache file and write it atomically.
+
+        Entries other processes saved meanwhile are kept; expired entries are
+        dropped. Does nothing if no entry changed.
+        """
+        if not self.dirty:
+            return False
+        now = datetime.datetime.now()
+        with locked(self.path):
+            self.checks = dict(self._read(), **self._changed)
+            self.checks = {domain: check for domain, check in self.checks.items() if self.get(domain, now)}
+            write_atomic(self.path, json.dumps(self.checks, indent=2))
+        self._changed = {}
+        self.dirty = False
+        return True
+
+
+def build_client(max_connections: int = MAX_CONNECTIONS, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT) -> httpx.AsyncClient:
+    """Return an async HTTP client with the verifier's limits, timeouts and redirect handling."""
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+async def fetch_page(client: httpx.AsyncClient, url: str) -> Dict:
+    """
+    Fetch the facts needed to score a candidate homepage.
+
+    A ``HEAD`` request runs first; a definite client or server error stops
+    there. Servers that reject ``HEAD`` (405, 501) still get the ``GET``,
+    which reads at most ``MAX_PAGE_BYTES`` of the page.
+
+    Returns:
+        Dictionary with ``url``, ``status``, ``final_url``, ``title``,
+        ``canonical``, ``error`` and ``checked_at``
+    """
+    check = {"url": url, "status": None, "final_url": None, "title": None, "canonical": None, "error": None,
+             "checked_at": datetime.datetime.now().isoformat()}
+    try:
+        head = await client.head(url)
+        if head.status_code >= 400 and head.status_code not in (403, 405, 501):
+            check.update(status=head.status_code, final_url=str(head.url))
+            return check
+        async with client.stream("GET", url) as response:
+            check.update(status=response.status_code, final_url=str(response.url))
+            content_type = response.headers.get("content-type", "")
+            if response.is_success and "html" in content_type.lower():
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= MAX_PAGE_BYTES:
+                        break
+                html = b"".join(chunks)[:MAX_PAGE_BYTES].decode(response.encoding or 'utf-8', 'replace')
+                check.update(parse_page(html, str(response.url)))
+    except httpx.HTTPError as e:
+        check["error"] = f"{type(e).__name__}: {str(e)}" if str(e) else type(e).__name__
+    return check
+
+
+async def verify_candidates(candidates: Iterable[Tuple[str, str]], cache: Optional[CheckCache] = None,
+                            client: Optional[httpx.AsyncClient] = None, concurrency: int = MAX_CONNECTIONS,
+                            threshold: float = VERIFY_THRESHOLD) -> List[Dict]:
+    """
+    Check candidate homepages concurrently and score them.
+
+    Each domain is fetched once per call, and not at all while the cache holds
+    fresh facts for it.
+
+    Args:
+        candidates: ``(newsletter name, candidate URL)`` pairs
+        cache: Optional ``CheckCache`` for page facts
+        client: Optional async HTTP client (defaults to ``build_client()``)
+        concurrency: Maximum concurrent domain checks
+        threshold: Minimum score for ``verified``
+
+    Returns:
+        One dictionary per candidate, in input order, with ``name``, ``url``,
+        ``homepage`` (canonical or final URL), ``score``, ``verified``,
+        ``reasons`` and ``cached``
+    """
+    candidates = list(candidates)
+    owns_client = client is None
+    client = client or build_client(max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    fetches: Dict[str, asyncio.Task] = {}
+    cached_domains = set()
+
+    async def fetch(url):
+        async with semaphore:
+            return await fetch_page(client, url)
+
+    try:
+        for _, url in candidates:
+            domain = url_domain(url)
+            if domain in fetches or domain in cached_domains:
+                continue
+            if cache is not None and cache.get(domain):
+                cached_domains.add(domain)
+            else:
+                fetches[domain] = asyncio.ensure_future(fetch(url))
+        if fetches:
+            await asyncio.gather(*fetches.values())
+    finally:
+        if owns_client:
+            await client.aclose()
+
+    results = []
+    for name, url in candidates:
+        domain = url_domain(url)
+        if domain in fetches:
+            check = fetches[domain].result()
+            if cache is not None:
+                cache.put(domain, check)
+        else:
+            check = cache.get(domain)
+        score, reasons = score_check(name, url, check)
+        homepage = check.get("canonical") or check.get("final_url") or url
+        results.append({
+            "name": name,
+            "url": url,
+            "homepage": homepage if url_domain(homepage) == domain else url,
+            "score": score,
+            "verified": score >= threshold,
+            "reasons": reasons,
+            "cached": domain in cached_domains,
+        })
+    return results
+
+
+def verify_unverified_websites(resolver: Optional[WebsiteResolver] = None, cache: Optional[CheckCache] = None,
+                               concurrency: int = MAX_CONNECTIONS, threshold: float = VERIFY_THRESHOLD) -> List[Dict]:
+    """
+    Verify the unverified entries of the website cache and save the outcome.
+
+    Entries that pass are stored as verified (with the page's canonical
+    homepage when it is on the same domain); the others stay unverified for
+    ``review_newsletter_websites.py``. Defaults to the process-wide resolver,
+    so it can run in a thread next to report generation.
+
+    Returns:
+        The results of ``verify_candidates``
+    """
+    resolver = resolver or get_resolver(DEFAULT_CACHE_PATH)
+    cache = cache if cache is not None else CheckCache()
+    candidates = [(name, entry["url"]) for name, entry in resolver.unverified() if entry.get("url")]
+    if not candidates:
+        return []
+    results = asyncio.run(verify_candidates(candidates, cache, concurrency=concurrency, threshold=threshold))
+    for result in results:
+        if result["verified"]:
+            resolver.set(result["name"], result["homepage"], verified=True)
+    resolver.save()
+    cache.save()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify guessed newsletter homepages over HTTP")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONNECTIONS,
+                        help=f'Maximum concurrent checks (default: {MAX_CONNECTIONS})')
+    parser.add_argument('--threshold', type=float, default=VERIFY_THRESHOLD,
+                        help=f'Minimum score to mark a homepage verified (default: {VERIFY_THRESHOLD})')
+    args = parser.parse_args()
+
+    results = verify_unverified_websites(concurrency=args.concurrency, threshold=args.threshold)
+    if not results:
+        print("No unverified websites to check.")
+        return
+    for result in results:
+        status = "verified" if result["verified"] else "unverified"
+        source = " (cached)" if result["cached"] else ""
+        print(f"{result['name']}: {result['homepage']} - {status}, score {result['score']:.2f}{source}")
+        print(f"  {'; '.join(result['reasons'])}")
+    verified = sum(1 for result in results if result["verified"])
+    print(f"\nVerified {verified} of {len(results)} websites.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Newsletter homepage resolution backed by the website cache.
+
+``newsletter_websites.json`` maps a newsletter name (lowercased) to its
+homepage and whether a person confirmed it (``verified``). A
+``WebsiteResolver`` loads the file once and keeps it in memory, indexed by
+normalized name and by the domain of each verified homepage. Changed and
+deleted entries are tracked, and ``save`` only writes when something is
+dirty: under the ``.lock`` file lock it re-reads the file, applies this
+process's changes on top (so entries written by a concurrent run are kept)
+and replaces the file atomically with a temp file and rename.
+
+``get_resolver`` returns the process-wide resolver for a cache path, so
+every report generated by one process shares the same loaded cache.
+``report.py``, ``review_newsletter_websites.py`` and
+``config_validator.validate_newsletter_websites_json`` all use this module.
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from file_lock import locked
+
+DEFAULT_CACHE_PATH = 'newsletter_websites.json'
+
+# Curated mapping for known newsletters (extend as needed)
+CURATED_WEBSITES = {
+    'the neuron': 'https://www.theneurondaily.com',
+    'tldr ai': 'https://www.tldrnewsletter.com',
+    'tldr': 'https://www.tldrnewsletter.com',
+    'the rundown ai': 'https://www.therundown.ai',
+    'ai breakfast': 'https://aibreakfast.substack.com',
+    "ben's bites": 'https://www.bensbites.co',
+    'alpha signal': 'https://alphasignal.ai',
+    'unwind ai': 'https://unwindai.com',
+    'simon willison': 'https://simonwillison.net',
+    'peter yang': 'https://creatoreconomy.so',
+    # Add more as needed
+}
+
+# Tracking, form and asset URLs that are never a newsletter's homepage
+EXCLUDED_URL_PARTS = ['form', 'track', 'unsubscribe', 'pixel', 'img', 'logo', 'pricing', 'cdn-cgi', 'utm_',
+                      'jwt_token', 'viewform']
+
+_registry_lock = threading.Lock()
+_resolvers: Dict[str, "WebsiteResolver"] = {}
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip everything but letters and digits."""
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+# Normalized once, in mapping order, so matching a sender does not re-normalize every key
+CURATED_KEYS = [(normalize(key), url) for key, url in CURATED_WEBSITES.items()]
+
+
+def domain_from_email(email: str) -> str:
+    """Return the sender's domain without common mail subdomains."""
+    domain = email.split('@')[-1]
+    domain = re.sub(r'^(mail|news|info|newsletter)\.', '', domain)
+    return domain
+
+
+def url_domain(url: str) -> str:
+    """Return the host of a URL, lowercased and without ``www.``."""
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def plausible_homepage_from_body(body: str, newsletter_name: Optional[str] = None) -> Optional[str]:
+    """Return the most homepage-like URL in a newsletter body, or None."""
+    urls = re.findall(r'https?://[\w\.-]+(?:/[\w\-\./?%&=]*)?', body)
+    # Filter out forms, tracking, deep paths, etc.
+    filtered = [u for u in urls if not any(x in u for x in EXCLUDED_URL_PARTS)]
+    # Prefer root domains
+    for url in filtered:
+        parsed = urlparse(url)
+        if parsed.path in ('', '/', '/home'):
+            return url
+    # As fallback, return first filtered
+    if filtered:
+        return filtered[0]
+    return None
+
+
+def curated_website(name: str) -> Optional[str]:
+    """Return the curated homepage whose normalized key occurs in the sender name, or None."""
+    norm_name = normalize(name)
+    for key, url in CURATED_KEYS:
+        if key in norm_name:
+            return url
+    return None
+
+
+class WebsiteResolver:
+    """In-memory, indexed view of the website cache with dirty tracking."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, load: bool = True):
+        """
+        Args:
+            path: Path of the website cache file
+            load: Load the file now (a missing or unreadable file gives an empty cache)
+        """
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.dirty = set()
+        self.deleted = set()
+        self._by_name: Dict[str, str] = {}
+        self._by_domain: Dict[str, str] = {}
+        self._stamp = None
+        self._lock = threading.RLock()
+        if load:
+            self.load()
+
+    def read(self):
+        """
+        Read the cache file as stored on disk.
+
+        Returns:
+            The parsed JSON (normally a dictionary), or an empty dictionary if the file does not exist
+
+        Raises:
+            json.JSONDecodeError: If the file is not valid JSON
+            OSError: If the file cannot be read
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> None:
+        """(Re)load the cache file, dropping unsaved changes."""
+        try:
+            data = self.read()
+            if not isinstance(data, dict):
+                raise ValueError("root element is not a dictionary")
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not read website cache {self.path} ({str(e)}); starting empty")
+            data = {}
+        with self._lock:
+            self.entries = {key: entry for key, entry in data.items() if isinstance(entry, dict)}
+            self.dirty.clear()
+            self.deleted.clear()
+            self._stamp = self._file_stamp()
+            self._reindex()
+
+    def changed_on_disk(self) -> bool:
+        """True if the cache file was modified since it was loaded or saved."""
+        return self._file_stamp() != self._stamp
+
+    def _reindex(self) -> None:
+        self._by_name = {}
+        self._by_domain = {}
+        for key, entry in self.entries.items():
+            self._index(key, entry)
+
+    def _index(self, key: str, entry: Dict) -> None:
+        self._by_name.setdefault(normalize(key), key)
+        if entry.get('verified') and entry.get('url'):
+            self._by_domain.setdefault(url_domain(entry['url']), key)
+
+    def get(self, name: str) -> Optional[Dict]:
+        """Return the cache entry for a newsletter name (exact key, then normalized name), or None."""
+        with self._lock:
+            key = name.strip().lower()
+            if key in self.entries:
+                return self.entries[key]
+            key = self._by_name.get(normalize(name))
+            return self.entries.get(key) if key else None
+
+    def verified_for_domain(self, domain: str) -> Optional[str]:
+        """Return the verified homepage hosted on ``domain``, or None."""
+        with self._lock:
+            key = self._by_domain.get(domain.lower())
+            return self.entries[key]['url'] if key else None
+
+    def set(self, name: str, url: str, verified: bool) -> None:
+        """Record a homepage; the entry is only marked dirty if it changed."""
+        key = name.strip().lower()
+        entry = {"url": url, "verified": verified}
+        with self._lock:
+            previous = self.entries.get(key)
+            if previous == entry:
+                return
+            self.entries[key] = entry
+            self.dirty.add(key)
+            self.deleted.discard(key)
+            if previous is None:
+                self._index(key, entry)
+            else:
+                self._reindex()
+
+    def delete(self, name: str) -> None:
+        """Remove an entry so it is re-guessed on the next run."""
+        key = name.strip().lower()
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                self.deleted.add(key)
+                self.dirty.discard(key)
+                self._reindex()
+
+    def unverified(self) -> List[Tuple[str, Dict]]:
+        """Return ``(name, entry)`` pairs still waiting for review."""
+        with self._lock:
+            return [(key, dict(entry)) for key, entry in self.entries.items() if not entry.get('verified')]
+
+    def resolve(self, name: str, email: Optional[str] = None, body: str = '') -> Optional[str]:
+        """
+        Find a newsletter's homepage and record it in the cache.
+
+        Lookup order: a verified cache entry, the curated mapping, a verified
+        homepage on the sender's domain, the sender domain if it matches the
+        newsletter name, then the most plausible homepage link in the body.
+
+        Args:
+            name: Newsletter display name
+            email: Sender address, or None
+            body: Body of one of the newsletter's issues
+
+        Returns:
+            The homepage URL, or None
+        """
+        norm_name = normalize(name)
+        cache_entry = self.get(name)
+        curated_match = curated_website(name)
+        website_url = None
+        verified = False
+        if cache_entry and cache_entry.get('verified'):
+            website_url = cache_entry['url']
+            verified = True
+        elif curated_match:
+            website_url = curated_match
+            verified = True
+        if not website_url and email:
+            domain = domain_from_email(email)
+            # A homepage already confirmed for this sender domain
+            website_url = self.verified_for_domain(domain)
+            # Sender domain if it matches newsletter name
+            if not website_url and any(part in domain for part in norm_name.split() if len(part) > 3):
+                website_url = f"https://{domain}"
+        if not website_url:
+            website_url = plausible_homepage_from_body(body, newsletter_name=name)
+        if website_url:
+            self.set(name, website_url, verified)
+        return website_url
+
+    def save(self) -> bool:
+        """
+        Write pending changes, merged into the current file, atomically.
+
+        Returns:
+            True if the file was written, False if nothing was dirty
+        """
+        with self._lock:
+            if not self.dirty and not self.deleted:
+                return False
+            with locked(self.path):
+                try:
+                    current = self.read()
+                except (OSError, ValueError):
+                    current = None
+                if not isinstance(current, dict):
+                    current = {}
+                for key in self.dirty:
+                    current[key] = self.entries[key]
+                for key in self.deleted:
+                    current.pop(key, None)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(current, f, indent=2)
+                os.replace(tmp_path, self.path)
+                self._stamp = self._file_stamp()
+            self.entries = {key: entry for key, entry in current.items() if isinstance(entry, dict)}
+            self.dirty.clear()
+            self.deleted.clear()
+            self._reindex()
+            return True
+
+
+def get_resolver(path: str = DEFAULT_CACHE_PATH) -> WebsiteResolver:
+    """
+    Return the process-wide resolver for a cache file, loading it on first use.
+
+    A resolver without unsaved changes is reloaded if the file changed on
+    disk (e.g. after a review), so a long-running process sees the edits.
+    """
+    key = os.path.abspath(path)
+    with _registry_lock:
+        resolver = _resolvers.get(key)
+        if resolver is None:
+            resolver = _resolvers[key] = WebsiteResolver(key)
+            return resolver
+    if not resolver.dirty and not resolver.deleted and resolver.changed_on_disk():
+        resolver.load()
+    return resolver
+
+
+def reset_resolvers() -> None:
+    """Forget all process-wide resolvers (unsaved changes are dropped)."""
+    with _registry_lock:
+        _resolvers.clear()